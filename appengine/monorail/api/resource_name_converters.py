@@ -91,9 +91,9 @@ def _GetResourceNameMatch(name, regex):
 def _IssueIdsFromLocalIds(cnxn, project_local_id_pairs, services):
   # (MonorailConnection, Sequence[Tuple(str, int)], Services -> Sequence[int]
   """Fetches issue IDs using the given project/local ID pairs."""
-  # Fetch Project ids from Project names.
+  # Fetch Project ids from Project names, looking up each name only once.
   project_ids_by_name = services.project.LookupProjectIDs(
-      cnxn, [pair[0] for pair in project_local_id_pairs])
+      cnxn, list({pair[0] for pair in project_local_id_pairs}))
 
   # Create (project_id, issue_local_id) pairs from project_local_id_pairs.
   project_id_local_ids = []
@@ -438,9 +438,32 @@ def IngestUserNames(cnxn, names, services, autocreate=False):
     NoSuchUserException if autocreate is False and some users with given
         emails were not found.
   """
-  ids = []
+  # Parse every name first, so that all emails can be looked up at once.
+  ids_and_emails = []
   for name in names:
-    ids.append(IngestUserName(cnxn, name, services, autocreate))
+    match = _GetResourceNameMatch(name, USER_NAME_RE)
+    user_id = match.group('user_id')
+    if user_id:
+      ids_and_emails.append((int(user_id), None))
+    elif validate.IsValidEmail(match.group('potential_email')):
+      ids_and_emails.append((None, match.group('potential_email').lower()))
+    else:
+      raise exceptions.InputException(
+          'Invalid email format found in User resource name: %s' % name)
+
+  emails = {email for _user_id, email in ids_and_emails if email}
+  user_ids_by_email = {}
+  if emails:
+    user_ids_by_email = services.user.LookupUserIDs(
+        cnxn, list(emails), autocreate=autocreate)
+
+  ids = []
+  for user_id, email in ids_and_emails:
+    if email:
+      if email not in user_ids_by_email:
+        raise exceptions.NoSuchUserException('%r not found' % email)
+      user_id = user_ids_by_email[email]
+    ids.append(user_id)
 
   return ids
 
@@ -0,0 +1,116 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Benchmark for turning many issue and user resource names into IDs.
+
+We time ingesting each name on its own vs. ingesting all of them at once,
+as hotlist and user batch requests do, and count the lookups that each way
+makes.
+
+Usage: python api/test/resource_name_converters_benchmark.py [num_names]
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import collections
+import random
+import sys
+import time
+
+from api import resource_name_converters as rnc
+from services import service_manager
+from testing import fake
+
+
+NUM_PROJECTS = 10
+
+
+def MakeServices(num_names):
+  services = service_manager.Services(
+      issue=fake.IssueService(),
+      project=fake.ProjectService(),
+      user=fake.UserService())
+  for project_id in range(1, NUM_PROJECTS + 1):
+    services.project.TestAddProject(
+        'proj%d' % project_id, project_id=project_id)
+    for local_id in range(1, num_names // NUM_PROJECTS + 2):
+      services.issue.TestAddIssue(fake.MakeTestIssue(
+          project_id, local_id, 'sum', 'New', 111,
+          issue_id=project_id * 100000 + local_id,
+          project_name='proj%d' % project_id))
+  for user_id in range(1, num_names + 1):
+    services.user.TestAddUser('user%d@example.com' % user_id, user_id)
+  return services
+
+
+def MakeNames(num_names):
+  """Return issue names spread over the projects and mixed user names."""
+  rand = random.Random(1)
+  issue_names = [
+      'projects/proj%d/issues/%d' % (
+          rand.randint(1, NUM_PROJECTS),
+          rand.randint(1, num_names // NUM_PROJECTS + 1))
+      for _ in range(num_names)]
+  user_names = [
+      'users/%d' % i if i % 2 else 'users/user%d@example.com' % i
+      for i in range(1, num_names + 1)]
+  return issue_names, user_names
+
+
+def CountCalls(services):
+  """Wrap the lookups made by ingesting names so that calls are counted."""
+  counts = collections.Counter()
+
+  def Wrap(service, method_name):
+    method = getattr(service, method_name)
+    def Counted(*args, **kwargs):
+      counts[method_name] += 1
+      return method(*args, **kwargs)
+    setattr(service, method_name, Counted)
+
+  Wrap(services.project, 'LookupProjectIDs')
+  Wrap(services.issue, 'LookupIssueIDs')
+  Wrap(services.user, 'LookupUserIDs')
+  return counts
+
+
+def TimeIngest(counts, ingest):
+  """Return ms taken, lookups made and the IDs returned by ingest()."""
+  counts.clear()
+  start = time.time()
+  ids = ingest()
+  return (time.time() - start) * 1000, sum(counts.values()), ids
+
+
+def main(argv):
+  num_names = int(argv[1]) if len(argv) > 1 else 1000
+  services = MakeServices(num_names)
+  counts = CountCalls(services)
+  cnxn = fake.MonorailConnection()
+  issue_names, user_names = MakeNames(num_names)
+  print('%d names' % num_names)
+
+  cases = [
+      ('issues',
+       lambda: [rnc.IngestIssueName(cnxn, name, services)
+                for name in issue_names],
+       lambda: rnc.IngestIssueNames(cnxn, issue_names, services)),
+      ('users',
+       lambda: [rnc.IngestUserName(cnxn, name, services)
+                for name in user_names],
+       lambda: rnc.IngestUserNames(cnxn, user_names, services)),
+      ]
+  for name, one_by_one, batched in cases:
+    single_ms, single_calls, single_ids = TimeIngest(counts, one_by_one)
+    batch_ms, batch_calls, batch_ids = TimeIngest(counts, batched)
+    assert single_ids == batch_ids
+    print('%-7s one at a time %7.1fms (%4d lookups), '
+          'batched %7.1fms (%4d lookups)' % (
+              name, single_ms, single_calls, batch_ms, batch_calls))
+
+
+if __name__ == '__main__':
+  main(sys.argv)
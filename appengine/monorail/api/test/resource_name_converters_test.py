@@ -203,6 +203,24 @@ class ResourceNameConverterTest(unittest.TestCase):
             self.cnxn, ['projects/proj/issues/1', 'projects/goose/issues/2'],
             self.services), [self.issue_1.issue_id, self.issue_2.issue_id])
 
+  def testIngestIssueNames_LooksUpEachProjectOnce(self):
+    """Names in the same project share one project and one issue lookup."""
+    names = ['projects/proj/issues/1', 'projects/goose/issues/2',
+             'projects/proj/issues/1']
+    with patch.object(
+        self.services.project, 'LookupProjectIDs',
+        wraps=self.services.project.LookupProjectIDs) as lookup_projects, \
+        patch.object(
+            self.services.issue, 'LookupIssueIDs',
+            wraps=self.services.issue.LookupIssueIDs) as lookup_issues:
+      self.assertEqual(
+          [self.issue_1.issue_id, self.issue_2.issue_id,
+           self.issue_1.issue_id],
+          rnc.IngestIssueNames(self.cnxn, names, self.services))
+    lookup_projects.assert_called_once()
+    self.assertItemsEqual(['proj', 'goose'], lookup_projects.call_args[0][1])
+    lookup_issues.assert_called_once()
+
   def testIngestIssueNames_EmptyList(self):
     """We get an empty list when providing an empty list of issue names."""
     self.assertEqual(rnc.IngestIssueNames(self.cnxn, [], self.services), [])
@@ -294,6 +312,23 @@ class ResourceNameConverterTest(unittest.TestCase):
     self.assertEqual(
         rnc.IngestUserNames(self.cnxn, names, self.services), expected_ids)
 
+  def testIngestUserNames_OneLookup(self):
+    """All emails are looked up together."""
+    names = [
+        'users/%s' % self.user_1.email, 'users/222',
+        'users/%s' % self.user_3.email.upper(),
+        'users/%s' % self.user_1.email]
+    with patch.object(
+        self.services.user, 'LookupUserIDs',
+        wraps=self.services.user.LookupUserIDs) as lookup_users:
+      self.assertEqual(
+          [111, 222, 333, 111],
+          rnc.IngestUserNames(self.cnxn, names, self.services))
+    lookup_users.assert_called_once()
+    self.assertItemsEqual(
+        [self.user_1.email, self.user_3.email],
+        lookup_users.call_args[0][1])
+
   def testIngestUserNames_NoSuchUser(self):
     """When autocreate=False, we raise an exception if a user is not found."""
     names = [
@@ -7,7 +7,6 @@ from __future__ import division
 from __future__ import absolute_import
 
 import collections
-import itertools
 import logging
 
 from google.protobuf import timestamp_pb2
@@ -29,6 +28,13 @@ from tracker import tracker_bizobj as tbo
 
 Choice = project_objects_pb2.FieldDef.EnumTypeSettings.Choice
 
+# Everything that ConvertIssues() needs to look up for a batch of issues.
+# All dicts except issue_names and user_names are keyed by project ID.
+_IssueConversionPlan = collections.namedtuple(
+    '_IssueConversionPlan',
+    'issue_names, user_names, configs, component_names, field_def_names, '
+    'enum_ids_by_name')
+
 
 class Converter(object):
   """Class to manage converting objects between the API and backend layer."""
@@ -141,16 +147,11 @@ class Converter(object):
 
   # Issues
 
-  def _ConvertComponentValues(self, issue):
-    # proto.tracker_pb2.Issue ->
+  def _ConvertComponentValues(self, issue, ids_to_names):
+    # proto.tracker_pb2.Issue, Mapping[int, str] ->
     #     Sequence[api_proto.issue_objects_pb2.Issue.ComponentValue]
-    """Convert the status string on issue into a ComponentValue."""
+    """Convert the component IDs on issue into ComponentValues."""
     component_values = []
-    component_ids = itertools.chain(
-        issue.component_ids, issue.derived_component_ids)
-    ids_to_names = rnc.ConvertComponentDefNames(
-        self.cnxn, component_ids, issue.project_id, self.services)
-
     for component_id in issue.component_ids:
       if component_id in ids_to_names:
         component_values.append(
@@ -290,18 +291,68 @@ class Converter(object):
       logging.warning('More than one converted issue returned: %s', issues)
     return issues[0]
 
+  def _PlanIssueConversion(self, issues):
+    # type: (Sequence[proto.tracker_pb2.Issue]) -> _IssueConversionPlan
+    """Look up everything needed to convert the given issues.
+
+    Each kind of value is resolved once for the whole batch: one lookup of
+    issue names for the issues and all the issues they refer to, one set of
+    user names, and one config and set of field and component names for
+    each project.
+    """
+    project_ids = {issue.project_id for issue in issues}
+    issue_ids = set()
+    user_ids = set()
+    component_ids_by_project = collections.defaultdict(set)
+    for issue in issues:
+      issue_ids.add(issue.issue_id)
+      if issue.merged_into:
+        issue_ids.add(issue.merged_into)
+      issue_ids.update(issue.blocked_on_iids)
+      issue_ids.update(issue.blocking_iids)
+      user_ids.update(
+          [issue.reporter_id, issue.owner_id, issue.derived_owner_id])
+      user_ids.update(issue.cc_ids)
+      user_ids.update(issue.derived_cc_ids)
+      component_ids_by_project[issue.project_id].update(issue.component_ids)
+      component_ids_by_project[issue.project_id].update(
+          issue.derived_component_ids)
+
+    issue_names = rnc.ConvertIssueNames(
+        self.cnxn, list(issue_ids), self.services)
+    user_names = rnc.ConvertUserNames(user_ids)
+    configs = self.services.config.GetProjectConfigs(self.cnxn, project_ids)
+
+    component_names = {}
+    field_def_names = {}
+    enum_ids_by_name = {}
+    for project_id in project_ids:
+      config = configs[project_id]
+      component_names[project_id] = rnc.ConvertComponentDefNames(
+          self.cnxn, component_ids_by_project[project_id], project_id,
+          self.services)
+      field_def_names[project_id] = rnc.ConvertFieldDefNames(
+          self.cnxn, [fd.field_id for fd in config.field_defs], project_id,
+          self.services)
+      enum_ids_by_name[project_id] = self._GetEnumFieldIDsByName(config)
+
+    return _IssueConversionPlan(
+        issue_names, user_names, configs, component_names, field_def_names,
+        enum_ids_by_name)
+
   def ConvertIssues(self, issues):
     # type: (Sequence[proto.tracker_pb2.Issue]) ->
     #     Sequence[api_proto.issue_objects_pb2.Issue]
     """Convert protorpc Issues into protoc Issues."""
-    issue_ids = [issue.issue_id for issue in issues]
-    issue_names_dict = rnc.ConvertIssueNames(
-        self.cnxn, issue_ids, self.services)
+    plan = self._PlanIssueConversion(issues)
+    issue_names_dict = plan.issue_names
+    user_names = plan.user_names
     found_issues = [
         issue for issue in issues if issue.issue_id in issue_names_dict
     ]
     converted_issues = []
     for issue in found_issues:
+      project_id = issue.project_id
       status = self._ConvertStatusValue(issue)
       content_state = issue_objects_pb2.IssueContentState.Value(
           'STATE_UNSPECIFIED')
@@ -317,49 +368,49 @@ class Converter(object):
       if issue.owner_id:
         owner = issue_objects_pb2.Issue.UserValue(
             derivation=issue_objects_pb2.Derivation.Value('EXPLICIT'),
-            user=rnc.ConvertUserName(issue.owner_id))
+            user=user_names[issue.owner_id])
       elif issue.derived_owner_id:
         owner = issue_objects_pb2.Issue.UserValue(
             derivation=issue_objects_pb2.Derivation.Value('RULE'),
-            user=rnc.ConvertUserName(issue.derived_owner_id))
+            user=user_names[issue.derived_owner_id])
 
       cc_users = []
       for cc_user_id in issue.cc_ids:
         cc_users.append(
             issue_objects_pb2.Issue.UserValue(
                 derivation=issue_objects_pb2.Derivation.Value('EXPLICIT'),
-                user=rnc.ConvertUserName(cc_user_id)))
+                user=user_names[cc_user_id]))
       for derived_cc_user_id in issue.derived_cc_ids:
         cc_users.append(
             issue_objects_pb2.Issue.UserValue(
                 derivation=issue_objects_pb2.Derivation.Value('RULE'),
-                user=rnc.ConvertUserName(derived_cc_user_id)))
+                user=user_names[derived_cc_user_id]))
 
-      labels = self.ConvertLabels(
-          issue.labels, issue.derived_labels, issue.project_id)
-      components = self._ConvertComponentValues(issue)
+      labels = self._ConvertLabelValues(
+          issue.labels, issue.derived_labels, plan.configs[project_id])
+      components = self._ConvertComponentValues(
+          issue, plan.component_names[project_id])
       # TODO(crbug/monorail/7634): filter out approval fields
-      field_values = self.ConvertFieldValues(
-          issue.field_values, issue.project_id, issue.phases)
+      field_values = self._ConvertFieldValues(
+          issue.field_values, plan.field_def_names[project_id],
+          {phase.phase_id: phase.name for phase in issue.phases})
       field_values.extend(
-          self.ConvertEnumFieldValues(
-              issue.labels, issue.derived_labels, issue.project_id))
-      related_issue_ids = (
-          [issue.merged_into] + issue.blocked_on_iids + issue.blocking_iids)
-      issue_names_by_ids = rnc.ConvertIssueNames(
-          self.cnxn, related_issue_ids, self.services)
+          self._ConvertEnumFieldValues(
+              issue.labels, issue.derived_labels,
+              plan.enum_ids_by_name[project_id],
+              plan.field_def_names[project_id]))
       merged_into_issue_ref = None
-      if issue.merged_into and issue.merged_into in issue_names_by_ids:
+      if issue.merged_into and issue.merged_into in issue_names_dict:
         merged_into_issue_ref = issue_objects_pb2.IssueRef(
-            issue=issue_names_by_ids[issue.merged_into])
+            issue=issue_names_dict[issue.merged_into])
       if issue.merged_into_external:
         merged_into_issue_ref = issue_objects_pb2.IssueRef(
             ext_identifier=issue.merged_into_external)
 
       blocked_on_issue_refs = [
-          issue_objects_pb2.IssueRef(issue=issue_names_by_ids[iid])
+          issue_objects_pb2.IssueRef(issue=issue_names_dict[iid])
           for iid in issue.blocked_on_iids
-          if iid in issue_names_by_ids
+          if iid in issue_names_dict
       ]
       blocked_on_issue_refs.extend(
           issue_objects_pb2.IssueRef(
@@ -367,9 +418,9 @@ class Converter(object):
           for blocked_on in issue.dangling_blocked_on_refs)
 
       blocking_issue_refs = [
-          issue_objects_pb2.IssueRef(issue=issue_names_by_ids[iid])
+          issue_objects_pb2.IssueRef(issue=issue_names_dict[iid])
           for iid in issue.blocking_iids
-          if iid in issue_names_by_ids
+          if iid in issue_names_dict
       ]
       blocking_issue_refs.extend(
           issue_objects_pb2.IssueRef(
@@ -387,7 +438,7 @@ class Converter(object):
           summary=issue.summary,
           state=content_state,
           status=status,
-          reporter=rnc.ConvertUserName(issue.reporter_id),
+          reporter=user_names[issue.reporter_id],
           owner=owner,
           cc_users=cc_users,
           labels=labels,
@@ -739,7 +790,14 @@ class Converter(object):
     field_ids = [fv.field_id for fv in field_values]
     resource_names_dict = rnc.ConvertFieldDefNames(
         self.cnxn, field_ids, project_id, self.services)
-
+    return self._ConvertFieldValues(
+        field_values, resource_names_dict, phase_names_by_id)
+
+  def _ConvertFieldValues(
+      self, field_values, resource_names_dict, phase_names_by_id):
+    # type: (Sequence[proto.tracker_pb2.FieldValue], Mapping[int, str],
+    #     Mapping[int, str]) -> Sequence[api_proto.issue_objects_pb2.FieldValue]
+    """Convert field_values using already looked up field and phase names."""
     api_fvs = []
     for fv in field_values:
       if fv.field_id not in resource_names_dict:
@@ -907,6 +965,9 @@ class Converter(object):
       fd = fds_by_id.get(fv.field_id)
       if fd and fd.approval_id:
         fvs_by_parent_approvals[fd.approval_id].append(fv)
+    fd_names_dict = rnc.ConvertFieldDefNames(
+        self.cnxn, [fv.field_id for fv in field_values], project_id,
+        self.services)
 
     api_avs = []
     for av in approval_values:
@@ -924,8 +985,9 @@ class Converter(object):
       setter = rnc.ConvertUserName(av.setter_id)
       phase = phase_names_by_id.get(av.phase_id)
 
-      field_values = self.ConvertFieldValues(
-          fvs_by_parent_approvals[av.approval_id], project_id, phases)
+      field_values = self._ConvertFieldValues(
+          fvs_by_parent_approvals[av.approval_id], fd_names_dict,
+          phase_names_by_id)
 
       api_item = issue_objects_pb2.ApprovalValue(
           name=name,
@@ -1121,6 +1183,12 @@ class Converter(object):
       do not represent enum field values.
     """
     config = self.services.config.GetProjectConfig(self.cnxn, project_id)
+    return self._ConvertLabelValues(labels, derived_labels, config)
+
+  def _ConvertLabelValues(self, labels, derived_labels, config):
+    # type: (Sequence[str], Sequence[str], proto.tracker_pb2.ProjectIssueConfig)
+    #     -> Sequence[api_proto.issue_objects_pb2.Issue.LabelValue]
+    """Convert labels to LabelValues using an already fetched config."""
     non_fd_labels, non_fd_der_labels = tbo.ExplicitAndDerivedNonMaskedLabels(
         labels, derived_labels, config)
     api_labels = []
@@ -1150,15 +1218,27 @@ class Converter(object):
       represent enum field values.
     """
     config = self.services.config.GetProjectConfig(self.cnxn, project_id)
-    enum_ids_by_name = {
+    enum_ids_by_name = self._GetEnumFieldIDsByName(config)
+    resource_names_dict = rnc.ConvertFieldDefNames(
+        self.cnxn, enum_ids_by_name.values(), project_id, self.services)
+    return self._ConvertEnumFieldValues(
+        labels, derived_labels, enum_ids_by_name, resource_names_dict)
+
+  def _GetEnumFieldIDsByName(self, config):
+    # type: (proto.tracker_pb2.ProjectIssueConfig) -> Mapping[str, int]
+    """Return the IDs of the enum fields in config keyed by lowercase name."""
+    return {
         fd.field_name.lower(): fd.field_id
         for fd in config.field_defs
         if fd.field_type is tracker_pb2.FieldTypes.ENUM_TYPE
         and not fd.is_deleted
     }
-    resource_names_dict = rnc.ConvertFieldDefNames(
-        self.cnxn, enum_ids_by_name.values(), project_id, self.services)
 
+  def _ConvertEnumFieldValues(
+      self, labels, derived_labels, enum_ids_by_name, resource_names_dict):
+    # type: (Sequence[str], Sequence[str], Mapping[str, int],
+    #     Mapping[int, str]) -> Sequence[api_proto.issue_objects_pb2.FieldValue]
+    """Convert enum labels using already looked up field IDs and names."""
     api_fvs = []
 
     labels_by_prefix = tbo.LabelsByPrefix(labels, enum_ids_by_name.keys())
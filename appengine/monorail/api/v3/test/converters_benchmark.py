@@ -0,0 +1,141 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+"""Benchmark for converting many issues to v3 API protos.
+
+We time converting each issue on its own, which does the per-issue lookups
+that ConvertIssues used to do, vs. converting the whole batch with one
+planned set of lookups.  We also count the calls made to the services.
+
+Usage: python api/v3/test/converters_benchmark.py [num_issues ...]
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import collections
+import random
+import sys
+import time
+
+from api.v3 import converters
+from framework import monorailcontext
+from proto import tracker_pb2
+from services import service_manager
+from testing import fake
+from tracker import tracker_bizobj
+
+
+NUM_PROJECTS = 3
+NUM_FIELDS = 20
+NUM_COMPONENTS = 30
+
+
+def MakeServices():
+  services = service_manager.Services(
+      issue=fake.IssueService(),
+      project=fake.ProjectService(),
+      usergroup=fake.UserGroupService(),
+      user=fake.UserService(),
+      config=fake.ConfigService(),
+      template=fake.TemplateService(),
+      features=fake.FeaturesService())
+  for project_id in range(1, NUM_PROJECTS + 1):
+    services.project.TestAddProject(
+        'proj%d' % project_id, project_id=project_id)
+    config = tracker_bizobj.MakeDefaultProjectIssueConfig(project_id)
+    for i in range(NUM_FIELDS):
+      field_type = (
+          tracker_pb2.FieldTypes.ENUM_TYPE if i % 4 == 0 else
+          tracker_pb2.FieldTypes.STR_TYPE)
+      config.field_defs.append(tracker_bizobj.MakeFieldDef(
+          project_id * 1000 + i, project_id, 'Field%d' % i, field_type,
+          None, '', False, False, False, None, None, '', False, '', '',
+          tracker_pb2.NotifyTriggers.NEVER, 'no_action', 'doc', False))
+    for i in range(NUM_COMPONENTS):
+      config.component_defs.append(tracker_bizobj.MakeComponentDef(
+          project_id * 1000 + i, project_id, 'Comp%d' % i, 'doc', False, [],
+          [], 0, 0))
+    services.config.StoreConfig('cnxn', config)
+  return services
+
+
+def MakeIssues(services, num_issues):
+  rand = random.Random(1)
+  issues = []
+  for i in range(num_issues):
+    project_id = rand.randint(1, NUM_PROJECTS)
+    issue = fake.MakeTestIssue(
+        project_id, i + 1, 'Summary %d' % i, 'New', rand.randint(1, 100),
+        reporter_id=rand.randint(1, 100), issue_id=100000 + i,
+        project_name='proj%d' % project_id,
+        labels=['Pri-2', 'Type-Bug', 'Field0-Value%d' % (i % 5)],
+        cc_ids=rand.sample(range(1, 100), 3),
+        component_ids=[project_id * 1000 + rand.randrange(NUM_COMPONENTS)])
+    issue.field_values = [
+        tracker_bizobj.MakeFieldValue(
+            project_id * 1000 + f, None, 'value %d' % f, None, None, None,
+            False)
+        for f in (1, 2, 3)]
+    if issues:
+      issue.blocked_on_iids = [rand.choice(issues).issue_id]
+    services.issue.TestAddIssue(issue)
+    issues.append(issue)
+  return issues
+
+
+def CountCalls(services):
+  """Wrap the service methods used by conversion so that calls are counted."""
+  counts = collections.Counter()
+
+  def Wrap(service, method_name):
+    method = getattr(service, method_name)
+    def Counted(*args, **kwargs):
+      counts[method_name] += 1
+      return method(*args, **kwargs)
+    setattr(service, method_name, Counted)
+
+  for method_name in ('GetProject', 'GetProjects'):
+    Wrap(services.project, method_name)
+  for method_name in ('GetProjectConfig', 'GetProjectConfigs'):
+    Wrap(services.config, method_name)
+  Wrap(services.issue, 'LookupIssueRefs')
+  return counts
+
+
+def TimeConversion(converter, counts, issues, one_at_a_time):
+  """Return ms per issue, service calls and the converted issues."""
+  counts.clear()
+  start = time.time()
+  if one_at_a_time:
+    converted = []
+    for issue in issues:
+      converted.extend(converter.ConvertIssues([issue]))
+  else:
+    converted = converter.ConvertIssues(issues)
+  elapsed_ms = (time.time() - start) * 1000
+  return elapsed_ms / len(issues), sum(counts.values()), converted
+
+
+def main(argv):
+  sizes = [int(arg) for arg in argv[1:]] or [1, 100, 1000]
+  for num_issues in sizes:
+    services = MakeServices()
+    issues = MakeIssues(services, num_issues)
+    counts = CountCalls(services)
+    mc = monorailcontext.MonorailContext(
+        services, cnxn=fake.MonorailConnection())
+    converter = converters.Converter(mc, services)
+    single_ms, single_calls, single_issues = TimeConversion(
+        converter, counts, issues, True)
+    batch_ms, batch_calls, batch_issues = TimeConversion(
+        converter, counts, issues, False)
+    assert single_issues == batch_issues
+    print('%5d issues: per issue %.3fms (%d service calls), '
+          'batched %.3fms (%d service calls)' % (
+              num_issues, single_ms, single_calls, batch_ms, batch_calls))
+
+
+if __name__ == '__main__':
+  main(sys.argv)
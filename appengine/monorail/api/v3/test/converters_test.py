@@ -754,6 +754,26 @@ class ConverterFunctionsTest(unittest.TestCase):
     self.assertEqual(
         self.converter.ConvertIssues(issues), [expected_1, expected_2])
 
+  def testConvertIssues_BatchesLookups(self):
+    """Issue names are looked up once, and configs once per project."""
+    issues = [self.issue_1, self.issue_2]
+    with patch.object(
+        self.services.issue, 'LookupIssueRefs',
+        wraps=self.services.issue.LookupIssueRefs) as lookup_refs, \
+        patch.object(
+            self.services.config, 'GetProjectConfigs',
+            wraps=self.services.config.GetProjectConfigs) as get_configs, \
+        patch.object(
+            self.services.config, 'GetProjectConfig',
+            wraps=self.services.config.GetProjectConfig) as get_config:
+      converted = self.converter.ConvertIssues(issues)
+    self.assertEqual(
+        ['projects/proj/issues/1', 'projects/goose/issues/2'],
+        [issue.name for issue in converted])
+    lookup_refs.assert_called_once()
+    get_configs.assert_called_once()
+    self.assertEqual(2, get_config.call_count)
+
   def testConvertIssues_Empty(self):
     """ConvertIssues works with no issues passed in."""
     self.assertEqual(self.converter.ConvertIssues([]), [])
@@ -3053,6 +3053,20 @@ class WorkEnvTest(unittest.TestCase):
       we.StarIssue(issue1, True)
       self.assertEqual([issue1.issue_id], we.ListStarredIssueIDs())
 
+  def testListStarredIssueIDsAmong(self):
+    """We can check which of some issues the user starred."""
+    issue1 = fake.MakeTestIssue(789, 1, 'sum1', 'New', 111, issue_id=78901)
+    self.services.issue.TestAddIssue(issue1)
+    issue2 = fake.MakeTestIssue(789, 2, 'sum2', 'New', 111, issue_id=78902)
+    self.services.issue.TestAddIssue(issue2)
+
+    self.SignIn(user_id=111)
+    with self.work_env as we:
+      we.StarIssue(issue1, True)
+      we.StarIssue(issue2, True)
+      self.assertEqual(
+          {issue2.issue_id}, we.ListStarredIssueIDsAmong([78902, 78903]))
+
   def testGetUser(self):
     """We return the User PB for the given existing user id."""
     expected = self.services.user.TestAddUser('test5@example.com', 555)
@@ -5006,7 +5020,8 @@ class WorkEnvTest(unittest.TestCase):
       with self.work_env as we:
         we.AddHotlistItems(hotlist.hotlist_id, [], 0)
 
-  def testAddHotlistItems(self):
+  @mock.patch('features.hotlist_helpers.EnqueueRebalanceIfNeeded')
+  def testAddHotlistItems(self, _fake_enqueue):
     """We add new items to the hotlist and don't touch existing items."""
     hotlist = self.createHotlistWithItems()
     self.SignIn(self.user_2.user_id)
@@ -5049,8 +5064,9 @@ class WorkEnvTest(unittest.TestCase):
       with self.work_env as we:
         we.RerankHotlistItems(hotlist.hotlist_id, moved_ids, target_position)
 
+  @mock.patch('features.hotlist_helpers.EnqueueRebalanceIfNeeded')
   @mock.patch('time.time')
-  def testRerankHotlistItems(self, fake_time):
+  def testRerankHotlistItems(self, fake_time, fake_enqueue):
     """We can rerank HotlistItems."""
     fake_time.return_value = self.PAST_TIME
     hotlist = self.createHotlistWithItems()
@@ -5064,6 +5080,9 @@ class WorkEnvTest(unittest.TestCase):
     expected_item_ids = [78902, 78901, 78903, 78904]
     self.assertEqual(
         expected_item_ids, [item.issue_id for item in updated_hotlist.items])
+    # The moved items now sit within a few ranks of their neighbours.
+    (_hotlist, changed_ranks), _kwargs = fake_enqueue.call_args
+    self.assertEqual([(78901, 16), (78903, 26)], changed_ranks)
 
   @mock.patch('time.time')
   def testGetChangedHotlistItems(self, fake_time):
@@ -5106,7 +5125,8 @@ class WorkEnvTest(unittest.TestCase):
 
   # TODO(crbug/monorail/7104): Remove these tests once RerankHotlistIssues
   # is deleted.
-  def testRerankHotlistIssues_SplitAbove(self):
+  @mock.patch('features.hotlist_helpers.EnqueueRebalanceIfNeeded')
+  def testRerankHotlistIssues_SplitAbove(self, _fake_enqueue):
     """We can rerank issues in a hotlist with split_above = true."""
     owner_ids = [self.user_1.user_id]
     editor_ids = [self.user_2.user_id]
@@ -5133,7 +5153,8 @@ class WorkEnvTest(unittest.TestCase):
           [item.issue_id for item in updated_hotlist.items],
           [78902, 78903, 78901, 78904])
 
-  def testRerankHotlistIssues_SplitBelow(self):
+  @mock.patch('features.hotlist_helpers.EnqueueRebalanceIfNeeded')
+  def testRerankHotlistIssues_SplitBelow(self, _fake_enqueue):
     """We can rerank issues in a hotlist with split_above = false."""
     owner_ids = [self.user_1.user_id]
     editor_ids = [self.user_2.user_id]
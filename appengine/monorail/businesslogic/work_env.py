@@ -1627,7 +1627,8 @@ class WorkEnv(object):
 
     with self.mc.profiler.Phase('getting comments for %r' % issue_id):
       issue = self.GetIssue(issue_id)
-      comments = self.services.issue.GetCommentsForIssue(self.mc.cnxn, issue_id)
+      comments, total_count = self.services.issue.GetCommentsForIssuePage(
+          self.mc.cnxn, issue_id, start, max_items)
       _, comment_reporters = self.LookupIssueFlaggers(issue)
       users_involved_in_comments = tracker_bizobj.UsersInvolvedInCommentList(
           comments)
@@ -1649,7 +1650,7 @@ class WorkEnv(object):
     end = start + max_items
     filtered_comments = []
     with self.mc.profiler.Phase('converting comments'):
-      for comment in comments[start:end]:
+      for comment in comments:
         commenter = users_by_id[comment.user_id]
 
         _can_flag, is_flagged = permissions.CanFlagComment(
@@ -1683,7 +1684,7 @@ class WorkEnv(object):
             filtered_comment.inbound_message = comment.inbound_message
         filtered_comments.append(filtered_comment)
     next_start = None
-    if end < len(comments):
+    if end < total_count:
       next_start = end
     return ListResult(filtered_comments, next_start)
 
@@ -1756,6 +1757,12 @@ class WorkEnv(object):
       return self.services.issue_star.LookupStarredItemIDs(
           self.mc.cnxn, self.mc.auth.user_id)
 
+  def ListStarredIssueIDsAmong(self, issue_ids):
+    """Return the set of the given issue IDs that the current user starred."""
+    with self.mc.profiler.Phase('getting stars %r' % self.mc.auth.user_id):
+      return self.services.issue_star.LookupStarredItemIDsAmong(
+          self.mc.cnxn, self.mc.auth.user_id, issue_ids)
+
   def SnapshotCountsQuery(self, project, timestamp, group_by, label_prefix=None,
                           query=None, canned_query=None, hotlist=None):
     """Query IssueSnapshots for daily counts.
@@ -2848,6 +2855,8 @@ class WorkEnv(object):
       self.services.features.UpdateHotlistIssues(
           self.mc.cnxn, hotlist_id, changed_items, [], self.services.issue,
           self.services.chart)
+      hotlist_helpers.EnqueueRebalanceIfNeeded(
+          hotlist, [(item.issue_id, item.rank) for item in changed_items])
 
   def RerankHotlistItems(self, hotlist_id, moved_issue_ids, target_position):
     # type: (int, list(int), int) -> Hotlist
@@ -2894,6 +2903,8 @@ class WorkEnv(object):
       self.services.features.UpdateHotlistIssues(
           self.mc.cnxn, hotlist_id, changed_items, [], self.services.issue,
           self.services.chart)
+      hotlist_helpers.EnqueueRebalanceIfNeeded(
+          hotlist, [(item.issue_id, item.rank) for item in changed_items])
 
     return self.GetHotlist(hotlist.hotlist_id)
 
@@ -2975,6 +2986,7 @@ class WorkEnv(object):
             issue_id: rank for issue_id, rank in rank_changes}
         self.services.features.UpdateHotlistItemsFields(
             self.mc.cnxn, hotlist_id, new_ranks=relations_to_change)
+        hotlist_helpers.EnqueueRebalanceIfNeeded(hotlist, rank_changes)
 
   def UpdateHotlistIssueNote(self, hotlist_id, issue_id, note):
     """Update the given issue of the given hotlist with the given note.
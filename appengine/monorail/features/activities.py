@@ -216,7 +216,7 @@ def GatherUpdatesData(
       content_list.append(activity.content)
 
     all_ref_artifacts = autolink.GetAllReferencedArtifacts(
-        mr, content_list)
+        mr, content_list, comment_ids=[activity.id for activity in comments])
 
   # Now process content and gather activities
   today = []
@@ -31,6 +31,8 @@ from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
 
+import collections
+import hashlib
 import logging
 import re
 import urllib
@@ -49,6 +51,8 @@ _MAX_TOTAL_LENGTH = 150 * 1024  # 150KB
 # Special all_referenced_artifacts value used to indicate that the
 # text content is too big to lookup all referenced artifacts quickly.
 SKIP_LOOKUPS = 'skip lookups'
+# Max number of comments whose extracted references are kept in RAM.
+_REFS_CACHE_MAX_SIZE = 10000
 
 _CLOSING_TAG_RE = re.compile('</[a-z0-9]+>$', re.IGNORECASE)
 
@@ -452,8 +456,13 @@ def _ReplaceSingleIssueRef(
 class Autolink(object):
   """Maintains a registry of autolink syntax and can apply it to comments."""
 
-  def __init__(self):
+  def __init__(self, refs_cache_max_size=_REFS_CACHE_MAX_SIZE):
     self.registry = {}
+    # {(comment_id, content_hash): {component_name: refs}} for recently
+    # scanned comments, oldest first.  This lives as long as the process.
+    self.refs_cache = collections.OrderedDict()
+    self.refs_cache_max_size = refs_cache_max_size
+    self._scanners = None
 
   def RegisterComponent(self, component_name, artifact_lookup_function,
                         match_to_reference_function, autolink_re_subst_dict):
@@ -465,8 +474,11 @@ class Autolink(object):
           might have been referenced in a set of comments:
           function(all_matches) -> referenced_artifacts
           the referenced_artifacts will be pased to each subst function.
+          Components that register the same function share one lookup.
       match_to_reference_function: convert a regex match object to
-          some internal representation of the artifact reference.
+          some internal representation of the artifact reference.  The
+          result must depend only on the matched text because it is cached.
+          None if the component never needs to look up artifacts.
       autolink_re_subst_dict: dictionary of regular expressions and
           the substitution function that should be called for each match:
           function(match, referenced_artifacts) -> replacement_markup
@@ -474,9 +486,52 @@ class Autolink(object):
     self.registry[component_name] = (artifact_lookup_function,
                                      match_to_reference_function,
                                      autolink_re_subst_dict)
+    self._scanners = None
+    self.refs_cache.clear()
+
+  def _GetScanners(self):
+    """Return [(component_name, regex, match_to_refs)] for reference lookups.
+
+    Components without a match_to_reference_function are left out so that
+    their regexes are only run when the text is marked up.
+    """
+    if self._scanners is None:
+      self._scanners = [
+          (comp, regex, match_to_refs)
+          for comp, (_lookup, match_to_refs, re_dict)
+          in sorted(self.registry.items())
+          if match_to_refs is not None
+          for regex in re_dict]
+    return self._scanners
+
+  def _ScanComment(self, mr, comment_text):
+    """Return {component_name: refs} found in one comment's text."""
+    refs_by_comp = {}
+    for comp, regex, match_to_refs in self._GetScanners():
+      for match in regex.finditer(comment_text):
+        additional_refs = match_to_refs(mr, match)
+        if additional_refs:
+          refs_by_comp.setdefault(comp, set()).update(additional_refs)
+    return refs_by_comp
+
+  def _GetCommentRefs(self, mr, comment_id, comment_text):
+    """Return {component_name: refs} for a comment, scanning it if needed."""
+    content = comment_text
+    if isinstance(content, unicode):
+      content = content.encode('utf-8')
+    key = (comment_id, hashlib.md5(content).hexdigest())
+    refs_by_comp = self.refs_cache.pop(key, None)
+    if refs_by_comp is None:
+      refs_by_comp = self._ScanComment(mr, comment_text)
+    # Re-adding the key marks it as the most recently used.
+    self.refs_cache[key] = refs_by_comp
+    while len(self.refs_cache) > self.refs_cache_max_size:
+      self.refs_cache.popitem(last=False)
+    return refs_by_comp
 
   def GetAllReferencedArtifacts(
-      self, mr, comment_text_list, max_total_length=_MAX_TOTAL_LENGTH):
+      self, mr, comment_text_list, max_total_length=_MAX_TOTAL_LENGTH,
+      comment_ids=None):
     """Call callbacks to lookup all artifacts possibly referenced.
 
     Args:
@@ -484,6 +539,8 @@ class Autolink(object):
       comment_text_list: list of comment content strings.
       max_total_length: int max number of characters to accept:
           if more than this, then skip autolinking entirely.
+      comment_ids: optional list of comment IDs parallel to comment_text_list,
+          used along with a hash of the content to cache extracted references.
 
     Returns:
       Opaque object that can be pased to MarkupAutolinks.  It's
@@ -494,18 +551,26 @@ class Autolink(object):
     if total_len > max_total_length:
       return SKIP_LOOKUPS
 
-    all_referenced_artifacts = {}
-    for comp, (lookup, match_to_refs, re_dict) in self.registry.items():
-      refs = set()
-      for comment_text in comment_text_list:
-        for regex in re_dict:
-          for match in regex.finditer(comment_text):
-            additional_refs = match_to_refs(mr, match)
-            if additional_refs:
-              refs.update(additional_refs)
-
-      all_referenced_artifacts[comp] = lookup(mr, refs)
-
+    comment_ids = comment_ids or [None] * len(comment_text_list)
+    refs_by_comp = collections.defaultdict(set)
+    for comment_id, comment_text in zip(comment_ids, comment_text_list):
+      for comp, refs in self._GetCommentRefs(
+          mr, comment_id, comment_text).items():
+        refs_by_comp[comp].update(refs)
+
+    # Components that share a lookup function, like the two issue reference
+    # syntaxes, get all of their references looked up in one batch.
+    refs_by_lookup = collections.defaultdict(set)
+    for comp, (lookup, _match_to_refs, _re_dict) in self.registry.items():
+      refs_by_lookup[lookup].update(refs_by_comp[comp])
+    artifacts_by_lookup = {
+        lookup: lookup(mr, refs) if refs else None
+        for lookup, refs in refs_by_lookup.items()}
+
+    all_referenced_artifacts = {
+        comp: artifacts_by_lookup[lookup]
+        for comp, (lookup, _match_to_refs, _re_dict)
+        in self.registry.items()}
     return all_referenced_artifacts
 
   def MarkupAutolinks(self, mr, text_runs, all_referenced_artifacts):
@@ -583,16 +648,20 @@ def RegisterAutolink(services):
   # Priority order of application is determined by the names of the registered
   # handers, which are sorted in MarkupAutolinks().
 
+  # Both issue reference syntaxes share one lookup so that the open and
+  # closed state of all referenced issues is resolved in a single batch.
+  get_referenced_issues = CurryGetReferencedIssues(services)
+
   services.autolink.RegisterComponent(
       '01-tracker-crbug',
-      CurryGetReferencedIssues(services),
+      get_referenced_issues,
       ExtractProjectAndIssueIdsCrBug,
       {_CRBUG_REF_RE: ReplaceIssueRefCrBug})
 
   services.autolink.RegisterComponent(
       '02-linkify-full-urls',
       lambda request, mr: None,
-      lambda mr, match: None,
+      None,
       {autolink_constants.IS_A_LINK_RE: Linkify})
 
   services.autolink.RegisterComponent(
@@ -603,14 +672,14 @@ def RegisterAutolink(services):
 
   services.autolink.RegisterComponent(
       '04-tracker-regular',
-      CurryGetReferencedIssues(services),
+      get_referenced_issues,
       ExtractProjectAndIssueIdsNormal,
       {_ISSUE_REF_RE: ReplaceIssueRefNormal})
 
   services.autolink.RegisterComponent(
       '05-linkify-shorthand',
       lambda request, mr: None,
-      lambda mr, match: None,
+      None,
       {autolink_constants.IS_A_SHORT_LINK_RE: Linkify,
        autolink_constants.IS_A_NUMERIC_SHORT_LINK_RE: Linkify,
        autolink_constants.IS_IMPLIED_LINK_RE: Linkify,
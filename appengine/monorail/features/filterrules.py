@@ -20,19 +20,28 @@ class RecomputeDerivedFieldsTask(jsonfeed.InternalTask):
 
   def HandleRequest(self, mr):
     """Recompute derived field values on one range of issues in a shard."""
+    run_id = mr.GetIntParam('run_id')
     logging.info(
-        'params are %r %r %r %r', mr.specified_project_id, mr.lower_bound,
-        mr.upper_bound, mr.shard_id)
+        'params are %r %r %r %r %r', mr.specified_project_id, mr.lower_bound,
+        mr.upper_bound, mr.shard_id, run_id)
     project = self.services.project.GetProject(
         mr.cnxn, mr.specified_project_id)
     config = self.services.config.GetProjectConfig(
         mr.cnxn, mr.specified_project_id)
-    filterrules_helpers.RecomputeAllDerivedFieldsNow(
-        mr.cnxn, self.services, project, config, lower_bound=mr.lower_bound,
-        upper_bound=mr.upper_bound)
+    if run_id is None:
+      # Tasks enqueued before runs were tracked.
+      filterrules_helpers.RecomputeAllDerivedFieldsNow(
+          mr.cnxn, self.services, project, config, lower_bound=mr.lower_bound,
+          upper_bound=mr.upper_bound)
+      progress = None
+    else:
+      progress = filterrules_helpers.RecomputeWorkUnit(
+          mr.cnxn, self.services, project, config, run_id, mr.lower_bound,
+          mr.upper_bound, shard_id=mr.shard_id or 0)
 
     return {
         'success': True,
+        'progress': progress,
         }
 
 
@@ -8,13 +8,17 @@ from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
 
+import collections
+import heapq
 import logging
 import re
+import time
 
 import six
 
 from six import string_types
 
+from google.appengine.api import memcache
 from google.appengine.api import taskqueue
 
 import settings
@@ -40,6 +44,21 @@ MAX_RULES = 200
 
 BLOCK = tracker_constants.RECOMPUTE_DERIVED_FIELDS_BLOCK_SIZE
 
+# Number of issues that are loaded, updated, and committed together when
+# recomputing derived fields.
+RECOMPUTE_BATCH_SIZE = 100
+
+# A recompute task stops starting new batches after this many seconds and
+# re-enqueues itself to continue from its checkpoint.  This stays well
+# within the 10 minute task request deadline.
+RECOMPUTE_TASK_TIME_BUDGET_SEC = 5 * framework_constants.SECS_PER_MINUTE
+
+# Recompute progress and checkpoints are kept in memcache for this long.
+RECOMPUTE_PROGRESS_EXPIRATION_SEC = framework_constants.SECS_PER_DAY
+
+# Maximum number of projects whose RuleIndex is kept in RAM.
+MAX_CACHED_RULE_INDEXES = 1000
+
 
 # TODO(jrobbins): implement a more efficient way to update just those
 # issues affected by a specific component change.
@@ -62,25 +81,151 @@ def RecomputeAllDerivedFields(cnxn, services, project, config):
   if highest_id == 0:
     return  # No work to do.
 
-  # Enqueue work items for blocks of issues to recompute.
+  # A new run supersedes any run that is still in progress for this project,
+  # because it will recompute every issue with the latest rules.
+  run_id = int(time.time() * 1000)
   steps = list(range(1, highest_id + 1, BLOCK))
+  _StartRecomputeRun(project.project_id, run_id, len(steps), highest_id)
+
+  # Enqueue work items for blocks of issues to recompute.
   steps.reverse()  # Update higher numbered issues sooner, old issues last.
   # Cycle through shard_ids just to load-balance among the replicas.  Each
   # block includes all issues in that local_id range, not just 1/10 of them.
   shard_id = 0
   for step in steps:
-    params = {
-      'project_id': project.project_id,
-      'lower_bound': step,
-      'upper_bound': min(step + BLOCK, highest_id + 1),
-      'shard_id': shard_id,
-      }
-    logging.info('adding task with params %r', params)
-    taskqueue.add(
-      url=urls.RECOMPUTE_DERIVED_FIELDS_TASK + '.do', params=params)
+    _EnqueueRecomputeTask(
+        project.project_id, run_id, step, min(step + BLOCK, highest_id + 1),
+        shard_id)
     shard_id = (shard_id + 1) % settings.num_logical_shards
 
 
+def _EnqueueRecomputeTask(
+    project_id, run_id, lower_bound, upper_bound, shard_id):
+  """Add a task to recompute derived fields on one block of issues."""
+  params = {
+    'project_id': project_id,
+    'lower_bound': lower_bound,
+    'upper_bound': upper_bound,
+    'shard_id': shard_id,
+    'run_id': run_id,
+    }
+  logging.info('adding task with params %r', params)
+  taskqueue.add(
+    url=urls.RECOMPUTE_DERIVED_FIELDS_TASK + '.do', params=params)
+
+
+def _RecomputeRunKey(project_id):
+  return 'recompute_run:%d' % project_id
+
+
+def _RecomputeCounterKey(project_id, run_id, what):
+  return 'recompute_%s:%d:%d' % (what, project_id, run_id)
+
+
+def _RecomputeCheckpointKey(project_id, run_id, lower_bound):
+  return 'recompute_checkpoint:%d:%d:%d' % (project_id, run_id, lower_bound)
+
+
+def _StartRecomputeRun(project_id, run_id, total_units, total_issues):
+  """Record the size of a new run so that progress can be reported."""
+  run = {
+      'run_id': run_id,
+      'total_units': total_units,
+      'total_issues': total_issues,
+      'started': time.time(),
+      }
+  memcache.set(
+      _RecomputeRunKey(project_id), run,
+      time=RECOMPUTE_PROGRESS_EXPIRATION_SEC)
+  for what in ('units', 'issues'):
+    memcache.set(
+        _RecomputeCounterKey(project_id, run_id, what), 0,
+        time=RECOMPUTE_PROGRESS_EXPIRATION_SEC)
+
+
+def GetRecomputeProgress(project_id, now=None):
+  """Return a dict describing the latest recompute run, or None.
+
+  The dict has the run's total and completed work units and issues, and
+  eta_sec, the estimated number of seconds until the run is done based on
+  the rate so far.  eta_sec is None until some issues have been processed.
+  """
+  run = memcache.get(_RecomputeRunKey(project_id))
+  if not run:
+    return None
+  run_id = run['run_id']
+  units_done = memcache.get(
+      _RecomputeCounterKey(project_id, run_id, 'units')) or 0
+  issues_done = memcache.get(
+      _RecomputeCounterKey(project_id, run_id, 'issues')) or 0
+  total_issues = run['total_issues']
+  elapsed = max(0, (now or time.time()) - run['started'])
+  eta_sec = None
+  if units_done >= run['total_units']:
+    eta_sec = 0
+  elif issues_done:
+    eta_sec = int(elapsed * (total_issues - issues_done) / issues_done)
+  return {
+      'run_id': run_id,
+      'units_done': units_done,
+      'total_units': run['total_units'],
+      'issues_done': issues_done,
+      'total_issues': total_issues,
+      'elapsed_sec': int(elapsed),
+      'eta_sec': eta_sec,
+      }
+
+
+def RecomputeWorkUnit(
+    cnxn, services, project, config, run_id, lower_bound, upper_bound,
+    shard_id=0):
+  """Recompute one block of issues as part of a run, resuming if needed.
+
+  The local ID of the next batch is checkpointed after each batch is
+  committed, so a retried task does not redo finished batches.  If the
+  task's time budget runs out, it enqueues a task for the same block that
+  continues from the checkpoint.
+
+  Returns:
+    The progress dict of the run, or None if it is not known.
+  """
+  project_id = project.project_id
+  run = memcache.get(_RecomputeRunKey(project_id))
+  if run and run['run_id'] > run_id:
+    logging.info('Skipping block of superseded run %r', run_id)
+    return GetRecomputeProgress(project_id)
+
+  checkpoint_key = _RecomputeCheckpointKey(project_id, run_id, lower_bound)
+  start = memcache.get(checkpoint_key) or lower_bound
+  deadline = time.time() + RECOMPUTE_TASK_TIME_BUDGET_SEC
+  rules = services.features.GetFilterRules(cnxn, project_id)
+  rule_index = GetRuleIndex(project_id, rules, config)
+  for batch_start in range(start, upper_bound, RECOMPUTE_BATCH_SIZE):
+    if time.time() > deadline:
+      logging.info('Out of time, continuing from %r', batch_start)
+      _EnqueueRecomputeTask(
+          project_id, run_id, lower_bound, upper_bound, shard_id)
+      return GetRecomputeProgress(project_id)
+    batch_end = min(batch_start + RECOMPUTE_BATCH_SIZE, upper_bound)
+    _RecomputeBatch(
+        cnxn, services, project, config, rules, rule_index,
+        batch_start, batch_end)
+    memcache.set(
+        checkpoint_key, batch_end, time=RECOMPUTE_PROGRESS_EXPIRATION_SEC)
+    memcache.incr(
+        _RecomputeCounterKey(project_id, run_id, 'issues'),
+        delta=batch_end - batch_start, initial_value=0)
+
+  # Count each block once, even if its task is retried after finishing.
+  if memcache.add(
+      checkpoint_key + ':done', True, time=RECOMPUTE_PROGRESS_EXPIRATION_SEC):
+    memcache.incr(
+        _RecomputeCounterKey(project_id, run_id, 'units'), initial_value=0)
+  progress = GetRecomputeProgress(project_id)
+  logging.info('Recompute progress: %r', progress)
+  return progress
+
+
 def RecomputeAllDerivedFieldsNow(
     cnxn, services, project, config, lower_bound=None, upper_bound=None):
   """Re-apply all filter rules to all issues in a project.
@@ -96,29 +241,48 @@ def RecomputeAllDerivedFieldsNow(
   SIDE-EFFECT: updates all issues in the project. Stores and re-indexes
   all those that were changed.
   """
-  if lower_bound is not None and upper_bound is not None:
-    issues = services.issue.GetIssuesByLocalIDs(
-        cnxn, project.project_id, list(range(lower_bound, upper_bound)),
-        use_cache=False)
-  else:
-    issues = services.issue.GetAllIssuesInProject(
-        cnxn, project.project_id, use_cache=False)
+  if lower_bound is None or upper_bound is None:
+    lower_bound = 1
+    upper_bound = services.issue.GetHighestLocalID(
+        cnxn, project.project_id) + 1
 
   rules = services.features.GetFilterRules(cnxn, project.project_id)
-  predicate_asts = ParsePredicateASTs(rules, config, [])
+  rule_index = GetRuleIndex(project.project_id, rules, config)
+  for batch_start in range(lower_bound, upper_bound, RECOMPUTE_BATCH_SIZE):
+    batch_end = min(batch_start + RECOMPUTE_BATCH_SIZE, upper_bound)
+    _RecomputeBatch(
+        cnxn, services, project, config, rules, rule_index,
+        batch_start, batch_end)
+
+
+def _RecomputeBatch(
+    cnxn, services, project, config, rules, rule_index, batch_start,
+    batch_end):
+  """Re-apply rules to one batch of issues and store the changed ones.
+
+  Issues whose derived values come out the same are not written.
+
+  Returns:
+    The number of issues that were changed.
+  """
+  issues = services.issue.GetIssuesByLocalIDs(
+      cnxn, project.project_id, list(range(batch_start, batch_end)),
+      use_cache=False)
   modified_issues = []
   for issue in issues:
     any_change, _traces = ApplyGivenRules(
-        cnxn, services, issue, config, rules, predicate_asts)
+        cnxn, services, issue, config, rules, rule_index.predicate_asts,
+        rule_index=rule_index)
     if any_change:
       modified_issues.append(issue)
 
-  services.issue.UpdateIssues(cnxn, modified_issues, just_derived=True)
-
-  # Doing the FTS indexing can be too slow, so queue up the issues
-  # that need to be re-indexed by a cron-job later.
-  services.issue.EnqueueIssuesForIndexing(
-      cnxn, [issue.issue_id for issue in modified_issues])
+  if modified_issues:
+    services.issue.UpdateIssues(cnxn, modified_issues, just_derived=True)
+    # Doing the FTS indexing can be too slow, so queue up the issues
+    # that need to be re-indexed by a cron-job later.
+    services.issue.EnqueueIssuesForIndexing(
+        cnxn, [issue.issue_id for issue in modified_issues])
+  return len(modified_issues)
 
 
 def ParsePredicateASTs(rules, config, me_user_ids):
@@ -134,6 +298,139 @@ def ParsePredicateASTs(rules, config, me_user_ids):
   return predicate_asts
 
 
+class RuleIndex(object):
+  """Parsed filter rule predicates, indexed by what an issue must have.
+
+  Most rules test for a label, component, or owner.  A rule is indexed by
+  the values of one such positive term in each OR-clause of its predicate,
+  because the rule cannot match an issue that has none of those values.
+  Other rules are always evaluated.
+  """
+
+  def __init__(self, predicate_asts, config):
+    self.predicate_asts = predicate_asts
+    self.unindexed = []
+    self.by_label = collections.defaultdict(list)
+    self.label_substrings = []  # [(lower_substring, rule_num), ...]
+    self.by_component_id = collections.defaultdict(list)
+    self.by_owner_id = collections.defaultdict(list)
+    self._rule_nums_by_label = {}
+
+    for rule_num, predicate_ast in enumerate(predicate_asts):
+      conj_keys = [
+          _GetConjunctionIndexKeys(conj, config)
+          for conj in predicate_ast.conjunctions]
+      if None in conj_keys:
+        self.unindexed.append(rule_num)
+        continue
+      for keys in conj_keys:
+        for kind, value in keys:
+          if kind == 'label':
+            self.by_label[value].append(rule_num)
+          elif kind == 'label_substring':
+            self.label_substrings.append((value, rule_num))
+          elif kind == 'component':
+            self.by_component_id[value].append(rule_num)
+          else:
+            self.by_owner_id[value].append(rule_num)
+
+  def GetRuleNumsForLabel(self, lower_label):
+    """Return the numbers of rules that could match an issue with the label."""
+    rule_nums = self._rule_nums_by_label.get(lower_label)
+    if rule_nums is None:
+      rule_nums = self.by_label.get(lower_label, []) + [
+          rule_num for substring, rule_num in self.label_substrings
+          if substring in lower_label]
+      self._rule_nums_by_label[lower_label] = rule_nums
+    return rule_nums
+
+  def GetCandidateRuleNums(self, issue, label_set):
+    """Return numbers of rules that could match the issue, maybe repeated."""
+    rule_nums = list(self.unindexed)
+    for lower_label in label_set:
+      rule_nums.extend(self.GetRuleNumsForLabel(lower_label))
+    for component_id in issue.component_ids:
+      rule_nums.extend(self.by_component_id.get(component_id, []))
+    rule_nums.extend(self.by_owner_id.get(issue.owner_id, []))
+    return rule_nums
+
+
+# Kinds of index keys, from the kind that usually matches the fewest issues.
+INDEX_KEY_KINDS = ['owner', 'component', 'label', 'label_substring']
+
+
+def _GetConjunctionIndexKeys(conj, config):
+  """Return [(kind, value), ...] that an issue needs to satisfy conj.
+
+  Returns None if the conjunction has no term that can be indexed.
+  """
+  best_keys = None
+  best_kind_num = len(INDEX_KEY_KINDS)
+  for cond in conj.conds:
+    keys = _GetCondIndexKeys(cond, config)
+    if keys is None:
+      continue
+    # E.g., for "Type=Bug component:UI" index the rule by the component.
+    kind_num = max([INDEX_KEY_KINDS.index(kind) for kind, _ in keys] or [-1])
+    if kind_num < best_kind_num:
+      best_keys, best_kind_num = keys, kind_num
+  return best_keys
+
+
+def _GetCondIndexKeys(cond, config):
+  """Return [(kind, value), ...] with one of which cond can be True."""
+  if len(cond.field_defs) != 1:
+    return None
+  field = cond.field_defs[0].field_name
+  op = cond.op
+  if op not in (ast_pb2.QueryOp.EQ, ast_pb2.QueryOp.TEXT_HAS):
+    return None
+
+  if field == 'label':
+    if op == ast_pb2.QueryOp.EQ:
+      return [('label', value) for value in cond.str_values]
+    return [('label_substring', value.lower()) for value in cond.str_values]
+
+  if field == 'component':
+    component_ids = set()
+    for path in cond.str_values:
+      component_ids.update(tracker_bizobj.FindMatchingComponentIDs(
+          path, config, exact=(op == ast_pb2.QueryOp.EQ)))
+    return [('component', component_id) for component_id in component_ids]
+
+  if field == 'owner':
+    try:
+      return [
+          ('owner', int(value))
+          for value in (cond.str_values or cond.int_values)]
+    except ValueError:
+      return None  # Email addresses are compared when the rule is evaluated.
+
+  return None
+
+
+def GetRuleIndex(project_id, rules, config):
+  """Return a RuleIndex of the rules, reusing one made for the same config.
+
+  Configs are replaced rather than modified when they change, so a RuleIndex
+  is reused only while the same config object and rule predicates are used.
+  """
+  predicates = tuple(rule.predicate for rule in rules)
+  cached = _rule_index_cache.get(project_id)
+  if cached and cached[0] is config and cached[1] == predicates:
+    return cached[2]
+
+  rule_index = RuleIndex(ParsePredicateASTs(rules, config, []), config)
+  if len(_rule_index_cache) >= MAX_CACHED_RULE_INDEXES:
+    _rule_index_cache.clear()
+  _rule_index_cache[project_id] = (config, predicates, rule_index)
+  return rule_index
+
+
+# {project_id: (config, predicates, rule_index)}
+_rule_index_cache = {}
+
+
 def ApplyFilterRules(cnxn, services, issue, config):
   """Apply the filter rules for this project to the given issue.
 
@@ -152,11 +449,14 @@ def ApplyFilterRules(cnxn, services, issue, config):
   SIDE-EFFECT: update the derived_* fields of the Issue PB.
   """
   rules = services.features.GetFilterRules(cnxn, issue.project_id)
-  predicate_asts = ParsePredicateASTs(rules, config, [])
-  return ApplyGivenRules(cnxn, services, issue, config, rules, predicate_asts)
+  rule_index = GetRuleIndex(issue.project_id, rules, config)
+  return ApplyGivenRules(
+      cnxn, services, issue, config, rules, rule_index.predicate_asts,
+      rule_index=rule_index)
 
 
-def ApplyGivenRules(cnxn, services, issue, config, rules, predicate_asts):
+def ApplyGivenRules(
+    cnxn, services, issue, config, rules, predicate_asts, rule_index=None):
   """Apply the filter rules for this project to the given issue.
 
   Args:
@@ -165,6 +465,9 @@ def ApplyGivenRules(cnxn, services, issue, config, rules, predicate_asts):
     issue: An Issue PB that has just been updated with new explicit values.
     config: The project's issue tracker config PB.
     rules: list of FilterRule PBs.
+    predicate_asts: QueryAST PB for each rule.
+    rule_index: optional RuleIndex of predicate_asts used to skip rules that
+      cannot match the issue.
 
   Returns:
     A pair (any_changes, traces) where any_changes is true if any changes
@@ -177,7 +480,8 @@ def ApplyGivenRules(cnxn, services, issue, config, rules, predicate_asts):
   (derived_owner_id, derived_status, derived_cc_ids,
    derived_labels, derived_notify_addrs, traces,
    new_warnings, new_errors) = _ComputeDerivedFields(
-       cnxn, services, issue, config, rules, predicate_asts)
+       cnxn, services, issue, config, rules, predicate_asts,
+       rule_index=rule_index)
 
   any_change = (derived_owner_id != issue.derived_owner_id or
                 derived_status != issue.derived_status or
@@ -197,7 +501,8 @@ def ApplyGivenRules(cnxn, services, issue, config, rules, predicate_asts):
   return any_change, traces
 
 
-def _ComputeDerivedFields(cnxn, services, issue, config, rules, predicate_asts):
+def _ComputeDerivedFields(
+    cnxn, services, issue, config, rules, predicate_asts, rule_index=None):
   """Compute derived field values for an issue based on filter rules.
 
   Args:
@@ -207,6 +512,7 @@ def _ComputeDerivedFields(cnxn, services, issue, config, rules, predicate_asts):
     config: ProjectIssueConfig for the project containing the issue.
     rules: list of FilterRule PBs.
     predicate_asts: QueryAST PB for each rule.
+    rule_index: optional RuleIndex of predicate_asts.
 
   Returns:
     A 8-tuple of derived values for owner_id, status, cc_ids, labels,
@@ -276,7 +582,8 @@ def _ComputeDerivedFields(cnxn, services, issue, config, rules, predicate_asts):
   # Later rules can overwrite or add to results of earlier rules.
   # TODO(jrobbins): also pass in in-progress values for owner and CCs so
   # that early rules that set those can affect later rules that check them.
-  for rule, predicate_ast in zip(rules, predicate_asts):
+  for rule, predicate_ast in _IterRulesToApply(
+      rules, predicate_asts, rule_index, issue, label_set):
     (rule_owner_id, rule_status, rule_add_cc_ids,
      rule_add_labels, rule_add_notify, rule_add_warning,
      rule_add_error) = _ApplyRule(
@@ -328,6 +635,36 @@ def _ComputeDerivedFields(cnxn, services, issue, config, rules, predicate_asts):
           derived_notify_addrs, traces, new_warnings, new_errors)
 
 
+def _IterRulesToApply(rules, predicate_asts, rule_index, issue, label_set):
+  """Yield (rule, predicate_ast) for each rule that might match, in order.
+
+  label_set grows as rules add labels, so rules that test for an added label
+  are considered after the rule that added it.
+  """
+  if rule_index is None:
+    for rule, predicate_ast in zip(rules, predicate_asts):
+      yield rule, predicate_ast
+    return
+
+  rule_nums = rule_index.GetCandidateRuleNums(issue, label_set)
+  heapq.heapify(rule_nums)
+  seen_labels = set(label_set)
+  last_rule_num = -1
+  while rule_nums:
+    rule_num = heapq.heappop(rule_nums)
+    if rule_num <= last_rule_num:
+      continue  # A rule can be indexed by more than one value.
+    last_rule_num = rule_num
+    yield rules[rule_num], predicate_asts[rule_num]
+
+    added_labels = label_set - seen_labels
+    seen_labels.update(added_labels)
+    for lower_label in added_labels:
+      for later_rule_num in rule_index.GetRuleNumsForLabel(lower_label):
+        if later_rule_num > rule_num:
+          heapq.heappush(rule_nums, later_rule_num)
+
+
 def EvalPredicate(
     cnxn, services, predicate_ast, issue, label_set, config, owner_id, cc_ids,
     status):
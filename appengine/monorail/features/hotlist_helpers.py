@@ -11,6 +11,8 @@ from __future__ import absolute_import
 import logging
 import collections
 
+from google.appengine.api import taskqueue
+
 from features import features_constants
 from framework import framework_views
 from framework import framework_helpers
@@ -20,6 +22,7 @@ from framework import timestr
 from framework import paginate
 from framework import permissions
 from framework import urls
+from tracker import rerank_helpers
 from tracker import tracker_bizobj
 from tracker import tracker_constants
 from tracker import tracker_helpers
@@ -126,8 +129,9 @@ def GetSortedHotlistIssues(
 def CreateHotlistTableData(mr, hotlist_issues, services):
   """Creates the table data for the hotlistissues table."""
   with mr.profiler.Phase('getting stars'):
-    starred_iid_set = set(services.issue_star.LookupStarredItemIDs(
-        mr.cnxn, mr.auth.user_id))
+    starred_iid_set = services.issue_star.LookupStarredItemIDsAmong(
+        mr.cnxn, mr.auth.user_id,
+        [hotlist_issue.issue_id for hotlist_issue in hotlist_issues])
 
   with mr.profiler.Phase('Computing col_spec'):
     mr.ComputeColSpec(mr.hotlist)
@@ -259,6 +263,7 @@ def FilterIssues(cnxn, auth, can, issues, services):
   perms_by_project_id = {
       pid: permissions.GetPermissions(auth.user_pb, auth.effective_ids, p)
       for pid, p in issue_projects.items()}
+  evaluator = permissions.PermissionEvaluator()
   for issue in issues:
     if (can == 1) or not issue.closed_timestamp:
       issue_project = issue_projects[issue.project_id]
@@ -266,7 +271,7 @@ def FilterIssues(cnxn, auth, can, issues, services):
       perms = perms_by_project_id[issue.project_id]
       granted_perms = tracker_bizobj.GetGrantedPerms(
           issue, auth.effective_ids, config)
-      permit_view = permissions.CanViewIssue(
+      permit_view = evaluator.CanViewIssue(
           auth.effective_ids, perms,
           issue_project, issue, granted_perms=granted_perms)
       if permit_view:
@@ -369,6 +374,19 @@ def RemoveHotlist(cnxn, hotlist_id, services):
   services.features.DeleteHotlist(cnxn, hotlist_id)
 
 
+def EnqueueRebalanceIfNeeded(hotlist, changed_ranks):
+  """Queue a task to rebalance the hotlist if the change crowds its issues.
+
+  Args:
+    hotlist: Hotlist PB, before the change.
+    changed_ranks: A list of [(issue_id, rank), ...] that will be stored.
+  """
+  if rerank_helpers.NeedsRebalance(hotlist.items, changed_ranks):
+    params = {'hotlist_id': hotlist.hotlist_id}
+    logging.info('adding rebalance-hotlist task with params %r', params)
+    taskqueue.add(url=urls.REBALANCE_HOTLIST_TASK + '.do', params=params)
+
+
 # The following are used by issueentry.
 
 def InvalidParsedHotlistRefsNames(parsed_hotlist_refs, user_hotlist_pbs):
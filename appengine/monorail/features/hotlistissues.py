@@ -284,8 +284,9 @@ class HotlistIssues(servlet.Servlet):
       Dictionary of page data for rendering of the Table View.
     """
     mr.ComputeColSpec(mr.hotlist)
-    starred_iid_set = set(self.services.issue_star.LookupStarredItemIDs(
-        mr.cnxn, mr.auth.user_id))
+    starred_iid_set = self.services.issue_star.LookupStarredItemIDsAmong(
+        mr.cnxn, mr.auth.user_id,
+        [hotlist_issue.issue_id for hotlist_issue in mr.hotlist.items])
     issues_list = self.services.issue.GetIssues(
         mr.cnxn,
         [hotlist_issue.issue_id for hotlist_issue
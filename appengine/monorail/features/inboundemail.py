@@ -61,7 +61,7 @@ class InboundEmail(webapp2.RequestHandler):
     self.services = services or self.app.config.get('services')
     self._templates = {}
     for name, template_path in MSG_TEMPLATES.items():
-      self._templates[name] = template_helpers.MonorailTemplate(
+      self._templates[name] = template_helpers.GetTemplate(
           TEMPLATE_PATH_BASE + template_path,
           compress_whitespace=False, base_format=ezt.FORMAT_RAW)
 
@@ -198,10 +198,8 @@ class NotifyIssueChangeTask(notify_helpers.NotifyTaskBase):
     omit_addrs = set([commenter_email] +
                      [users_by_id[omit_id].email for omit_id in omit_ids])
 
-    auth = authdata.AuthData.FromUserID(
-        cnxn, comment.user_id, self.services)
-    commenter_in_project = framework_bizobj.UserIsInProject(
-        project, auth.effective_ids)
+    planner = notify_reasons.NotificationPlanner(cnxn, self.services)
+    commenter_in_project = planner.IsMember(comment.user_id, project)
     noisy = tracker_helpers.IsNoisy(len(all_comments) - 1, len(starrer_ids))
 
     # Give each user a bullet-list of all the reasons that apply for that user.
@@ -209,7 +207,8 @@ class NotifyIssueChangeTask(notify_helpers.NotifyTaskBase):
         cnxn, self.services, project, issue, config, users_by_id,
         omit_addrs, contributor_could_view, noisy=noisy,
         starrer_ids=starrer_ids, old_owner_id=old_owner_id,
-        commenter_in_project=commenter_in_project)
+        commenter_in_project=commenter_in_project, planner=planner)
+    planner.RecordMetrics('issue_change')
 
     commenter_view = users_by_id[comment.user_id]
     detail_url = framework_helpers.FormatAbsoluteURLForDomain(
@@ -279,13 +278,16 @@ class NotifyBlockingChangeTask(notify_helpers.NotifyTaskBase):
 
     tasks = []
     if send_email:
+      # The same users are often involved in many of the upstream issues.
+      planner = notify_reasons.NotificationPlanner(mr.cnxn, self.services)
       for upstream_issue in upstream_issues:
         one_issue_email_tasks = self._ProcessUpstreamIssue(
             mr.cnxn, upstream_issue,
             upstream_projects[upstream_issue.project_id],
             upstream_configs[upstream_issue.project_id],
-            issue, omit_ids, hostport, commenter_view)
+            issue, omit_ids, hostport, commenter_view, planner=planner)
         tasks.extend(one_issue_email_tasks)
+      planner.RecordMetrics('blocking_change')
 
     notified = notify_helpers.AddAllEmailTasks(tasks)
 
@@ -296,7 +298,7 @@ class NotifyBlockingChangeTask(notify_helpers.NotifyTaskBase):
 
   def _ProcessUpstreamIssue(
       self, cnxn, upstream_issue, upstream_project, upstream_config,
-      issue, omit_ids, hostport, commenter_view):
+      issue, omit_ids, hostport, commenter_view, planner=None):
     """Compute notifications for one upstream issue that is now blocking."""
     upstream_detail_url = framework_helpers.FormatAbsoluteURLForDomain(
         hostport, upstream_issue.project_name, urls.ISSUE_DETAIL,
@@ -346,7 +348,8 @@ class NotifyBlockingChangeTask(notify_helpers.NotifyTaskBase):
     # Starrers are not notified of blocking changes to reduce noise.
     group_reason_list = notify_reasons.ComputeGroupReasonList(
         cnxn, self.services, upstream_project, upstream_issue,
-        upstream_config, users_by_id, omit_addrs, contributor_could_view)
+        upstream_config, users_by_id, omit_addrs, contributor_could_view,
+        planner=planner)
     one_issue_email_tasks = notify_helpers.MakeBulletedEmailWorkItems(
         group_reason_list, upstream_issue, body_link_only, body, body,
         upstream_project, hostport, commenter_view, detail_url)
@@ -399,16 +402,16 @@ class NotifyBulkChangeTask(notify_helpers.NotifyTaskBase):
     issues = [issue for issue in issues if not issue.is_spam]
     anon_perms = permissions.GetPermissions(None, set(), project)
 
-    users_by_id = framework_views.MakeAllUserViews(
-        mr.cnxn, self.services.user, [commenter_id])
     ids_in_issues = {}
     starrers = {}
+    ids_needing_views = {commenter_id}
+    starrers_by_issue_id = self.services.issue_star.LookupItemsStarrers(
+        mr.cnxn, [issue.issue_id for issue in issues])
 
     non_private_issues = []
     for issue, old_owner_id in zip(issues, old_owner_ids):
       # TODO(jrobbins): use issue_id consistently rather than local_id.
-      starrers[issue.local_id] = self.services.issue_star.LookupItemStarrers(
-          mr.cnxn, issue.issue_id)
+      starrers[issue.local_id] = starrers_by_issue_id.get(issue.issue_id, [])
       named_ids = set()  # users named in user-value fields that notify.
       for fd in config.field_defs:
         named_ids.update(notify_reasons.ComputeNamedUserIDsToNotify(
@@ -420,20 +423,16 @@ class NotifyBulkChangeTask(notify_helpers.NotifyTaskBase):
       ids_in_issues[issue.local_id] = set(starrers[issue.local_id])
       ids_in_issues[issue.local_id].update(direct)
       ids_in_issues[issue.local_id].update(indirect)
-      ids_in_issue_needing_views = (
-          ids_in_issues[issue.local_id] |
-          tracker_bizobj.UsersInvolvedInIssues([issue]))
-      new_ids_in_issue = [user_id for user_id in ids_in_issue_needing_views
-                          if user_id not in users_by_id]
-      users_by_id.update(
-          framework_views.MakeAllUserViews(
-              mr.cnxn, self.services.user, new_ids_in_issue))
+      ids_needing_views.update(ids_in_issues[issue.local_id])
+      ids_needing_views.update(tracker_bizobj.UsersInvolvedInIssues([issue]))
 
       anon_can_view = permissions.CanViewIssue(
           set(), anon_perms, project, issue)
       if anon_can_view:
         non_private_issues.append(issue)
 
+    users_by_id = framework_views.MakeAllUserViews(
+        mr.cnxn, self.services.user, ids_needing_views)
     commenter_view = users_by_id[commenter_id]
     omit_addrs = {commenter_view.email}
 
@@ -465,10 +464,12 @@ class NotifyBulkChangeTask(notify_helpers.NotifyTaskBase):
     ids_to_notify_of_issue = {}
     additional_addrs_to_notify_of_issue = collections.defaultdict(list)
 
+    # Load each user that could be notified just once for all the issues.
+    planner = notify_reasons.NotificationPlanner(cnxn, self.services)
+    planner.Prefetch(set().union(*ids_in_issues.values()))
     users_to_queries = notify_reasons.GetNonOmittedSubscriptions(
         cnxn, self.services, [project.project_id], {})
-    config = self.services.config.GetProjectConfig(
-        cnxn, project.project_id)
+    config = planner.GetConfig(project.project_id)
     for issue, old_owner_id in zip(issues, old_owner_ids):
       issue_participants = set(
           [tracker_bizobj.GetOwnerId(issue), old_owner_id] +
@@ -478,25 +479,16 @@ class NotifyBulkChangeTask(notify_helpers.NotifyTaskBase):
         issue_participants.update(
             notify_reasons.ComputeNamedUserIDsToNotify(issue.field_values, fd))
       for user_id in ids_in_issues[issue.local_id]:
-        # TODO(jrobbins): implement batch GetUser() for speed.
         if not user_id:
           continue
-        auth = authdata.AuthData.FromUserID(
-            cnxn, user_id, self.services)
+        auth = planner.GetAuth(user_id)
         if (auth.user_pb.notify_issue_change and
             not auth.effective_ids.isdisjoint(issue_participants)):
           ids_to_notify_of_issue.setdefault(user_id, []).append(issue)
         elif (auth.user_pb.notify_starred_issue_change and
               user_id in starrers[issue.local_id]):
           # Skip users who have starred issues that they can no longer view.
-          starrer_perms = permissions.GetPermissions(
-              auth.user_pb, auth.effective_ids, project)
-          granted_perms = tracker_bizobj.GetGrantedPerms(
-              issue, auth.effective_ids, config)
-          starrer_can_view = permissions.CanViewIssue(
-              auth.effective_ids, starrer_perms, project, issue,
-              granted_perms=granted_perms)
-          if starrer_can_view:
+          if planner.CanViewIssue(user_id, project, issue):
             ids_to_notify_of_issue.setdefault(user_id, []).append(issue)
         logging.info(
             'ids_to_notify_of_issue[%s] = %s',
@@ -506,16 +498,9 @@ class NotifyBulkChangeTask(notify_helpers.NotifyTaskBase):
       # Find all subscribers that should be notified.
       subscribers_to_consider = notify_reasons.EvaluateSubscriptions(
           cnxn, issue, users_to_queries, self.services, config)
+      planner.Prefetch(subscribers_to_consider)
       for sub_id in subscribers_to_consider:
-        auth = authdata.AuthData.FromUserID(cnxn, sub_id, self.services)
-        sub_perms = permissions.GetPermissions(
-            auth.user_pb, auth.effective_ids, project)
-        granted_perms = tracker_bizobj.GetGrantedPerms(
-            issue, auth.effective_ids, config)
-        sub_can_view = permissions.CanViewIssue(
-            auth.effective_ids, sub_perms, project, issue,
-            granted_perms=granted_perms)
-        if sub_can_view:
+        if planner.CanViewIssue(sub_id, project, issue):
           ids_to_notify_of_issue.setdefault(sub_id, [])
           if issue not in ids_to_notify_of_issue[sub_id]:
             ids_to_notify_of_issue[sub_id].append(issue)
@@ -537,8 +522,6 @@ class NotifyBulkChangeTask(notify_helpers.NotifyTaskBase):
     member_additional_addrs = {}
     non_member_additional_addrs = {}
     addr_to_addrperm = {}  # {email_address: AddrPerm object}
-    all_user_prefs = self.services.user.GetUsersPrefs(
-        cnxn, ids_to_notify_of_issue)
 
     # TODO(jrobbins): Merge ids_to_notify_of_issue entries for linked accounts.
 
@@ -551,10 +534,7 @@ class NotifyBulkChangeTask(notify_helpers.NotifyTaskBase):
       user_issues = ids_to_notify_of_issue[user_id]
       if not user_issues:
         continue  # user's prefs indicate they don't want these notifications
-      auth = authdata.AuthData.FromUserID(
-          cnxn, user_id, self.services)
-      is_member = bool(framework_bizobj.UserIsInProject(
-          project, auth.effective_ids))
+      is_member = planner.IsMember(user_id, project)
       if is_member:
         member_ids_to_notify_of_issue[user_id] = user_issues
       else:
@@ -563,7 +543,7 @@ class NotifyBulkChangeTask(notify_helpers.NotifyTaskBase):
       omit_addrs.add(addr)
       addr_to_addrperm[addr] = notify_reasons.AddrPerm(
           is_member, addr, users_by_id[user_id].user,
-          notify_reasons.REPLY_NOT_ALLOWED, all_user_prefs[user_id])
+          notify_reasons.REPLY_NOT_ALLOWED, planner.GetUserPrefs(user_id))
 
     for addr, addr_issues in additional_addrs_to_notify_of_issue.items():
       auth = None
@@ -650,6 +630,7 @@ class NotifyBulkChangeTask(notify_helpers.NotifyTaskBase):
                      project.issue_notify_address,
                      [issue.local_id for issue in non_private_issues])
 
+    planner.RecordMetrics('bulk_change')
     return email_tasks
 
   def _FormatBulkIssuesEmail(
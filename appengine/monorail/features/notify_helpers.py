@@ -131,12 +131,12 @@ class NotifyTaskBase(jsonfeed.InternalTask):
                       ' This class must not be called directly.')
     # We use FORMAT_RAW for emails because they are plain text, not HTML.
     # TODO(jrobbins): consider sending HTML formatted emails someday.
-    self.email_template = template_helpers.MonorailTemplate(
+    self.email_template = template_helpers.GetTemplate(
         framework_constants.TEMPLATE_PATH + self._EMAIL_TEMPLATE,
         compress_whitespace=False, base_format=ezt.FORMAT_RAW)
 
     if self._LINK_ONLY_EMAIL_TEMPLATE:
-      self.link_only_email_template = template_helpers.MonorailTemplate(
+      self.link_only_email_template = template_helpers.GetTemplate(
           framework_constants.TEMPLATE_PATH + self._LINK_ONLY_EMAIL_TEMPLATE,
           compress_whitespace=False, base_format=ezt.FORMAT_RAW)
 
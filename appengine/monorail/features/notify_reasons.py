@@ -11,6 +11,8 @@ from __future__ import absolute_import
 import collections
 import logging
 
+from infra_libs import ts_mon
+
 import settings
 from features import filterrules_helpers
 from features import savedqueries_helpers
@@ -61,11 +63,119 @@ REASON_LINKED_ACCOUNT = 'Your linked account would have been notified'
 AddrPerm = collections.namedtuple(
     'AddrPerm', 'is_member, address, user, reply_perm, user_prefs')
 
+RECIPIENT_LOOKUPS = ts_mon.CounterMetric(
+    'monorail/notify/recipient_lookups',
+    'Count of possible notification recipients whose user info was loaded.',
+    [ts_mon.StringField('task')])
+
+RECIPIENT_LOOKUPS_SAVED = ts_mon.CounterMetric(
+    'monorail/notify/recipient_lookups_saved',
+    'Count of times that a recipient\'s already loaded user info was reused.',
+    [ts_mon.StringField('task')])
+
+
+class NotificationPlanner(object):
+  """Looks up each possible recipient once for a whole set of changes.
+
+  Deciding whether to notify a user of an issue change needs their User PB,
+  effective IDs, prefs, and permissions in the issue's project.  A planner
+  loads those in bulk for all the user IDs given to Prefetch() and keeps
+  them, so a task that considers many issues and reasons does not look up
+  the same user again for each one.
+  """
+
+  def __init__(self, cnxn, services):
+    self.cnxn = cnxn
+    self.services = services
+    self.auths = {}  # {user_id: AuthData}
+    self.user_prefs = {}  # {user_id: UserPrefs}
+    self.perms = {}  # {(user_id, project_id): PermissionSet}
+    self.configs = {}  # {project_id: ProjectIssueConfig}
+    self.num_lookups = 0  # Number of users whose info was loaded.
+    # Number of recipient decisions, i.e., calls to GetAuth().
+    self.num_requests = 0
+
+  def Prefetch(self, user_ids):
+    """Load info for any of the given users that is not loaded yet."""
+    needed_ids = list({
+        user_id for user_id in user_ids
+        if user_id and user_id not in self.auths})
+    if not needed_ids:
+      return
+    self.auths.update(authdata.AuthData.FromUserIDs(
+        self.cnxn, needed_ids, self.services))
+    all_user_prefs = self.services.user.GetUsersPrefs(self.cnxn, needed_ids)
+    self.user_prefs.update(
+        (user_id, all_user_prefs[user_id]) for user_id in needed_ids)
+    self.num_lookups += len(needed_ids)
+
+  def GetAuth(self, user_id):
+    """Return the AuthData for the given user.
+
+    Callers call this once when they start deciding whether to notify a
+    user, so each call counts as one request.  The planner's own methods
+    use _GetAuth() so that they do not count the same decision again.
+    """
+    if user_id:
+      self.num_requests += 1
+    return self._GetAuth(user_id)
+
+  def _GetAuth(self, user_id):
+    if not user_id:
+      return authdata.AuthData()
+    self.Prefetch([user_id])
+    return self.auths[user_id]
+
+  def GetUserPrefs(self, user_id):
+    self.Prefetch([user_id])
+    return self.user_prefs[user_id]
+
+  def GetConfig(self, project_id):
+    if project_id not in self.configs:
+      self.configs[project_id] = self.services.config.GetProjectConfig(
+          self.cnxn, project_id)
+    return self.configs[project_id]
+
+  def GetPerms(self, user_id, project):
+    """Return the PermissionSet of the given user in the given project."""
+    key = (user_id, project.project_id)
+    if key not in self.perms:
+      auth = self._GetAuth(user_id)
+      self.perms[key] = permissions.GetPermissions(
+          auth.user_pb, auth.effective_ids, project)
+    return self.perms[key]
+
+  def CanViewIssue(self, user_id, project, issue):
+    """Return True if the given user may view the given issue."""
+    auth = self._GetAuth(user_id)
+    perms = self.GetPerms(user_id, project)
+    granted_perms = tracker_bizobj.GetGrantedPerms(
+        issue, auth.effective_ids, self.GetConfig(project.project_id))
+    return permissions.CanViewIssue(
+        auth.effective_ids, perms, project, issue,
+        granted_perms=granted_perms)
+
+  def IsMember(self, user_id, project):
+    auth = self._GetAuth(user_id)
+    return bool(framework_bizobj.UserIsInProject(
+        project, auth.effective_ids))
+
+  def RecordMetrics(self, task_name):
+    """Report how many user lookups were done and how many were avoided."""
+    num_saved = max(0, self.num_requests - self.num_lookups)
+    logging.info(
+        'Notification planner loaded %d users and reused them %d times',
+        self.num_lookups, num_saved)
+    fields = {'task': task_name}
+    RECIPIENT_LOOKUPS.increment_by(self.num_lookups, fields)
+    RECIPIENT_LOOKUPS_SAVED.increment_by(num_saved, fields)
+
 
 
 def ComputeIssueChangeAddressPermList(
     cnxn, ids_to_consider, project, issue, services, omit_addrs,
-    users_by_id, pref_check_function=lambda u: u.notify_issue_change):
+    users_by_id, pref_check_function=lambda u: u.notify_issue_change,
+    planner=None):
   """Return a list of user email addresses to notify of an issue change.
 
   User email addresses are determined by looking up the given user IDs
@@ -84,32 +194,28 @@ def ComputeIssueChangeAddressPermList(
         User PB has a preference set to receive the email being sent.  It
         defaults to "If I am in the issue's owner or cc field", but it
         can be set to check "If I starred the issue."
+    planner: optional NotificationPlanner that has user info that was
+        already loaded.
 
   Returns:
     A list of AddrPerm objects.
   """
   memb_addr_perm_list = []
   logging.info('Considering %r ', ids_to_consider)
-  all_user_prefs = services.user.GetUsersPrefs(cnxn, ids_to_consider)
+  planner = planner or NotificationPlanner(cnxn, services)
+  planner.Prefetch(ids_to_consider)
   for user_id in ids_to_consider:
     if user_id == framework_constants.NO_USER_SPECIFIED:
       continue
-    user = services.user.GetUser(cnxn, user_id)
+    auth = planner.GetAuth(user_id)
+    user = auth.user_pb
     # Notify people who have a pref set, or if they have no User PB
     # because the pref defaults to True.
     if user and not pref_check_function(user):
       logging.info('Not notifying %r: user preference', user.email)
       continue
-    # TODO(jrobbins): doing a bulk operation would reduce DB load.
-    auth = authdata.AuthData.FromUserID(cnxn, user_id, services)
-    perms = permissions.GetPermissions(user, auth.effective_ids, project)
-    config = services.config.GetProjectConfig(cnxn, project.project_id)
-    granted_perms = tracker_bizobj.GetGrantedPerms(
-        issue, auth.effective_ids, config)
-
-    if not permissions.CanViewIssue(
-        auth.effective_ids, perms, project, issue,
-        granted_perms=granted_perms):
+    perms = planner.GetPerms(user_id, project)
+    if not planner.CanViewIssue(user_id, project, issue):
       logging.info('Not notifying %r: user cannot view issue', user.email)
       continue
 
@@ -118,8 +224,7 @@ def ComputeIssueChangeAddressPermList(
       logging.info('Not notifying %r: user already knows', user.email)
       continue
 
-    recipient_is_member = bool(framework_bizobj.UserIsInProject(
-        project, auth.effective_ids))
+    recipient_is_member = planner.IsMember(user_id, project)
 
     reply_perm = REPLY_NOT_ALLOWED
     if project.process_inbound_email:
@@ -131,7 +236,7 @@ def ComputeIssueChangeAddressPermList(
 
     memb_addr_perm_list.append(
       AddrPerm(recipient_is_member, addr, user, reply_perm,
-               all_user_prefs[user_id]))
+               planner.GetUserPrefs(user_id)))
 
   logging.info('For %s %s, will notify: %r',
                project.project_name, issue.local_id,
@@ -203,7 +308,8 @@ def ComputeIssueNotificationAddrList(cnxn, services, issue, omit_addrs):
 
 
 def _GetSubscribersAddrPermList(
-    cnxn, services, issue, project, config, omit_addrs, users_by_id):
+    cnxn, services, issue, project, config, omit_addrs, users_by_id,
+    planner=None):
   """Lookup subscribers, evaluate their saved queries, and decide to notify."""
   users_to_queries = GetNonOmittedSubscriptions(
       cnxn, services, [project.project_id], omit_addrs)
@@ -217,7 +323,7 @@ def _GetSubscribersAddrPermList(
       cnxn, services.user, subs_needing_user_views))
   sub_addr_perm_list = ComputeIssueChangeAddressPermList(
       cnxn, subscribers_to_notify, project, issue, services, omit_addrs,
-      users_by_id, pref_check_function=lambda *args: True)
+      users_by_id, pref_check_function=lambda *args: True, planner=planner)
 
   return sub_addr_perm_list
 
@@ -265,7 +371,8 @@ def GetNonOmittedSubscriptions(cnxn, services, project_ids, omit_addrs):
 
 
 def ComputeCustomFieldAddrPerms(
-    cnxn, config, issue, project, services, omit_addrs, users_by_id):
+    cnxn, config, issue, project, services, omit_addrs, users_by_id,
+    planner=None):
   """Check the reasons to notify users named in custom fields."""
   group_reason_list = []
   for fd in config.field_defs:
@@ -273,7 +380,7 @@ def ComputeCustomFieldAddrPerms(
     if named_user_ids:
       named_addr_perms = ComputeIssueChangeAddressPermList(
           cnxn, named_user_ids, project, issue, services, omit_addrs,
-          users_by_id, pref_check_function=lambda u: True)
+          users_by_id, pref_check_function=lambda u: True, planner=planner)
       group_reason_list.append(
           (named_addr_perms, 'You are named in the %s field' % fd.field_name))
 
@@ -291,7 +398,8 @@ def ComputeNamedUserIDsToNotify(field_values, fd):
 
 
 def ComputeComponentFieldAddrPerms(
-    cnxn, config, issue, project, services, omit_addrs, users_by_id):
+    cnxn, config, issue, project, services, omit_addrs, users_by_id,
+    planner=None):
   """Return [(addr_perm_list, reason),...] for users auto-cc'd by components."""
   component_ids = set(issue.component_ids)
   group_reason_list = []
@@ -300,7 +408,7 @@ def ComputeComponentFieldAddrPerms(
       cc_ids = component_helpers.GetCcIDsForComponentAndAncestors(config, cd)
       comp_addr_perms = ComputeIssueChangeAddressPermList(
           cnxn, cc_ids, project, issue, services, omit_addrs,
-          users_by_id, pref_check_function=lambda u: True)
+          users_by_id, pref_check_function=lambda u: True, planner=planner)
       group_reason_list.append(
           (comp_addr_perms,
            'You are auto-CC\'d on all issues in component %s' % cd.path))
@@ -313,8 +421,10 @@ def ComputeGroupReasonList(
     contributor_could_view, starrer_ids=None, noisy=False,
     old_owner_id=None, commenter_in_project=True, include_subscribers=True,
     include_notify_all=True,
-    starrer_pref_check_function=lambda u: u.notify_starred_issue_change):
+    starrer_pref_check_function=lambda u: u.notify_starred_issue_change,
+    planner=None):
   """Return a list [(addr_perm_list, reason),...] of addrs to notify."""
+  planner = planner or NotificationPlanner(cnxn, services)
   # Get the transitive set of owners and Cc'd users, and their UserViews.
   starrer_ids = starrer_ids or []
   reporter = [issue.reporter_id] if issue.reporter_id in starrer_ids else []
@@ -341,30 +451,36 @@ def ComputeGroupReasonList(
   users_by_id.update(framework_views.MakeAllUserViews(
       cnxn, services.user, transitive_owners, der_transitive_owners,
       direct_comp, trans_comp, transitive_ccs, der_transitive_ccs))
+  planner.Prefetch(
+      reporter + old_direct_owners + old_transitive_owners + direct_owners +
+      transitive_owners + der_direct_owners + der_transitive_owners +
+      direct_ccs + transitive_ccs + der_direct_ccs + der_transitive_ccs +
+      starrer_ids[-settings.max_starrers_to_notify:])
 
   # Notify interested people according to the reason for their interest:
   # owners, component auto-cc'd users, cc'd users, starrers, and
   # other notification addresses.
   reporter_addr_perm_list = ComputeIssueChangeAddressPermList(
-      cnxn, reporter, project, issue, services, omit_addrs, users_by_id)
+      cnxn, reporter, project, issue, services, omit_addrs, users_by_id,
+      planner=planner)
   owner_addr_perm_list = ComputeIssueChangeAddressPermList(
       cnxn, direct_owners + transitive_owners, project, issue,
-      services, omit_addrs, users_by_id)
+      services, omit_addrs, users_by_id, planner=planner)
   old_owner_addr_perm_list = ComputeIssueChangeAddressPermList(
       cnxn, old_direct_owners + old_transitive_owners, project, issue,
-      services, omit_addrs, users_by_id)
+      services, omit_addrs, users_by_id, planner=planner)
   owner_addr_perm_set = set(owner_addr_perm_list)
   old_owner_addr_perm_list = [ap for ap in old_owner_addr_perm_list
                               if ap not in owner_addr_perm_set]
   der_owner_addr_perm_list = ComputeIssueChangeAddressPermList(
       cnxn, der_direct_owners + der_transitive_owners, project, issue,
-      services, omit_addrs, users_by_id)
+      services, omit_addrs, users_by_id, planner=planner)
   cc_addr_perm_list = ComputeIssueChangeAddressPermList(
       cnxn, direct_ccs + transitive_ccs, project, issue,
-      services, omit_addrs, users_by_id)
+      services, omit_addrs, users_by_id, planner=planner)
   der_cc_addr_perm_list = ComputeIssueChangeAddressPermList(
       cnxn, der_direct_ccs + der_transitive_ccs, project, issue,
-      services, omit_addrs, users_by_id)
+      services, omit_addrs, users_by_id, planner=planner)
 
   starrer_addr_perm_list = []
   sub_addr_perm_list = []
@@ -378,12 +494,13 @@ def ComputeGroupReasonList(
         ComputeIssueChangeAddressPermList(
             cnxn, starrer_ids, project, issue,
             services, omit_addrs, users_by_id,
-            pref_check_function=starrer_pref_check_function))
+            pref_check_function=starrer_pref_check_function,
+            planner=planner))
 
     if include_subscribers:
       sub_addr_perm_list = _GetSubscribersAddrPermList(
           cnxn, services, issue, project, config, omit_addrs,
-          users_by_id)
+          users_by_id, planner=planner)
 
   # Get the list of addresses to notify based on filter rules.
   issue_notify_addr_list = ComputeIssueNotificationAddrList(
@@ -404,10 +521,10 @@ def ComputeGroupReasonList(
     ]
   group_reason_list.extend(ComputeComponentFieldAddrPerms(
       cnxn, config, issue, project, services, omit_addrs,
-      users_by_id))
+      users_by_id, planner=planner))
   group_reason_list.extend(ComputeCustomFieldAddrPerms(
       cnxn, config, issue, project, services, omit_addrs,
-      users_by_id))
+      users_by_id, planner=planner))
   group_reason_list.extend([
       (starrer_addr_perm_list, REASON_STARRER),
       (sub_addr_perm_list, REASON_SUBSCRIBER),
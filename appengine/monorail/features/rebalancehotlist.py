@@ -0,0 +1,44 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Task to space out the ranks of the issues in a hotlist.
+
+Reranking gives new ranks only to the moved issues when there is room
+between their new neighbours.  Once a move leaves issues crowded together,
+a task is queued to spread out the ranks of the whole hotlist, so that later
+moves do not have to rerank the neighbouring issues while a user waits.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import logging
+
+from framework import jsonfeed
+from services import features_svc
+from tracker import rerank_helpers
+
+
+class RebalanceHotlistTask(jsonfeed.InternalTask):
+  """Space out the ranks of all issues in a hotlist, keeping their order."""
+
+  def HandleRequest(self, mr):
+    hotlist_id = mr.GetPositiveIntParam('hotlist_id')
+    try:
+      hotlist = self.services.features.GetHotlist(
+          mr.cnxn, hotlist_id, use_cache=False)
+    except features_svc.NoSuchHotlistException:
+      logging.info('hotlist %r was deleted', hotlist_id)
+      return {'reranked': 0}
+
+    new_ranks = dict(rerank_helpers.GetRebalanceChanges(hotlist.items))
+    if new_ranks:
+      self.services.features.UpdateHotlistItemsFields(
+          mr.cnxn, hotlist_id, new_ranks=new_ranks)
+
+    return {
+        'reranked': len(new_ranks),
+        }
@@ -44,6 +44,7 @@ class RerankHotlistIssue(jsonfeed.JsonFeed):
 
       self.services.features.UpdateHotlistItemsFields(
           mr.cnxn, mr.hotlist_id, new_ranks=relations_to_change)
+      hotlist_helpers.EnqueueRebalanceIfNeeded(mr.hotlist, changed_ranks)
 
       hotlist_items = self.services.features.GetHotlist(
           mr.cnxn, mr.hotlist_id).items
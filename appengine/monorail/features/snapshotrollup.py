@@ -0,0 +1,72 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Cron and task handlers that keep daily rollups of issue snapshot counts.
+
+Each night the cron handler spawns one task per project, and each task rolls
+up every day that ended since that project was last rolled up.  Charts can
+then read the counts at the end of each day without scanning IssueSnapshot.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import logging
+import time
+
+from google.appengine.api import taskqueue
+
+import settings
+
+from framework import framework_constants
+from framework import jsonfeed
+from framework import urls
+
+
+class SnapshotRollupCron(jsonfeed.InternalTask):
+  """Spawn a task to roll up the issue snapshots of each project."""
+
+  def HandleRequest(self, mr):
+    if not settings.chart_snapshot_rollups:
+      return
+    for project_id in sorted(self.services.project.GetAllProjects(mr.cnxn)):
+      self.EnqueueSnapshotRollup(project_id)
+
+  def EnqueueSnapshotRollup(self, project_id):
+    params = {'project_id': project_id}
+    logging.info('adding snapshot-rollup task with params %r', params)
+    taskqueue.add(url=urls.SNAPSHOT_ROLLUP_TASK + '.do', params=params)
+
+
+class SnapshotRollupTask(jsonfeed.InternalTask):
+  """Roll up the issue snapshots of one project for each day that ended."""
+
+  def HandleRequest(self, mr):
+    project_id = mr.GetPositiveIntParam('project_id')
+    last_day_end = _GetLastDayEnd(int(time.time()))
+    _since, through = self.services.chart.GetRollUpStatus(mr.cnxn, project_id)
+    if through:
+      day_end = through + framework_constants.SECS_PER_DAY
+    else:
+      # Earlier days are left to the raw snapshot queries.
+      day_end = last_day_end
+
+    rolled_up = []
+    while (day_end <= last_day_end and
+           len(rolled_up) < settings.chart_snapshot_rollup_max_days):
+      self.services.chart.RollUpIssueSnapshots(mr.cnxn, project_id, day_end)
+      rolled_up.append(day_end)
+      day_end += framework_constants.SECS_PER_DAY
+
+    return {
+        'rolled_up': rolled_up,
+        }
+
+
+def _GetLastDayEnd(now):
+  """Return the timestamp of the last second of the last UTC day that ended."""
+  return (now // framework_constants.SECS_PER_DAY *
+          framework_constants.SECS_PER_DAY) - 1
@@ -93,6 +93,62 @@ class AutolinkTest(unittest.TestCase):
 
     self.assertEqual(autolink.SKIP_LOOKUPS, all_ref_artifacts)
 
+  def testGetAllReferencedArtifacts_CachesExtractedRefs(self):
+    scanned = []
+
+    def Match2Domains(_mr, match):
+      scanned.append(match.group(0))
+      return [match.group(0)]
+
+    self.aa.RegisterComponent(
+        'testcomp2', lambda _mr, refs: refs, Match2Domains,
+        {OVER_AMBITIOUS_DOMAIN_RE: None})
+    first = self.aa.GetAllReferencedArtifacts(
+        None, self.comments, comment_ids=[1, 2, 3])
+    num_scanned = len(scanned)
+    second = self.aa.GetAllReferencedArtifacts(
+        None, self.comments, comment_ids=[1, 2, 3])
+
+    self.assertEqual(first, second)
+    self.assertEqual(num_scanned, len(scanned))
+    self.assertEqual(3, len(self.aa.refs_cache))
+
+    # Edited comments are scanned again.
+    self.aa.GetAllReferencedArtifacts(
+        None, ['see d@example.com'], comment_ids=[1])
+    self.assertEqual('example.com', scanned[-1])
+
+  def testGetAllReferencedArtifacts_CacheIsBounded(self):
+    self.aa = autolink.Autolink(refs_cache_max_size=2)
+    self.RegisterEmailCallbacks(self.aa)
+    self.aa.GetAllReferencedArtifacts(None, self.comments)
+    self.assertEqual(2, len(self.aa.refs_cache))
+
+  def testGetAllReferencedArtifacts_SharedLookup(self):
+    lookups = []
+
+    def LookupAll(_mr, refs):
+      lookups.append(set(refs))
+      return refs
+
+    self.aa.RegisterComponent(
+        'comp-a', LookupAll, lambda _mr, match: [match.group(0)],
+        {SIMPLE_EMAIL_RE: None})
+    self.aa.RegisterComponent(
+        'comp-b', LookupAll, lambda _mr, match: [match.group(0)],
+        {OVER_AMBITIOUS_DOMAIN_RE: None})
+    self.aa.RegisterComponent(
+        'comp-c', lambda _mr, _refs: self.fail('Should not be called'),
+        None, {OVER_AMBITIOUS_DOMAIN_RE: None})
+    all_ref_artifacts = self.aa.GetAllReferencedArtifacts(
+        None, [self.comment3])
+
+    self.assertEqual(
+        [{'a@other.com', 'other.com', 'example.org'}],
+        lookups)
+    self.assertIs(all_ref_artifacts['comp-a'], all_ref_artifacts['comp-b'])
+    self.assertIsNone(all_ref_artifacts['comp-c'])
+
   def testMarkupAutolinks(self):
     all_ref_artifacts = self.aa.GetAllReferencedArtifacts(None, self.comments)
     result = self.aa.MarkupAutolinks(
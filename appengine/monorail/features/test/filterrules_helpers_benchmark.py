@@ -0,0 +1,123 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Benchmark for applying a project's filter rules to many issues.
+
+We time applying every rule to each issue vs. applying only the rules that a
+RuleIndex finds might match each issue.
+
+Usage: python features/test/filterrules_helpers_benchmark.py [num_rules]
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import copy
+import random
+import sys
+import time
+
+from features import filterrules_helpers
+from proto import tracker_pb2
+from services import service_manager
+from testing import fake
+from tracker import tracker_bizobj
+
+
+NUM_ISSUES = 500
+NUM_COMPONENTS = 50
+
+
+def MakeConfig():
+  config = tracker_pb2.ProjectIssueConfig(
+      project_id=789, exclusive_label_prefixes=['Pri', 'Type'])
+  for i in range(NUM_COMPONENTS):
+    config.component_defs.append(tracker_bizobj.MakeComponentDef(
+        i + 1, 789, 'Comp%d' % i, 'doc', False, [], [], 0, 0))
+  return config
+
+
+def MakeRules(num_rules):
+  """Return rules of the kinds that projects usually have."""
+  rand = random.Random(1)
+  rules = []
+  for i in range(num_rules):
+    kind = i % 10
+    if kind < 5:
+      predicate = 'label:Area-%d' % rand.randrange(200)
+    elif kind < 7:
+      predicate = 'Type=Bug component:Comp%d' % rand.randrange(NUM_COMPONENTS)
+    elif kind < 8:
+      predicate = 'owner:%d' % rand.randrange(1, 100)
+    elif kind < 9:
+      predicate = 'Pri=%d OR label:Hotlist-%d' % (
+          rand.randrange(4), rand.randrange(50))
+    else:
+      predicate = 'status:Untriaged -label:Area-%d' % rand.randrange(200)
+    rules.append(filterrules_helpers.MakeRule(
+        predicate, add_labels=['Derived-%d' % i]))
+  return rules
+
+
+def MakeIssues():
+  rand = random.Random(2)
+  issues = []
+  for local_id in range(1, NUM_ISSUES + 1):
+    labels = ['Type-%s' % rand.choice(['Bug', 'Feature', 'Task']),
+              'Pri-%d' % rand.randrange(4)]
+    labels.extend(
+        'Area-%d' % rand.randrange(200) for _ in range(rand.randrange(3)))
+    issues.append(fake.MakeTestIssue(
+        789, local_id, 'summary', rand.choice(['New', 'Untriaged']),
+        rand.randrange(100), labels=labels,
+        component_ids=[rand.randrange(1, NUM_COMPONENTS + 1)]))
+  return issues
+
+
+def TimeApply(services, config, rules, issues, rule_index):
+  """Return average microseconds per issue and the derived labels."""
+  issues = copy.deepcopy(issues)
+  predicate_asts = (
+      rule_index.predicate_asts if rule_index else
+      filterrules_helpers.ParsePredicateASTs(rules, config, []))
+  start = time.time()
+  for issue in issues:
+    filterrules_helpers.ApplyGivenRules(
+        'cnxn', services, issue, config, rules, predicate_asts,
+        rule_index=rule_index)
+  elapsed = time.time() - start
+  return (elapsed * 1000000 / len(issues),
+          [list(issue.derived_labels) for issue in issues])
+
+
+def main(argv):
+  num_rules = int(argv[1]) if len(argv) > 1 else 500
+  services = service_manager.Services(
+      project=fake.ProjectService(), user=fake.UserService(),
+      config=fake.ConfigService())
+  services.project.TestAddProject('proj', project_id=789)
+  config = MakeConfig()
+  rules = MakeRules(num_rules)
+  issues = MakeIssues()
+
+  start = time.time()
+  rule_index = filterrules_helpers.RuleIndex(
+      filterrules_helpers.ParsePredicateASTs(rules, config, []), config)
+  compile_ms = (time.time() - start) * 1000
+
+  plain_us, plain_labels = TimeApply(services, config, rules, issues, None)
+  indexed_us, indexed_labels = TimeApply(
+      services, config, rules, issues, rule_index)
+  assert plain_labels == indexed_labels
+  print('%d rules, %d issues, %d rules not indexed' % (
+      num_rules, NUM_ISSUES, len(rule_index.unindexed)))
+  print('  compile once:  %8.1f ms' % compile_ms)
+  print('  every rule:    %8.1f us/issue' % plain_us)
+  print('  indexed rules: %8.1f us/issue' % indexed_us)
+  print('  speedup:       %8.2fx' % (plain_us / indexed_us))
+
+
+if __name__ == '__main__':
+  main(sys.argv)
@@ -10,9 +10,12 @@ from __future__ import absolute_import
 
 import unittest
 
+import mock
 import mox
 
+from google.appengine.api import memcache
 from google.appengine.api import taskqueue
+from google.appengine.ext import testbed
 
 import settings
 from features import filterrules_helpers
@@ -73,8 +76,12 @@ class RecomputeAllDerivedFieldsTest(unittest.TestCase):
     self.mox = mox.Mox()
     self.mock_task_queue = MockTaskQueue()
     self.mox.StubOutWithMock(taskqueue, 'add')
+    self.testbed = testbed.Testbed()
+    self.testbed.activate()
+    self.testbed.init_memcache_stub()
 
   def tearDown(self):
+    self.testbed.deactivate()
     self.mox.UnsetStubs()
     self.mox.ResetAll()
 
@@ -82,13 +89,14 @@ class RecomputeAllDerivedFieldsTest(unittest.TestCase):
     """Servlet should just call RecomputeAllDerivedFieldsNow with no bounds."""
     saved_flag = settings.recompute_derived_fields_in_worker
     settings.recompute_derived_fields_in_worker = False
+    self.mox.StubOutWithMock(
+        filterrules_helpers, 'RecomputeAllDerivedFieldsNow')
+    filterrules_helpers.RecomputeAllDerivedFieldsNow(
+        self.cnxn, self.services, self.project, self.config)
     self.mox.ReplayAll()
 
     filterrules_helpers.RecomputeAllDerivedFields(
         self.cnxn, self.services, self.project, self.config)
-    self.assertTrue(self.services.issue.get_all_issues_in_project_called)
-    self.assertTrue(self.services.issue.update_issues_called)
-    self.assertTrue(self.services.issue.enqueue_issues_called)
 
     self.mox.VerifyAll()
     settings.recompute_derived_fields_in_worker = saved_flag
@@ -98,12 +106,14 @@ class RecomputeAllDerivedFieldsTest(unittest.TestCase):
     saved_flag = settings.recompute_derived_fields_in_worker
     settings.recompute_derived_fields_in_worker = False
     self.services.issue.next_id = 1234
+    self.mox.StubOutWithMock(
+        filterrules_helpers, 'RecomputeAllDerivedFieldsNow')
+    filterrules_helpers.RecomputeAllDerivedFieldsNow(
+        self.cnxn, self.services, self.project, self.config)
     self.mox.ReplayAll()
 
     filterrules_helpers.RecomputeAllDerivedFields(
         self.cnxn, self.services, self.project, self.config)
-    self.assertTrue(self.services.issue.get_all_issues_in_project_called)
-    self.assertTrue(self.services.issue.enqueue_issues_called)
 
     self.mox.VerifyAll()
     settings.recompute_derived_fields_in_worker = saved_flag
@@ -203,13 +213,13 @@ class RecomputeAllDerivedFieldsTest(unittest.TestCase):
     for test_issue in test_issues:
       filterrules_helpers.ApplyGivenRules(
           self.cnxn, self.services, test_issue, self.config,
-          [], []).AndReturn((True, {}))
+          [], [], rule_index=mox.IsA(filterrules_helpers.RuleIndex)
+          ).AndReturn((True, {}))
     self.mox.ReplayAll()
 
     filterrules_helpers.RecomputeAllDerivedFieldsNow(
         self.cnxn, self.services, self.project, self.config)
 
-    self.assertTrue(self.services.issue.get_all_issues_in_project_called)
     self.assertTrue(self.services.issue.update_issues_called)
     self.assertTrue(self.services.issue.enqueue_issues_called)
     self.assertEqual(test_issues, self.services.issue.updated_issues)
@@ -218,6 +228,123 @@ class RecomputeAllDerivedFieldsTest(unittest.TestCase):
     self.mox.VerifyAll()
 
 
+  def AddIssues(self, num_issues):
+    self.services.issue.next_id = num_issues + 1
+    for local_id in range(1, num_issues + 1):
+      issue = fake.MakeTestIssue(
+          project_id=self.project.project_id, local_id=local_id,
+          issue_id=1000 + local_id, summary='sum', owner_id=100,
+          status='New')
+      issue.assume_stale = False  # We will store this issue.
+      self.services.issue.TestAddIssue(issue)
+
+  def RunWorkItems(self):
+    """Act as the task queue: run each enqueued work item, in order."""
+    progress = None
+    while self.mock_task_queue.work_items:
+      params = self.mock_task_queue.work_items.pop(0)['params']
+      progress = filterrules_helpers.RecomputeWorkUnit(
+          self.cnxn, self.services, self.project, self.config,
+          params['run_id'], params['lower_bound'], params['upper_bound'],
+          shard_id=params['shard_id'])
+    return progress
+
+  @mock.patch('features.filterrules_helpers.ApplyGivenRules')
+  def testRecomputeWorkUnit_WholeRun(self, mock_apply):
+    """Every block is processed, and only changed issues are stored."""
+    mock_apply.side_effect = lambda cnxn, services, issue, *args, **kw: (
+        issue.local_id % 100 == 0, {})
+    self.AddIssues(600)
+    taskqueue.add(
+        params=mox.IsA(dict),
+        url='/_task/recomputeDerivedFields.do').WithSideEffects(
+            self.mock_task_queue.add).MultipleTimes()
+    self.mox.ReplayAll()
+
+    filterrules_helpers.RecomputeAllDerivedFields(
+        self.cnxn, self.services, self.project, self.config)
+    progress = self.RunWorkItems()
+
+    self.mox.VerifyAll()
+    self.assertEqual(600, mock_apply.call_count)
+    self.assertEqual(
+        [100, 200, 300, 400, 500, 600],
+        sorted(issue.local_id for issue in self.services.issue.updated_issues))
+    self.assertEqual(3, progress['units_done'])
+    self.assertEqual(3, progress['total_units'])
+    self.assertEqual(600, progress['issues_done'])
+    self.assertEqual(600, progress['total_issues'])
+    self.assertEqual(0, progress['eta_sec'])
+
+    # Running a block again does not count it twice.
+    progress = filterrules_helpers.RecomputeWorkUnit(
+        self.cnxn, self.services, self.project, self.config,
+        progress['run_id'], 1, self.BLOCK + 1)
+    self.assertEqual(3, progress['units_done'])
+    self.assertEqual(600, mock_apply.call_count)
+
+  @mock.patch('features.filterrules_helpers.time')
+  @mock.patch('features.filterrules_helpers.ApplyGivenRules')
+  def testRecomputeWorkUnit_ResumesFromCheckpoint(self, mock_apply, mock_time):
+    """A block that runs out of time continues in another task."""
+    mock_apply.return_value = (False, {})
+    self.AddIssues(self.BLOCK)
+    budget = filterrules_helpers.RECOMPUTE_TASK_TIME_BUDGET_SEC
+    # Run ID and start time, task start, first batch, then out of time.
+    mock_time.time.side_effect = [
+        1000, 1000, 1000, 1000, 1000 + budget + 1] + [1010] * 20
+    taskqueue.add(
+        params=mox.IsA(dict),
+        url='/_task/recomputeDerivedFields.do').WithSideEffects(
+            self.mock_task_queue.add).MultipleTimes()
+    self.mox.ReplayAll()
+
+    filterrules_helpers.RecomputeAllDerivedFields(
+        self.cnxn, self.services, self.project, self.config)
+    params = self.mock_task_queue.work_items[0]['params']
+    progress = filterrules_helpers.RecomputeWorkUnit(
+        self.cnxn, self.services, self.project, self.config,
+        params['run_id'], params['lower_bound'], params['upper_bound'])
+    batch_size = filterrules_helpers.RECOMPUTE_BATCH_SIZE
+    self.assertEqual(batch_size, mock_apply.call_count)
+    self.assertEqual(0, progress['units_done'])
+    self.assertEqual(batch_size, progress['issues_done'])
+    self.assertEqual(
+        [params, params],
+        [item['params'] for item in self.mock_task_queue.work_items])
+
+    self.mock_task_queue.work_items = self.mock_task_queue.work_items[1:]
+    progress = self.RunWorkItems()
+    self.mox.VerifyAll()
+    self.assertEqual(self.BLOCK, mock_apply.call_count)
+    self.assertEqual(1, progress['units_done'])
+
+  @mock.patch('features.filterrules_helpers.ApplyGivenRules')
+  def testRecomputeWorkUnit_Superseded(self, mock_apply):
+    """Blocks of an older run are skipped once a newer run starts."""
+    self.AddIssues(10)
+    filterrules_helpers._StartRecomputeRun(
+        self.project.project_id, 2000, 1, 10)
+    progress = filterrules_helpers.RecomputeWorkUnit(
+        self.cnxn, self.services, self.project, self.config, 1000, 1, 11)
+    self.assertFalse(mock_apply.called)
+    self.assertEqual(2000, progress['run_id'])
+
+  def testGetRecomputeProgress(self):
+    project_id = self.project.project_id
+    self.assertIsNone(filterrules_helpers.GetRecomputeProgress(project_id))
+
+    with mock.patch('time.time', return_value=1000):
+      filterrules_helpers._StartRecomputeRun(project_id, 1, 4, 1000)
+    memcache.incr('recompute_units:%d:1' % project_id)
+    memcache.incr('recompute_issues:%d:1' % project_id, delta=250)
+    self.assertEqual(
+        {'run_id': 1, 'units_done': 1, 'total_units': 4,
+         'issues_done': 250, 'total_issues': 1000, 'elapsed_sec': 60,
+         'eta_sec': 180},
+        filterrules_helpers.GetRecomputeProgress(project_id, now=1060))
+
+
 class FilterRulesHelpersTest(unittest.TestCase):
 
   def setUp(self):
@@ -614,6 +741,68 @@ class FilterRulesHelpersTest(unittest.TestCase):
         filterrules_helpers._ComputeDerivedFields(
             cnxn, self.services, issue, config, rules, predicate_asts))
 
+  def testComputeDerivedFields_RuleIndex(self):
+    """Skipping rules that cannot match gives the same results."""
+    cnxn = 'fake sql connection'
+    rules = [
+        filterrules_helpers.MakeRule(
+            'label:HasWorkaround', add_labels=['Priority-Low']),
+        filterrules_helpers.MakeRule(
+            'label:Security', add_labels=['Priority-High']),
+        filterrules_helpers.MakeRule(
+            'Priority=High label:Regression', add_labels=['Urgent']),
+        filterrules_helpers.MakeRule('Urgent=Now', add_labels=['Page']),
+        filterrules_helpers.MakeRule('label:Urgent', add_cc_ids=[111]),
+        filterrules_helpers.MakeRule(
+            'component:UI OR owner:222', default_status='Triaged'),
+        filterrules_helpers.MakeRule(
+            '-label:Security', warning='Not security'),
+        ]
+    config = tracker_pb2.ProjectIssueConfig(
+        exclusive_label_prefixes=['Priority'],
+        project_id=self.project.project_id)
+    config.component_defs.append(tracker_bizobj.MakeComponentDef(
+        10, 789, 'UI', 'doc', False, [], [], 0, 0))
+    rule_index = filterrules_helpers.RuleIndex(
+        filterrules_helpers.ParsePredicateASTs(rules, config, []), config)
+    self.assertEqual([6], rule_index.unindexed)
+
+    for labels, component_ids, owner_id in [
+        ([], [], 0),
+        (['Security', 'Regression'], [], 0),
+        (['HasWorkaround', 'Regression'], [], 0),
+        (['Urgent-Now'], [10], 0),
+        (['Other'], [], 222),
+        ]:
+      issue = fake.MakeTestIssue(
+          789, 1, ORIG_SUMMARY, '', owner_id, labels=labels,
+          component_ids=component_ids)
+      self.assertEqual(
+          filterrules_helpers._ComputeDerivedFields(
+              cnxn, self.services, issue, config, rules,
+              rule_index.predicate_asts),
+          filterrules_helpers._ComputeDerivedFields(
+              cnxn, self.services, issue, config, rules,
+              rule_index.predicate_asts, rule_index=rule_index))
+
+  def testGetRuleIndex(self):
+    """A RuleIndex is reused until the config or rule predicates change."""
+    rules = [filterrules_helpers.MakeRule('label:a', add_labels=['b'])]
+    config = tracker_pb2.ProjectIssueConfig(project_id=789)
+    rule_index = filterrules_helpers.GetRuleIndex(789, rules, config)
+    self.assertEqual([('a', 0)], rule_index.label_substrings)
+
+    rules[0].add_labels = ['c']
+    self.assertIs(
+        rule_index, filterrules_helpers.GetRuleIndex(789, rules, config))
+    self.assertIsNot(
+        rule_index, filterrules_helpers.GetRuleIndex(
+            789, rules, tracker_pb2.ProjectIssueConfig(project_id=789)))
+    rules.append(filterrules_helpers.MakeRule('label:b', add_labels=['c']))
+    self.assertEqual(
+        2, len(filterrules_helpers.GetRuleIndex(
+            789, rules, config).predicate_asts))
+
   def testCompareComponents_Trivial(self):
     config = tracker_pb2.ProjectIssueConfig()
     self.assertTrue(filterrules_helpers._CompareComponents(
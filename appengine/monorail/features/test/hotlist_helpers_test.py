@@ -8,16 +8,20 @@ from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
 
+import mock
+import sys
 import unittest
 
 from features import hotlist_helpers
 from features import features_constants
 from framework import profiler
 from framework import table_view_helpers
+from framework import urls
 from framework import sorting
 from services import service_manager
 from testing import testing_helpers
 from testing import fake
+from tracker import rerank_helpers
 from tracker import tablecell
 from tracker import tracker_bizobj
 from proto import features_pb2
@@ -283,3 +287,17 @@ class HelpersUnitTest(unittest.TestCase):
     url = hotlist_helpers.GetURLOfHotlist(cnxn, hotlist_unowned,
         self.services.user)
     self.assertFalse(url)
+
+  @mock.patch('tracker.rerank_helpers.MAX_RANKING', sys.maxint)
+  @mock.patch('google.appengine.api.taskqueue.add')
+  def testEnqueueRebalanceIfNeeded(self, fake_add):
+    gap = rerank_helpers.RANK_GAP
+    hotlist = fake.Hotlist('hotlist', 123, hotlist_item_fields=[
+        (78901, gap, 111, None, ''), (78902, 2 * gap, 111, None, '')])
+
+    hotlist_helpers.EnqueueRebalanceIfNeeded(hotlist, [(78903, 3 * gap)])
+    self.assertFalse(fake_add.called)
+
+    hotlist_helpers.EnqueueRebalanceIfNeeded(hotlist, [(78903, gap + 1)])
+    fake_add.assert_called_once_with(
+        url=urls.REBALANCE_HOTLIST_TASK + '.do', params={'hotlist_id': 123})
@@ -11,6 +11,8 @@ from __future__ import absolute_import
 import unittest
 import os
 
+import mock
+
 from google.appengine.api import taskqueue
 from google.appengine.ext import testbed
 
@@ -77,6 +79,38 @@ class ComputeIssueChangeAddressPermListTest(unittest.TestCase):
         addr_perm_list)
 
 
+  def testSharedPlanner(self):
+    """Users are looked up once for all the issues that use a planner."""
+    cnxn = 'fake cnxn'
+    other_issue = fake.MakeTestIssue(
+        self.project.project_id, 2, 'summary', 'New', 111)
+    planner = notify_reasons.NotificationPlanner(cnxn, self.services)
+    with mock.patch.object(
+        self.services.user, 'GetUsersByIDs',
+        wraps=self.services.user.GetUsersByIDs) as get_users:
+      for issue in [self.issue, other_issue]:
+        addr_perm_list = notify_reasons.ComputeIssueChangeAddressPermList(
+            cnxn, [111, 222, 999], self.project, issue, self.services,
+            set(), self.users_by_id, pref_check_function=lambda *args: True,
+            planner=planner)
+        self.assertEqual(3, len(addr_perm_list))
+      get_users.assert_called_once()
+
+    self.assertEqual(3, planner.num_lookups)
+    self.assertTrue(planner.IsMember(222, self.project))
+    self.assertFalse(planner.IsMember(999, self.project))
+    with mock.patch.object(
+        notify_reasons.RECIPIENT_LOOKUPS, 'increment_by') as lookups:
+      with mock.patch.object(
+          notify_reasons.RECIPIENT_LOOKUPS_SAVED, 'increment_by') as saved:
+        planner.RecordMetrics('test')
+    lookups.assert_called_once_with(3, {'task': 'test'})
+    # Each of the 3 users was decided on for 2 issues, and loaded once.
+    # IsMember() calls made outside of a decision do not count.
+    self.assertEqual(6, planner.num_requests)
+    saved.assert_called_once_with(3, {'task': 'test'})
+
+
 class ComputeProjectAndIssueNotificationAddrListTest(unittest.TestCase):
 
   def setUp(self):
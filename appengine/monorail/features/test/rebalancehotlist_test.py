@@ -0,0 +1,71 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Unittest for the rebalancehotlist module."""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import sys
+import unittest
+
+import mock
+
+from features import rebalancehotlist
+from framework import urls
+from services import service_manager
+from testing import fake
+from testing import testing_helpers
+from tracker import rerank_helpers
+
+
+# Other test modules lower MAX_RANKING, so restore the real limit here.
+@mock.patch('tracker.rerank_helpers.MAX_RANKING', sys.maxint)
+class RebalanceHotlistTaskTest(unittest.TestCase):
+
+  def setUp(self):
+    self.services = service_manager.Services(
+        features=fake.FeaturesService())
+    self.servlet = rebalancehotlist.RebalanceHotlistTask(
+        'req', 'res', services=self.services)
+    self.gap = rerank_helpers.RANK_GAP
+
+  def GetRequest(self, hotlist_id):
+    _request, mr = testing_helpers.GetRequestObjects(
+        path=urls.REBALANCE_HOTLIST_TASK + '.do?hotlist_id=%d' % hotlist_id)
+    return mr
+
+  def testHandleRequest(self):
+    """Ranks are spaced out and the order is kept."""
+    self.services.features.TestAddHotlist(
+        'hotlist', hotlist_id=123, hotlist_item_fields=[
+            (78901, self.gap, 111, None, ''),
+            (78902, self.gap + 1, 111, None, ''),
+            (78903, self.gap + 2, 111, None, '')])
+
+    result = self.servlet.HandleRequest(self.GetRequest(123))
+    self.assertEqual({'reranked': 2}, result)
+    hotlist = self.services.features.GetHotlist('cnxn', 123)
+    self.assertEqual(
+        [(78901, self.gap), (78902, 2 * self.gap), (78903, 3 * self.gap)],
+        [(item.issue_id, item.rank) for item in hotlist.items])
+
+  def testHandleRequest_Balanced(self):
+    self.services.features.TestAddHotlist(
+        'hotlist', hotlist_id=123, hotlist_item_fields=[
+            (78901, self.gap, 111, None, ''),
+            (78902, 2 * self.gap, 111, None, '')])
+
+    result = self.servlet.HandleRequest(self.GetRequest(123))
+    self.assertEqual({'reranked': 0}, result)
+
+  def testHandleRequest_NoSuchHotlist(self):
+    result = self.servlet.HandleRequest(self.GetRequest(404))
+    self.assertEqual({'reranked': 0}, result)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,120 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Unittest for the snapshotrollup module."""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import time
+import unittest
+
+import mock
+import mox
+
+from google.appengine.api import taskqueue
+
+from features import snapshotrollup
+from framework import urls
+from services import chart_svc
+from services import service_manager
+from testing import fake
+from testing import testing_helpers
+
+
+NOW = 1514800000  # 2018-01-01 09:46:40 UTC
+LAST_DAY_END = 1514764799  # 2017-12-31 23:59:59 UTC
+DAY = 24 * 60 * 60
+
+
+class SnapshotRollupCronTest(unittest.TestCase):
+
+  def setUp(self):
+    self.services = service_manager.Services(project=fake.ProjectService())
+    self.services.project.TestAddProject('proj', project_id=789)
+    self.services.project.TestAddProject('other', project_id=788)
+    self.servlet = snapshotrollup.SnapshotRollupCron(
+        'req', 'res', services=self.services)
+    self.mox = mox.Mox()
+
+  def tearDown(self):
+    self.mox.UnsetStubs()
+    self.mox.ResetAll()
+
+  @mock.patch('settings.chart_snapshot_rollups', True)
+  def testHandleRequest(self):
+    _request, mr = testing_helpers.GetRequestObjects(
+        path=urls.SNAPSHOT_ROLLUP_CRON)
+    self.mox.StubOutWithMock(taskqueue, 'add')
+    for project_id in [788, 789]:
+      taskqueue.add(
+          url=urls.SNAPSHOT_ROLLUP_TASK + '.do',
+          params={'project_id': project_id})
+    self.mox.ReplayAll()
+
+    self.servlet.HandleRequest(mr)
+    self.mox.VerifyAll()
+
+  def testHandleRequest_Disabled(self):
+    _request, mr = testing_helpers.GetRequestObjects(
+        path=urls.SNAPSHOT_ROLLUP_CRON)
+    self.mox.StubOutWithMock(taskqueue, 'add')
+    self.mox.ReplayAll()
+
+    self.servlet.HandleRequest(mr)
+    self.mox.VerifyAll()
+
+
+class SnapshotRollupTaskTest(unittest.TestCase):
+
+  def setUp(self):
+    self.mox = mox.Mox()
+    self.services = service_manager.Services(
+        chart=self.mox.CreateMock(chart_svc.ChartService))
+    self.servlet = snapshotrollup.SnapshotRollupTask(
+        'req', 'res', services=self.services)
+    _request, self.mr = testing_helpers.GetRequestObjects(
+        path=urls.SNAPSHOT_ROLLUP_TASK + '.do?project_id=789')
+    self.mox.StubOutWithMock(time, 'time')
+    time.time().AndReturn(NOW)
+
+  def tearDown(self):
+    self.mox.UnsetStubs()
+    self.mox.ResetAll()
+
+  def testHandleRequest_FirstRun(self):
+    """The first rollup of a project starts with the day that just ended."""
+    self.services.chart.GetRollUpStatus(self.mr.cnxn, 789).AndReturn(
+        (None, None))
+    self.services.chart.RollUpIssueSnapshots(self.mr.cnxn, 789, LAST_DAY_END)
+    self.mox.ReplayAll()
+
+    result = self.servlet.HandleRequest(self.mr)
+    self.mox.VerifyAll()
+    self.assertEqual({'rolled_up': [LAST_DAY_END]}, result)
+
+  def testHandleRequest_CatchesUp(self):
+    """Each day since the last rollup is rolled up in order."""
+    self.services.chart.GetRollUpStatus(self.mr.cnxn, 789).AndReturn(
+        (LAST_DAY_END - 9 * DAY, LAST_DAY_END - 2 * DAY))
+    self.services.chart.RollUpIssueSnapshots(
+        self.mr.cnxn, 789, LAST_DAY_END - DAY)
+    self.services.chart.RollUpIssueSnapshots(self.mr.cnxn, 789, LAST_DAY_END)
+    self.mox.ReplayAll()
+
+    result = self.servlet.HandleRequest(self.mr)
+    self.mox.VerifyAll()
+    self.assertEqual(
+        {'rolled_up': [LAST_DAY_END - DAY, LAST_DAY_END]}, result)
+
+  def testHandleRequest_UpToDate(self):
+    self.services.chart.GetRollUpStatus(self.mr.cnxn, 789).AndReturn(
+        (LAST_DAY_END - 9 * DAY, LAST_DAY_END))
+    self.mox.ReplayAll()
+
+    result = self.servlet.HandleRequest(self.mr)
+    self.mox.VerifyAll()
+    self.assertEqual({'rolled_up': []}, result)
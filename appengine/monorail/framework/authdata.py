@@ -127,6 +127,53 @@ class AuthData(object):
 
     return auth
 
+  @classmethod
+  def FromUserIDs(cls, cnxn, user_ids, services):
+    """Determine auth information for many user IDs with bulk lookups.
+
+    Args:
+      cnxn: monorail connection to the database.
+      user_ids: list of int user IDs.
+      services: connections to backend servers.
+
+    Returns:
+      A dict {user_id: AuthData} with one new AuthData for each user ID.
+    """
+    user_ids = [user_id for user_id in set(user_ids) if user_id]
+    users_by_id = services.user.GetUsersByIDs(cnxn, user_ids)
+    linked_ids = set()
+    for user in users_by_id.values():
+      if user.linked_parent_id:
+        linked_ids.add(user.linked_parent_id)
+      linked_ids.update(user.linked_child_ids)
+    memberships = services.usergroup.LookupAllMemberships(
+        cnxn, list(set(user_ids) | linked_ids))
+    computed_by_domain = {}
+
+    result = {}
+    for user_id in user_ids:
+      auth = cls()
+      auth.user_id = user_id
+      auth.user_pb = users_by_id[user_id]
+      auth.email = auth.user_pb.email
+      auth.user_view = framework_views.UserView(auth.user_pb)
+      auth.effective_ids = set(memberships[user_id])
+      auth.effective_ids.add(user_id)
+      domain = auth.user_view.domain
+      if domain not in computed_by_domain:
+        computed_by_domain[domain] = (
+            services.usergroup.LookupComputedMemberships(cnxn, domain))
+      auth.effective_ids.update(computed_by_domain[domain])
+      user_linked_ids = list(auth.user_pb.linked_child_ids)
+      if auth.user_pb.linked_parent_id:
+        user_linked_ids.append(auth.user_pb.linked_parent_id)
+      for linked_id in user_linked_ids:
+        auth.effective_ids.add(linked_id)
+        auth.effective_ids.update(memberships[linked_id])
+      result[user_id] = auth
+
+    return result
+
   @classmethod
   def _AddEffectiveIDsOfLinkedAccounts(
       cls, cnxn, services, effective_ids, linked_account_id):
@@ -461,26 +461,41 @@ def UpdateIssuePermissions(
   if not perms.HasPerm(VIEW, None, None):
     return EMPTY_PERMISSIONSET
 
-  # Compute the restrictions for the given issue and store them in a dictionary
-  # of {perm: set(needed_perms)}.
-  restrictions = collections.defaultdict(set)
-  if perms.consider_restrictions:
-    for label in GetRestrictions(issue):
-      label = label.lower()
-      # format: Restrict-Action-ToThisPerm
-      _, requested_perm, needed_perm = label.split('-', 2)
-      restrictions[requested_perm.lower()].add(needed_perm.lower())
-
   # Store the user permissions, and the extra permissions of all effective IDs
   # in the given project.
   all_perms = set(perms.perm_names)
   for effective_id in effective_ids:
     all_perms.update(p.lower() for p in GetExtraPerms(project, effective_id))
 
-  # And filter them applying the restriction labels.
+  restriction_labels = (
+      GetRestrictions(issue) if perms.consider_restrictions else [])
+  filtered_perms = _FilterRestrictedPerms(
+      all_perms, restriction_labels, granted_perms)
+  return _AddIssueRolePerms(perms, filtered_perms, issue, effective_ids)
+
+
+def _FilterRestrictedPerms(all_perms, restriction_labels, granted_perms):
+  """Return the set of perms that the restriction labels do not block.
+
+  Args:
+    all_perms: set of lowercase perms of the user, including extra perms.
+    restriction_labels: list of lowercase restriction labels on the issue.
+    granted_perms: list of lowercase perms granted within the issue.
+
+  Returns:
+    A set of lowercase perms including the granted perms.
+  """
+  # Compute the restrictions for the given issue and store them in a dictionary
+  # of {perm: set(needed_perms)}.
+  restrictions = collections.defaultdict(set)
+  for label in restriction_labels:
+    # format: Restrict-Action-ToThisPerm
+    _, requested_perm, needed_perm = label.split('-', 2)
+    restrictions[requested_perm].add(needed_perm)
+
+  # Filter the perms by applying the restriction labels.
   filtered_perms = set()
   for perm_name in all_perms:
-    perm_name = perm_name.lower()
     restricted = any(
         restriction not in all_perms and restriction not in granted_perms
         for restriction in restrictions.get(perm_name, []))
@@ -489,14 +504,24 @@ def UpdateIssuePermissions(
 
   # Add any granted permissions.
   filtered_perms.update(granted_perms)
+  return filtered_perms
 
-  # The VIEW perm might have been removed due to restrictions, but the issue
-  # owner, reporter, cc and approvers can always be an issue.
+
+def _IsIssueParticipant(issue, effective_ids):
+  """Return True if the user is the issue owner, reporter, a cc or approver."""
   allowed_ids = set(
       tracker_bizobj.GetCcIds(issue)
       + tracker_bizobj.GetApproverIds(issue)
       + [issue.reporter_id, tracker_bizobj.GetOwnerId(issue)])
-  if effective_ids and not allowed_ids.isdisjoint(effective_ids):
+  return bool(effective_ids) and not allowed_ids.isdisjoint(effective_ids)
+
+
+def _AddIssueRolePerms(perms, filtered_perms, issue, effective_ids):
+  """Return a PermissionSet that accounts for the user's role in the issue."""
+  filtered_perms = set(filtered_perms)
+  # The VIEW perm might have been removed due to restrictions, but the issue
+  # owner, reporter, cc and approvers can always be an issue.
+  if _IsIssueParticipant(issue, effective_ids):
     filtered_perms.add(VIEW.lower())
 
   # If the issue is deleted, only the VIEW and DELETE_ISSUE permissions are
@@ -1096,6 +1121,118 @@ def CanCommentIssue(effective_ids, perms, project, issue, granted_perms=None):
       GetRestrictions(issue), granted_perms=granted_perms)
 
 
+class PermissionEvaluator(object):
+  """Memoizes issue permission checks for one request.
+
+  Pages that list many issues check the same user's permissions on each of
+  them, and most of those issues have the same few restriction labels.  This
+  object remembers the perms that remain after applying each distinct set of
+  restriction labels, and it precompiles each project's extra perms into a
+  dict.  It assumes that the projects and PermissionSets passed to it do not
+  change during the request, so it should not outlive the request.
+  """
+
+  def __init__(self):
+    # {project_id: {member_id: frozenset(lowercase extra perms)}}
+    self._extra_perms_by_project = {}
+    # {(perm_names, consider_restrictions, project_id, effective_ids,
+    #   restriction_labels, granted_perms): frozenset(filtered perms)}
+    self._filtered_perms = {}
+    # Same keys, with PermissionSets for users who are not participants.
+    self._nonparticipant_permsets = {}
+    # {(perm_names, consider_restrictions, perm_name, project_id,
+    #   effective_ids, restriction_labels, granted_perms): bool}
+    self._perm_decisions = {}
+
+  def _ProjectExtraPerms(self, project):
+    """Return {member_id: frozenset} of lowercase extra perms in a project."""
+    if not project:
+      return {}
+    if project.project_id not in self._extra_perms_by_project:
+      # Users who have no current role cannot have any extra perms.
+      self._extra_perms_by_project[project.project_id] = {
+          extra_perms.member_id: frozenset(p.lower() for p in extra_perms.perms)
+          for extra_perms in project.extra_perms
+          if framework_bizobj.UserIsInProject(
+              project, {extra_perms.member_id})}
+    return self._extra_perms_by_project[project.project_id]
+
+  def GetExtraPerms(self, project, effective_ids):
+    """Return a frozenset of lowercase extra perms of any effective ID."""
+    extra_perms_by_member = self._ProjectExtraPerms(project)
+    result = frozenset()
+    for effective_id in effective_ids:
+      result = result.union(extra_perms_by_member.get(effective_id, ()))
+    return result
+
+  def CanUsePerm(
+      self, perms, perm_name, effective_ids, project, restriction_labels,
+      granted_perms=None):
+    """Memoized version of perms.CanUsePerm()."""
+    key = (
+        perms.perm_names, perms.consider_restrictions, perm_name.lower(),
+        project and project.project_id, frozenset(effective_ids or ()),
+        frozenset(lab.lower() for lab in restriction_labels),
+        frozenset(granted_perms or ()))
+    if key not in self._perm_decisions:
+      self._perm_decisions[key] = perms.CanUsePerm(
+          perm_name, effective_ids, project, restriction_labels,
+          granted_perms=granted_perms)
+    return self._perm_decisions[key]
+
+  def UpdateIssuePermissions(
+      self, perms, project, issue, effective_ids, granted_perms=None,
+      config=None):
+    """Memoized version of UpdateIssuePermissions()."""
+    if config:
+      granted_perms = tracker_bizobj.GetGrantedPerms(
+          issue, effective_ids, config)
+    elif granted_perms is None:
+      granted_perms = []
+
+    if not perms.HasPerm(VIEW, None, None):
+      return EMPTY_PERMISSIONSET
+
+    restriction_labels = frozenset(
+        GetRestrictions(issue) if perms.consider_restrictions else ())
+    effective_ids = frozenset(effective_ids)
+    key = (
+        perms.perm_names, perms.consider_restrictions,
+        project and project.project_id, effective_ids, restriction_labels,
+        frozenset(granted_perms))
+    if key not in self._filtered_perms:
+      all_perms = perms.perm_names.union(
+          self.GetExtraPerms(project, effective_ids))
+      self._filtered_perms[key] = frozenset(_FilterRestrictedPerms(
+          all_perms, restriction_labels, granted_perms))
+
+    if issue.deleted or _IsIssueParticipant(issue, effective_ids):
+      return _AddIssueRolePerms(
+          perms, self._filtered_perms[key], issue, effective_ids)
+    if key not in self._nonparticipant_permsets:
+      self._nonparticipant_permsets[key] = PermissionSet(
+          self._filtered_perms[key], perms.consider_restrictions)
+    return self._nonparticipant_permsets[key]
+
+  def CanViewIssue(
+      self, effective_ids, perms, project, issue, allow_viewing_deleted=False,
+      granted_perms=None):
+    """Memoized version of CanViewIssue()."""
+    if issue.deleted and not allow_viewing_deleted:
+      return False
+
+    perms = self.UpdateIssuePermissions(
+        perms, project, issue, effective_ids, granted_perms=granted_perms)
+    return perms.HasPerm(VIEW, None, None)
+
+  def CanEditIssue(
+      self, effective_ids, perms, project, issue, granted_perms=None):
+    """Memoized version of CanEditIssue()."""
+    perms = self.UpdateIssuePermissions(
+        perms, project, issue, effective_ids, granted_perms=granted_perms)
+    return perms.HasPerm(EDIT_ISSUE, None, None)
+
+
 def CanUpdateApprovalStatus(
     effective_ids, perms, project, approver_ids, new_status):
   """Return True if a user can change the approval status to the new status."""
@@ -170,7 +170,7 @@ class Servlet(webapp2.RequestHandler):
     else:
       self.template = None
 
-    self._missing_permissions_template = template_helpers.MonorailTemplate(
+    self._missing_permissions_template = template_helpers.GetTemplate(
         self._TEMPLATE_PATH + self._MISSING_PERMISSIONS_TEMPLATE)
     self.services = services or self.app.config.get('services')
     self.content_type = content_type
@@ -382,7 +382,8 @@ class Servlet(webapp2.RequestHandler):
           page_data.update(self.GatherBaseData(self.mr, nonce))
         self._AddHelpDebugPageData(page_data)
         self._missing_permissions_template.WriteResponse(
-            self.response, page_data, content_type=self.content_type)
+            self.response, page_data, content_type=self.content_type,
+            profiler=self.mr.profiler)
 
   def SetCacheHeaders(self, response):
     """Set headers to allow the response to be cached."""
@@ -421,7 +422,8 @@ class Servlet(webapp2.RequestHandler):
   def _RenderResponse(self, page_data):
     logging.info('rendering response len(page_data) is %r', len(page_data))
     self.GetTemplate(page_data).WriteResponse(
-        self.response, page_data, content_type=self.content_type)
+        self.response, page_data, content_type=self.content_type,
+        profiler=self.mr.profiler)
 
   def ProcessFormData(self, mr, post_data):
     """Handle form data and redirect appropriately.
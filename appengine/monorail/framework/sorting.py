@@ -124,6 +124,21 @@ def SortArtifacts(
   faster overall than doing multiple stable-sorts or doing one sort
   using a multi-field comparison function.
   """
+  sort_key = MakeSortKeyFunction(
+      config, accessors, postprocessors, group_by_spec, sort_spec,
+      users_by_id=users_by_id, tie_breakers=tie_breakers)
+  return sorted(artifacts, key=sort_key)
+
+
+def MakeSortKeyFunction(
+    config, accessors, postprocessors, group_by_spec, sort_spec,
+    users_by_id=None, tie_breakers=None):
+  """Return a function(art) -> sort_key for use by SortArtifacts().
+
+  The args are the same as for SortArtifacts().  users_by_id may be updated
+  in place after the function is made, e.g., as more artifacts are fetched,
+  as long as it covers each artifact before its sort key is computed.
+  """
   sort_directives = ComputeSortDirectives(
       config, group_by_spec, sort_spec, tie_breakers=tie_breakers)
 
@@ -134,7 +149,7 @@ def SortArtifacts(
       for sd in sort_directives]
 
   def SortKey(art):
-    """Make a sort_key for the given artifact, used by sorted() below."""
+    """Make a sort_key for the given artifact."""
     if art_values_cache.HasItem(art.issue_id):
       art_values = art_values_cache.GetItem(art.issue_id)
     else:
@@ -149,7 +164,7 @@ def SortArtifacts(
     art_values_cache.CacheItem(art.issue_id, art_values)
     return sort_key
 
-  return sorted(artifacts, key=SortKey)
+  return SortKey
 
 
 def ComputeSortDirectives(config, group_by_spec, sort_spec, tie_breakers=None):
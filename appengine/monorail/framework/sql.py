@@ -12,6 +12,7 @@ import logging
 import random
 import re
 import sys
+import threading
 import time
 
 from six import string_types
@@ -110,6 +111,21 @@ MASTER_CNXN = 'master_cnxn'
 # When one replica is temporarily unresponseive, we can use a different one.
 BAD_SHARD_AVOIDANCE_SEC = 45
 
+# Weight given to each new observation in a replica's moving average latency.
+REPLICA_LATENCY_EWMA_ALPHA = 0.3
+
+# Forget a replica's latency if it has not been observed for this long, so
+# that a replica that was slow gets another chance once it recovers.
+REPLICA_LATENCY_STALE_SEC = 30
+
+# Latency charged to a replica when a query on it fails.
+REPLICA_FAILURE_PENALTY_MS = 10 * 1000
+
+# Only route away from a shard's usual replica when it is this many times
+# slower than the alternative, so that each replica keeps serving its own
+# shards, and keeps their rows in its buffer pool, most of the time.
+REPLICA_REROUTE_RATIO = 1.5
+
 
 CONNECTION_COUNT = ts_mon.CounterMetric(
     'monorail/sql/connection_count',
@@ -161,6 +177,62 @@ DB_RESULT_ROWS = ts_mon.CumulativeDistributionMetric(
     'Number of results returned by a DB query.',
     None)
 
+DB_REPLICA_REROUTE_COUNT = ts_mon.CounterMetric(
+    'monorail/sql/db_replica_reroute_count',
+    'Count of queries sent to a faster replica than the usual one.',
+    None)
+
+
+class ReplicaLatencyTracker(object):
+  """Keep a moving average of the latency observed on each DB replica.
+
+  Latency includes the time needed to establish a connection, which is also
+  reported in DB_CNXN_LATENCY, and the time needed to make the query.
+  """
+
+  def __init__(
+      self, alpha=REPLICA_LATENCY_EWMA_ALPHA,
+      stale_sec=REPLICA_LATENCY_STALE_SEC):
+    self.alpha = alpha
+    self.stale_sec = stale_sec
+    self.latency = {}  # {replica_name: (average_ms, timestamp)}
+    self.lock = threading.Lock()
+
+  def Observe(self, replica_name, duration_ms, now=None):
+    """Fold one observed latency into the average for replica_name."""
+    now = now or time.time()
+    with self.lock:
+      average_ms, timestamp = self.latency.get(replica_name, (None, 0))
+      if average_ms is None or now - timestamp > self.stale_sec:
+        average_ms = duration_ms
+      else:
+        average_ms += self.alpha * (duration_ms - average_ms)
+      self.latency[replica_name] = average_ms, now
+
+  def Penalize(self, replica_name, now=None):
+    """Treat replica_name as very slow because a query on it failed."""
+    now = now or time.time()
+    with self.lock:
+      average_ms, _timestamp = self.latency.get(replica_name, (0, 0))
+      self.latency[replica_name] = (
+          max(average_ms, REPLICA_FAILURE_PENALTY_MS), now)
+
+  def GetLatency(self, replica_name, now=None):
+    """Return the average latency in ms, or None if unknown or stale."""
+    now = now or time.time()
+    average_ms, timestamp = self.latency.get(replica_name, (None, 0))
+    if now - timestamp > self.stale_sec:
+      return None
+    return average_ms
+
+  def Clear(self):
+    with self.lock:
+      self.latency = {}
+
+
+# Latency is tracked across requests, like unavailable_shards.
+replica_latency_tracker = ReplicaLatencyTracker()
+
 
 def RandomShardID():
   """Return a random shard ID to load balance across replicas."""
@@ -190,14 +262,18 @@ class MonorailConnection(object):
 
     return self.sql_cnxns[MASTER_CNXN]
 
+  @staticmethod
+  def ReplicaNameForShard(shard_id):
+    """Return the name of the DB replica that will be used for shard_id."""
+    physical_shard_id = shard_id % settings.num_logical_shards
+    return settings.db_replica_names[
+        physical_shard_id % len(settings.db_replica_names)]
+
   @framework_helpers.retry(1, delay=0.1, backoff=2)
   def GetConnectionForShard(self, shard_id):
     """Return a connection to the DB replica that will be used for shard_id."""
     if shard_id not in self.sql_cnxns:
-      physical_shard_id = shard_id % settings.num_logical_shards
-
-      replica_name = settings.db_replica_names[
-          physical_shard_id % len(settings.db_replica_names)]
+      replica_name = self.ReplicaNameForShard(shard_id)
       shard_instance_name = (
           settings.physical_db_name_format % replica_name)
       self.unavailable_shards[shard_id] = int(time.time())
@@ -208,6 +284,37 @@ class MonorailConnection(object):
 
     return self.sql_cnxns[shard_id]
 
+  def ChooseShard(self, shard_id, now=None):
+    """Return shard_id, or another shard if its replica is much faster.
+
+    This uses the power of two choices: compare the latency of the replica
+    that normally serves shard_id with that of one other random replica.
+    """
+    num_replicas = len(settings.db_replica_names)
+    if num_replicas < 2:
+      return shard_id
+    other_shard_id = (
+        shard_id + random.randint(1, num_replicas - 1)
+        ) % settings.num_logical_shards
+    replica_name = self.ReplicaNameForShard(shard_id)
+    other_replica_name = self.ReplicaNameForShard(other_shard_id)
+    if other_replica_name == replica_name:
+      return shard_id
+
+    latency_ms = replica_latency_tracker.GetLatency(replica_name, now=now)
+    other_latency_ms = replica_latency_tracker.GetLatency(
+        other_replica_name, now=now)
+    # An unknown latency keeps the usual replica so that it gets probed.
+    if latency_ms is None or other_latency_ms is None:
+      return shard_id
+    if latency_ms > other_latency_ms * REPLICA_REROUTE_RATIO:
+      logging.info(
+          'Using replica %r (%d ms) rather than %r (%d ms)',
+          other_replica_name, other_latency_ms, replica_name, latency_ms)
+      DB_REPLICA_REROUTE_COUNT.increment()
+      return other_shard_id
+    return shard_id
+
   def Execute(self, stmt_str, stmt_args, shard_id=None, commit=True, retries=2):
     """Execute the given SQL statement on one of the relevant databases."""
     if shard_id is None:
@@ -219,14 +326,24 @@ class MonorailConnection(object):
         if bad_age_sec < BAD_SHARD_AVOIDANCE_SEC:
           logging.info('Avoiding bad replica %r, age %r', shard_id, bad_age_sec)
           shard_id = (shard_id + 1) % settings.num_logical_shards
+      if settings.adaptive_replica_selection:
+        shard_id = self.ChooseShard(shard_id)
+      start_time = time.time()
       sql_cnxn = self.GetConnectionForShard(shard_id)
 
     try:
-      return self._ExecuteWithSQLConnection(
+      cursor = self._ExecuteWithSQLConnection(
           sql_cnxn, stmt_str, stmt_args, commit=commit)
+      if shard_id is not None:
+        replica_latency_tracker.Observe(
+            self.ReplicaNameForShard(shard_id),
+            (time.time() - start_time) * 1000)
+      return cursor
     except MySQLdb.OperationalError as e:
       logging.exception(e)
       logging.info('retries: %r', retries)
+      if shard_id is not None:
+        replica_latency_tracker.Penalize(self.ReplicaNameForShard(shard_id))
       if retries > 0:
         DB_RETRY_COUNT.increment()
         self.sql_cnxns = {}  # Drop all old mysql connections and make new.
@@ -19,6 +19,7 @@ import types
 from third_party import ezt
 from third_party import six
 
+from infra_libs import ts_mon
 from protorpc import messages
 
 import settings
@@ -28,6 +29,11 @@ from framework import framework_constants
 _DISPLAY_VALUE_TRAILING_CHARS = 8
 _DISPLAY_VALUE_TIP_CHARS = 120
 
+TEMPLATE_RENDER_LATENCY = ts_mon.CumulativeDistributionMetric(
+    'monorail/template/render_latency',
+    'Time needed to render an EZT template, in ms.',
+    [ts_mon.StringField('template')])
+
 
 class PBProxy(object):
   """Wraps a Protocol Buffer so it is easy to acceess from a template."""
@@ -108,7 +114,7 @@ def GetTemplate(
     template_path, compress_whitespace=True, eliminate_blank_lines=False,
     base_format=ezt.FORMAT_HTML):
   """Make a MonorailTemplate if needed, or reuse one if possible."""
-  key = template_path, compress_whitespace, base_format
+  key = template_path, compress_whitespace, eliminate_blank_lines, base_format
   if key in _templates:
     return _templates[key]
 
@@ -119,6 +125,28 @@ def GetTemplate(
   return template
 
 
+def WarmTemplates(template_paths, **kwargs):
+  """Parse and compile templates before any request needs them.
+
+  Args:
+    template_paths: list of template paths relative to the templates dir.
+    kwargs: other arguments to pass to GetTemplate().
+
+  Returns:
+    The number of templates that are ready to render.
+  """
+  num_ready = 0
+  for template_path in template_paths:
+    template = GetTemplate(
+        framework_constants.TEMPLATE_PATH + template_path, **kwargs)
+    try:
+      template.GetTemplate()
+      num_ready += 1
+    except (IOError, ezt.EZTException) as e:
+      logging.warning('Could not warm template %r: %r', template_path, e)
+  return num_ready
+
+
 class cStringIOUnicodeWrapper(object):
   """Wrapper on cStringIO.StringIO that encodes unicode as UTF-8 as it goes."""
 
@@ -152,13 +180,14 @@ class MonorailTemplate(object):
     self.base_format = base_format
     self.eliminate_blank_lines = eliminate_blank_lines
 
-  def WriteResponse(self, response, data, content_type=None):
+  def WriteResponse(
+      self, response, data, content_type=None, profiler=None):
     """Write the parsed and filled in template to http server."""
     if content_type:
       response.content_type = content_type
 
     response.status = data.get('http_response_code', httplib.OK)
-    whole_page = self.GetResponse(data)
+    whole_page = self.GetResponse(data, profiler=profiler)
     if data.get('prevent_sniffing'):
       for sniff_pattern, sniff_replacement in SNIFFABLE_PATTERNS.items():
         whole_page = whole_page.replace(sniff_pattern, sniff_replacement)
@@ -166,14 +195,30 @@ class MonorailTemplate(object):
     response.write(whole_page)
     logging.info('wrote response in %dms', int((time.time() - start) * 1000))
 
-  def GetResponse(self, data):
-    """Generate the text from the template and return it as a string."""
+  def GetResponse(self, data, profiler=None):
+    """Generate the text from the template and return it as a string.
+
+    Args:
+      data: dict of values that the template refers to.
+      profiler: optional Profiler to record the render as a phase of the
+          current request.
+
+    Returns:
+      The rendered template as a string.
+    """
     template = self.GetTemplate()
     start = time.time()
     buf = cStringIOUnicodeWrapper()
-    template.generate(buf, data)
+    if profiler:
+      with profiler.Phase('render %s' % self.GetTemplateName()):
+        template.generate(buf, data)
+    else:
+      template.generate(buf, data)
     whole_page = buf.getvalue()
-    logging.info('rendering took %dms', int((time.time() - start) * 1000))
+    render_ms = (time.time() - start) * 1000
+    TEMPLATE_RENDER_LATENCY.add(
+        render_ms, {'template': self.GetTemplateName()})
+    logging.info('rendering took %dms', int(render_ms))
     logging.info('whole_page len is %r', len(whole_page))
     if self.eliminate_blank_lines:
       lines = whole_page.split('\n')
@@ -184,7 +229,7 @@ class MonorailTemplate(object):
     return whole_page
 
   def GetTemplate(self):
-    """Parse the EZT template, or return an already parsed one."""
+    """Parse and compile the EZT template, or return an already parsed one."""
     # We don't operate directly on self.template to avoid races.
     template = self.template
 
@@ -194,6 +239,7 @@ class MonorailTemplate(object):
           fname=self.template_path,
           compress_whitespace=self.compress_whitespace,
           base_format=self.base_format)
+      template.compile()
       logging.info('parsed in %dms', int((time.time() - start) * 1000))
       self.template = template
 
@@ -207,6 +253,12 @@ class MonorailTemplate(object):
     """
     return self.template_path
 
+  def GetTemplateName(self):
+    """Return the template path relative to the templates dir, for reports."""
+    if self.template_path.startswith(framework_constants.TEMPLATE_PATH):
+      return self.template_path[len(framework_constants.TEMPLATE_PATH):]
+    return self.template_path
+
 
 class EZTError(object):
   """This class is a helper class to pass errors to EZT.
@@ -94,3 +94,23 @@ class AuthDataTest(unittest.TestCase):
         self.cnxn, auth, self.services)
     self.assertEqual(auth.user_id, 333)
     self.assertEqual(auth.effective_ids, {111, 222, 333, 888, 999})
+
+  def testFromUserIDs(self):
+    """Many users get the same effective_ids as when loaded one by one."""
+    child = self.services.user.TestAddUser('child@example.com', 222)
+    child.linked_parent_id = 333
+    parent = self.services.user.TestAddUser('parent@example.com', 333)
+    parent.linked_child_ids = [222]
+    self.services.usergroup.TestAddMembers(888, [111, 333])
+    self.services.usergroup.TestAddGroupSettings(999, 'everyone@example.com')
+
+    auths = authdata.AuthData.FromUserIDs(
+        self.cnxn, [111, 222, 333, 0], self.services)
+    self.assertItemsEqual([111, 222, 333], list(auths.keys()))
+    for user_id, auth in auths.items():
+      expected = authdata.AuthData.FromUserID(
+          self.cnxn, user_id, self.services)
+      self.assertEqual(expected.effective_ids, auth.effective_ids)
+      self.assertEqual(expected.email, auth.email)
+    self.assertEqual({111, 888, 999}, auths[111].effective_ids)
+    self.assertEqual({222, 333, 888, 999}, auths[222].effective_ids)
@@ -0,0 +1,89 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Benchmark for checking permissions on every issue in a large list.
+
+We time CanViewIssue() and CanEditIssue() on each issue, as list, grid and
+hotlist pages do, vs. the same checks made through a PermissionEvaluator.
+
+Usage: python framework/test/permissions_benchmark.py [num_issues]
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import random
+import sys
+import time
+
+from framework import permissions
+from proto import project_pb2
+from proto import tracker_pb2
+
+
+LABEL_CHOICES = [
+    [],
+    [],
+    ['Pri-2', 'Type-Bug'],
+    ['Restrict-View-Google', 'Pri-1'],
+    ['Restrict-View-Google', 'Restrict-EditIssue-Commit'],
+    ['Restrict-AddIssueComment-Commit'],
+    ]
+
+
+def MakeProject(num_members):
+  """Return a project where each member has some extra perms."""
+  project = project_pb2.Project(project_id=789)
+  for member_id in range(1, num_members + 1):
+    project.committer_ids.append(member_id)
+    project.extra_perms.append(project_pb2.Project.ExtraPerms(
+        member_id=member_id, perms=['Google', 'Perm%d' % member_id]))
+  return project
+
+
+def MakeIssues(num_issues):
+  rand = random.Random(1)
+  return [
+      tracker_pb2.Issue(
+          issue_id=78900000 + i, project_id=789, local_id=i,
+          reporter_id=rand.randint(1, 1000), owner_id=rand.randint(1, 1000),
+          labels=rand.choice(LABEL_CHOICES))
+      for i in range(num_issues)]
+
+
+def TimeChecks(checker, effective_ids, perms, project, issues, repeat):
+  """Return average ms to check and the decisions made."""
+  start = time.time()
+  for _ in range(repeat):
+    decisions = [
+        (checker.CanViewIssue(effective_ids, perms, project, issue),
+         checker.CanEditIssue(effective_ids, perms, project, issue))
+        for issue in issues]
+  return (time.time() - start) * 1000 / repeat, decisions
+
+
+def main(argv):
+  num_issues = int(argv[1]) if len(argv) > 1 else 1000
+  project = MakeProject(200)
+  issues = MakeIssues(num_issues)
+  perms = permissions.COMMITTER_ACTIVE_PERMISSIONSET
+  print('%d issues' % num_issues)
+  for name, effective_ids in [
+      ('anon', set()), ('member', {5}), ('member in groups', {5, 6, 7, 8})]:
+    plain_ms, plain_decisions = TimeChecks(
+        permissions, effective_ids, perms, project, issues, 5)
+    # Each request makes a new evaluator, so include that in the time.
+    memo_ms, memo_decisions = TimeChecks(
+        permissions.PermissionEvaluator(), effective_ids, perms, project,
+        issues, 1)
+    assert plain_decisions == memo_decisions
+    print(name)
+    print('  plain:     %8.1f ms' % plain_ms)
+    print('  memoized:  %8.1f ms' % memo_ms)
+    print('  speedup:   %8.2fx' % (plain_ms / memo_ms))
+
+
+if __name__ == '__main__':
+  main(sys.argv)
@@ -1858,3 +1858,85 @@ class IssuePermissionsTest(unittest.TestCase):
         permissions.CanAdministerHotlist({333, 444}, self.PERMS, hotlist))
     self.assertTrue(
         permissions.CanAdministerHotlist({333, 444}, self.ADMIN_PERMS, hotlist))
+
+
+class PermissionEvaluatorTest(unittest.TestCase):
+
+  def setUp(self):
+    self.evaluator = permissions.PermissionEvaluator()
+    self.project = project_pb2.Project(
+        project_id=789, committer_ids=[REPORTER_ID, OTHER_ID])
+    self.project.extra_perms.append(project_pb2.Project.ExtraPerms(
+        member_id=OTHER_ID, perms=['Commit', 'InnerCircle']))
+    # Users who are no longer members do not keep their extra perms.
+    self.project.extra_perms.append(project_pb2.Project.ExtraPerms(
+        member_id=APPROVER_ID, perms=['InnerCircle']))
+
+  def MakeIssues(self):
+    issues = []
+    for labels in [[], ['Restrict-View-InnerCircle'],
+                   ['Restrict-View-Commit', 'Restrict-EditIssue-Foo'],
+                   ['restrict-view-innercircle']]:
+      for deleted in [False, True]:
+        issue = tracker_pb2.Issue(
+            reporter_id=REPORTER_ID, owner_id=OWNER_ID, cc_ids=[CC_ID],
+            labels=labels, deleted=deleted)
+        issues.append(issue)
+    return issues
+
+  def testMatchesUnmemoizedChecks(self):
+    perm_sets = [
+        permissions.READ_ONLY_PERMISSIONSET,
+        permissions.COMMITTER_ACTIVE_PERMISSIONSET,
+        permissions.OWNER_ACTIVE_PERMISSIONSET,
+        permissions.EMPTY_PERMISSIONSET]
+    users = [set(), {REPORTER_ID}, {OWNER_ID}, {CC_ID}, {OTHER_ID},
+             {APPROVER_ID}, {OTHER_ID, CC_ID}]
+    for perms in perm_sets:
+      for effective_ids in users:
+        for issue in self.MakeIssues():
+          for granted_perms in [None, ['innercircle']]:
+            self.assertEqual(
+                permissions.UpdateIssuePermissions(
+                    perms, self.project, issue, effective_ids,
+                    granted_perms=granted_perms).perm_names,
+                self.evaluator.UpdateIssuePermissions(
+                    perms, self.project, issue, effective_ids,
+                    granted_perms=granted_perms).perm_names)
+            self.assertEqual(
+                permissions.CanViewIssue(
+                    effective_ids, perms, self.project, issue,
+                    granted_perms=granted_perms),
+                self.evaluator.CanViewIssue(
+                    effective_ids, perms, self.project, issue,
+                    granted_perms=granted_perms))
+            self.assertEqual(
+                permissions.CanEditIssue(
+                    effective_ids, perms, self.project, issue),
+                self.evaluator.CanEditIssue(
+                    effective_ids, perms, self.project, issue))
+            self.assertEqual(
+                perms.CanUsePerm(
+                    permissions.VIEW, effective_ids, self.project,
+                    permissions.GetRestrictions(issue)),
+                self.evaluator.CanUsePerm(
+                    perms, permissions.VIEW, effective_ids, self.project,
+                    permissions.GetRestrictions(issue)))
+
+  def testGetExtraPerms(self):
+    self.assertEqual(
+        {'commit', 'innercircle'},
+        self.evaluator.GetExtraPerms(self.project, {OTHER_ID, CC_ID}))
+    self.assertEqual(
+        frozenset(), self.evaluator.GetExtraPerms(self.project, {APPROVER_ID}))
+    self.assertEqual(frozenset(), self.evaluator.GetExtraPerms(None, {111}))
+
+  def testUpdateIssuePermissions_ReusesDecisions(self):
+    issue_1, issue_2 = self.MakeIssues()[4], self.MakeIssues()[4]
+    perms = permissions.COMMITTER_ACTIVE_PERMISSIONSET
+    first = self.evaluator.UpdateIssuePermissions(
+        perms, self.project, issue_1, {OTHER_ID})
+    second = self.evaluator.UpdateIssuePermissions(
+        perms, self.project, issue_2, {OTHER_ID})
+    self.assertIs(first, second)
+    self.assertNotIn(permissions.EDIT_ISSUE.lower(), first.perm_names)
@@ -0,0 +1,116 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Simulation of static vs. adaptive DB replica selection.
+
+A trace of queries is replayed against fake replicas with injected
+latencies, in simulated time, and the latency that each query would have
+seen is reported for both routing policies.
+
+A trace file has one query per line: the time in seconds since the start
+of the trace at which the query was made, and its shard_id.  Without one,
+a synthetic trace is used.
+
+Usage: python framework/test/sql_benchmark.py [trace_file]
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import random
+import sys
+
+import settings
+from framework import sql
+
+
+class FakeReplica(object):
+  """A replica whose latency is base_ms, times factor during slow periods."""
+
+  def __init__(self, name, base_ms, slow_periods=None):
+    self.name = name
+    self.base_ms = base_ms
+    self.slow_periods = slow_periods or []  # [(start_sec, end_sec, factor)]
+
+  def Latency(self, now, rand):
+    latency_ms = self.base_ms * rand.lognormvariate(0, 0.3)
+    for start_sec, end_sec, factor in self.slow_periods:
+      if start_sec <= now < end_sec:
+        latency_ms *= factor
+    return latency_ms
+
+
+# Replica 2 has a bad minute and replica 3 is always somewhat slow.
+DEFAULT_REPLICAS = [
+    FakeReplica('replica-00', 10),
+    FakeReplica('replica-01', 10),
+    FakeReplica('replica-02', 10, slow_periods=[(30, 90, 20)]),
+    FakeReplica('replica-03', 25),
+    ]
+
+
+def MakeSyntheticTrace(num_queries=20000, duration_sec=120, num_shards=8):
+  """Return [(timestamp, shard_id)] evenly spread over duration_sec."""
+  rand = random.Random(1)
+  return [
+      (i * duration_sec / num_queries, rand.randint(0, num_shards - 1))
+      for i in range(num_queries)]
+
+
+def ReadTrace(path):
+  """Return [(timestamp, shard_id)] from a trace file."""
+  trace = []
+  with open(path) as trace_file:
+    for line in trace_file:
+      if line.strip():
+        timestamp, shard_id = line.split()
+        trace.append((float(timestamp), int(shard_id)))
+  return trace
+
+
+def Replay(trace, replicas, adaptive):
+  """Return (latencies_ms, num_rerouted) for replaying the trace."""
+  settings.db_replica_names = [replica.name for replica in replicas]
+  replicas_by_name = {replica.name: replica for replica in replicas}
+  sql.replica_latency_tracker.Clear()
+  random.seed(2)
+  rand = random.Random(3)
+  cnxn = sql.MonorailConnection()
+  latencies_ms = []
+  num_rerouted = 0
+  for now, shard_id in trace:
+    chosen_shard_id = shard_id
+    if adaptive:
+      chosen_shard_id = cnxn.ChooseShard(shard_id, now=now)
+    if chosen_shard_id != shard_id:
+      num_rerouted += 1
+    replica_name = cnxn.ReplicaNameForShard(chosen_shard_id)
+    latency_ms = replicas_by_name[replica_name].Latency(now, rand)
+    sql.replica_latency_tracker.Observe(replica_name, latency_ms, now=now)
+    latencies_ms.append(latency_ms)
+  return latencies_ms, num_rerouted
+
+
+def Percentile(sorted_values, fraction):
+  return sorted_values[min(len(sorted_values) - 1,
+                           int(len(sorted_values) * fraction))]
+
+
+def main(argv):
+  trace = ReadTrace(argv[1]) if len(argv) > 1 else MakeSyntheticTrace()
+  settings.num_logical_shards = max(shard_id for _, shard_id in trace) + 1
+  print('%d queries over %d replicas' % (len(trace), len(DEFAULT_REPLICAS)))
+  for label, adaptive in [('static', False), ('adaptive', True)]:
+    latencies_ms, num_rerouted = Replay(trace, DEFAULT_REPLICAS, adaptive)
+    latencies_ms.sort()
+    print('  %-9s mean %6.1f ms  p50 %6.1f ms  p99 %6.1f ms  '
+          'rerouted %4.1f%%' % (
+              label + ':', sum(latencies_ms) / len(latencies_ms),
+              Percentile(latencies_ms, 0.5), Percentile(latencies_ms, 0.99),
+              100.0 * num_rerouted / len(trace)))
+
+
+if __name__ == '__main__':
+  main(sys.argv)
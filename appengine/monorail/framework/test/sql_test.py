@@ -242,6 +242,101 @@ class MonorailConnectionTest(unittest.TestCase):
       ewsc.assert_called_once_with(sql_cnxn_1, 'statement', [], commit=True)
 
 
+class ReplicaLatencyTrackerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tracker = sql.ReplicaLatencyTracker(alpha=0.5, stale_sec=30)
+
+  def testObserve_MovingAverage(self):
+    self.assertIsNone(self.tracker.GetLatency('r1', now=100))
+    self.tracker.Observe('r1', 10, now=100)
+    self.assertEqual(10, self.tracker.GetLatency('r1', now=100))
+    self.tracker.Observe('r1', 30, now=101)
+    self.assertEqual(20, self.tracker.GetLatency('r1', now=101))
+    self.assertIsNone(self.tracker.GetLatency('r2', now=101))
+
+  def testObserve_Stale(self):
+    self.tracker.Observe('r1', 1000, now=100)
+    self.assertIsNone(self.tracker.GetLatency('r1', now=200))
+    # A stale average is replaced rather than averaged.
+    self.tracker.Observe('r1', 10, now=200)
+    self.assertEqual(10, self.tracker.GetLatency('r1', now=200))
+
+  def testPenalize(self):
+    self.tracker.Observe('r1', 10, now=100)
+    self.tracker.Penalize('r1', now=101)
+    self.assertEqual(
+        sql.REPLICA_FAILURE_PENALTY_MS, self.tracker.GetLatency('r1', now=101))
+
+
+class ChooseShardTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cnxn = sql.MonorailConnection()
+    self.orig_replica_names = settings.db_replica_names
+    self.orig_num_logical_shards = settings.num_logical_shards
+    settings.db_replica_names = ['r0', 'r1']
+    settings.num_logical_shards = 4
+    sql.replica_latency_tracker.Clear()
+
+  def tearDown(self):
+    settings.db_replica_names = self.orig_replica_names
+    settings.num_logical_shards = self.orig_num_logical_shards
+    sql.replica_latency_tracker.Clear()
+
+  def testChooseShard_OneReplica(self):
+    settings.db_replica_names = ['r0']
+    self.assertEqual(2, self.cnxn.ChooseShard(2))
+
+  def testChooseShard_UnknownLatency(self):
+    sql.replica_latency_tracker.Observe('r1', 1, now=100)
+    self.assertEqual(0, self.cnxn.ChooseShard(0, now=100))
+
+  def testChooseShard_UsualReplicaIsFastEnough(self):
+    sql.replica_latency_tracker.Observe('r0', 12, now=100)
+    sql.replica_latency_tracker.Observe('r1', 10, now=100)
+    self.assertEqual(0, self.cnxn.ChooseShard(0, now=100))
+
+  def testChooseShard_UsualReplicaIsSlow(self):
+    sql.replica_latency_tracker.Observe('r0', 100, now=100)
+    sql.replica_latency_tracker.Observe('r1', 10, now=100)
+    self.assertEqual(1, self.cnxn.ChooseShard(0, now=100))
+    self.assertEqual(3, self.cnxn.ChooseShard(2, now=100))
+    self.assertEqual(1, self.cnxn.ChooseShard(1, now=100))
+
+  def testExecute_ObservesLatency(self):
+    sql_cnxn = self.cnxn.GetConnectionForShard(1)
+    with mock.patch.object(self.cnxn, '_ExecuteWithSQLConnection') as ewsc:
+      ewsc.return_value = 'db result'
+      self.cnxn.Execute('statement', [], shard_id=1)
+      ewsc.assert_called_once_with(sql_cnxn, 'statement', [], commit=True)
+    self.assertIsNotNone(sql.replica_latency_tracker.GetLatency('r1'))
+    self.assertIsNone(sql.replica_latency_tracker.GetLatency('r0'))
+
+  @mock.patch('settings.adaptive_replica_selection', True)
+  def testExecute_Adaptive(self):
+    sql.replica_latency_tracker.Observe('r0', 100)
+    sql.replica_latency_tracker.Observe('r1', 10)
+    sql_cnxn_1 = self.cnxn.GetConnectionForShard(1)
+    with mock.patch.object(self.cnxn, '_ExecuteWithSQLConnection') as ewsc:
+      ewsc.return_value = 'db result'
+      self.cnxn.Execute('statement', [], shard_id=0)
+      ewsc.assert_called_once_with(sql_cnxn_1, 'statement', [], commit=True)
+
+  def testExecute_PenalizesFailures(self):
+    operational_error = type('OperationalError', (Exception,), {})
+    self.cnxn.GetConnectionForShard(1)
+    with mock.patch('framework.sql.MySQLdb', create=True) as mysqldb:
+      mysqldb.OperationalError = operational_error
+      with mock.patch.object(self.cnxn, '_ExecuteWithSQLConnection') as ewsc:
+        ewsc.side_effect = operational_error
+        with self.assertRaises(operational_error):
+          self.cnxn.Execute('statement', [], shard_id=1, retries=0)
+    self.assertEqual(
+        sql.REPLICA_FAILURE_PENALTY_MS,
+        sql.replica_latency_tracker.GetLatency('r1'))
+
+
 class TableManagerTest(unittest.TestCase):
 
   def setUp(self):
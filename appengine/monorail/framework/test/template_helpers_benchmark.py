@@ -0,0 +1,146 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Benchmark for rendering EZT templates with and without compiling them.
+
+We render the issue list table and an issue change notification, which is
+the issue detail that EZT still renders, with large made-up datasets.  Each
+is rendered by interpreting the parsed program, as EZT used to do, and by
+the compiled template that MonorailTemplate now uses.
+
+Usage: python framework/test/template_helpers_benchmark.py [num_issues]
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import sys
+import time
+
+from third_party import ezt
+
+from framework import framework_constants
+from framework import template_helpers
+
+
+class Item(template_helpers.EZTItem):
+  """EZTItem that treats any field that was not given as empty."""
+
+  def __getattr__(self, name):
+    if name.startswith('__'):
+      raise AttributeError(name)
+    return None
+
+
+COLUMNS = ['ID', 'Type', 'Status', 'Priority', 'Owner', 'Summary', 'Blocking']
+
+
+def MakeListData(num_issues):
+  """Return page data for the issue list table."""
+  rows = []
+  for i in range(num_issues):
+    cells = []
+    for col_index, col in enumerate(COLUMNS):
+      if col == 'Summary':
+        cells.append(Item(
+            type='summary', col_index=col_index,
+            values=[Item(item='Issue %d does not <work> & crashes' % i)],
+            non_column_labels=[
+                Item(value='Label-%d' % j, is_derived=ezt.boolean(j == 2))
+                for j in range(4)]))
+      elif col == 'Blocking':
+        cells.append(Item(
+            type='issues', col_index=col_index, align='right',
+            values=[Item(item=Item(
+                id=i + j, href='/p/proj/issues/detail?id=%d' % (i + j),
+                title='Blocked issue %d' % (i + j),
+                closed=ezt.boolean(j % 2)))
+                for j in range(3)]))
+      else:
+        cells.append(Item(
+            type='attr', col_index=col_index, NOWRAP=ezt.boolean(True),
+            values=[Item(item='%s-%d' % (col, i % 7))], non_column_labels=[]))
+    rows.append(Item(
+        idx=i, local_id=i + 1, project_name='proj', issue_ref='proj:%d' % i,
+        issue_url='/p/proj/issues/detail?id=%d' % (i + 1),
+        crbug_url='https://crbug.com/proj/%d' % (i + 1),
+        starred=ezt.boolean(i % 3 == 0), cells=cells))
+
+  return Item(
+      panels=[Item(ordered_columns=[
+          Item(name=col, col_index=col_index)
+          for col_index, col in enumerate(COLUMNS)])],
+      table_data=rows, cursor='proj:1', colspec=' '.join(COLUMNS),
+      page_perms=Item(EditIssue=ezt.boolean(True), SetStar=ezt.boolean(True)))
+
+
+def MakeDetailData(num_items):
+  """Return email data for a new issue with many values and a long comment."""
+  issue = Item(
+      local_id=1234, status=Item(name='Available'),
+      owner=Item(username='owner', display_name='owner@example.com'),
+      cc=[Item(display_name='cc%d@example.com' % i)
+          for i in range(num_items // 10)],
+      labels=[Item(name='Label-%d' % i) for i in range(num_items // 10)],
+      components=[Item(path='UI>Comp%d' % i) for i in range(num_items // 100)],
+      blocked_on=[Item(visible=ezt.boolean(True), display_name='proj:%d' % i)
+                  for i in range(num_items // 10)],
+      fields=[Item(display=ezt.boolean(True), field_name='Field%d' % i,
+                   values=[Item(val='v%d' % j) for j in range(3)])
+              for i in range(num_items // 10)])
+  comment = Item(
+      sequence='0', creator=Item(display_name='reporter@example.com'),
+      content='yes',
+      text_runs=[Item(content='Line %d of the description\n' % i)
+                 for i in range(num_items)],
+      attachments=[Item(filename='log%d.txt' % i, filesizestr='1.2 KB')
+                   for i in range(num_items // 100)])
+  return Item(
+      issue=issue, comment=comment, summary='A long issue',
+      detail_url='https://bugs.example.com/p/proj/issues/detail?id=1234')
+
+
+def TimeRender(template, data, compiled, repeat):
+  """Return average ms to render and the rendered text."""
+  start = time.time()
+  for _ in range(repeat):
+    buf = template_helpers.cStringIOUnicodeWrapper()
+    if compiled:
+      template.generate(buf, data)
+    else:
+      ctx = ezt._context()
+      ctx.data = data
+      ctx.for_index = {}
+      ctx.defines = {}
+      template._execute(template.program, buf, ctx)
+  return (time.time() - start) * 1000 / repeat, buf.getvalue()
+
+
+def main(argv):
+  num_issues = int(argv[1]) if len(argv) > 1 else 1000
+  cases = [
+      ('issue list', 'tracker/issue-list-body.ezt', MakeListData(num_issues),
+       {}),
+      ('issue detail', 'tracker/issue-change-notification-email.ezt',
+       MakeDetailData(num_issues * 10),
+       {'compress_whitespace': False, 'base_format': ezt.FORMAT_RAW}),
+      ]
+  print('%d issues' % num_issues)
+  for name, template_path, data, kwargs in cases:
+    start = time.time()
+    template = template_helpers.MonorailTemplate(
+        framework_constants.TEMPLATE_PATH + template_path, **kwargs)
+    parsed = template.GetTemplate()
+    compile_ms = (time.time() - start) * 1000
+    plain_ms, plain_page = TimeRender(parsed, data, False, 5)
+    compiled_ms, compiled_page = TimeRender(parsed, data, True, 5)
+    assert plain_page == compiled_page
+    print('%-12s %7d bytes  parse+compile %6.1fms  '
+          'interpreted %7.1fms  compiled %7.1fms' % (
+              name, len(plain_page), compile_ms, plain_ms, compiled_ms))
+
+
+if __name__ == '__main__':
+  main(sys.argv)
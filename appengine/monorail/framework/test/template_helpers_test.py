@@ -9,9 +9,17 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import absolute_import
 
+import cStringIO
+import os
+import shutil
+import tempfile
 import unittest
 
+from third_party import ezt
+
+from framework import framework_constants
 from framework import pbproxy_test_pb2
+from framework import profiler
 from framework import template_helpers
 
 
@@ -193,6 +201,82 @@ class HelpersUnitTest(unittest.TestCase):
     self.assertEqual('99 MB', template_helpers.BytesKbOrMb(99 * 1024 * 1024))
 
 
+class MonorailTemplateTest(unittest.TestCase):
+
+  TEMPLATE_TEXT = (
+      '<p>[title]</p>\n\n'
+      '[if-any items][for items]<li>[items.name][if-index items last]!'
+      '[else],[end]</li>[end][else]none[end]\n'
+      '[is mode "raw"]R[else]H[end] [define greeting]Hi [title][end]'
+      '[greeting] [format "raw"][title][end] ["<b>"]')
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.template_path = os.path.join(self.temp_dir, 'test.ezt')
+    with open(self.template_path, 'w') as f:
+      f.write(self.TEMPLATE_TEXT)
+    self.data = {
+        'title': 'A & B',
+        'items': [template_helpers.EZTItem(name='x<'),
+                  template_helpers.EZTItem(name='y')],
+        'mode': 'RAW',
+        }
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def testGetResponse_MatchesInterpretedProgram(self):
+    """The compiled template renders exactly what the parsed program does."""
+    template = template_helpers.MonorailTemplate(self.template_path)
+    page = template.GetResponse(self.data)
+
+    parsed = template.GetTemplate()
+    ctx = ezt._context()
+    ctx.data = template_helpers.EZTItem(**self.data)
+    ctx.for_index = {}
+    ctx.defines = {}
+    buf = cStringIO.StringIO()
+    parsed._execute(parsed.program, buf, ctx)
+
+    self.assertEqual(buf.getvalue(), page)
+    self.assertEqual(
+        '<p>A &amp; B</p>\n<li>x&lt;,</li><li>y!</li>\n'
+        'R Hi A &amp;amp; B A & B &lt;b&gt;',
+        page)
+
+  def testGetResponse_Profiler(self):
+    template = template_helpers.MonorailTemplate(self.template_path)
+    prof = profiler.Profiler()
+    template.GetResponse(self.data, profiler=prof)
+    self.assertEqual(
+        ['render ' + self.template_path],
+        [phase.name for phase in prof.top_phase.subphases])
+
+  def testGetTemplate_ParsesOnce(self):
+    template = template_helpers.MonorailTemplate(self.template_path)
+    parsed = template.GetTemplate()
+    self.assertIs(parsed, template.GetTemplate())
+
+  def testGetTemplateName(self):
+    template = template_helpers.MonorailTemplate(
+        framework_constants.TEMPLATE_PATH + 'tracker/issue-list-page.ezt')
+    self.assertEqual('tracker/issue-list-page.ezt', template.GetTemplateName())
+    template = template_helpers.MonorailTemplate(self.template_path)
+    self.assertEqual(self.template_path, template.GetTemplateName())
+
+  def testWarmTemplates(self):
+    self.assertEqual(
+        1, template_helpers.WarmTemplates(
+            ['tracker/issue-change-notification-email.ezt',
+             'no/such-template.ezt'],
+            compress_whitespace=False, base_format=ezt.FORMAT_RAW))
+    template = template_helpers.GetTemplate(
+        framework_constants.TEMPLATE_PATH +
+        'tracker/issue-change-notification-email.ezt',
+        compress_whitespace=False, base_format=ezt.FORMAT_RAW)
+    self.assertIsNotNone(template.template)
+
+
 class TextRunTest(unittest.TestCase):
 
   def testLink(self):
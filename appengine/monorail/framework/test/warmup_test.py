@@ -10,6 +10,8 @@ from __future__ import absolute_import
 
 import unittest
 
+import mock
+
 from testing import testing_helpers
 
 from framework import sql
@@ -34,3 +36,10 @@ class WarmupTest(unittest.TestCase):
     self.assertEqual(
         {'success': 1},
         actual_json_data)
+
+  @mock.patch('framework.template_helpers.WarmTemplates')
+  def testHandleRequest_WarmsTemplates(self, mock_warm):
+    mock_warm.return_value = 1
+    mr = testing_helpers.MakeMonorailRequest()
+    self.servlet.HandleRequest(mr)
+    self.assertEqual(len(warmup.WARMUP_TEMPLATES), mock_warm.call_count)
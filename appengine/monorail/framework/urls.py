@@ -61,6 +61,8 @@ COMPONENT_DATA_EXPORT_TASK = '/_task/componentDataExportTask'
 SEND_WIPEOUT_USER_LISTS_TASK = '/_task/sendWipeoutUserListsTask'
 DELETE_WIPEOUT_USERS_TASK = '/_task/deleteWipeoutUsersTask'
 DELETE_USERS_TASK = '/_task/deleteUsersTask'
+SNAPSHOT_ROLLUP_TASK = '/_task/snapshotRollup'
+REBALANCE_HOTLIST_TASK = '/_task/rebalanceHotlist'
 
 # URL for publishing issue changes to a pubsub topic.
 PUBLISH_PUBSUB_ISSUE_CHANGE_TASK = '/_task/publishPubsubIssueChange'
@@ -79,6 +81,7 @@ DATE_ACTION_CRON = '/_cron/dateAction'
 SPAM_TRAINING_CRON = '/_cron/spamTraining'
 COMPONENT_DATA_EXPORT_CRON = '/_cron/componentDataExport'
 WIPEOUT_SYNC_CRON = '/_cron/wipeoutSync'
+SNAPSHOT_ROLLUP_CRON = '/_cron/snapshotRollup'
 
 # URLs of handlers needed for GAE instance management.
 WARMUP = '/_ah/warmup'
@@ -10,7 +10,34 @@ from __future__ import absolute_import
 
 import logging
 
+from third_party import ezt
+
 from framework import jsonfeed
+from framework import template_helpers
+
+
+# Templates that are rendered often enough that the first request or task
+# to use them on a new instance should not have to parse them.  Each entry
+# gives the GetTemplate() options that match the code that renders them.
+WARMUP_TEMPLATES = [
+    (['tracker/issue-list-page.ezt'], {'eliminate_blank_lines': True}),
+    (['sitewide/403-page.ezt'], {}),
+    (['tracker/issue-change-notification-email.ezt',
+      'tracker/issue-change-notification-email-link-only.ezt',
+      'tracker/issue-blocking-change-notification-email.ezt',
+      'tracker/issue-bulk-change-notification-email.ezt',
+      'tracker/approval-change-notification-email.ezt'],
+     {'compress_whitespace': False, 'base_format': ezt.FORMAT_RAW}),
+    ]
+
+
+def WarmTemplates():
+  """Parse and compile the templates in WARMUP_TEMPLATES."""
+  num_ready = 0
+  for template_paths, kwargs in WARMUP_TEMPLATES:
+    num_ready += template_helpers.WarmTemplates(template_paths, **kwargs)
+  logging.info('Warmed %d templates', num_ready)
+  return num_ready
 
 
 class Warmup(jsonfeed.InternalTask):
@@ -18,8 +45,10 @@ class Warmup(jsonfeed.InternalTask):
 
   def HandleRequest(self, _mr):
     """Don't do anything that could cause a jam when many instances start."""
-    logging.info('/_ah/startup does nothing in Monorail.')
+    logging.info('/_ah/startup only warms templates in Monorail.')
     logging.info('However it is needed for min_idle_instances in app.yaml.')
+    # Templates are read from local files, so this cannot cause a jam.
+    WarmTemplates()
 
     return {
       'success': 1,
@@ -30,8 +59,9 @@ class Start(jsonfeed.InternalTask):
 
   def HandleRequest(self, _mr):
     """Don't do anything that could cause a jam when many instances start."""
-    logging.info('/_ah/start does nothing in Monorail.')
+    logging.info('/_ah/start only warms templates in Monorail.')
     logging.info('However it is needed for manual_scaling in app.yaml.')
+    WarmTemplates()
 
     return {
       'success': 1,
@@ -27,11 +27,13 @@ from features import pubsub
 from features import userhotlists
 from features import inboundemail
 from features import notify
+from features import rebalancehotlist
 from features import rerankhotlist
 from features import savedqueries
 from features import spammodel
 from features import spamtraining
 from features import componentexport
+from features import snapshotrollup
 
 from framework import banned
 from framework import clientmon
@@ -233,6 +235,8 @@ class ServletRegistry(object):
         urls.COMPONENT_DATA_EXPORT_TASK:
           componentexport.ComponentTrainingDataExportTask,
         urls.FLT_ISSUE_CONVERSION_TASK: fltconversion.FLTConvertTask,
+        urls.SNAPSHOT_ROLLUP_CRON: snapshotrollup.SnapshotRollupCron,
+        urls.SNAPSHOT_ROLLUP_TASK: snapshotrollup.SnapshotRollupTask,
         })
 
     self._SetupProjectServlets(
@@ -391,6 +395,7 @@ class ServletRegistry(object):
         urls.GROUP_DELETE: grouplist.GroupList,
         urls.HOTLIST_CREATE: hotlistcreate.HotlistCreate,
         urls.BAN_SPAMMER_TASK: banspammer.BanSpammerTask,
+        urls.REBALANCE_HOTLIST_TASK: rebalancehotlist.RebalanceHotlistTask,
         urls.WIPEOUT_SYNC_CRON: deleteusers.WipeoutSyncCron,
         urls.SEND_WIPEOUT_USER_LISTS_TASK: deleteusers.SendWipeoutUserListsTask,
         urls.DELETE_WIPEOUT_USERS_TASK: deleteusers.DeleteWipeoutUsersTask,
@@ -379,6 +379,7 @@ CREATE TABLE Comment (
   is_description BOOLEAN DEFAULT FALSE,
 
   PRIMARY KEY(id),
+  INDEX (issue_id, created),
   INDEX (is_spam, project_id, created),
   INDEX (commenter_id, created),
   INDEX (commenter_id, deleted_by, issue_id),
@@ -954,3 +955,25 @@ CREATE TABLE IssueSnapshot2Hotlist(
   FOREIGN KEY (issuesnapshot_id) REFERENCES IssueSnapshot(id),
   FOREIGN KEY (hotlist_id) REFERENCES Hotlist(id)
 ) ENGINE=INNODB;
+
+
+CREATE TABLE IssueSnapshotRollup(
+  project_id SMALLINT UNSIGNED NOT NULL,
+  day_end INT UNSIGNED NOT NULL,
+  dimension ENUM ('total', 'open', 'status', 'owner', 'label', 'component') NOT NULL,
+  value_id INT UNSIGNED NOT NULL,
+  issue_count INT NOT NULL,
+
+  PRIMARY KEY (project_id, day_end, dimension, value_id),
+  FOREIGN KEY (project_id) REFERENCES Project(project_id)
+) ENGINE=INNODB;
+
+
+CREATE TABLE IssueSnapshotRollupStatus(
+  project_id SMALLINT UNSIGNED NOT NULL,
+  rolled_up_since INT UNSIGNED NOT NULL,
+  rolled_up_through INT UNSIGNED NOT NULL,
+
+  PRIMARY KEY (project_id),
+  FOREIGN KEY (project_id) REFERENCES Project(project_id)
+) ENGINE=INNODB;
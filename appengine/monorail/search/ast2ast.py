@@ -276,6 +276,16 @@ def _MakeWordBoundaryRegex(cond):
   return re.compile(r'.*\b(%s)\b.*' % all_words, re.I)
 
 
+def MakeLabelRegex(cond):
+  """Return the regex for labels that a non-equality label cond matches."""
+  if _IsDefinedOp(cond.op):
+    return _MakePrefixRegex(cond)
+  elif cond.op == ast_pb2.QueryOp.KEY_HAS:
+    return _MakeKeyValueRegex(cond)
+  else:
+    return _MakeWordBoundaryRegex(cond)
+
+
 def _PreprocessLabelCond(
     cnxn, cond, project_ids, services, _harmonized_config, _is_member):
   """Preprocess a label=names cond into label_id=IDs."""
@@ -285,28 +295,16 @@ def _PreprocessLabelCond(
       if _IsEqualityOp(cond.op):
         label_ids.extend(services.config.LookupLabelIDs(
             cnxn, project_id, cond.str_values))
-      elif _IsDefinedOp(cond.op):
-        label_ids.extend(services.config.LookupIDsOfLabelsMatching(
-            cnxn, project_id, _MakePrefixRegex(cond)))
-      elif cond.op == ast_pb2.QueryOp.KEY_HAS:
-        label_ids.extend(services.config.LookupIDsOfLabelsMatching(
-            cnxn, project_id, _MakeKeyValueRegex(cond)))
       else:
         label_ids.extend(services.config.LookupIDsOfLabelsMatching(
-            cnxn, project_id, _MakeWordBoundaryRegex(cond)))
+            cnxn, project_id, MakeLabelRegex(cond)))
   else:
     if _IsEqualityOp(cond.op):
       label_ids = services.config.LookupLabelIDsAnyProject(
           cnxn, cond.str_values)
-    elif _IsDefinedOp(cond.op):
-      label_ids = services.config.LookupIDsOfLabelsMatchingAnyProject(
-          cnxn, _MakePrefixRegex(cond))
-    elif cond.op == ast_pb2.QueryOp.KEY_HAS:
-      label_ids = services.config.LookupIDsOfLabelsMatchingAnyProject(
-          cnxn, _MakeKeyValueRegex(cond))
     else:
       label_ids = services.config.LookupIDsOfLabelsMatchingAnyProject(
-          cnxn, _MakeWordBoundaryRegex(cond))
+          cnxn, MakeLabelRegex(cond))
 
   return ast_pb2.Condition(
       op=_TextOpToIntOp(cond.op),
@@ -26,6 +26,7 @@ from framework import framework_helpers
 from framework import jsonfeed
 from framework import permissions
 from framework import sql
+from search import restrictionindex
 from search import search_helpers
 
 
@@ -117,6 +118,11 @@ class BackendNonviewable(jsonfeed.InternalTask):
     """Return IIDs of restricted issues that user might not be able to view."""
     at_risk_label_ids = search_helpers.GetPersonalAtRiskLabelIDs(
       cnxn, user, self.services.config, effective_ids, project, perms)
+    if settings.index_restricted_issues:
+      return list(restrictionindex.GetRestrictedIIDs(
+          cnxn, self.services, project.project_id, shard_id,
+          at_risk_label_ids))
+
     at_risk_iids = self.services.issue.GetIIDsByLabelIDs(
       cnxn, at_risk_label_ids, project.project_id, shard_id)
 
@@ -33,6 +33,7 @@ from search import ast2ast
 from search import ast2select
 from search import ast2sort
 from search import query2ast
+from search import searchcache
 from search import searchpipeline
 from services import tracker_fulltext
 from services import fulltext_helpers
@@ -284,14 +285,16 @@ def _GetQueryResultIIDs(
 
   projects_str = ','.join(str(pid) for pid in sorted(query_project_ids))
   projects_str = projects_str or 'all'
+  query_key = searchpipeline.QueryCacheKey(
+      canned_query, user_query, harmonized_config)
   memcache_key = ';'.join([
-      projects_str, canned_query, user_query, ' '.join(sd), str(shard_id)])
+      projects_str, query_key, ' '.join(sd), str(shard_id)])
   memcache.set(memcache_key, (result_iids, invalidation_timestep),
                time=expiration, namespace=settings.memcache_namespace)
   logging.info('set memcache key %r', memcache_key)
 
   search_limit_memcache_key = ';'.join([
-      projects_str, canned_query, user_query, ' '.join(sd),
+      projects_str, query_key, ' '.join(sd),
       'search_limit_reached', str(shard_id)])
   memcache.set(search_limit_memcache_key,
                (search_limit_reached, invalidation_timestep),
@@ -301,23 +304,26 @@ def _GetQueryResultIIDs(
 
   timestamps_for_projects = memcache.get_multi(
       keys=(['%d;%d' % (pid, shard_id) for pid in query_project_ids] +
-            ['all:%d' % shard_id]),
+            ['all;%d' % shard_id]),
       namespace=settings.memcache_namespace)
 
   if query_project_ids:
-    for pid in query_project_ids:
-      key = '%d;%d' % (pid, shard_id)
-      if key not in timestamps_for_projects:
-        memcache.set(
-            key, invalidation_timestep,
-            time=framework_constants.MEMCACHE_EXPIRATION,
-            namespace=settings.memcache_namespace)
+    timestamp_keys = ['%d;%d' % (pid, shard_id) for pid in query_project_ids]
   else:
-    key = 'all;%d' % shard_id
+    timestamp_keys = ['all;%d' % shard_id]
+  started_keys = set()
+  for key in timestamp_keys:
     if key not in timestamps_for_projects:
       memcache.set(
           key, invalidation_timestep,
           time=framework_constants.MEMCACHE_EXPIRATION,
           namespace=settings.memcache_namespace)
+      started_keys.add(key)
+
+  if settings.incremental_search_cache:
+    searchcache.RegisterCachedResult(
+        cnxn, services, query_ast, query_project_ids, harmonized_config, sd,
+        shard_id, memcache_key, search_limit_memcache_key,
+        search_limit_reached, started_keys)
 
   return result_iids, search_limit_reached, error
@@ -21,6 +21,7 @@ from __future__ import absolute_import
 import json
 
 import collections
+import heapq
 import logging
 import math
 import random
@@ -48,6 +49,8 @@ from tracker import tracker_bizobj
 from tracker import tracker_constants
 from tracker import tracker_helpers
 
+from infra_libs import ts_mon
+
 
 # Fail-fast responses usually finish in less than 50ms.  If we see a failure
 # in under that amount of time, we don't bother logging it.
@@ -63,6 +66,40 @@ MIN_SAMPLE_CHUNK_SIZE = int(
 MAX_SAMPLE_CHUNK_SIZE = int(math.sqrt(settings.search_limit_per_shard))
 PREFERRED_NUM_CHUNKS = 50
 
+# When merging sorted shards, fetch at least this many issues at a time from
+# any one shard, so that uneven shards do not cause many small fetches.
+MIN_MERGE_BATCH_SIZE = 10
+
+# Sort directives for which the backends' SQL ORDER BY gives exactly the
+# order of sorting.SortArtifacts() and whose values never change, so cached
+# shard results stay in order.  Others differ, e.g., in NULL placement or
+# how multi-valued fields are compared, so their shards cannot be merged.
+# 'project' also qualifies when only one project is searched, because SQL
+# sorts on project_id while SortArtifacts() uses the project name.
+MERGEABLE_SORT_FIELDS = {'id', 'opened'}
+
+# Number of recent backend search latencies used to choose the hedge delay,
+# and the number needed before any searches are hedged.
+HEDGE_LATENCY_SAMPLES = 500
+HEDGE_MIN_LATENCY_SAMPLES = 20
+
+QUERY_CACHE_LOOKUPS = ts_mon.CounterMetric(
+    'monorail/search/query_cache_lookups',
+    'Count of cached search result lookups per shard, by result: '
+    'hit, miss, or stale.',
+    [ts_mon.IntegerField('shard_id'), ts_mon.StringField('result')])
+
+BACKEND_SEARCH_LATENCY = ts_mon.CumulativeDistributionMetric(
+    'monorail/search/backend_search_latency',
+    'Time in ms for a backend to answer a search of one shard.',
+    [ts_mon.IntegerField('shard_id'), ts_mon.BooleanField('hedged')])
+
+BACKEND_HEDGE_COUNT = ts_mon.CounterMetric(
+    'monorail/search/backend_hedge_count',
+    'Count of duplicated backend searches, by which call answered first: '
+    'original or duplicate.',
+    [ts_mon.StringField('winner')])
+
 
 # TODO(jojwang): monorail:4127: combine some url parameters info or
 # query info into dicts or tuples to make argument manager easier.
@@ -219,6 +256,15 @@ class FrontendSearchPipeline(object):
       for filtered_shard_iids in self.filtered_iids.values():
         self.allowed_iids.extend(filtered_shard_iids)
 
+    if not self.grid_mode and self._CanMergeSortedShards():
+      # Each shard is already sorted, so we only need to fetch and merge
+      # enough issues to fill the current pagination page.
+      limit = (self.paginate_start + self.items_per_page -
+               self.num_skipped_at_start)
+      with self.profiler.Phase('merging sorted shards'):
+        self.allowed_results = self._MergeSortedShards(limit)
+      return
+
     # The grid view is not paginated, so limit the results shown to avoid
     # generating a HTML page that would be too large.
     limit = settings.max_issues_in_grid
@@ -238,6 +284,79 @@ class FrontendSearchPipeline(object):
           self.allowed_results, self.harmonized_config, self.users_by_id,
           self.group_by_spec, self.sort_spec)
 
+  def _CanMergeSortedShards(self):
+    """Return True if the shards are sorted exactly as SortArtifacts would."""
+    sort_directives = sorting.ComputeSortDirectives(
+        self.harmonized_config, self.group_by_spec, self.sort_spec)
+    mergeable_fields = MERGEABLE_SORT_FIELDS
+    if len(set(self.query_project_ids)) == 1:
+      mergeable_fields = mergeable_fields | {'project'}
+    return all(
+        sort_directive.lstrip('-') in mergeable_fields
+        for sort_directive in sort_directives)
+
+  def _MergeSortedShards(self, limit):
+    """Return the first limit issues from a k-way merge of sorted shards.
+
+    Issues are fetched from each shard in small batches as the merge reaches
+    them, so we never fetch or compute sort keys for most of the issues in
+    long result lists.
+    """
+    shard_iid_lists = [
+        shard_iids for shard_iids in self.filtered_iids.values()
+        if shard_iids]
+    if not shard_iid_lists or limit <= 0:
+      return []
+    batch_size = max(
+        MIN_MERGE_BATCH_SIZE, -(-limit // len(shard_iid_lists)))
+    sort_key = sorting.MakeSortKeyFunction(
+        self.harmonized_config, tracker_helpers.SORTABLE_FIELDS,
+        tracker_helpers.SORTABLE_FIELDS_POSTPROCESSORS, self.group_by_spec,
+        self.sort_spec, users_by_id=self.users_by_id)
+
+    def FetchBatches(batch_slices):
+      """Return {shard_index: [issue, ...]} for (shard_index, iids) pairs."""
+      batch_iids = []
+      for _shard_index, iids in batch_slices:
+        batch_iids.extend(iids)
+      issues = self.services.issue.GetIssues(self.cnxn, batch_iids)
+      self._LookupNeededUsers(issues)
+      issue_dict = {issue.issue_id: issue for issue in issues}
+      return {
+          shard_index: collections.deque(
+              issue_dict[iid] for iid in iids if iid in issue_dict)
+          for shard_index, iids in batch_slices}
+
+    buffers = FetchBatches([
+        (shard_index, shard_iids[:batch_size])
+        for shard_index, shard_iids in enumerate(shard_iid_lists)])
+    next_offsets = [batch_size] * len(shard_iid_lists)
+    heap = []
+
+    def PushNext(shard_index):
+      """Put the next issue from a shard onto the heap, if there is one."""
+      shard_iids = shard_iid_lists[shard_index]
+      buf = buffers[shard_index]
+      while not buf and next_offsets[shard_index] < len(shard_iids):
+        offset = next_offsets[shard_index]
+        next_offsets[shard_index] += batch_size
+        buf.extend(FetchBatches([
+            (shard_index, shard_iids[offset:offset + batch_size])
+            ])[shard_index])
+      if buf:
+        issue = buf.popleft()
+        heapq.heappush(heap, (sort_key(issue), shard_index, issue))
+
+    for shard_index in range(len(shard_iid_lists)):
+      PushNext(shard_index)
+
+    merged = []
+    while heap and len(merged) < limit:
+      _key, shard_index, issue = heapq.heappop(heap)
+      merged.append(issue)
+      PushNext(shard_index)
+    return merged
+
   def _NarrowFilteredIIDs(self):
     """Combine filtered shards into a range of IIDs for issues to sort.
 
@@ -625,31 +744,138 @@ def _StartBackendSearch(
   # 3. Hit backends for any shards that are still needed.  When these results
   # come back, they are also put into unfiltered_iids_dict.
   for shard_key in needed_shard_keys:
-    rpc = _StartBackendSearchCall(
-        query_project_names, shard_key,
-        services.cache_manager.processed_invalidations_up_to,
-        me_user_ids, logged_in_user_id, new_url_num, url_params,
-        sort_spec=sort_spec, group_by_spec=group_by_spec)
-    rpc_tuple = (time.time(), shard_key, rpc)
-    rpc.callback = _MakeBackendCallback(
-        _HandleBackendSearchResponse, query_project_names, rpc_tuple,
-        rpc_tuples, settings.backend_retries, unfiltered_iids_dict,
+    hedge = None
+    if settings.hedge_backend_searches:
+      hedge = BackendHedge(settings.backend_retries)
+    call_args = (
+        query_project_names, shard_key, rpc_tuples, unfiltered_iids_dict,
         search_limit_reached_dict,
         services.cache_manager.processed_invalidations_up_to,
         error_responses, me_user_ids, logged_in_user_id, new_url_num,
         url_params, sort_spec, group_by_spec)
-    rpc_tuples.append(rpc_tuple)
+    if hedge:
+      hedge.start_duplicate = _MakeBackendCallback(
+          _StartBackendSearchAttempt, 0, True, hedge, *call_args)
+    _StartBackendSearchAttempt(
+        settings.backend_retries, True, hedge, *call_args)
 
   return rpc_tuples
 
 
+class BackendLatencyTracker(object):
+  """Keep recent backend search latencies to decide when to hedge."""
+
+  def __init__(self, max_samples=HEDGE_LATENCY_SAMPLES):
+    self.samples = collections.deque(maxlen=max_samples)
+
+  def Observe(self, duration_sec):
+    """Record the time taken by one successful backend search."""
+    self.samples.append(duration_sec)
+
+  def HedgeDelay(self):
+    """Return seconds to wait before duplicating a search, or None."""
+    if len(self.samples) < HEDGE_MIN_LATENCY_SAMPLES:
+      return None
+    ordered = sorted(self.samples)
+    index = int(len(ordered) * settings.backend_hedge_percentile / 100)
+    return max(
+        settings.backend_hedge_min_delay_sec,
+        ordered[min(index, len(ordered) - 1)])
+
+
+backend_latency_tracker = BackendLatencyTracker()
+
+
+class BackendHedge(object):
+  """State shared by all calls that search the same shard.
+
+  When a search takes longer than most recent searches, we send a duplicate
+  request and use whichever call answers first.  The duplicate is failfast,
+  so it is rejected rather than queued if it lands on a busy instance.
+  """
+
+  def __init__(self, remaining_retries):
+    self.start_duplicate = None  # function() that starts the duplicate call.
+    self.duplicate_rpc = None
+    self.answered = False
+    self.num_pending = 0
+    # Retries are shared by all calls for the shard and are only used after
+    # every pending call has failed.
+    self.remaining_retries = remaining_retries
+
+  @property
+  def hedged(self):
+    return self.duplicate_rpc is not None
+
+
+def _StartBackendSearchAttempt(
+    remaining_retries, failfast, hedge, query_project_names, shard_key,
+    rpc_tuples, unfiltered_iids, search_limit_reached, invalidation_timestep,
+    error_responses, me_user_ids, logged_in_user_id, new_url_num, url_params,
+    sort_spec, group_by_spec):
+  """Start one backend search call and add it to rpc_tuples."""
+  rpc = _StartBackendSearchCall(
+      query_project_names, shard_key, invalidation_timestep,
+      me_user_ids, logged_in_user_id, new_url_num, url_params,
+      sort_spec=sort_spec, group_by_spec=group_by_spec, failfast=failfast)
+  rpc_tuple = (time.time(), shard_key, rpc)
+  rpc.callback = _MakeBackendCallback(
+      _HandleBackendSearchResponse, query_project_names, rpc_tuple,
+      rpc_tuples, remaining_retries, unfiltered_iids, search_limit_reached,
+      invalidation_timestep, error_responses, me_user_ids, logged_in_user_id,
+      new_url_num, url_params, sort_spec, group_by_spec)
+  if hedge:
+    rpc.hedge = hedge
+    hedge.num_pending += 1
+  rpc_tuples.append(rpc_tuple)
+  return rpc
+
+
+def _NextHedgeTime(rpc_tuples):
+  """Return the time at which the next search should be duplicated, or None."""
+  delay = backend_latency_tracker.HedgeDelay()
+  if delay is None or settings.local_mode:
+    return None
+  hedge_times = [
+      start_time + delay for start_time, _shard_key, rpc in rpc_tuples
+      if _CanHedge(rpc)]
+  return min(hedge_times) if hedge_times else None
+
+
+def _CanHedge(rpc):
+  hedge = getattr(rpc, 'hedge', None)
+  return hedge is not None and not hedge.hedged and not hedge.answered
+
+
+def _StartDueHedges(rpc_tuples, hedge_time):
+  """Duplicate the searches that were started at least hedge_time ago."""
+  delay = backend_latency_tracker.HedgeDelay()
+  for start_time, shard_key, rpc in list(rpc_tuples):
+    if _CanHedge(rpc) and start_time + delay <= hedge_time:
+      logging.info('Duplicating slow backend search of shard %r', shard_key)
+      rpc.hedge.duplicate_rpc = rpc.hedge.start_duplicate()
+
+
+def _IsAnswered(rpc):
+  hedge = getattr(rpc, 'hedge', None)
+  return hedge is not None and hedge.answered
+
+
 def _FinishBackendSearch(rpc_tuples):
-  """Wait for all backend calls to complete, including any retries."""
+  """Wait for all backend calls to complete, including any retries.
+
+  Slow searches are duplicated if hedging is enabled, and we stop waiting
+  for a shard as soon as any of its calls has answered.
+  """
   while rpc_tuples:
     active_rpcs = [rpc for (_time, _shard_key, rpc) in rpc_tuples]
     # Wait for any active RPC to complete.  It's callback function will
     # automatically be called.
-    finished_rpc = real_wait_any(active_rpcs)
+    hedge_time = _NextHedgeTime(rpc_tuples)
+    finished_rpc = real_wait_any(active_rpcs, deadline=hedge_time)
+    if finished_rpc is None:
+      _StartDueHedges(rpc_tuples, hedge_time)
+      continue
     # Figure out which rpc_tuple finished and remove it from our list.
     for rpc_tuple in rpc_tuples:
       _time, _shard_key, rpc = rpc_tuple
@@ -658,9 +884,12 @@ def _FinishBackendSearch(rpc_tuples):
         break
     else:
       raise ValueError('We somehow finished an RPC that is not in rpc_tuples')
+    # There is no need to wait for the other call to a shard that answered.
+    rpc_tuples[:] = [
+        rpc_tuple for rpc_tuple in rpc_tuples if not _IsAnswered(rpc_tuple[2])]
 
 
-def real_wait_any(active_rpcs):
+def real_wait_any(active_rpcs, deadline=None):
   """Work around the blocking nature of wait_any().
 
   wait_any() checks for any finished RPCs, and returns one if found.
@@ -670,6 +899,7 @@ def real_wait_any(active_rpcs):
   request that is taking a long time to do actual work.
 
   Instead, we do the same check, without blocking on any individual RPC.
+  If deadline is given and passes before any RPC finishes, returns None.
   """
   if settings.local_mode:
     # The development server has very different code for RPCs than the
@@ -679,6 +909,8 @@ def real_wait_any(active_rpcs):
     finished, _ = apiproxy_stub_map.UserRPC._UserRPC__check_one(active_rpcs)
     if finished:
       return finished
+    if deadline is not None and time.time() >= deadline:
+      return None
     time.sleep(DELAY_BETWEEN_RPC_COMPLETION_POLLS)
 
 def _GetProjectTimestamps(query_project_ids, needed_shard_keys):
@@ -826,16 +1058,18 @@ def _GetCachedSearchResults(
   sd = sorting.ComputeSortDirectives(
       harmonized_config, group_by_spec, sort_spec)
   sd_str = ' '.join(sd)
-  memcache_key_prefix = '%s;%s' % (projects_str, canned_query)
-  limit_reached_key_prefix = '%s;%s' % (projects_str, canned_query)
+  query_keys = {
+      subquery: searchpipeline.QueryCacheKey(
+          canned_query, subquery, harmonized_config)
+      for subquery in {subquery for _sid, subquery in needed_shard_keys}}
 
   cached_dict = memcache.get_multi(
-      ['%s;%s;%s;%d' % (memcache_key_prefix, subquery, sd_str, sid)
+      ['%s;%s;%s;%d' % (projects_str, query_keys[subquery], sd_str, sid)
        for sid, subquery in needed_shard_keys],
       namespace=settings.memcache_namespace)
   cached_search_limit_reached_dict = memcache.get_multi(
       ['%s;%s;%s;search_limit_reached;%d' % (
-          limit_reached_key_prefix, subquery, sd_str, sid)
+          projects_str, query_keys[subquery], sd_str, sid)
        for sid, subquery in needed_shard_keys],
       namespace=settings.memcache_namespace)
 
@@ -844,11 +1078,12 @@ def _GetCachedSearchResults(
   for shard_key in needed_shard_keys:
     shard_id, subquery = shard_key
     memcache_key = '%s;%s;%s;%d' % (
-        memcache_key_prefix, subquery, sd_str, shard_id)
+        projects_str, query_keys[subquery], sd_str, shard_id)
     limit_reached_key = '%s;%s;%s;search_limit_reached;%d' % (
-        limit_reached_key_prefix, subquery, sd_str, shard_id)
+        projects_str, query_keys[subquery], sd_str, shard_id)
     if memcache_key not in cached_dict:
       logging.info('memcache miss on shard %r', shard_key)
+      QUERY_CACHE_LOOKUPS.increment({'shard_id': shard_id, 'result': 'miss'})
       continue
 
     cached_iids, cached_ts = cached_dict[memcache_key]
@@ -874,8 +1109,11 @@ def _GetCachedSearchResults(
         logging.info('memcache too stale on shard %r because of all',
                      shard_id)
 
-    if not stale:
+    if stale:
+      QUERY_CACHE_LOOKUPS.increment({'shard_id': shard_id, 'result': 'stale'})
+    else:
       logging.info('memcache hit on %r', shard_key)
+      QUERY_CACHE_LOOKUPS.increment({'shard_id': shard_id, 'result': 'hit'})
       unfiltered_dict[shard_key] = cached_iids
       search_limit_reached_dict[shard_key] = search_limit_reached
 
@@ -950,6 +1188,11 @@ def _HandleBackendSearchResponse(
   """Process one backend response and retry if there was an error."""
   start_time, shard_key, rpc = rpc_tuple
   duration_sec = time.time() - start_time
+  hedge = getattr(rpc, 'hedge', None)
+  if hedge:
+    hedge.num_pending -= 1
+    if hedge.answered:
+      return  # Another call for this shard answered first.
 
   try:
     response = rpc.get_result()
@@ -964,6 +1207,9 @@ def _HandleBackendSearchResponse(
     json_data = json.loads(json_content)
     unfiltered_iids[shard_key] = json_data['unfiltered_iids']
     search_limit_reached[shard_key] = json_data['search_limit_reached']
+    if hedge:
+      hedge.answered = True
+    _RecordBackendSearchLatency(shard_key, rpc, duration_sec, hedge)
     if json_data.get('error'):
       # Don't raise an exception, just log, because these errors are more like
       # 400s than 500s, and shouldn't be retried.
@@ -974,6 +1220,11 @@ def _HandleBackendSearchResponse(
   except Exception as e:
     if duration_sec > FAIL_FAST_LIMIT_SEC:  # Don't log fail-fast exceptions.
       logging.exception(e)
+    if hedge:
+      if hedge.num_pending:
+        return  # Another call for this shard may still answer.
+      remaining_retries = hedge.remaining_retries
+
     if not remaining_retries:
       logging.error('backend search retries exceeded')
       error_responses.add(shard_key)
@@ -985,19 +1236,28 @@ def _HandleBackendSearchResponse(
       return  # That backend shard is overloaded, so give up.
 
     logging.error('backend call for shard %r failed, retrying', shard_key)
-    retry_rpc = _StartBackendSearchCall(
-        query_project_names, shard_key, invalidation_timestep,
-        me_user_ids, logged_in_user_id, new_url_num, url_params,
-        sort_spec=sort_spec, group_by_spec=group_by_spec,
-        failfast=remaining_retries > 2)
-    retry_rpc_tuple = (time.time(), shard_key, retry_rpc)
-    retry_rpc.callback = _MakeBackendCallback(
-        _HandleBackendSearchResponse, query_project_names,
-        retry_rpc_tuple, rpc_tuples, remaining_retries - 1, unfiltered_iids,
+    if hedge:
+      hedge.remaining_retries = remaining_retries - 1
+    _StartBackendSearchAttempt(
+        remaining_retries - 1, remaining_retries > 2, hedge,
+        query_project_names, shard_key, rpc_tuples, unfiltered_iids,
         search_limit_reached, invalidation_timestep, error_responses,
         me_user_ids, logged_in_user_id, new_url_num, url_params,
         sort_spec, group_by_spec)
-    rpc_tuples.append(retry_rpc_tuple)
+
+
+def _RecordBackendSearchLatency(shard_key, rpc, duration_sec, hedge):
+  """Record how long a successful backend search took."""
+  # The system clock can be adjusted while we wait.
+  duration_sec = max(0, duration_sec)
+  backend_latency_tracker.Observe(duration_sec)
+  shard_id, _subquery = shard_key
+  hedged = bool(hedge and hedge.hedged)
+  BACKEND_SEARCH_LATENCY.add(
+      duration_sec * 1000, {'shard_id': shard_id, 'hedged': hedged})
+  if hedged:
+    winner = 'duplicate' if rpc is hedge.duplicate_rpc else 'original'
+    BACKEND_HEDGE_COUNT.increment({'winner': winner})
 
 
 def _HandleBackendNonviewableResponse(
@@ -0,0 +1,306 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""An index of restricted issues in each project shard, kept in memcache.
+
+To compute the issues that a user cannot view, besearch needs the IDs of
+issues that have any "Restrict-View-*" label that the user lacks the
+permission for.  Rather than querying Issue2Label each time, we keep a
+"restricted_index:PROJECT_ID;SHARD_ID" entry in memcache that maps each
+restriction label ID to the set of issue IDs with that label.  The index is
+built with one query when it is missing and is then patched as issues are
+stored.
+
+Sets of issue IDs are stored like roaring bitmaps: issue IDs are split into
+chunks that share their high bits, and each chunk is either a sorted array
+of the low bits, if it has few members, or an int used as a bitmap.
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import array
+import collections
+import logging
+
+from google.appengine.api import memcache
+
+import settings
+from framework import framework_constants
+from search import search_helpers
+
+
+INDEX_KEY_PREFIX = 'restricted_index:'
+
+# Limit the life of an index so that any missed update is eventually fixed.
+INDEX_EXPIRATION = framework_constants.SECS_PER_HOUR
+
+# Value stored while an index is being built.
+PENDING = 'pending'
+
+# Number of times to retry a compare-and-set of an index.
+INDEX_CAS_RETRIES = 3
+
+# Each chunk holds issue IDs that are equal when shifted right by CHUNK_BITS.
+CHUNK_BITS = 12
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+# A chunk with more members than this is stored as a bitmap, which then
+# takes fewer bytes than an array of 16-bit values.
+MAX_ARRAY_CHUNK_LEN = (1 << CHUNK_BITS) // 16
+
+RESTRICT_VIEW_PREFIX = search_helpers.RESTRICT_VIEW_PATTERN.rstrip('%')
+
+
+def _ChunkToBitmap(chunk):
+  """Return an int with bits set for each low value in the chunk."""
+  if isinstance(chunk, array.array):
+    bitmap = 0
+    for low in chunk:
+      bitmap |= 1 << low
+    return bitmap
+  return chunk
+
+
+def _PopCount(bitmap):
+  return bin(bitmap).count('1')
+
+
+def _BitmapToChunk(bitmap):
+  """Return the most compact chunk for a bitmap, or None if it is empty."""
+  if not bitmap:
+    return None
+  if _PopCount(bitmap) > MAX_ARRAY_CHUNK_LEN:
+    return bitmap
+  return array.array('H', _IterBits(bitmap))
+
+
+def _IterBits(bitmap):
+  """Yield the positions of set bits in ascending order."""
+  while bitmap:
+    lowest = bitmap & -bitmap
+    yield lowest.bit_length() - 1
+    bitmap ^= lowest
+
+
+class IIDSet(object):
+  """A compact set of issue IDs.
+
+  chunks is a dict {high: chunk} where high is iid >> CHUNK_BITS and chunk is
+  either an array.array('H') of sorted low bits or an int bitmap.
+  """
+
+  def __init__(self, iids=None, chunks=None):
+    self.chunks = dict(chunks or {})
+    if iids:
+      bitmaps = collections.defaultdict(int)
+      for iid in iids:
+        bitmaps[iid >> CHUNK_BITS] |= 1 << (iid & CHUNK_MASK)
+      for high, bitmap in bitmaps.items():
+        self.chunks[high] = _BitmapToChunk(
+            bitmap | _ChunkToBitmap(self.chunks.get(high, 0)))
+
+  def __contains__(self, iid):
+    chunk = self.chunks.get(iid >> CHUNK_BITS)
+    if chunk is None:
+      return False
+    low = iid & CHUNK_MASK
+    if isinstance(chunk, array.array):
+      return low in chunk
+    return bool(chunk & (1 << low))
+
+  def __iter__(self):
+    for high in sorted(self.chunks):
+      chunk = self.chunks[high]
+      lows = chunk if isinstance(chunk, array.array) else _IterBits(chunk)
+      for low in lows:
+        yield (high << CHUNK_BITS) | low
+
+  def __len__(self):
+    return sum(
+        len(chunk) if isinstance(chunk, array.array) else _PopCount(chunk)
+        for chunk in self.chunks.values())
+
+  def __eq__(self, other):
+    return isinstance(other, IIDSet) and list(self) == list(other)
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return 'IIDSet(%r)' % list(self)
+
+  def _SetChunkBitmap(self, high, bitmap):
+    chunk = _BitmapToChunk(bitmap)
+    if chunk is None:
+      self.chunks.pop(high, None)
+    else:
+      self.chunks[high] = chunk
+
+  def Add(self, iid):
+    high = iid >> CHUNK_BITS
+    bitmap = _ChunkToBitmap(self.chunks.get(high, 0))
+    self._SetChunkBitmap(high, bitmap | (1 << (iid & CHUNK_MASK)))
+
+  def Discard(self, iid):
+    high = iid >> CHUNK_BITS
+    if high in self.chunks:
+      bitmap = _ChunkToBitmap(self.chunks[high])
+      self._SetChunkBitmap(high, bitmap & ~(1 << (iid & CHUNK_MASK)))
+
+  def Difference(self, other):
+    """Return a new IIDSet of members that are not in the other IIDSet."""
+    result = IIDSet()
+    for high, chunk in self.chunks.items():
+      if high in other.chunks:
+        result._SetChunkBitmap(
+            high, _ChunkToBitmap(chunk) & ~_ChunkToBitmap(other.chunks[high]))
+      else:
+        result.chunks[high] = chunk
+    return result
+
+  @classmethod
+  def Union(cls, iid_sets):
+    """Return a new IIDSet of members of any of the given IIDSets."""
+    bitmaps = collections.defaultdict(int)
+    for iid_set in iid_sets:
+      for high, chunk in iid_set.chunks.items():
+        bitmaps[high] |= _ChunkToBitmap(chunk)
+    result = cls()
+    for high, bitmap in bitmaps.items():
+      result._SetChunkBitmap(high, bitmap)
+    return result
+
+
+def _IndexKey(project_id, shard_id):
+  return '%d;%d' % (project_id, shard_id)
+
+
+def GetRestrictedIIDs(cnxn, services, project_id, shard_id, label_ids):
+  """Return an IIDSet of issues in the shard with any of the given labels.
+
+  Args:
+    cnxn: connection to the database.
+    services: interface to issue storage backends.
+    project_id: int ID of the project.
+    shard_id: int shard of issues to consider.
+    label_ids: IDs of Restrict-View-* labels.
+  """
+  index = _GetIndex(cnxn, services, project_id, shard_id)
+  return IIDSet.Union(
+      IIDSet(chunks=index[label_id]) for label_id in label_ids
+      if label_id in index)
+
+
+def _GetIndex(cnxn, services, project_id, shard_id):
+  """Return {label_id: chunks} from memcache, or build it from the DB."""
+  index_key = INDEX_KEY_PREFIX + _IndexKey(project_id, shard_id)
+  client = memcache.Client()
+  index = client.gets(index_key, namespace=settings.memcache_namespace)
+  if index is None:
+    # Mark the index as being built so that any update made while we query
+    # the DB will delete the marker and make our compare-and-set fail.
+    client.add(
+        index_key, PENDING, time=INDEX_EXPIRATION,
+        namespace=settings.memcache_namespace)
+    index = client.gets(index_key, namespace=settings.memcache_namespace)
+  if index is not None and index != PENDING:
+    return index
+
+  restriction_label_ids = _GetRestrictionLabelIDs(
+      cnxn, services.config, project_id)
+  iids_by_label_id = collections.defaultdict(list)
+  if restriction_label_ids:
+    for iid, label_id in services.issue.GetIIDLabelIDPairs(
+        cnxn, restriction_label_ids, project_id, shard_id):
+      iids_by_label_id[label_id].append(iid)
+  built_index = {
+      label_id: IIDSet(iids=iids).chunks
+      for label_id, iids in iids_by_label_id.items()}
+  if index == PENDING:
+    client.cas(
+        index_key, built_index, time=INDEX_EXPIRATION,
+        namespace=settings.memcache_namespace)
+  return built_index
+
+
+def _GetRestrictionLabelIDs(cnxn, config_service, project_id):
+  """Return IDs of the Restrict-View-* labels defined in the project."""
+  return [
+      label_id for label_id, _pid, _rank, label, _docstring, _hidden
+      in config_service.GetLabelDefRows(cnxn, project_id)
+      if label.lower().startswith(RESTRICT_VIEW_PREFIX)]
+
+
+def UpdateIndexes(cnxn, config_service, issues):
+  """Patch the indexes of the given issues to match their current labels.
+
+  Indexes that are not in memcache are left to be built when needed, and an
+  index that cannot be updated, or that is being built, is deleted.
+  """
+  issues_by_key = collections.defaultdict(list)
+  for issue in issues:
+    shard_id = issue.issue_id % settings.num_logical_shards
+    issues_by_key[_IndexKey(issue.project_id, shard_id)].append(issue)
+
+  client = memcache.Client()
+  for key, key_issues in issues_by_key.items():
+    label_ids_by_iid = {
+        issue.issue_id: _GetIssueRestrictionLabelIDs(
+            cnxn, config_service, issue)
+        for issue in key_issues}
+    if not _PatchIndex(client, key, label_ids_by_iid):
+      logging.info('Could not update %r, deleting it', key)
+      memcache.delete(
+          INDEX_KEY_PREFIX + key, namespace=settings.memcache_namespace)
+
+
+def _GetIssueRestrictionLabelIDs(cnxn, config_service, issue):
+  """Return IDs of the issue's explicit and derived Restrict-View-* labels."""
+  label_ids = set()
+  for label in list(issue.labels) + list(issue.derived_labels):
+    if label.lower().startswith(RESTRICT_VIEW_PREFIX):
+      label_id = config_service.LookupLabelID(
+          cnxn, issue.project_id, label, autocreate=False)
+      if label_id:
+        label_ids.add(label_id)
+  return label_ids
+
+
+def _PatchIndex(client, key, label_ids_by_iid):
+  """Move issues to the right label sets, return False on failure."""
+  for _ in range(INDEX_CAS_RETRIES):
+    index = client.gets(
+        INDEX_KEY_PREFIX + key, namespace=settings.memcache_namespace)
+    if index is None:
+      return True  # Nothing to update.
+    if index == PENDING:
+      return False  # The index being built might not include these changes.
+
+    for label_id in set(index).union(*label_ids_by_iid.values()):
+      iid_set = IIDSet(chunks=index.get(label_id))
+      for iid, label_ids in label_ids_by_iid.items():
+        if label_id in label_ids:
+          iid_set.Add(iid)
+        else:
+          iid_set.Discard(iid)
+      if iid_set.chunks:
+        index[label_id] = iid_set.chunks
+      else:
+        index.pop(label_id, None)
+
+    if client.cas(
+        INDEX_KEY_PREFIX + key, index, time=INDEX_EXPIRATION,
+        namespace=settings.memcache_namespace):
+      return True
+
+  return False
+
+
+def DeleteIndexes(project_shards):
+  """Delete the indexes of the given (project_id, shard_id) pairs."""
+  memcache.delete_multi(
+      [_IndexKey(pid, sid) for pid, sid in project_shards],
+      key_prefix=INDEX_KEY_PREFIX, namespace=settings.memcache_namespace)
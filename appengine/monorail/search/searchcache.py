@@ -0,0 +1,459 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Keep cached search results up to date as individual issues change.
+
+Backends cache the IDs of issues that match a query in one shard, and the
+frontend ignores any cached result that is older than the "PROJECT_ID;SHARD_ID"
+timestamp in memcache.  Normally, a change to any issue deletes that
+timestamp, which makes every cached result in that project and shard stale.
+
+In incremental mode, each "PROJECT_ID;SHARD_ID" (or "all;SHARD_ID") also has
+an index in memcache that lists the cached results written since the
+timestamp was set.  When issues change, we evaluate each indexed query
+against just those issues in RAM and then either leave its cached result
+alone, remove issues that no longer match, or delete that one cached result.
+The timestamp is only deleted if the index is missing.
+
+A cached result must never be fresh unless it is in the index, so a
+backend deletes its own result if it cannot add it to the index.
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import collections
+import logging
+
+from google.appengine.api import memcache
+
+import settings
+from framework import framework_constants
+from proto import ast_pb2
+from proto import tracker_pb2
+from search import ast2ast
+
+from infra_libs import ts_mon
+
+
+INDEX_KEY_PREFIX = 'searchindex:'
+
+# Limit on the number of cached results tracked per project and shard.
+# When an index is full, the oldest cached result is deleted.
+MAX_INDEXED_RESULTS = 100
+
+# Number of times to retry a compare-and-set of an index.
+INDEX_CAS_RETRIES = 3
+
+# Issues keep their position in results that are only sorted by these.
+IMMUTABLE_SORT_FIELDS = {'project', 'id'}
+
+# Fields that can be evaluated in RAM before and after ast2ast preprocessing.
+# Other fields, e.g., full-text fields and custom fields, need the database
+# or the full-text index, so results for queries using them are deleted.
+_RAW_FIELDS = {
+    'open', 'spam', 'status', 'label', 'component', 'owner',
+    'id', 'is_spam', 'stars', 'attachments', 'opened', 'modified',
+    'status_id', 'label_id', 'component_id', 'owner_id',
+    }
+
+# {field_name: Issue PB attribute} for fields stored in the Issue table.
+_NATIVE_FIELD_ATTRS = {
+    'id': 'local_id',
+    'is_spam': 'is_spam',
+    'stars': 'star_count',
+    'attachments': 'attachment_count',
+    'opened': 'opened_timestamp',
+    'modified': 'modified_timestamp',
+    }
+
+# Ops that ast2select turns into "no matching row" checks.
+_NEGATIVE_OPS = (
+    ast_pb2.QueryOp.NE, ast_pb2.QueryOp.NOT_TEXT_HAS,
+    ast_pb2.QueryOp.IS_NOT_DEFINED)
+
+
+CACHED_RESULT_PATCHES = ts_mon.CounterMetric(
+    'monorail/search/cached_result_patches',
+    'Count of cached search results considered when issues changed, by '
+    'outcome: unchanged, patched, dropped, conflict, or invalidated.',
+    [ts_mon.StringField('outcome')])
+
+
+class UnsupportedQuery(Exception):
+  """The query cannot be evaluated against an issue in RAM."""
+
+
+def _MakeIndexKeys(project_ids, shard_id):
+  """Return the "PROJECT_ID;SHARD_ID" keys that a search result depends on."""
+  if project_ids:
+    return ['%d;%d' % (pid, shard_id) for pid in project_ids]
+  return ['all;%d' % shard_id]
+
+
+def _CheckSupported(query_ast, field_names):
+  """Raise UnsupportedQuery unless all conds use the given fields."""
+  for conj in query_ast.conjunctions:
+    for cond in conj.conds:
+      for fd in cond.field_defs:
+        if fd.field_id or fd.field_name not in field_names:
+          raise UnsupportedQuery(fd.field_name)
+
+
+def _PreprocessForIndex(
+    cnxn, services, query_ast, query_project_ids, harmonized_config):
+  """Return a serialized preprocessed AST, or None if it is unsupported."""
+  try:
+    _CheckSupported(query_ast, _RAW_FIELDS)
+    preprocessed_ast = ast2ast.PreprocessAST(
+        cnxn, query_ast, query_project_ids, services, harmonized_config)
+    # E.g., owner:substring is still "owner" after preprocessing.
+    _CheckSupported(preprocessed_ast, set(_NATIVE_FIELD_ATTRS) | {
+        'status_id', 'label_id', 'component_id', 'owner_id'})
+  except (UnsupportedQuery, ast2ast.MalformedQuery) as e:
+    logging.info('Query cannot be evaluated incrementally: %r', e)
+    return None
+  return _SerializeAST(preprocessed_ast, query_ast)
+
+
+def _SerializeAST(preprocessed_ast, query_ast):
+  """Return a compact picklable form of a preprocessed QueryAST.
+
+  Label conds are kept as label names rather than the IDs of the labels
+  that existed when the query was cached, so that a label created later,
+  e.g., Pri-5 for label:Pri, is matched when results are patched.
+  """
+  return [
+      [_SerializeCond(cond, raw_cond)
+       for cond, raw_cond in zip(conj.conds, raw_conj.conds)]
+      for conj, raw_conj in zip(
+          preprocessed_ast.conjunctions, query_ast.conjunctions)]
+
+
+def _SerializeCond(cond, raw_cond):
+  """Return an (op, field_name, values) tuple for one cond."""
+  if raw_cond.field_defs[0].field_name == 'label':
+    return (raw_cond.op.number, 'label', list(raw_cond.str_values))
+  return (cond.op.number, cond.field_defs[0].field_name, list(cond.int_values))
+
+
+def _DeserializeAST(serialized):
+  """Return a QueryAST with just the parts that EvalQueryAST() uses."""
+  return ast_pb2.QueryAST(conjunctions=[
+      ast_pb2.Conjunction(conds=[
+          ast_pb2.MakeCond(
+              ast_pb2.QueryOp(op), [tracker_pb2.FieldDef(field_name=name)],
+              values if name == 'label' else [],
+              [] if name == 'label' else values)
+          for op, name, values in conj])
+      for conj in serialized])
+
+
+def RegisterCachedResult(
+    cnxn, services, query_ast, query_project_ids, harmonized_config, sd,
+    shard_id, memcache_key, search_limit_memcache_key, search_limit_reached,
+    started_index_keys):
+  """Add a just-cached search result to the indexes for its projects.
+
+  Args:
+    cnxn: connection to the database.
+    services: interface to issue storage backends.
+    query_ast: QueryAST for the search, before ast2ast preprocessing.
+    query_project_ids: list of project IDs that were searched.
+    harmonized_config: combined configs for all the queried projects.
+    sd: list of sort directives.
+    shard_id: int shard that was searched.
+    memcache_key: key of the cached result issue IDs.
+    search_limit_memcache_key: key of the cached search_limit_reached value.
+    search_limit_reached: True if the result was capped.
+    started_index_keys: collection of "PROJECT_ID;SHARD_ID" keys that this
+        search just set, so it may create new indexes for them.
+  """
+  entry = {
+      'key': memcache_key,
+      'limit_key': search_limit_memcache_key,
+      'sd': list(sd),
+      'project_ids': list(query_project_ids),
+      'ast': None,
+      }
+  # A capped result might be missing issues that start to match, and an
+  # unsupported query cannot be evaluated, so we just list them to be
+  # deleted whenever an issue in the project and shard changes.
+  if not search_limit_reached:
+    entry['ast'] = _PreprocessForIndex(
+        cnxn, services, query_ast, query_project_ids, harmonized_config)
+
+  for index_key in _MakeIndexKeys(query_project_ids, shard_id):
+    if not _AddToIndex(index_key, entry, index_key in started_index_keys):
+      logging.info('Could not index %r in %r', memcache_key, index_key)
+      # Without an index, we cannot patch the results that were cached
+      # since the timestamp was set, so start over.
+      memcache.delete_multi(
+          [index_key, memcache_key, search_limit_memcache_key],
+          namespace=settings.memcache_namespace)
+      return
+
+
+def _AddToIndex(index_key, entry, may_create):
+  """Add entry to an index, return False if that was not possible."""
+  client = memcache.Client()
+  full_key = INDEX_KEY_PREFIX + index_key
+  for _ in range(INDEX_CAS_RETRIES):
+    index = client.gets(full_key, namespace=settings.memcache_namespace)
+    if index is None:
+      if not may_create:
+        return False
+      if client.add(
+          full_key, [entry], time=framework_constants.MEMCACHE_EXPIRATION,
+          namespace=settings.memcache_namespace):
+        return True
+      continue  # Another backend just created it.
+
+    index = [e for e in index if e['key'] != entry['key']]
+    index.append(entry)
+    evicted = index[:-MAX_INDEXED_RESULTS]
+    index = index[-MAX_INDEXED_RESULTS:]
+    # Refreshing the expiration keeps the index alive as long as anything
+    # that it lists.
+    if client.cas(
+        full_key, index, time=framework_constants.MEMCACHE_EXPIRATION,
+        namespace=settings.memcache_namespace):
+      if evicted:
+        memcache.delete_multi(
+            [e['key'] for e in evicted] + [e['limit_key'] for e in evicted],
+            namespace=settings.memcache_namespace)
+      return True
+
+  return False
+
+
+def PatchCachedResults(cnxn, config_service, issues):
+  """Update cached search results to reflect changes to the given issues.
+
+  Args:
+    cnxn: connection to the database.
+    config_service: ConfigService used to look up label and status IDs.
+    issues: list of Issue PBs as they are now stored in the database.
+
+  Returns:
+    A set of (project_id, shard_id) pairs for which cached results could not
+    be patched, so they must all be invalidated.
+  """
+  issues_by_project_shard = collections.defaultdict(list)
+  for issue in issues:
+    shard_id = issue.issue_id % settings.num_logical_shards
+    issues_by_project_shard[issue.project_id, shard_id].append(issue)
+
+  unpatched = set()
+  for (project_id, shard_id), ps_issues in issues_by_project_shard.items():
+    for index_key in _MakeIndexKeys([project_id], shard_id) + ['all;%d' %
+                                                               shard_id]:
+      if not _PatchIndexedResults(cnxn, config_service, index_key, ps_issues):
+        unpatched.add((project_id, shard_id))
+  return unpatched
+
+
+def _PatchIndexedResults(cnxn, config_service, index_key, issues):
+  """Patch the results listed in one index, return False if it is missing."""
+  client = memcache.Client()
+  full_key = INDEX_KEY_PREFIX + index_key
+  index = client.gets(full_key, namespace=settings.memcache_namespace)
+  if index is None:
+    # Some results might have been cached before their index was evicted.
+    CACHED_RESULT_PATCHES.increment({'outcome': 'invalidated'})
+    return False
+
+  cached_dict = client.get_multi(
+      [entry['key'] for entry in index], for_cas=True,
+      namespace=settings.memcache_namespace)
+  limit_keys = {entry['key']: entry['limit_key'] for entry in index}
+  patched_dict = {}
+  keys_to_delete = []
+  conflicting_keys = []
+  for entry in index:
+    if entry['key'] not in cached_dict:
+      continue  # Already deleted or expired.
+    result_iids, cached_ts = cached_dict[entry['key']]
+    try:
+      patched_iids = _PatchResultIIDs(
+          cnxn, config_service, entry, result_iids, issues)
+    except UnsupportedQuery:
+      patched_iids = None
+    if patched_iids is None:
+      CACHED_RESULT_PATCHES.increment({'outcome': 'dropped'})
+      keys_to_delete.extend([entry['key'], entry['limit_key']])
+    elif patched_iids is result_iids:
+      CACHED_RESULT_PATCHES.increment({'outcome': 'unchanged'})
+    else:
+      CACHED_RESULT_PATCHES.increment({'outcome': 'patched'})
+      patched_dict[entry['key']] = (patched_iids, cached_ts)
+
+  if patched_dict:
+    # Another patcher or a backend storing fresh results may have changed a
+    # result since we read it.  Overwriting it could bring back IIDs that the
+    # other writer removed, so such results are deleted instead.
+    conflicting_keys = client.cas_multi(
+        patched_dict, time=framework_constants.MEMCACHE_EXPIRATION,
+        namespace=settings.memcache_namespace)
+    for key in conflicting_keys:
+      CACHED_RESULT_PATCHES.increment({'outcome': 'conflict'})
+      keys_to_delete.extend([key, limit_keys[key]])
+  if keys_to_delete:
+    memcache.delete_multi(
+        keys_to_delete, namespace=settings.memcache_namespace)
+  if len(patched_dict) > len(conflicting_keys):
+    # The patched results now expire later, so the index must too.  If the
+    # cas fails, a backend has just refreshed the index anyway.
+    client.cas(
+        full_key, index, time=framework_constants.MEMCACHE_EXPIRATION,
+        namespace=settings.memcache_namespace)
+  return True
+
+
+def _PatchResultIIDs(cnxn, config_service, entry, result_iids, issues):
+  """Return patched result_iids, or None if the result must be deleted.
+
+  result_iids itself is returned if no change is needed.
+  """
+  if entry['ast'] is None:
+    return None
+  query_ast = _DeserializeAST(entry['ast'])
+  keeps_order = all(
+      sort_directive.lstrip('-') in IMMUTABLE_SORT_FIELDS
+      for sort_directive in entry['sd'])
+
+  result_iid_set = set(result_iids)
+  iids_to_remove = set()
+  for issue in issues:
+    matches = (
+        not issue.deleted and
+        (not entry['project_ids'] or issue.project_id in entry['project_ids'])
+        and EvalQueryAST(cnxn, config_service, query_ast, issue))
+    present = issue.issue_id in result_iid_set
+    if matches and not present:
+      return None  # We cannot tell where it would be in the sorted result.
+    if matches and present and not keeps_order:
+      return None  # The issue might need to move within the result.
+    if present and not matches:
+      iids_to_remove.add(issue.issue_id)
+
+  if not iids_to_remove:
+    return result_iids
+  return [iid for iid in result_iids if iid not in iids_to_remove]
+
+
+def EvalQueryAST(cnxn, config_service, query_ast, issue):
+  """Return True if the issue would be found by the preprocessed query.
+
+  This gives the same answer as the SQL generated by ast2select for the
+  fields that it supports.
+
+  Raises:
+    UnsupportedQuery: if the query uses any other field.
+  """
+  return any(
+      all(_EvalCond(cnxn, config_service, cond, issue) for cond in conj.conds)
+      for conj in query_ast.conjunctions)
+
+
+def _EvalCond(cnxn, config_service, cond, issue):
+  """Return True if the issue satisfies one preprocessed condition."""
+  field_name = cond.field_defs[0].field_name
+  op = cond.op
+  values = cond.int_values
+
+  if field_name in _NATIVE_FIELD_ATTRS:
+    value = getattr(issue, _NATIVE_FIELD_ATTRS[field_name])
+    if field_name == 'is_spam':
+      value = int(bool(value))
+    return _CompareColumn(op, value, values)
+
+  if field_name == 'status_id':
+    return _CompareColumns(op, [
+        _LookupStatusID(cnxn, config_service, issue.project_id, issue.status),
+        _LookupStatusID(
+            cnxn, config_service, issue.project_id, issue.derived_status)],
+        values)
+
+  if field_name == 'owner_id':
+    return _CompareColumns(
+        op, [issue.owner_id or None, issue.derived_owner_id or None], values)
+
+  if field_name == 'label':
+    return _CompareJoined(op, _MatchingLabels(
+        cond, list(issue.labels) + list(issue.derived_labels)))
+
+  if field_name == 'label_id':
+    if not values and op == ast_pb2.QueryOp.NE:
+      return True
+    label_ids = {
+        config_service.LookupLabelID(
+            cnxn, issue.project_id, label, autocreate=False)
+        for label in list(issue.labels) + list(issue.derived_labels)}
+    return _CompareJoined(op, label_ids.intersection(values))
+
+  if field_name == 'component_id':
+    component_ids = set(issue.component_ids) | set(issue.derived_component_ids)
+    if op not in (ast_pb2.QueryOp.IS_DEFINED, ast_pb2.QueryOp.IS_NOT_DEFINED):
+      component_ids.intersection_update(values)
+    return _CompareJoined(op, component_ids)
+
+  raise UnsupportedQuery(field_name)
+
+
+def _MatchingLabels(cond, labels):
+  """Return the labels that ast2ast would resolve a label cond to."""
+  if cond.op in (ast_pb2.QueryOp.EQ, ast_pb2.QueryOp.NE):
+    wanted = {value.lower() for value in cond.str_values}
+    return [label for label in labels if label.lower() in wanted]
+  regex = ast2ast.MakeLabelRegex(cond)
+  return [label for label in labels if regex.match(label)]
+
+
+def _LookupStatusID(cnxn, config_service, project_id, status):
+  """Return the status ID stored in the Issue table for a status string."""
+  if not status:
+    return None
+  return config_service.LookupStatusID(
+      cnxn, project_id, status, autocreate=False) or None
+
+
+def _CompareJoined(op, joined_values):
+  """Evaluate a cond that ast2select turns into a LEFT JOIN."""
+  if op in _NEGATIVE_OPS:
+    return not joined_values
+  return bool(joined_values)
+
+
+def _CompareColumns(op, column_values, values):
+  """Evaluate a cond that ast2select checks on explicit and derived columns."""
+  results = [_CompareColumn(op, value, values) for value in column_values]
+  if op in _NEGATIVE_OPS:
+    return all(results)
+  return any(results)
+
+
+def _CompareColumn(op, value, values):
+  """Evaluate a cond like ast2select._Compare() does for an int column."""
+  if op == ast_pb2.QueryOp.IS_DEFINED:
+    return value is not None and value != 0
+  if op == ast_pb2.QueryOp.IS_NOT_DEFINED:
+    return value is None or value == 0
+  if op in (ast_pb2.QueryOp.EQ, ast_pb2.QueryOp.TEXT_HAS,
+            ast_pb2.QueryOp.KEY_HAS):
+    return value is not None and value in values
+  if op in (ast_pb2.QueryOp.NE, ast_pb2.QueryOp.NOT_TEXT_HAS):
+    return not values or value is None or value not in values
+  if value is None or not values:
+    return False
+  if op == ast_pb2.QueryOp.GT:
+    return value > values[0]
+  if op == ast_pb2.QueryOp.LT:
+    return value < values[0]
+  if op == ast_pb2.QueryOp.GE:
+    return value >= values[0]
+  if op == ast_pb2.QueryOp.LE:
+    return value <= values[0]
+  raise UnsupportedQuery(op)
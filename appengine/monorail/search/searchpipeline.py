@@ -8,6 +8,8 @@ from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
 
+import hashlib
+import json
 import logging
 import re
 
@@ -90,6 +92,56 @@ def ReplaceKeywordsWithUserIDs(me_user_ids, query):
   return query, warnings
 
 
+# Relative dates like "today-7" are parsed against this fixed time when
+# making cache keys so that the key for such a query does not change every
+# second.  Cached results still expire like any other.
+_CACHE_KEY_NOW = 0
+
+
+def _ConditionCacheKey(cond):
+  """Return a tuple that is the same for equivalent conditions."""
+  # Multiple values in one condition are ORed, and string comparisons in
+  # search are case-insensitive, so neither order nor case matters.
+  return (
+      cond.op.number,
+      tuple(sorted(
+          (fd.field_name.lower(), fd.field_id or 0) for fd in cond.field_defs)),
+      tuple(sorted(set(value.lower() for value in cond.str_values))),
+      tuple(sorted(set(cond.int_values))),
+      (cond.key_suffix or '').lower(),
+      (cond.phase_name or '').lower())
+
+
+def QueryCacheKey(canned_query, user_query, harmonized_config):
+  """Return a string that identifies cached results for a query.
+
+  The string is the same for queries that parse to equivalent ASTs, e.g.,
+  [Pri=1 status:open] and [status:Open  pri=1], so that they can share
+  cached search results.
+
+  Args:
+    canned_query: string part of the query from the drop-down menu.
+    user_query: string part of the query that the user typed in.  Keywords
+        like "me" must already have been replaced with user IDs.
+    harmonized_config: combined configs for all the queried projects.
+
+  Returns:
+    A hex digest string.
+  """
+  try:
+    query_ast = query2ast.ParseUserQuery(
+        user_query, canned_query, query2ast.BUILTIN_ISSUE_FIELDS,
+        harmonized_config, now=_CACHE_KEY_NOW)
+    canonical = sorted(set(
+        tuple(sorted(set(_ConditionCacheKey(cond) for cond in conj.conds)))
+        for conj in query_ast.conjunctions))
+  except query2ast.InvalidQueryError:
+    # Searching will report the error, there is no need to be clever.
+    canonical = ['raw', canned_query, user_query]
+  # JSON gives the same string whether values are str or unicode.
+  return hashlib.sha1(json.dumps(canonical).encode('utf-8')).hexdigest()
+
+
 def ParseQuery(mr, config, services):
   """Parse the user's query.
 
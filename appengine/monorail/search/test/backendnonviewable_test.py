@@ -8,6 +8,7 @@ from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
 
+import mock
 import unittest
 import mox
 
@@ -134,6 +135,30 @@ class BackendNonviewableTest(unittest.TestCase):
     self.mox.VerifyAll()
     self.assertEqual([432, 543], at_risk_iids)
 
+  @mock.patch('settings.index_restricted_issues', True)
+  def testGetAtRiskIIDs_Indexed(self):
+    """Restricted issues can be found in the index rather than the DB."""
+    fake_restriction_label_rows = [
+        (123, 789, 1, 'Restrict-View-A', 'doc', False),
+        ]
+    self.mox.StubOutWithMock(self.services.config, 'GetLabelDefRowsAnyProject')
+    self.services.config.GetLabelDefRowsAnyProject(
+      self.mr.cnxn, where=[('LOWER(label) LIKE %s', ['restrict-view-%'])]
+      ).AndReturn(fake_restriction_label_rows)
+    self.mox.StubOutWithMock(self.services.config, 'GetLabelDefRows')
+    self.services.config.GetLabelDefRows(
+      self.mr.cnxn, 789).AndReturn(fake_restriction_label_rows)
+    self.mox.StubOutWithMock(self.services.issue, 'GetIIDLabelIDPairs')
+    self.services.issue.GetIIDLabelIDPairs(
+      self.mr.cnxn, [123], 789, 2).AndReturn([(543, 123), (432, 123)])
+    self.mox.ReplayAll()
+
+    at_risk_iids = self.servlet.GetAtRiskIIDs(
+        self.mr.cnxn, self.mr.auth.user_pb, self.mr.auth.effective_ids,
+        self.project, self.mr.perms, self.mr.shard_id)
+    self.mox.VerifyAll()
+    self.assertEqual([432, 543], at_risk_iids)
+
   def testGetViewableIIDs_Anon(self):
     """Anon users are never participants in any issues."""
     ok_iids = self.servlet.GetViewableIIDs(
@@ -23,6 +23,7 @@ from proto import tracker_pb2
 from search import backendsearchpipeline
 from search import ast2ast
 from search import query2ast
+from search import searchpipeline
 from services import service_manager
 from services import tracker_fulltext
 from testing import fake
@@ -218,9 +219,14 @@ class BackendSearchPipelineMethodsTest(unittest.TestCase):
     self.assertEqual([10002, 10052], result)
     self.assertFalse(capped)
     self.assertEqual(None, err)
+    query_key = searchpipeline.QueryCacheKey(
+      'is:open', 'Priority:High', self.config)
     self.assertEqual(
       ([10002, 10052], 12345),
-      memcache.get('789;is:open;Priority:High;project id;2'))
+      memcache.get('789;%s;project id;2' % query_key))
+    self.assertEqual(
+      (False, 12345),
+      memcache.get('789;%s;project id;search_limit_reached;2' % query_key))
 
   def testGetSpamQueryResultIIDs(self):
     sd = ['project', 'id']
@@ -245,6 +251,8 @@ class BackendSearchPipelineMethodsTest(unittest.TestCase):
     self.assertEqual([10002, 10052], result)
     self.assertFalse(capped)
     self.assertEqual(None, err)
+    query_key = searchpipeline.QueryCacheKey(
+      'is:open', 'Priority:High is:spam', self.config)
     self.assertEqual(
       ([10002, 10052], 12345),
-      memcache.get('789;is:open;Priority:High is:spam;project id;2'))
+      memcache.get('789;%s;project id;2' % query_key))
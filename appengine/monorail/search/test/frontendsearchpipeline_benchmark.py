@@ -0,0 +1,130 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Benchmark for sorting all shard results vs. merging sorted shards.
+
+Each shard's IIDs are pre-sorted, as the backends return them, and trimmed
+to the end of the requested page, as SearchForIIDs() does.  We then time
+fetching and sorting every remaining issue vs. a k-way merge that only
+fetches enough issues to fill the page.  The results are sorted on a field
+that MERGEABLE_SORT_FIELDS allows to be merged.
+
+Usage: python search/test/frontendsearchpipeline_benchmark.py
+    [num_shards] [iids_per_shard] [num]
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import random
+import sys
+import time
+
+from google.appengine.ext import testbed
+
+from framework import sorting
+from search import frontendsearchpipeline
+from services import service_manager
+from testing import fake
+from testing import testing_helpers
+from tracker import tracker_bizobj
+
+
+def MakePipeline(num_shards, iids_per_shard, num):
+  """Return a pipeline and the sorted IIDs of each shard."""
+  services = service_manager.Services(
+      user=fake.UserService(),
+      project=fake.ProjectService(),
+      issue=fake.IssueService(),
+      config=fake.ConfigService(),
+      cache_manager=fake.CacheManager())
+  services.user.TestAddUser('a@example.com', 111)
+  project = services.project.TestAddProject('proj', project_id=789)
+  mr = testing_helpers.MakeMonorailRequest(
+      path='/p/proj/issues/list', project=project)
+  sorting.InitializeArtValues(services)
+  config = tracker_bizobj.MakeDefaultProjectIssueConfig(789)
+
+  rand = random.Random(1)
+  sorted_shard_iids = {}
+  for shard_id in range(num_shards):
+    shard_issues = []
+    for i in range(iids_per_shard):
+      local_id = i * num_shards + shard_id + 1
+      issue = fake.MakeTestIssue(
+          789, local_id, 'sum', 'New', 111, issue_id=78900000 + local_id,
+          opened_timestamp=rand.randint(1500000000, 1600000000))
+      services.issue.TestAddIssue(issue)
+      shard_issues.append(issue)
+    shard_issues = frontendsearchpipeline._SortIssues(
+        shard_issues, config, {}, '', '-opened')
+    sorted_shard_iids[(shard_id, '')] = [
+        issue.issue_id for issue in shard_issues]
+
+  pipeline = frontendsearchpipeline.FrontendSearchPipeline(
+      mr.cnxn, services, mr.auth, 111, '', ['proj'], num, 0, [],
+      mr.can, '', '-opened', mr.warnings, mr.errors, True, mr.profiler,
+      project=project)
+  return pipeline, sorted_shard_iids
+
+
+def TimeSortAll(pipeline, repeat):
+  """Return average ms to fetch and sort every issue in every shard."""
+  start = time.time()
+  for _ in range(repeat):
+    sorting.InitializeArtValues(pipeline.services)
+    allowed_iids = []
+    for shard_iids in pipeline.filtered_iids.values():
+      allowed_iids.extend(shard_iids)
+    issues = pipeline.services.issue.GetIssues(pipeline.cnxn, allowed_iids)
+    pipeline._LookupNeededUsers(issues)
+    results = frontendsearchpipeline._SortIssues(
+        issues, pipeline.harmonized_config, pipeline.users_by_id,
+        pipeline.group_by_spec, pipeline.sort_spec)
+  return (time.time() - start) * 1000 / repeat, results
+
+
+def TimeMerge(pipeline, repeat):
+  """Return average ms to merge just enough issues to fill the page."""
+  limit = pipeline.paginate_start + pipeline.items_per_page
+  start = time.time()
+  for _ in range(repeat):
+    sorting.InitializeArtValues(pipeline.services)
+    results = pipeline._MergeSortedShards(limit)
+  return (time.time() - start) * 1000 / repeat, results
+
+
+def main(argv):
+  num_shards = int(argv[1]) if len(argv) > 1 else 10
+  iids_per_shard = int(argv[2]) if len(argv) > 2 else 10000
+  num = int(argv[3]) if len(argv) > 3 else 100
+  tb = testbed.Testbed()
+  tb.activate()
+  tb.init_memcache_stub()
+  tb.init_user_stub()
+
+  print('%d shards x %d IIDs, %d per page' % (
+      num_shards, iids_per_shard, num))
+  pipeline, sorted_shard_iids = MakePipeline(num_shards, iids_per_shard, num)
+  assert pipeline._CanMergeSortedShards()
+  for start in [0, 1000, iids_per_shard]:
+    pipeline.paginate_start = start
+    pipeline.filtered_iids = {
+        shard_key: shard_iids[:start + num]
+        for shard_key, shard_iids in sorted_shard_iids.items()}
+    sort_ms, sorted_results = TimeSortAll(pipeline, 3)
+    merge_ms, merged_results = TimeMerge(pipeline, 3)
+    assert (sorted_results[start:start + num] ==
+            merged_results[start:start + num])
+    print('start=%d' % start)
+    print('  sort all: %8.1f ms' % sort_ms)
+    print('  merge:    %8.1f ms' % merge_ms)
+    print('  speedup:  %8.2fx' % (sort_ms / merge_ms))
+
+  tb.deactivate()
+
+
+if __name__ == '__main__':
+  main(sys.argv)
@@ -224,6 +224,76 @@ class FrontendSearchPipelineTest(unittest.TestCase):
       pipeline.allowed_results)
     self.assertEqual([0, 111], list(pipeline.users_by_id.keys()))
 
+  def testMergeAndSortIssues_MergesOnlyFirstPage(self):
+    pipeline = frontendsearchpipeline.FrontendSearchPipeline(
+        self.cnxn, self.services, self.auth, self.me_user_id, self.query,
+        self.query_project_names, 5, 5, self.url_params, self.can,
+        self.group_by_spec, '', self.warnings, self.errors,
+        self.use_cached_searches, self.profiler, project=self.project)
+    # Issues are sorted by ID within each shard, as the backends return them.
+    pipeline.filtered_iids = {}
+    for shard_id in range(3):
+      shard_issues = [
+          fake.MakeTestIssue(
+              789, local_id, 'sum', 'New', 111, issue_id=78900 + local_id)
+          for local_id in range(1 + shard_id, 100, 3)]
+      for issue in shard_issues:
+        self.services.issue.TestAddIssue(issue)
+      pipeline.filtered_iids[(shard_id, '')] = [
+          issue.issue_id for issue in shard_issues]
+
+    fetched_iids = []
+    orig_get_issues = self.services.issue.GetIssues
+    def RecordGetIssues(cnxn, issue_ids, **kwargs):
+      fetched_iids.extend(issue_ids)
+      return orig_get_issues(cnxn, issue_ids, **kwargs)
+    self.services.issue.GetIssues = RecordGetIssues
+
+    pipeline.MergeAndSortIssues()
+    self.assertEqual(
+        list(range(1, 11)),
+        [issue.local_id for issue in pipeline.allowed_results])
+    self.assertEqual(
+        3 * frontendsearchpipeline.MIN_MERGE_BATCH_SIZE, len(fetched_iids))
+    pipeline.Paginate()
+    self.assertEqual(
+        list(range(6, 11)),
+        [issue.local_id for issue in pipeline.visible_results])
+
+  def testMergeAndSortIssues_ResortsWhenSQLOrderDiffers(self):
+    """Shards sorted by SQL on e.g. owner email may not be in our order."""
+    pipeline = frontendsearchpipeline.FrontendSearchPipeline(
+        self.cnxn, self.services, self.auth, self.me_user_id, self.query,
+        self.query_project_names, 5, 0, self.url_params, self.can,
+        self.group_by_spec, 'owner', self.warnings, self.errors,
+        self.use_cached_searches, self.profiler, project=self.project)
+    self.services.user.TestAddUser('b@example.com', 222)
+    # SQL puts issues without an owner last, but we sort them first.
+    shard_issues = [
+        fake.MakeTestIssue(789, 3, 'sum', 'New', 111, issue_id=78903),
+        fake.MakeTestIssue(789, 2, 'sum', 'New', 222, issue_id=78902),
+        fake.MakeTestIssue(789, 1, 'sum', 'New', 0, issue_id=78901)]
+    for issue in shard_issues:
+      self.services.issue.TestAddIssue(issue)
+    pipeline.filtered_iids = {
+        (0, ''): [issue.issue_id for issue in shard_issues]}
+
+    self.assertFalse(pipeline._CanMergeSortedShards())
+    pipeline.MergeAndSortIssues()
+    self.assertEqual(
+        [1, 3, 2], [issue.local_id for issue in pipeline.allowed_results])
+
+  def testCanMergeSortedShards(self):
+    pipeline = frontendsearchpipeline.FrontendSearchPipeline(
+        self.cnxn, self.services, self.auth, self.me_user_id, self.query,
+        self.query_project_names, 5, 0, self.url_params, self.can,
+        '', '-opened', self.warnings, self.errors,
+        self.use_cached_searches, self.profiler, project=self.project)
+    self.assertTrue(pipeline._CanMergeSortedShards())
+    # SQL sorts projects by ID, but we sort them by name.
+    pipeline.query_project_ids = [789, 790]
+    self.assertFalse(pipeline._CanMergeSortedShards())
+
   def testDetermineIssuePosition_Normal(self):
     pipeline = frontendsearchpipeline.FrontendSearchPipeline(
          self.cnxn, self.services, self.auth, self.me_user_id, self.query,
@@ -764,8 +834,25 @@ class FrontendSearchPipelineMethodsTest(unittest.TestCase):
     self.assertEqual({1: {10001}}, nonviewable_iids)
 
   def testGetCachedSearchResults(self):
-    # TODO(jrobbins): Write this test.
-    pass
+    """Equivalent queries share cached results, stale ones are ignored."""
+    query_key = searchpipeline.QueryCacheKey(
+        'is:open', 'Pri=1 status:New', self.default_config)
+    memcache.set('789;%s;project id;0' % query_key, ([10001], NOW))
+    memcache.set('789;%s;project id;1' % query_key, ([10002], NOW - 100))
+    memcache.set(
+        '789;%s;project id;search_limit_reached;0' % query_key, (True, NOW))
+    project_shard_timestamps = {(789, 0): NOW - 10, (789, 1): NOW - 10}
+    needed_shard_keys = {
+        (0, 'status:new  pri=1'), (1, 'status:new  pri=1'),
+        (2, 'status:new  pri=1')}
+
+    unfiltered_dict, search_limit_reached_dict = (
+        frontendsearchpipeline._GetCachedSearchResults(
+            'cnxn', [789], needed_shard_keys, self.default_config,
+            project_shard_timestamps, self.services, [], 2, '', '', []))
+    self.assertEqual({(0, 'status:new  pri=1'): [10001]}, unfiltered_dict)
+    self.assertEqual(
+        {(0, 'status:new  pri=1'): True}, search_limit_reached_dict)
 
   def testMakeBackendRequestHeaders(self):
     headers = frontendsearchpipeline._MakeBackendRequestHeaders(False)
@@ -886,7 +973,7 @@ class FrontendSearchPipelineMethodsTest(unittest.TestCase):
     rpc = testing_helpers.Blank(
       get_result=lambda: testing_helpers.Blank(
           content=response_str, status_code=200))
-    rpc_tuple = (NOW, 2, rpc)
+    rpc_tuple = (NOW, (2, ''), rpc)
     rpc_tuples = []  # Nothing should be added for this case.
     filtered_iids = {}  # Search results should accumlate here, per-shard.
     search_limit_reached = {}  # Booleans accumulate here, per-shard.
@@ -902,9 +989,9 @@ class FrontendSearchPipelineMethodsTest(unittest.TestCase):
       search_limit_reached, processed_invalidations_up_to, error_responses,
       me_user_ids, logged_in_user_id, new_url_num, url_params, None, None)
     self.assertEqual([], rpc_tuples)
-    self.assertEqual({2: []}, filtered_iids)
-    self.assertEqual({2: False}, search_limit_reached)
-    self.assertEqual({2}, error_responses)
+    self.assertEqual({(2, ''): []}, filtered_iids)
+    self.assertEqual({(2, ''): False}, search_limit_reached)
+    self.assertEqual({(2, '')}, error_responses)
 
   def testHandleBackendSearchResponse_Normal(self):
     response_str = (
@@ -917,7 +1004,7 @@ class FrontendSearchPipelineMethodsTest(unittest.TestCase):
     rpc = testing_helpers.Blank(
       get_result=lambda: testing_helpers.Blank(
           content=response_str, status_code=200))
-    rpc_tuple = (NOW, 2, rpc)
+    rpc_tuple = (NOW, (2, ''), rpc)
     rpc_tuples = []  # Nothing should be added for this case.
     filtered_iids = {}  # Search results should accumlate here, per-shard.
     search_limit_reached = {}  # Booleans accumulate here, per-shard.
@@ -933,8 +1020,8 @@ class FrontendSearchPipelineMethodsTest(unittest.TestCase):
       search_limit_reached, processed_invalidations_up_to, error_responses,
       me_user_ids, logged_in_user_id, new_url_num, url_params, None, None)
     self.assertEqual([], rpc_tuples)
-    self.assertEqual({2: [10002, 10042]}, filtered_iids)
-    self.assertEqual({2: False}, search_limit_reached)
+    self.assertEqual({(2, ''): [10002, 10042]}, filtered_iids)
+    self.assertEqual({(2, ''): False}, search_limit_reached)
 
   def testHandleBackendSearchResponse_TriggersRetry(self):
     response_str = None
@@ -1171,3 +1258,97 @@ class FrontendSearchPipelineShardMethodsTest(unittest.TestCase):
        (40, (0, 'p:v'), 3),
        (81, (1, 'p:v'), 3)],
       frontendsearchpipeline._CalcSamplePositions(self.sharded_iids, samples))
+
+
+class BackendHedgingTest(unittest.TestCase):
+
+  def setUp(self):
+    self.mox = mox.Mox()
+    self.orig_hedge_backend_searches = settings.hedge_backend_searches
+    settings.hedge_backend_searches = True
+    self.tracker = frontendsearchpipeline.BackendLatencyTracker()
+    self.mox.stubs.Set(
+        frontendsearchpipeline, 'backend_latency_tracker', self.tracker)
+    self.unfiltered_iids = {}
+    self.error_responses = set()
+
+  def tearDown(self):
+    settings.hedge_backend_searches = self.orig_hedge_backend_searches
+    self.mox.UnsetStubs()
+    self.mox.ResetAll()
+
+  def Search(self, backend, shard_ids):
+    """Search the fake backend and wait for all shards to answer."""
+    self.mox.stubs.Set(frontendsearchpipeline.time, 'time', backend.Now)
+    self.mox.stubs.Set(
+        frontendsearchpipeline, '_StartBackendSearchCall',
+        backend.StartSearchCall)
+    self.mox.stubs.Set(frontendsearchpipeline, 'real_wait_any', backend.WaitAny)
+
+    rpc_tuples = []
+    for shard_id in shard_ids:
+      hedge = frontendsearchpipeline.BackendHedge(settings.backend_retries)
+      call_args = (
+          ['proj'], (shard_id, ''), rpc_tuples, self.unfiltered_iids, {},
+          12345, self.error_responses, [], 0, 100, [], '', '')
+      hedge.start_duplicate = frontendsearchpipeline._MakeBackendCallback(
+          frontendsearchpipeline._StartBackendSearchAttempt, 0, True, hedge,
+          *call_args)
+      frontendsearchpipeline._StartBackendSearchAttempt(
+          settings.backend_retries, True, hedge, *call_args)
+    frontendsearchpipeline._FinishBackendSearch(rpc_tuples)
+
+  def ObserveTypicalLatency(self):
+    for _ in range(frontendsearchpipeline.HEDGE_MIN_LATENCY_SAMPLES):
+      self.tracker.Observe(0.1)
+
+  def testHedgeDelay(self):
+    self.assertIsNone(self.tracker.HedgeDelay())
+    for i in range(100):
+      self.tracker.Observe(i / 100.0)
+    self.assertEqual(0.95, self.tracker.HedgeDelay())
+
+  def testHedgeDelay_Minimum(self):
+    self.ObserveTypicalLatency()
+    self.assertEqual(
+        settings.backend_hedge_min_delay_sec, self.tracker.HedgeDelay())
+
+  def testFinishBackendSearch_DuplicateAnswersFirst(self):
+    self.ObserveTypicalLatency()
+    backend = fake.BesearchBackend(
+        {0: [10], 1: [21]}, latencies={1: [5.0, 0.1]})
+    self.Search(backend, [0, 1])
+    self.assertEqual({(0, ''): [10], (1, ''): [21]}, self.unfiltered_iids)
+    self.assertEqual(set(), self.error_responses)
+    # The duplicate was sent at 0.2 sec and we did not wait for the original.
+    self.assertAlmostEqual(0.3, backend.Now())
+    self.assertEqual(
+        [(0, ''), (1, ''), (1, '')],
+        [shard_key for _start, shard_key, _failfast in backend.calls])
+
+  def testFinishBackendSearch_NoLatencyHistory(self):
+    backend = fake.BesearchBackend(
+        {0: [10], 1: [21]}, latencies={1: [5.0, 0.1]})
+    self.Search(backend, [0, 1])
+    self.assertEqual({(0, ''): [10], (1, ''): [21]}, self.unfiltered_iids)
+    self.assertAlmostEqual(5.0, backend.Now())
+    self.assertEqual(2, len(backend.calls))
+
+  def testFinishBackendSearch_DuplicateFailsOriginalAnswers(self):
+    """A failed call is not retried while another call may still answer."""
+    self.ObserveTypicalLatency()
+    backend = fake.BesearchBackend({1: [21]}, latencies={1: [5.0, None]})
+    self.Search(backend, [1])
+    self.assertEqual({(1, ''): [21]}, self.unfiltered_iids)
+    self.assertEqual(set(), self.error_responses)
+    self.assertAlmostEqual(5.0, backend.Now())
+    self.assertEqual(2, len(backend.calls))
+
+  def testFinishBackendSearch_RetriesAfterAllCallsFail(self):
+    self.ObserveTypicalLatency()
+    backend = fake.BesearchBackend(
+        {1: [21]}, latencies={1: [(1.0, False), None, 0.1]})
+    self.Search(backend, [1])
+    self.assertEqual({(1, ''): [21]}, self.unfiltered_iids)
+    self.assertEqual(set(), self.error_responses)
+    self.assertEqual(3, len(backend.calls))
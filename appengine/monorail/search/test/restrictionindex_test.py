@@ -0,0 +1,172 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Tests for the restrictionindex module."""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import array
+import unittest
+
+import mox
+
+from google.appengine.api import memcache
+from google.appengine.ext import testbed
+
+import settings
+from search import restrictionindex
+from services import service_manager
+from testing import fake
+
+
+class IIDSetTest(unittest.TestCase):
+
+  def testSmallChunksAreArrays(self):
+    iid_set = restrictionindex.IIDSet(iids=[78901, 5, 4097, 78901])
+    self.assertEqual([5, 4097, 78901], list(iid_set))
+    self.assertEqual(3, len(iid_set))
+    for chunk in iid_set.chunks.values():
+      self.assertIsInstance(chunk, array.array)
+    self.assertIn(4097, iid_set)
+    self.assertNotIn(4096, iid_set)
+    self.assertNotIn(999999, iid_set)
+
+  def testLargeChunksAreBitmaps(self):
+    iids = list(range(0, 4096, 2))
+    iid_set = restrictionindex.IIDSet(iids=iids)
+    self.assertNotIsInstance(iid_set.chunks[0], array.array)
+    self.assertEqual(iids, list(iid_set))
+    self.assertIn(10, iid_set)
+    self.assertNotIn(11, iid_set)
+
+  def testAddAndDiscard(self):
+    iid_set = restrictionindex.IIDSet(iids=[1])
+    iid_set.Add(5000)
+    iid_set.Discard(1)
+    iid_set.Discard(123456)
+    self.assertEqual([5000], list(iid_set))
+    iid_set.Discard(5000)
+    self.assertEqual({}, iid_set.chunks)
+
+  def testAddAndDiscard_ConvertsChunks(self):
+    limit = restrictionindex.MAX_ARRAY_CHUNK_LEN
+    iid_set = restrictionindex.IIDSet(iids=list(range(limit)))
+    self.assertIsInstance(iid_set.chunks[0], array.array)
+    iid_set.Add(limit)
+    self.assertNotIsInstance(iid_set.chunks[0], array.array)
+    iid_set.Discard(0)
+    self.assertIsInstance(iid_set.chunks[0], array.array)
+    self.assertEqual(list(range(1, limit + 1)), list(iid_set))
+
+  def testUnionAndDifference(self):
+    set_a = restrictionindex.IIDSet(iids=[1, 2, 9000])
+    set_b = restrictionindex.IIDSet(iids=list(range(2, 4000)) + [20000])
+    union = restrictionindex.IIDSet.Union([set_a, set_b])
+    self.assertEqual(
+        [1] + list(range(2, 4000)) + [9000, 20000], list(union))
+    self.assertEqual(
+        restrictionindex.IIDSet(iids=[1, 9000]), set_a.Difference(set_b))
+    self.assertEqual(
+        restrictionindex.IIDSet(), restrictionindex.IIDSet.Union([]))
+
+
+class RestrictionIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self.testbed = testbed.Testbed()
+    self.testbed.activate()
+    self.testbed.init_memcache_stub()
+    self.mox = mox.Mox()
+    self.cnxn = 'fake cnxn'
+    self.services = service_manager.Services(
+        config=fake.ConfigService(),
+        issue=fake.IssueService())
+    self.services.config.TestAddLabelsDict(
+        {'Restrict-View-A': 123, 'Restrict-View-B': 234, 'Hot': 345})
+    self.services.config.GetLabelDefRows = (
+        lambda _cnxn, _pid, use_cache=True: [
+            (123, 789, 1, 'Restrict-View-A', 'doc', False),
+            (234, 789, 2, 'Restrict-View-B', 'doc', False),
+            (345, 789, 3, 'Hot', 'doc', False),
+            ])
+    self.shard_id = 78901 % settings.num_logical_shards
+    self.iid_a = 78901
+    self.iid_b = self.iid_a + settings.num_logical_shards
+
+  def tearDown(self):
+    self.testbed.deactivate()
+    self.mox.UnsetStubs()
+    self.mox.ResetAll()
+
+  def StubIndexQuery(self, pairs):
+    self.mox.StubOutWithMock(self.services.issue, 'GetIIDLabelIDPairs')
+    self.services.issue.GetIIDLabelIDPairs(
+        self.cnxn, [123, 234], 789, self.shard_id).AndReturn(pairs)
+
+  def GetRestrictedIIDs(self, label_ids):
+    return list(restrictionindex.GetRestrictedIIDs(
+        self.cnxn, self.services, 789, self.shard_id, label_ids))
+
+  def UpdateIssue(self, labels):
+    issue = fake.MakeTestIssue(
+        789, 1, 'sum', 'New', 111, labels=labels, issue_id=self.iid_a)
+    restrictionindex.UpdateIndexes(self.cnxn, self.services.config, [issue])
+
+  def testGetRestrictedIIDs_BuildsIndexOnce(self):
+    self.StubIndexQuery([(self.iid_a, 123), (self.iid_b, 234)])
+    self.mox.ReplayAll()
+
+    self.assertEqual([self.iid_a], self.GetRestrictedIIDs([123]))
+    self.assertEqual(
+        [self.iid_a, self.iid_b], self.GetRestrictedIIDs([123, 234]))
+    self.assertEqual([], self.GetRestrictedIIDs([]))
+    self.mox.VerifyAll()
+
+  def testUpdateIndexes_PatchesLabels(self):
+    self.StubIndexQuery([(self.iid_a, 123), (self.iid_b, 234)])
+    self.mox.ReplayAll()
+    self.GetRestrictedIIDs([123])
+
+    self.UpdateIssue(['Restrict-View-B', 'Hot'])
+    self.assertEqual([], self.GetRestrictedIIDs([123]))
+    self.assertEqual(
+        [self.iid_a, self.iid_b], self.GetRestrictedIIDs([234]))
+
+    self.UpdateIssue([])
+    self.assertEqual([self.iid_b], self.GetRestrictedIIDs([123, 234]))
+    self.mox.VerifyAll()
+
+  def testUpdateIndexes_NoIndex(self):
+    self.UpdateIssue(['Restrict-View-A'])
+    self.assertIsNone(memcache.get(
+        restrictionindex.INDEX_KEY_PREFIX + '789;%d' % self.shard_id))
+
+  def testUpdateIndexes_IndexBeingBuilt(self):
+    """An update during a build keeps the built index from being cached."""
+    index_key = restrictionindex.INDEX_KEY_PREFIX + '789;%d' % self.shard_id
+
+    def UpdateDuringBuild(*_args):
+      self.UpdateIssue(['Restrict-View-A'])
+      return []
+    self.services.issue.GetIIDLabelIDPairs = UpdateDuringBuild
+
+    self.assertEqual([], self.GetRestrictedIIDs([123]))
+    self.assertIsNone(memcache.get(index_key))
+
+  def testDeleteIndexes(self):
+    self.StubIndexQuery([])
+    self.mox.ReplayAll()
+    self.GetRestrictedIIDs([123])
+    index_key = restrictionindex.INDEX_KEY_PREFIX + '789;%d' % self.shard_id
+    self.assertEqual({}, memcache.get(index_key))
+
+    restrictionindex.DeleteIndexes([(789, self.shard_id)])
+    self.assertIsNone(memcache.get(index_key))
+    self.mox.VerifyAll()
+
+
+if __name__ == '__main__':
+  unittest.main()
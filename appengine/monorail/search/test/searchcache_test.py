@@ -0,0 +1,295 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Tests for the searchcache module."""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import mock
+import unittest
+
+from google.appengine.api import memcache
+from google.appengine.ext import testbed
+
+import settings
+from proto import ast_pb2
+from proto import tracker_pb2
+from search import query2ast
+from search import searchcache
+from services import service_manager
+from testing import fake
+from tracker import tracker_bizobj
+
+
+def MakeField(field_name, field_type=tracker_pb2.FieldTypes.INT_TYPE):
+  return tracker_pb2.FieldDef(field_name=field_name, field_type=field_type)
+
+
+def MakeAST(*conds):
+  return ast_pb2.QueryAST(conjunctions=[ast_pb2.Conjunction(conds=conds)])
+
+
+class EvalQueryASTTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cnxn = 'fake cnxn'
+    self.config_service = fake.ConfigService()
+    self.config_service.TestAddLabelsDict({'Hot': 11, 'Cold': 12})
+    self.issue = fake.MakeTestIssue(
+        789, 1, 'sum', 'New', 111, labels=['Hot'], issue_id=78901)
+
+  def Eval(self, *conds):
+    return searchcache.EvalQueryAST(
+        self.cnxn, self.config_service, MakeAST(*conds), self.issue)
+
+  def testNativeFields(self):
+    self.issue.star_count = 3
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.GT, [MakeField('stars')], [], [2])))
+    self.assertFalse(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.GT, [MakeField('stars')], [], [3])))
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.EQ, [MakeField('id')], [], [1, 2])))
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.EQ, [MakeField('is_spam')], [], [0])))
+    self.issue.is_spam = True
+    self.assertFalse(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.EQ, [MakeField('is_spam')], [], [0])))
+
+  def testLabelID(self):
+    label_field = MakeField('label_id')
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.EQ, [label_field], [], [11, 99])))
+    self.assertFalse(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.EQ, [label_field], [], [12])))
+    self.assertFalse(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.NE, [label_field], [], [11])))
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.NE, [label_field], [], [])))
+    self.issue.labels = []
+    self.issue.derived_labels = ['Cold']
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.EQ, [label_field], [], [12])))
+
+  def testLabelNames(self):
+    label_field = query2ast.BUILTIN_ISSUE_FIELDS['label']
+    self.issue.labels = ['Pri-1', 'Hot']
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.EQ, [label_field], ['hot'], [])))
+    self.assertFalse(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.NE, [label_field], ['Hot', 'Cold'], [])))
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.IS_DEFINED, [label_field], ['Pri'], [])))
+    self.assertFalse(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.IS_DEFINED, [label_field], ['Type'], [])))
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.TEXT_HAS, [label_field], ['pri'], [])))
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.KEY_HAS, [label_field], ['Pri-1', 'Pri-2'], [])))
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.NOT_TEXT_HAS, [label_field], ['Cold'], [])))
+    self.issue.labels = []
+    self.issue.derived_labels = ['Pri-2']
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.KEY_HAS, [label_field], ['Pri-1', 'Pri-2'], [])))
+
+  def testStatusAndOwnerIDs(self):
+    # The fake config service says every status has ID 1.
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.NE, [MakeField('status_id')], [], [7, 8])))
+    self.assertFalse(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.NE, [MakeField('status_id')], [], [1])))
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.EQ, [MakeField('owner_id')], [], [111])))
+    self.issue.owner_id = 0
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.IS_NOT_DEFINED, [MakeField('owner_id')], [], [])))
+    self.issue.derived_owner_id = 222
+    self.assertFalse(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.IS_NOT_DEFINED, [MakeField('owner_id')], [], [])))
+
+  def testComponentID(self):
+    component_field = MakeField('component_id')
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.IS_NOT_DEFINED, [component_field], [], [])))
+    self.issue.derived_component_ids = [5]
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.IS_DEFINED, [component_field], [], [])))
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.EQ, [component_field], [], [5, 6])))
+    self.assertTrue(self.Eval(ast_pb2.MakeCond(
+        ast_pb2.QueryOp.NE, [component_field], [], [6])))
+
+  def testAnyConjunction(self):
+    query_ast = ast_pb2.QueryAST(conjunctions=[
+        ast_pb2.Conjunction(conds=[ast_pb2.MakeCond(
+            ast_pb2.QueryOp.EQ, [MakeField('id')], [], [2])]),
+        ast_pb2.Conjunction(conds=[ast_pb2.MakeCond(
+            ast_pb2.QueryOp.EQ, [MakeField('id')], [], [1])]),
+        ])
+    self.assertTrue(searchcache.EvalQueryAST(
+        self.cnxn, self.config_service, query_ast, self.issue))
+
+  def testUnsupported(self):
+    with self.assertRaises(searchcache.UnsupportedQuery):
+      self.Eval(ast_pb2.MakeCond(
+          ast_pb2.QueryOp.TEXT_HAS, [MakeField('summary')], ['sum'], []))
+
+
+class PatchCachedResultsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.testbed = testbed.Testbed()
+    self.testbed.activate()
+    self.testbed.init_memcache_stub()
+    self.cnxn = 'fake cnxn'
+    self.services = service_manager.Services(
+        project=fake.ProjectService(),
+        config=fake.ConfigService(),
+        issue=fake.IssueService())
+    self.services.config.TestAddLabelsDict({'Hot': 11, 'Cold': 12})
+    self.services.config.LookupLabelIDs = (
+        lambda _cnxn, _pid, labels, autocreate=False: [
+            self.services.config.label_to_id[label] for label in labels])
+    self.config = tracker_bizobj.MakeDefaultProjectIssueConfig(789)
+    self.shard_id = 78901 % settings.num_logical_shards
+
+  def tearDown(self):
+    self.testbed.deactivate()
+
+  def CacheResult(self, key, iids, query_ast, sd=None, limit_reached=False,
+                  started=True, project_ids=None):
+    if project_ids is None:
+      project_ids = [789]
+    memcache.set(key, (iids, 123))
+    memcache.set(key + ';limit', (limit_reached, 123))
+    index_keys = {'%d;%d' % (pid, self.shard_id) for pid in project_ids}
+    searchcache.RegisterCachedResult(
+        self.cnxn, self.services, query_ast, project_ids, self.config,
+        sd or ['project', 'id'], self.shard_id, key, key + ';limit',
+        limit_reached, index_keys if started else set())
+
+  def MakeLabelAST(self, label):
+    return ast_pb2.QueryAST(conjunctions=[ast_pb2.Conjunction(conds=[
+        ast_pb2.MakeCond(
+            ast_pb2.QueryOp.EQ, [query2ast.BUILTIN_ISSUE_FIELDS['label']],
+            [label], [])])])
+
+  def Patch(self, issue):
+    # Searches of all projects are indexed separately.
+    memcache.add(searchcache.INDEX_KEY_PREFIX + 'all;%d' % self.shard_id, [])
+    return searchcache.PatchCachedResults(
+        self.cnxn, self.services.config, [issue])
+
+  def testPatch_RemovesIssueThatNoLongerMatches(self):
+    self.CacheResult('hot', [78906, 78901, 78911], self.MakeLabelAST('Hot'))
+    issue = fake.MakeTestIssue(
+        789, 1, 'sum', 'New', 111, labels=['Cold'], issue_id=78901)
+    self.assertEqual(set(), self.Patch(issue))
+    self.assertEqual(([78906, 78911], 123), memcache.get('hot'))
+
+  def testPatch_LeavesResultThatIsNotAffected(self):
+    self.CacheResult('cold', [78906], self.MakeLabelAST('Cold'))
+    issue = fake.MakeTestIssue(
+        789, 1, 'sum', 'New', 111, labels=['Hot'], issue_id=78901)
+    self.assertEqual(set(), self.Patch(issue))
+    self.assertEqual(([78906], 123), memcache.get('cold'))
+
+  def testPatch_DropsResultThatIssueNowMatches(self):
+    self.CacheResult('cold', [78906], self.MakeLabelAST('Cold'))
+    issue = fake.MakeTestIssue(
+        789, 1, 'sum', 'New', 111, labels=['Cold'], issue_id=78901)
+    self.assertEqual(set(), self.Patch(issue))
+    self.assertIsNone(memcache.get('cold'))
+    self.assertIsNone(memcache.get('cold;limit'))
+
+  def testPatch_MatchesLabelCreatedAfterCaching(self):
+    """A label created after the query was cached is matched by name."""
+    self.services.config.LookupIDsOfLabelsMatching = (
+        lambda _cnxn, _pid, regex: [
+            label_id for label, label_id
+            in self.services.config.label_to_id.items()
+            if regex.match(label)])
+    pri_ast = ast_pb2.QueryAST(conjunctions=[ast_pb2.Conjunction(conds=[
+        ast_pb2.MakeCond(
+            ast_pb2.QueryOp.IS_DEFINED,
+            [query2ast.BUILTIN_ISSUE_FIELDS['label']], ['Pri'], [])])])
+    self.CacheResult('haspri', [78906], pri_ast)
+    self.CacheResult('hot', [78906], self.MakeLabelAST('Hot'))
+
+    self.services.config.label_to_id['Pri-1'] = 13
+    issue = fake.MakeTestIssue(
+        789, 1, 'sum', 'New', 111, labels=['Pri-1'], issue_id=78901)
+    self.assertEqual(set(), self.Patch(issue))
+    self.assertIsNone(memcache.get('haspri'))
+    self.assertIsNone(memcache.get('haspri;limit'))
+    self.assertEqual(([78906], 123), memcache.get('hot'))
+
+  def testPatch_DropsResultWithMutableSortOrder(self):
+    self.CacheResult(
+        'hot', [78901], self.MakeLabelAST('Hot'), sd=['-stars', 'id'])
+    issue = fake.MakeTestIssue(
+        789, 1, 'sum', 'New', 111, labels=['Hot'], issue_id=78901)
+    self.assertEqual(set(), self.Patch(issue))
+    self.assertIsNone(memcache.get('hot'))
+
+  def testPatch_DropsUnsupportedAndCappedResults(self):
+    summary_ast = ast_pb2.QueryAST(conjunctions=[ast_pb2.Conjunction(conds=[
+        ast_pb2.MakeCond(
+            ast_pb2.QueryOp.TEXT_HAS,
+            [query2ast.BUILTIN_ISSUE_FIELDS['summary']], ['sum'], [])])])
+    self.CacheResult('summary', [78901], summary_ast)
+    self.CacheResult(
+        'capped', [78906], self.MakeLabelAST('Cold'), limit_reached=True)
+    issue = fake.MakeTestIssue(
+        789, 1, 'sum', 'New', 111, labels=['Hot'], issue_id=78901)
+    self.assertEqual(set(), self.Patch(issue))
+    self.assertIsNone(memcache.get('summary'))
+    self.assertIsNone(memcache.get('capped'))
+
+  def testPatch_DropsResultChangedByAnotherWriter(self):
+    """A result that changed while we patched it is deleted, not overwritten."""
+    self.CacheResult('hot', [78906, 78901, 78911], self.MakeLabelAST('Hot'))
+    issue = fake.MakeTestIssue(
+        789, 1, 'sum', 'New', 111, labels=['Cold'], issue_id=78901)
+    orig_patch = searchcache._PatchResultIIDs
+
+    def PatchDuringConcurrentWrite(*args):
+      # Another patcher removes a different issue in the meantime.
+      memcache.set('hot', ([78906, 78901], 123))
+      return orig_patch(*args)
+
+    with mock.patch.object(
+        searchcache, '_PatchResultIIDs',
+        side_effect=PatchDuringConcurrentWrite):
+      self.assertEqual(set(), self.Patch(issue))
+    self.assertIsNone(memcache.get('hot'))
+    self.assertIsNone(memcache.get('hot;limit'))
+
+  def testPatch_MissingIndex(self):
+    issue = fake.MakeTestIssue(
+        789, 1, 'sum', 'New', 111, labels=['Hot'], issue_id=78901)
+    self.assertEqual({(789, self.shard_id)}, self.Patch(issue))
+
+  def testRegister_LostIndex(self):
+    """A result is deleted if its index was lost since the epoch started."""
+    self.CacheResult(
+        'hot', [78901], self.MakeLabelAST('Hot'), started=False)
+    self.assertIsNone(memcache.get('hot'))
+    self.assertIsNone(memcache.get('hot;limit'))
+
+  def testRegister_EvictsOldestResults(self):
+    for i in range(searchcache.MAX_INDEXED_RESULTS + 1):
+      self.CacheResult('hot%d' % i, [78901], self.MakeLabelAST('Hot'))
+    self.assertIsNone(memcache.get('hot0'))
+    self.assertIsNotNone(memcache.get('hot1'))
+    index = memcache.get(
+        searchcache.INDEX_KEY_PREFIX + '789;%d' % self.shard_id)
+    self.assertEqual(searchcache.MAX_INDEXED_RESULTS, len(index))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -122,3 +122,44 @@ class SearchPipelineTest(unittest.TestCase):
 
   def testParseQuery(self):
     pass  # TODO(jrobbins): write tests
+
+  def testQueryCacheKey_Equivalent(self):
+    """Queries that differ in order, spacing, or case share a key."""
+    key = searchpipeline.QueryCacheKey(
+        'is:open', 'Pri=1 status:New', self.config)
+    self.assertEqual(key, searchpipeline.QueryCacheKey(
+        'is:open', 'status:New  Pri=1', self.config))
+    self.assertEqual(key, searchpipeline.QueryCacheKey(
+        'is:open', 'status:new pri=1', self.config))
+    self.assertEqual(key, searchpipeline.QueryCacheKey(
+        '', 'Pri=1 is:open status:New', self.config))
+    self.assertEqual(
+        searchpipeline.QueryCacheKey('', 'Pri=1,2', self.config),
+        searchpipeline.QueryCacheKey('', 'Pri=2,1', self.config))
+
+  def testQueryCacheKey_Different(self):
+    """Queries that could match different issues have different keys."""
+    key = searchpipeline.QueryCacheKey('is:open', 'Pri=1', self.config)
+    self.assertNotEqual(key, searchpipeline.QueryCacheKey(
+        'is:open', 'Pri=2', self.config))
+    self.assertNotEqual(key, searchpipeline.QueryCacheKey(
+        'is:open', 'Pri:1', self.config))
+    self.assertNotEqual(key, searchpipeline.QueryCacheKey(
+        '', 'Pri=1', self.config))
+    self.assertNotEqual(key, searchpipeline.QueryCacheKey(
+        'is:open', '-Pri=1', self.config))
+
+  def testQueryCacheKey_RelativeDates(self):
+    """The key for a relative date does not change as time passes."""
+    self.assertEqual(
+        searchpipeline.QueryCacheKey('', 'opened>today-7', self.config),
+        searchpipeline.QueryCacheKey('', 'opened>today-7', self.config))
+    self.assertNotEqual(
+        searchpipeline.QueryCacheKey('', 'opened>today-7', self.config),
+        searchpipeline.QueryCacheKey('', 'opened>today-8', self.config))
+
+  def testQueryCacheKey_InvalidQuery(self):
+    """An unparsable query still gets a key."""
+    key = searchpipeline.QueryCacheKey('', 'opened>sometime', self.config)
+    self.assertNotEqual(key, searchpipeline.QueryCacheKey(
+        '', 'opened>whenever', self.config))
@@ -0,0 +1,147 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""A compact, versioned encoding for PBs that we store in memcache.
+
+protorpc's protobuf.decode_message() parses the wire format one byte at a
+time in pure Python, which dominates CPU on pages that read hundreds of
+issues from memcache.  Instead, we convert each PB into nested tuples that
+alternate field numbers and values for only the fields that are set, and
+serialize those with marshal, which is implemented in C.  marshal spends
+more bytes on small ints than protobuf varints, so values over a small
+threshold are zlib-compressed, which is cheap compared to decoding.
+
+Every encoded value starts with a 3-byte header: a NUL byte, the format
+version, and flags.  A valid protobuf never starts with a NUL byte, so
+values written in the old format can still be decoded.
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import logging
+import marshal
+import zlib
+
+from protorpc import messages
+from protorpc import protobuf
+
+
+FORMAT_MARKER = b'\x00'
+FORMAT_VERSION = 1
+FLAG_COMPRESSED = 1
+HEADER_LEN = 3
+
+# Values longer than this many bytes after marshaling are compressed.
+DEFAULT_COMPRESSION_THRESHOLD = 256
+
+# marshal format 2 is supported by every python 2.7 runtime.
+MARSHAL_VERSION = 2
+
+
+def VersionedPrefix(memcache_prefix):
+  """Return the memcache key prefix for values in the compact format.
+
+  Older app versions only know how to decode protobufs, so compact values
+  must not be stored under the keys that those versions read.
+  """
+  return '%sc%d:' % (memcache_prefix, FORMAT_VERSION)
+
+
+class CompactPBCodec(object):
+  """Encode and decode PBs of one class in the compact format."""
+
+  def __init__(
+      self, pb_class, compression_threshold=DEFAULT_COMPRESSION_THRESHOLD):
+    self.pb_class = pb_class
+    self.compression_threshold = compression_threshold
+    self.header = FORMAT_MARKER + chr(FORMAT_VERSION).encode('latin-1')
+    self._fields_by_class = {}
+
+  def _Fields(self, pb_class):
+    """Return [(number, name, field)] for pb_class, computed once."""
+    fields = self._fields_by_class.get(pb_class)
+    if fields is None:
+      fields = sorted(
+          (field.number, field.name, field) for field in pb_class.all_fields())
+      self._fields_by_class[pb_class] = fields
+    return fields
+
+  def _ToTuple(self, pb):
+    """Convert a PB into a flat tuple of number, value, ... for set fields."""
+    items = []
+    for number, name, field in self._Fields(type(pb)):
+      value = pb.get_assigned_value(name)
+      if value is None:
+        continue
+      if field.repeated:
+        if not value:
+          continue
+        if isinstance(field, messages.MessageField):
+          value = tuple(self._ToTuple(item) for item in value)
+        elif isinstance(field, messages.EnumField):
+          value = tuple(item.number for item in value)
+        else:
+          value = tuple(value)
+      elif isinstance(field, messages.MessageField):
+        value = self._ToTuple(value)
+      elif isinstance(field, messages.EnumField):
+        value = value.number
+      items.append(number)
+      items.append(value)
+    return tuple(items)
+
+  def _FromTuple(self, pb_class, items):
+    """Construct a PB of pb_class from a tuple made by _ToTuple()."""
+    pb = pb_class()
+    for i in range(0, len(items), 2):
+      number, value = items[i], items[i + 1]
+      try:
+        field = pb_class.field_by_number(number)
+      except KeyError:
+        # The field was removed from the PB definition since it was cached.
+        continue
+      if isinstance(field, messages.MessageField):
+        if field.repeated:
+          value = [self._FromTuple(field.type, item) for item in value]
+        else:
+          value = self._FromTuple(field.type, value)
+      elif isinstance(field, messages.EnumField):
+        if field.repeated:
+          value = [field.type(item) for item in value]
+        else:
+          value = field.type(value)
+      elif field.repeated:
+        value = list(value)
+      setattr(pb, field.name, value)
+    return pb
+
+  def Encode(self, pb):
+    """Return a string that represents the given PB."""
+    payload = marshal.dumps(self._ToTuple(pb), MARSHAL_VERSION)
+    flags = 0
+    if (self.compression_threshold is not None and
+        len(payload) > self.compression_threshold):
+      payload = zlib.compress(payload, 1)
+      flags |= FLAG_COMPRESSED
+    return self.header + chr(flags).encode('latin-1') + payload
+
+  def Decode(self, serialized):
+    """Return a PB from a string made by Encode() or protobuf encoding.
+
+    Returns None if the value was written in a format version that this
+    code does not understand, e.g., by a newer version of the app.
+    """
+    if not serialized.startswith(FORMAT_MARKER):
+      return protobuf.decode_message(self.pb_class, serialized)
+    if serialized[:HEADER_LEN - 1] != self.header:
+      logging.info('Unsupported cache value format version %r',
+                   serialized[1:HEADER_LEN - 1])
+      return None
+    flags = ord(serialized[HEADER_LEN - 1:HEADER_LEN])
+    payload = serialized[HEADER_LEN:]
+    if flags & FLAG_COMPRESSED:
+      payload = zlib.decompress(payload)
+    return self._FromTuple(self.pb_class, marshal.loads(payload))
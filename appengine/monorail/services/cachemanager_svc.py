@@ -31,10 +31,16 @@ handler for invalidation events.  E.g., the sorting code has a cache that
 is correctly invalidated on each issue change, but needs to be completely
 dropped when a config is modified.
 
+Optionally, a CacheManager can be given an InvalidationTransport that
+fans out invalidation messages to all jobs without a DB query.  When the
+transport reports that it delivered every message since the previous
+request, the Invalidate table is only polled every
+settings.invalidate_db_poll_interval_sec seconds as a safety net.  If the
+transport may have dropped messages, we poll the table right away.
+
 TODO(jrobbins): If this part of the system becomes a bottleneck, consider
 some optimizations: (a) splitting the table into multiple tables by
-kind, or (b) sharding the table by cache_key.  Or, maybe leverage memcache
-to avoid even hitting the DB in the frequent case where nothing has changed.
+kind, or (b) sharding the table by cache_key.
 """
 from __future__ import print_function
 from __future__ import division
@@ -42,7 +48,11 @@ from __future__ import absolute_import
 
 import collections
 import logging
+import time
+
+from google.appengine.api import memcache
 
+import settings
 from framework import jsonfeed
 from framework import sql
 
@@ -59,14 +69,132 @@ INVALIDATE_KIND_VALUES = [
 INVALIDATE_ALL_KEYS = 0
 MAX_INVALIDATE_ROWS_TO_CONSIDER = 1000
 
+# Memcache keys used by MemcacheInvalidationTransport.
+INVALIDATE_SEQ_KEY = 'invalidate:seq'
+INVALIDATE_MSG_KEY = 'invalidate:msg:%d'
+# Messages only need to live long enough for every job to read them.
+INVALIDATE_MSG_EXPIRATION = 10 * 60  # seconds
+# If a job falls further behind than this, it reads the DB table instead.
+MAX_INVALIDATE_MSGS_TO_CONSIDER = 500
+
+
+class InvalidationTransport(object):
+  """Interface for fanning out invalidation messages to all jobs.
+
+  A message is a list of (kind, cache_key) pairs.
+  """
+
+  def Publish(self, pairs):
+    """Send the given (kind, cache_key) pairs to all jobs."""
+    raise NotImplementedError()
+
+  def Receive(self):
+    """Return (pairs, complete) for messages published since the last call.
+
+    complete is False if this job may have missed some messages, e.g.,
+    because they expired, in which case the caller must poll the DB.
+    """
+    raise NotImplementedError()
+
+
+class MemcacheInvalidationTransport(InvalidationTransport):
+  """Fan out invalidations through a numbered sequence of memcache entries.
+
+  Publishing increments a shared sequence number and stores the message
+  under that number.  Each job remembers the last number it processed, so
+  on each request it does one memcache get when nothing has changed.
+  """
+
+  def __init__(self):
+    self.last_seq = None
+
+  def Publish(self, pairs):
+    seq = memcache.incr(
+        INVALIDATE_SEQ_KEY, initial_value=0,
+        namespace=settings.memcache_namespace)
+    if seq is None:
+      logging.error('Could not publish invalidation of %r', pairs)
+      return
+    memcache.set(
+        INVALIDATE_MSG_KEY % seq, list(pairs), time=INVALIDATE_MSG_EXPIRATION,
+        namespace=settings.memcache_namespace)
+
+  def Receive(self):
+    current_seq = memcache.get(
+        INVALIDATE_SEQ_KEY, namespace=settings.memcache_namespace)
+    if current_seq is None:
+      self.last_seq = None
+      return [], False
+
+    last_seq = self.last_seq
+    self.last_seq = current_seq
+    if last_seq is None or current_seq < last_seq:
+      # Either this job just started or memcache was flushed.
+      return [], False
+    if current_seq - last_seq > MAX_INVALIDATE_MSGS_TO_CONSIDER:
+      return [], False
+    if current_seq == last_seq:
+      return [], True
+
+    msg_keys = [
+        INVALIDATE_MSG_KEY % seq
+        for seq in range(last_seq + 1, current_seq + 1)]
+    msgs = memcache.get_multi(
+        msg_keys, namespace=settings.memcache_namespace)
+    pairs = []
+    for msg_key in msg_keys:
+      pairs.extend(msgs.get(msg_key, []))
+    # A message is missing if it expired, or if the publisher incremented
+    # the sequence number but has not stored its message yet.  We cannot
+    # tell which, so treat both as possibly missed.
+    return pairs, len(msgs) == len(msg_keys)
+
+
+class LocalInvalidationHub(object):
+  """In-process stand-in for a fan-out service, used in tests."""
+
+  def __init__(self):
+    self.subscribers = []
+
+  def MakeTransport(self):
+    """Return a new transport that receives all messages sent to this hub."""
+    transport = LocalInvalidationTransport(self)
+    self.subscribers.append(transport)
+    return transport
+
+
+class LocalInvalidationTransport(InvalidationTransport):
+  """Deliver invalidations to other CacheManagers in the same process."""
+
+  def __init__(self, hub):
+    self.hub = hub
+    self.inbox = []
+
+  def Publish(self, pairs):
+    for subscriber in self.hub.subscribers:
+      subscriber.inbox.extend(pairs)
+
+  def Receive(self):
+    pairs, self.inbox = self.inbox, []
+    return pairs, True
+
+
+def MakeInvalidationTransport():
+  """Return the transport configured in settings, or None to poll the DB."""
+  if settings.cache_invalidation_transport == 'memcache':
+    return MemcacheInvalidationTransport()
+  return None
+
 
 class CacheManager(object):
   """Service class to manage RAM caches and shared Invalidate table."""
 
-  def __init__(self):
+  def __init__(self, transport=None):
     self.cache_registry = collections.defaultdict(list)
     self.processed_invalidations_up_to = 0
     self.invalidate_tbl = sql.SQLTableManager(INVALIDATE_TABLE_NAME)
+    self.transport = transport
+    self.last_db_poll_time = 0
 
   def RegisterCache(self, cache, kind):
     """Register a cache to be notified of future invalidations."""
@@ -94,8 +222,42 @@ class CacheManager(object):
         else:
           cache.LocalInvalidate(key)
 
-  def DoDistributedInvalidation(self, cnxn):
+  def _ProcessInvalidationPairs(self, pairs):
+    """Invalidate cache entries indicated by transport messages."""
+    for kind, key in set(pairs):
+      for cache in self.cache_registry[kind]:
+        if key == INVALIDATE_ALL_KEYS:
+          cache.LocalInvalidateAll()
+        else:
+          cache.LocalInvalidate(key)
+
+  def DoDistributedInvalidation(self, cnxn, now=None):
     """Drop any cache entries that were invalidated by other jobs."""
+    trust_transport = False
+    if self.transport:
+      now = now or time.time()
+      pairs, complete = self.transport.Receive()
+      logging.info('Received %d invalidations', len(pairs))
+      self._ProcessInvalidationPairs(pairs)
+      if complete:
+        poll_interval = settings.invalidate_db_poll_interval_sec
+        if now - self.last_db_poll_time < poll_interval:
+          return
+        trust_transport = True
+      self.last_db_poll_time = now
+
+    self._PollInvalidateTable(cnxn, trust_transport)
+
+  def _PollInvalidateTable(self, cnxn, trust_transport):
+    """Read new rows of the Invalidate table and process them.
+
+    Args:
+      cnxn: connection to the database.
+      trust_transport: True if the transport reported delivering every
+          invalidation since the last poll.  The rows are still applied,
+          because a Publish() may have failed, but too many rows does not
+          cause us to invalidate all caches.
+    """
     # Only consider a reasonable number of rows so that we can never
     # get bogged down on this step.  If there are too many rows to
     # process, just invalidate all caches, and process the last group
@@ -108,11 +270,12 @@ class CacheManager(object):
 
     cnxn.Commit()
 
-    if len(rows) == MAX_INVALIDATE_ROWS_TO_CONSIDER:
+    logging.info('Saw %d invalidation rows', len(rows))
+    if (not trust_transport and
+        len(rows) == MAX_INVALIDATE_ROWS_TO_CONSIDER):
       logging.info('Invaliditing all caches: there are too many invalidations')
       self._InvalidateAllCaches()
 
-    logging.info('Saw %d invalidation rows', len(rows))
     self._ProcessInvalidationRows(rows)
 
   def StoreInvalidateRows(self, cnxn, kind, keys):
@@ -120,6 +283,8 @@ class CacheManager(object):
     assert kind in INVALIDATE_KIND_VALUES
     self.invalidate_tbl.InsertRows(
         cnxn, ['kind', 'cache_key'], [(kind, key) for key in keys])
+    if self.transport:
+      self.transport.Publish([(kind, key) for key in keys])
 
   def StoreInvalidateAll(self, cnxn, kind):
     """Store a value to tell all jobs to invalidate all items of this kind."""
@@ -127,6 +292,8 @@ class CacheManager(object):
         cnxn, kind=kind, cache_key=INVALIDATE_ALL_KEYS)
     self.invalidate_tbl.Delete(
         cnxn, kind=kind, where=[('timestep < %s', [last_timestep])])
+    if self.transport:
+      self.transport.Publish([(kind, INVALIDATE_ALL_KEYS)])
 
 
 class RamCacheConsolidate(jsonfeed.InternalTask):
@@ -21,51 +21,304 @@ from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
 
+import collections
 import logging
+import random
+import sys
 
+from protorpc import messages
 from protorpc import protobuf
 
 from google.appengine.api import memcache
 
+from infra_libs import ts_mon
+
 import settings
 from framework import framework_constants
 from proto import tracker_pb2
+from services import cache_codec
 
 
 DEFAULT_MAX_SIZE = 10000
 
+# Number of randomly sampled keys that LFUEvictionPolicy compares when
+# choosing a victim.  Larger samples approximate true LFU more closely.
+LFU_SAMPLE_SIZE = 5
+
+# Access counts are halved after this many accesses so that items that
+# were hot long ago do not stay in the cache forever.
+LFU_DECAY_PERIOD = 10000
+
+
+CACHE_HITS = ts_mon.CounterMetric(
+    'monorail/cache/ram/hits',
+    'Count of RAM cache lookups that found the requested key.',
+    [ts_mon.StringField('kind')])
+
+CACHE_MISSES = ts_mon.CounterMetric(
+    'monorail/cache/ram/misses',
+    'Count of RAM cache lookups that did not find the requested key.',
+    [ts_mon.StringField('kind')])
+
+CACHE_EVICTIONS = ts_mon.CounterMetric(
+    'monorail/cache/ram/evictions',
+    'Count of RAM cache entries dropped to make room for new entries.',
+    [ts_mon.StringField('kind'), ts_mon.StringField('policy')])
+
+
+class EvictionPolicy(object):
+  """Decides which key a RamCache should drop when it is full.
+
+  The RamCache notifies its policy of every key that is added, read, or
+  removed, and asks it to ChooseVictim() when it needs to make room.
+  """
+
+  name = 'abstract'
+
+  def KeyAdded(self, key):
+    """A new key was stored in the cache."""
+    raise NotImplementedError()
+
+  def KeyUsed(self, key):
+    """An existing key was read from or rewritten in the cache."""
+    raise NotImplementedError()
+
+  def KeyRemoved(self, key):
+    """A key was dropped from the cache."""
+    raise NotImplementedError()
+
+  def Clear(self):
+    """All keys were dropped from the cache."""
+    raise NotImplementedError()
+
+  def ChooseVictim(self):
+    """Return the key that should be evicted next."""
+    raise NotImplementedError()
+
+
+class RandomEvictionPolicy(EvictionPolicy):
+  """Drop an arbitrary key, which is what RamCache originally did."""
+
+  name = 'random'
+
+  def __init__(self):
+    self.keys = set()
+
+  def KeyAdded(self, key):
+    self.keys.add(key)
+
+  def KeyUsed(self, key):
+    pass
+
+  def KeyRemoved(self, key):
+    self.keys.discard(key)
+
+  def Clear(self):
+    self.keys = set()
+
+  def ChooseVictim(self):
+    key = self.keys.pop()
+    self.keys.add(key)
+    return key
+
+
+class LRUEvictionPolicy(EvictionPolicy):
+  """Drop the key that was least recently used."""
+
+  name = 'lru'
+
+  def __init__(self):
+    self.recency = collections.OrderedDict()
+
+  def KeyAdded(self, key):
+    self.recency[key] = True
+
+  def KeyUsed(self, key):
+    # Moving the key to the end of the OrderedDict makes it most recent.
+    if self.recency.pop(key, None):
+      self.recency[key] = True
+
+  def KeyRemoved(self, key):
+    self.recency.pop(key, None)
+
+  def Clear(self):
+    self.recency = collections.OrderedDict()
+
+  def ChooseVictim(self):
+    return next(iter(self.recency))
+
+
+class LFUEvictionPolicy(EvictionPolicy):
+  """Drop a key that was rarely used, approximated by random sampling.
+
+  Keeping a fully ordered frequency structure would cost more than the
+  lookups that it saves, so we compare the access counts of a small random
+  sample of keys, like memcached and redis do.  Counts decay periodically
+  so that formerly hot items can eventually be evicted.
+  """
+
+  name = 'lfu'
+
+  def __init__(
+      self, sample_size=LFU_SAMPLE_SIZE, decay_period=LFU_DECAY_PERIOD):
+    self.sample_size = sample_size
+    self.decay_period = decay_period
+    self.counts = {}
+    self.keys = []
+    self.positions = {}
+    self.accesses_since_decay = 0
+
+  def KeyAdded(self, key):
+    self.counts[key] = 1
+    self.positions[key] = len(self.keys)
+    self.keys.append(key)
+
+  def KeyUsed(self, key):
+    if key in self.counts:
+      self.counts[key] += 1
+      self.accesses_since_decay += 1
+      if self.accesses_since_decay >= self.decay_period:
+        self._Decay()
+
+  def _Decay(self):
+    """Halve all counts so that old popularity fades away."""
+    for key in self.counts:
+      self.counts[key] = self.counts[key] // 2 + 1
+    self.accesses_since_decay = 0
+
+  def KeyRemoved(self, key):
+    pos = self.positions.pop(key, None)
+    if pos is None:
+      return
+    del self.counts[key]
+    # Swap the last key into the vacated slot to keep removal O(1).
+    last_key = self.keys.pop()
+    if last_key != key:
+      self.keys[pos] = last_key
+      self.positions[last_key] = pos
+
+  def Clear(self):
+    self.counts = {}
+    self.keys = []
+    self.positions = {}
+    self.accesses_since_decay = 0
+
+  def ChooseVictim(self):
+    sample_size = min(self.sample_size, len(self.keys))
+    sample = random.sample(self.keys, sample_size)
+    return min(sample, key=lambda k: self.counts[k])
+
+
+EVICTION_POLICIES = {
+    policy_class.name: policy_class
+    for policy_class in (
+        RandomEvictionPolicy, LRUEvictionPolicy, LFUEvictionPolicy)}
+
+
+def MakeEvictionPolicy(policy_name=None):
+  """Return a new EvictionPolicy object for the given policy name."""
+  policy_name = policy_name or settings.ram_cache_eviction_policy
+  return EVICTION_POLICIES[policy_name]()
+
 
 class RamCache(object):
-  """An in-RAM cache with distributed invalidation."""
+  """An in-RAM cache with distributed invalidation.
+
+  When the cache reaches max_size items, or max_bytes total estimated size,
+  its eviction policy picks which existing items to drop.
+  """
 
-  def __init__(self, cache_manager, kind, max_size=None):
+  def __init__(
+      self, cache_manager, kind, max_size=None, eviction_policy=None,
+      max_bytes=None, sizer=None):
     self.cache_manager = cache_manager
     self.kind = kind
     self.cache = {}
     self.max_size = max_size or DEFAULT_MAX_SIZE
+    self.policy = MakeEvictionPolicy(eviction_policy)
+    self.max_bytes = max_bytes
+    self.sizer = sizer or sys.getsizeof
+    self.item_sizes = {}
+    self.total_bytes = 0
     cache_manager.RegisterCache(self, kind)
 
+  def _Store(self, key, item):
+    """Put one item in the cache and update our bookkeeping."""
+    if key in self.cache:
+      self.policy.KeyUsed(key)
+    else:
+      self.policy.KeyAdded(key)
+    self.cache[key] = item
+    if self.max_bytes:
+      size = self.sizer(item)
+      self.total_bytes += size - self.item_sizes.get(key, 0)
+      self.item_sizes[key] = size
+
+  def _Drop(self, key):
+    """Remove one item from the cache, if present."""
+    if key in self.cache:
+      del self.cache[key]
+      self.policy.KeyRemoved(key)
+      self.total_bytes -= self.item_sizes.pop(key, 0)
+
+  def _Clear(self):
+    """Remove all items from the cache."""
+    self.cache = {}
+    self.policy.Clear()
+    self.item_sizes = {}
+    self.total_bytes = 0
+
+  def _IsOverBudget(self, num_items, num_bytes):
+    """Return True if the given totals exceed this cache's limits."""
+    if num_items > self.max_size:
+      return True
+    if self.max_bytes and num_bytes > self.max_bytes:
+      return True
+    return False
+
+  def _Evict(self, incoming_items=0, incoming_bytes=0):
+    """Drop items chosen by the policy until there is room for new ones."""
+    num_evicted = 0
+    while self.cache and self._IsOverBudget(
+        len(self.cache) + incoming_items, self.total_bytes + incoming_bytes):
+      self._Drop(self.policy.ChooseVictim())
+      num_evicted += 1
+    if num_evicted:
+      CACHE_EVICTIONS.increment_by(
+          num_evicted, {'kind': self.kind, 'policy': self.policy.name})
+
   def CacheItem(self, key, item):
-    """Store item at key in this cache, discarding a random item if needed."""
-    if len(self.cache) >= self.max_size:
-      self.cache.popitem()
+    """Store item at key in this cache, evicting another item if needed."""
+    if key not in self.cache:
+      incoming_bytes = self.sizer(item) if self.max_bytes else 0
+      self._Evict(incoming_items=1, incoming_bytes=incoming_bytes)
 
-    self.cache[key] = item
+    self._Store(key, item)
 
   def CacheAll(self, new_item_dict):
     """Cache all items in the given dict, dropping old items if needed."""
     if len(new_item_dict) >= self.max_size:
       logging.warn('Dumping the entire cache! %s', self.kind)
-      self.cache = {}
+      self._Clear()
     else:
-      while len(self.cache) + len(new_item_dict) > self.max_size:
-        self.cache.popitem()
+      new_keys = [key for key in new_item_dict if key not in self.cache]
+      incoming_bytes = 0
+      if self.max_bytes:
+        incoming_bytes = sum(
+            self.sizer(new_item_dict[key]) for key in new_keys)
+      self._Evict(incoming_items=len(new_keys), incoming_bytes=incoming_bytes)
 
-    self.cache.update(new_item_dict)
+    for key, item in new_item_dict.items():
+      self._Store(key, item)
 
   def GetItem(self, key):
     """Return the cached item if present, otherwise None."""
-    return self.cache.get(key)
+    if key in self.cache:
+      self.policy.KeyUsed(key)
+      CACHE_HITS.increment({'kind': self.kind})
+      return self.cache[key]
+    CACHE_MISSES.increment({'kind': self.kind})
+    return None
 
   def HasItem(self, key):
     """Return True if there is a value cached at the given key."""
@@ -86,16 +339,21 @@ class RamCache(object):
     for key in keys:
       try:
         hits[key] = self.cache[key]
+        self.policy.KeyUsed(key)
       except KeyError:
         misses.append(key)
 
+    if hits:
+      CACHE_HITS.increment_by(len(hits), {'kind': self.kind})
+    if misses:
+      CACHE_MISSES.increment_by(len(misses), {'kind': self.kind})
     return hits, misses
 
   def LocalInvalidate(self, key):
     """Drop the given key from this cache, without distributed notification."""
     if key in self.cache:
       logging.info('Locally invalidating %r in kind=%r', key, self.kind)
-    self.cache.pop(key, None)
+    self._Drop(key)
 
   def Invalidate(self, cnxn, key):
     """Drop key locally, and append it to the Invalidate DB table."""
@@ -111,7 +369,7 @@ class RamCache(object):
   def LocalInvalidateAll(self):
     """Invalidate all keys locally: just start over with an empty dict."""
     logging.info('Locally invalidating all in kind=%r', self.kind)
-    self.cache = {}
+    self._Clear()
 
   def InvalidateAll(self, cnxn):
     """Invalidate all keys in this cache."""
@@ -129,9 +387,12 @@ class ShardedRamCache(RamCache):
   (16, 0), (16, 1), (16, 2), ... (16, 9).
   """
 
-  def __init__(self, cache_manager, kind, max_size=None, num_shards=10):
+  def __init__(
+      self, cache_manager, kind, max_size=None, num_shards=10,
+      eviction_policy=None, max_bytes=None, sizer=None):
     super(ShardedRamCache, self).__init__(
-        cache_manager, kind, max_size=max_size)
+        cache_manager, kind, max_size=max_size,
+        eviction_policy=eviction_policy, max_bytes=max_bytes, sizer=sizer)
     self.num_shards = num_shards
 
   def LocalInvalidate(self, key):
@@ -140,7 +401,7 @@ class ShardedRamCache(RamCache):
                  [(key, shard_id) for shard_id in range(self.num_shards)
                   if (key, shard_id) in self.cache])
     for shard_id in range(self.num_shards):
-      self.cache.pop((key, shard_id), None)
+      self._Drop((key, shard_id))
 
 
 class ValueCentricRamCache(RamCache):
@@ -157,7 +418,7 @@ class ValueCentricRamCache(RamCache):
       if v == value:
         keys_to_drop.append(k)
     for k in keys_to_drop:
-      self.cache.pop(k, None)
+      self._Drop(k)
 
   def InvalidateKeys(self, cnxn, keys):
     """Drop keys locally, and append their values to the Invalidate DB table."""
@@ -191,6 +452,16 @@ class AbstractTwoLevelCache(object):
     self.cache = self._MakeCache(cache_manager, kind, max_size=max_size)
     self.memcache_prefix = memcache_prefix
     self.pb_class = pb_class
+    self.codec = None
+    if (memcache_prefix in settings.compact_memcache_prefixes and
+        isinstance(pb_class, type) and issubclass(pb_class, messages.Message)):
+      self.codec = cache_codec.CompactPBCodec(
+          pb_class,
+          compression_threshold=settings.memcache_compression_threshold)
+      self.memcache_prefix = cache_codec.VersionedPrefix(memcache_prefix)
+    # Invalidations drop the keys used by any app version that may be
+    # serving at the same time.
+    self.memcache_prefixes = sorted({memcache_prefix, self.memcache_prefix})
 
   def _MakeCache(self, cache_manager, kind, max_size=None):
     """Make the RAM cache and register it with the cache_manager."""
@@ -268,7 +539,7 @@ class AbstractTwoLevelCache(object):
     for key_str, serialized_value in cached_dict.items():
       value = self._StrToValue(serialized_value)
       key = self._StrToKey(key_str)
-      if self._CheckCompatibility(value):
+      if value is not None and self._CheckCompatibility(value):
         memcache_hits[key] = value
         self.cache.CacheItem(key, value)
 
@@ -321,6 +592,8 @@ class AbstractTwoLevelCache(object):
       return value
     elif self.pb_class == int:
       return str(value)
+    elif self.codec:
+      return self.codec.Encode(value)
     else:
       return protobuf.encode_message(value)
 
@@ -330,6 +603,8 @@ class AbstractTwoLevelCache(object):
       return serialized_value
     elif self.pb_class == int:
       return int(serialized_value)
+    elif self.codec:
+      return self.codec.Decode(serialized_value)
     else:
       return protobuf.decode_message(self.pb_class, serialized_value)
 
@@ -339,13 +614,17 @@ class AbstractTwoLevelCache(object):
   def LocalInvalidate(self, key):
     self.cache.LocalInvalidate(key)
 
+  def _DeleteFromMemcache(self, key_strs):
+    """Delete the given keys from memcache under every prefix we use."""
+    for memcache_prefix in self.memcache_prefixes:
+      memcache.delete_multi(
+          key_strs, seconds=5, key_prefix=memcache_prefix,
+          namespace=settings.memcache_namespace)
+
   def InvalidateKeys(self, cnxn, keys):
     """Drop the given keys from both RAM and memcache."""
     self.cache.InvalidateKeys(cnxn, keys)
-    memcache.delete_multi(
-        [self._KeyToStr(key) for key in keys], seconds=5,
-        key_prefix=self.memcache_prefix,
-        namespace=settings.memcache_namespace)
+    self._DeleteFromMemcache([self._KeyToStr(key) for key in keys])
 
   def InvalidateAllKeys(self, cnxn, keys):
     """Drop the given keys from memcache and invalidate all keys in RAM.
@@ -354,10 +633,7 @@ class AbstractTwoLevelCache(object):
     invalidating a large group of keys all at once. Only use when necessary.
     """
     self.cache.InvalidateAll(cnxn)
-    memcache.delete_multi(
-        [self._KeyToStr(key) for key in keys], seconds=5,
-        key_prefix=self.memcache_prefix,
-        namespace=settings.memcache_namespace)
+    self._DeleteFromMemcache([self._KeyToStr(key) for key in keys])
 
   def GetAllAlreadyInRam(self, keys):
     """Look only in RAM to return {key: values}, missed_keys."""
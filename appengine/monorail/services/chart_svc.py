@@ -11,11 +11,13 @@ from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
 
+import collections
 import logging
 import settings
 import time
 
 from features import hotlist_helpers
+from framework import framework_constants
 from framework import framework_helpers
 from framework import sql
 from search import search_helpers
@@ -30,6 +32,8 @@ ISSUESNAPSHOT_TABLE_NAME = 'IssueSnapshot'
 ISSUESNAPSHOT2CC_TABLE_NAME = 'IssueSnapshot2Cc'
 ISSUESNAPSHOT2COMPONENT_TABLE_NAME = 'IssueSnapshot2Component'
 ISSUESNAPSHOT2LABEL_TABLE_NAME = 'IssueSnapshot2Label'
+ISSUESNAPSHOTROLLUP_TABLE_NAME = 'IssueSnapshotRollup'
+ISSUESNAPSHOTROLLUPSTATUS_TABLE_NAME = 'IssueSnapshotRollupStatus'
 
 ISSUESNAPSHOT_COLS = ['id', 'issue_id', 'shard', 'project_id', 'local_id',
     'reporter_id', 'owner_id', 'status_id', 'period_start', 'period_end',
@@ -37,6 +41,26 @@ ISSUESNAPSHOT_COLS = ['id', 'issue_id', 'shard', 'project_id', 'local_id',
 ISSUESNAPSHOT2CC_COLS = ['issuesnapshot_id', 'cc_id']
 ISSUESNAPSHOT2COMPONENT_COLS = ['issuesnapshot_id', 'component_id']
 ISSUESNAPSHOT2LABEL_COLS = ['issuesnapshot_id', 'label_id']
+ISSUESNAPSHOTROLLUP_COLS = ['project_id', 'day_end', 'dimension', 'value_id',
+    'issue_count']
+ISSUESNAPSHOTROLLUPSTATUS_COLS = ['project_id', 'rolled_up_since',
+    'rolled_up_through']
+
+# Each rollup row counts the issues in one group of a dimension, keyed by
+# the value of a column.  Issues with no value are counted under 0.
+ROLLUP_DIMENSIONS = [
+  # (dimension, column, left joins needed for the column)
+  ('total', None, []),
+  ('open', 'IssueSnapshot.is_open', []),
+  ('status', 'IssueSnapshot.status_id', []),
+  ('owner', 'IssueSnapshot.owner_id', []),
+  ('label', 'Is2l.label_id', [
+    (('IssueSnapshot2Label AS Is2l'
+      ' ON Is2l.issuesnapshot_id = IssueSnapshot.id'), [])]),
+  ('component', 'Is2c.component_id', [
+    (('IssueSnapshot2Component AS Is2c'
+      ' ON Is2c.issuesnapshot_id = IssueSnapshot.id'), [])]),
+]
 
 
 class ChartService(object):
@@ -58,6 +82,10 @@ class ChartService(object):
         ISSUESNAPSHOT2COMPONENT_TABLE_NAME)
     self.issuesnapshot2label_tbl = sql.SQLTableManager(
         ISSUESNAPSHOT2LABEL_TABLE_NAME)
+    self.issuesnapshotrollup_tbl = sql.SQLTableManager(
+        ISSUESNAPSHOTROLLUP_TABLE_NAME)
+    self.issuesnapshotrollupstatus_tbl = sql.SQLTableManager(
+        ISSUESNAPSHOTROLLUPSTATUS_TABLE_NAME)
 
   def QueryIssueSnapshots(self, cnxn, services, unixtime, effective_ids,
                           project, perms, group_by=None, label_prefix=None,
@@ -106,6 +134,8 @@ class ChartService(object):
     else:
       project_ids = hotlist_issues_project_ids
 
+    dimension = group_by or 'total'
+
     try:
       query_left_joins, query_where, unsupported_conds = self._QueryToWhere(
           cnxn, services, project_config, query, canned_query, project_ids)
@@ -209,6 +239,17 @@ class ChartService(object):
       raise ValueError('`group_by` must be label, component, ' \
         'open, status, owner or None.')
 
+    # Counts that do not depend on the user or a query can come from the
+    # daily rollup instead of scanning the snapshots.
+    if (settings.chart_snapshot_rollups and project and not hotlist and
+        not (query or canned_query) and
+        not self._HasAtRiskIssues(
+            cnxn, project.project_id, restricted_label_ids)):
+      rollup_counts = self._QueryIssueSnapshotRollup(
+          cnxn, project.project_id, unixtime, dimension, label_prefix)
+      if rollup_counts is not None:
+        return rollup_counts, [], False
+
     if query_left_joins:
       left_joins.extend(query_left_joins)
 
@@ -338,6 +379,146 @@ class ChartService(object):
         SELECT %s, hotlist_id FROM Hotlist2Issue WHERE issue_id = %s
       ''', [issuesnapshot_id, issue.issue_id])
 
+  def RollUpIssueSnapshots(self, cnxn, project_id, day_end, commit=True):
+    """Store the project's issue counts as of the end of a day.
+
+    Args:
+      cnxn: connection to SQL database.
+      project_id: int ID of the project.
+      day_end: int timestamp of the last second of a UTC day.  Days must be
+        rolled up in order, starting from any day.
+      commit: set to False to skip the DB commit and do it in a caller.
+    """
+    rows = []
+    for dimension, col, left_joins in ROLLUP_DIMENSIONS:
+      counts = self._CountIssueSnapshots(
+          cnxn, project_id, day_end, col, left_joins)
+      if dimension == 'label':
+        counts.pop(0, None)
+      if dimension == 'total':
+        counts.setdefault(0, 0)
+      rows.extend(
+          (project_id, day_end, dimension, value_id, count)
+          for value_id, count in sorted(counts.items()))
+
+    # Only store days that differ from the day before.  Queries use the
+    # latest stored day.
+    prev_day_end = self.issuesnapshotrollup_tbl.SelectValue(
+        cnxn, 'MAX(IssueSnapshotRollup.day_end)', project_id=project_id,
+        where=[('IssueSnapshotRollup.day_end < %s', [day_end])])
+    prev_rows = []
+    if prev_day_end:
+      prev_rows = self.issuesnapshotrollup_tbl.Select(
+          cnxn, cols=ISSUESNAPSHOTROLLUP_COLS[2:], project_id=project_id,
+          day_end=prev_day_end)
+    if sorted(prev_rows) != sorted(row[2:] for row in rows):
+      self.issuesnapshotrollup_tbl.Delete(
+          cnxn, project_id=project_id, day_end=day_end, commit=False)
+      self.issuesnapshotrollup_tbl.InsertRows(
+          cnxn, ISSUESNAPSHOTROLLUP_COLS, rows, commit=False)
+
+    since, _through = self.GetRollUpStatus(cnxn, project_id)
+    self.issuesnapshotrollupstatus_tbl.InsertRow(
+        cnxn, replace=True, project_id=project_id,
+        rolled_up_since=since or day_end, rolled_up_through=day_end,
+        commit=False)
+    if commit:
+      cnxn.Commit()
+
+  def GetRollUpStatus(self, cnxn, project_id):
+    """Return (rolled_up_since, rolled_up_through), or Nones if never."""
+    rows = self.issuesnapshotrollupstatus_tbl.Select(
+        cnxn, cols=ISSUESNAPSHOTROLLUPSTATUS_COLS[1:], project_id=project_id)
+    if not rows:
+      return None, None
+    return rows[0]
+
+  def _CountIssueSnapshots(self, cnxn, project_id, unixtime, col, left_joins):
+    """Return {value_id: count} of the project's issues at unixtime."""
+    left_joins = [
+      ('Issue ON IssueSnapshot.issue_id = Issue.id', []),
+    ] + left_joins
+    where = [
+      ('IssueSnapshot.period_start <= %s', [unixtime]),
+      ('IssueSnapshot.period_end > %s', [unixtime]),
+      ('Issue.is_spam = %s', [False]),
+      ('Issue.deleted = %s', [False]),
+      ('IssueSnapshot.project_id = %s', [project_id]),
+    ]
+    counts = collections.Counter()
+    for shard_id in range(settings.num_logical_shards):
+      if col:
+        rows = self.issuesnapshot_tbl.Select(
+            cnxn, cols=[col, 'COUNT(IssueSnapshot.id)'],
+            left_joins=left_joins,
+            where=where + [('IssueSnapshot.shard = %s', [shard_id])],
+            group_by=[col], shard_id=shard_id)
+      else:
+        rows = self.issuesnapshot_tbl.Select(
+            cnxn, cols=['COUNT(IssueSnapshot.id)'], left_joins=left_joins,
+            where=where + [('IssueSnapshot.shard = %s', [shard_id])],
+            shard_id=shard_id)
+        rows = [(0, count) for (count,) in rows]
+      for value_id, count in rows:
+        counts[int(value_id or 0)] += count
+    return counts
+
+  def _HasAtRiskIssues(self, cnxn, project_id, restricted_label_ids):
+    """Return True if some issues in the project may be hidden from the user.
+
+    The at-risk labels are site-wide, but only the project's own labels can be
+    on its issues.
+    """
+    if not restricted_label_ids:
+      return False
+    project_label_ids = {
+        row[0] for row in self.config_service.GetLabelDefRows(
+            cnxn, project_id)}
+    return bool(project_label_ids.intersection(restricted_label_ids))
+
+  def _QueryIssueSnapshotRollup(
+      self, cnxn, project_id, unixtime, dimension, label_prefix):
+    """Return {name: count} from the rollup, or None if it is not there.
+
+    Only the last second of each UTC day is rolled up.  The names match those
+    given by the raw snapshot queries.
+    """
+    if (unixtime + 1) % framework_constants.SECS_PER_DAY:
+      return None
+    since, through = self.GetRollUpStatus(cnxn, project_id)
+    if not since or not since <= unixtime <= through:
+      return None
+
+    day_end = self.issuesnapshotrollup_tbl.SelectValue(
+        cnxn, 'MAX(IssueSnapshotRollup.day_end)', project_id=project_id,
+        where=[('IssueSnapshotRollup.day_end <= %s', [unixtime])])
+    rows = self.issuesnapshotrollup_tbl.Select(
+        cnxn, cols=['value_id', 'issue_count'], project_id=project_id,
+        day_end=day_end, dimension=dimension)
+
+    if dimension == 'component':
+      config = self.config_service.GetProjectConfig(cnxn, project_id)
+    counts = {}
+    for value_id, count in rows:
+      if dimension == 'total':
+        name = 'total'
+      elif dimension == 'open':
+        name = 'Opened' if value_id else 'Closed'
+      elif dimension == 'owner':
+        name = value_id or None
+      elif dimension == 'status':
+        name = value_id and self.config_service.LookupStatus(
+            cnxn, project_id, value_id) or None
+      elif dimension == 'label':
+        name = self.config_service.LookupLabel(cnxn, project_id, value_id)
+        if not (name and name.lower().startswith(label_prefix.lower() + '-')):
+          continue
+      else:
+        component_def = tracker_bizobj.FindComponentDefByID(value_id, config)
+        name = component_def.path if component_def else None
+      counts[name] = counts.get(name, 0) + count
+    return counts
+
   def ExpungeHotlistsFromIssueSnapshots(self, cnxn, hotlist_ids, commit=True):
     """Expunge the existence of hotlists from issue snapshots.
 
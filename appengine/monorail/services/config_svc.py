@@ -25,6 +25,8 @@ from framework import exceptions
 from framework import framework_constants
 from framework import sql
 from proto import tracker_pb2
+from search import restrictionindex
+from search import searchcache
 from services import caches
 from services import project_svc
 from tracker import tracker_bizobj
@@ -1424,14 +1426,29 @@ class ConfigService(object):
 
   ### Memcache management
 
-  def InvalidateMemcache(self, issues, key_prefix=''):
-    """Delete the memcache entries for issues and their project-shard pairs."""
+  def InvalidateMemcache(self, issues, key_prefix='', cnxn=None):
+    """Delete the memcache entries for issues and their project-shard pairs.
+
+    If cnxn is given, issues must be the PBs that were just stored, and in
+    incremental mode cached search results are patched when possible rather
+    than being made stale.  Likewise, indexes of restricted issues are
+    patched if given cnxn and otherwise deleted.
+    """
     memcache.delete_multi(
         [str(issue.issue_id) for issue in issues], key_prefix='issue:',
         seconds=5, namespace=settings.memcache_namespace)
-    project_shards = set(
+    all_project_shards = set(
         (issue.project_id, issue.issue_id % settings.num_logical_shards)
         for issue in issues)
+    if not key_prefix and settings.index_restricted_issues:
+      if cnxn:
+        restrictionindex.UpdateIndexes(cnxn, self, issues)
+      else:
+        restrictionindex.DeleteIndexes(all_project_shards)
+    if cnxn and not key_prefix and settings.incremental_search_cache:
+      project_shards = searchcache.PatchCachedResults(cnxn, self, issues)
+    else:
+      project_shards = all_project_shards
     self._InvalidateMemcacheShards(project_shards, key_prefix=key_prefix)
 
   def _InvalidateMemcacheShards(self, project_shards, key_prefix=''):
@@ -1453,15 +1470,22 @@ class ConfigService(object):
     memcache.delete_multi(
         cache_entries, key_prefix=key_prefix,
         namespace=settings.memcache_namespace)
+    if not key_prefix:
+      # Results cached from now on will be listed in new indexes.
+      memcache.delete_multi(
+          cache_entries, key_prefix=searchcache.INDEX_KEY_PREFIX,
+          namespace=settings.memcache_namespace)
 
   def InvalidateMemcacheForEntireProject(self, project_id):
     """Delete the memcache entries for all searches in a project."""
     project_shards = set((project_id, shard_id)
                          for shard_id in range(settings.num_logical_shards))
     self._InvalidateMemcacheShards(project_shards)
-    memcache.delete_multi(
-        [str(project_id)], key_prefix='config:',
-        namespace=settings.memcache_namespace)
+    restrictionindex.DeleteIndexes(project_shards)
+    for memcache_prefix in self.config_2lc.memcache_prefixes:
+      memcache.delete_multi(
+          [str(project_id)], key_prefix=memcache_prefix,
+          namespace=settings.memcache_namespace)
     memcache.delete_multi(
         [str(project_id)], key_prefix='label_rows:',
         namespace=settings.memcache_namespace)
@@ -28,6 +28,7 @@ from framework import sql
 from proto import features_pb2
 from services import caches
 from services import config_svc
+from tracker import rerank_helpers
 from tracker import tracker_bizobj
 from tracker import tracker_constants
 
@@ -1018,11 +1019,12 @@ class FeaturesService(object):
         commit=False)
     if hotlist.items:
       items_sorted = sorted(hotlist.items, key=lambda item: item.rank)
-      rank_base = items_sorted[-1].rank + 10
+      rank_base = items_sorted[-1].rank + rerank_helpers.RANK_GAP
     else:
-      rank_base = 1
+      rank_base = rerank_helpers.RANK_GAP
     insert_rows = [
-        (hotlist_id, issue_id, rank*10 + rank_base, user_id, ts, note)
+        (hotlist_id, issue_id, rank * rerank_helpers.RANK_GAP + rank_base,
+         user_id, ts, note)
         for (rank, (issue_id, user_id, ts, note)) in enumerate(added_tuples)
         if issue_id not in current_issues_ids]
     self.hotlist2issue_tbl.InsertRows(
@@ -128,6 +128,10 @@ ISSUEAPPROVAL2COMMENT_COLS = ['approval_id', 'comment_id']
 
 CHUNK_SIZE = 1000
 
+# When loading at least this many issues from a replica, run the sub-queries
+# in parallel.  For fewer issues, the thread overhead is not worth it.
+PARALLEL_FETCH_MIN_ISSUES = 20
+
 
 class IssueIDTwoLevelCache(caches.AbstractTwoLevelCache):
   """Class to manage RAM and memcache for Issue IDs."""
@@ -366,20 +370,24 @@ class IssueTwoLevelCache(caches.AbstractTwoLevelCache):
 
     return results_dict
 
-  # Note: sharding is used to here to allow us to load issues from the replicas
-  # without placing load on the master.  Writes are not sharded.
-  # pylint: disable=arguments-differ
-  def FetchItems(self, cnxn, issue_ids, shard_id=None):
-    """Retrieve and deserialize issues."""
+  def _FetchIssueAndSummaryRows(self, cnxn, issue_ids, shard_id):
+    """Return (issue_rows, summary_rows) for the given issues."""
     issue_rows = self.issue_service.issue_tbl.Select(
         cnxn, cols=ISSUE_COLS, id=issue_ids, shard_id=shard_id)
-
     summary_rows = self.issue_service.issuesummary_tbl.Select(
         cnxn, cols=ISSUESUMMARY_COLS, shard_id=shard_id, issue_id=issue_ids)
+    return issue_rows, summary_rows
+
+  def _FetchLabelAndComponentRows(self, cnxn, issue_ids, shard_id):
+    """Return (label_rows, component_rows) for the given issues."""
     label_rows = self.issue_service.issue2label_tbl.Select(
         cnxn, cols=ISSUE2LABEL_COLS, shard_id=shard_id, issue_id=issue_ids)
     component_rows = self.issue_service.issue2component_tbl.Select(
         cnxn, cols=ISSUE2COMPONENT_COLS, shard_id=shard_id, issue_id=issue_ids)
+    return label_rows, component_rows
+
+  def _FetchPeopleAndFieldValueRows(self, cnxn, issue_ids, shard_id):
+    """Return (cc_rows, notify_rows, fieldvalue_rows) for the given issues."""
     cc_rows = self.issue_service.issue2cc_tbl.Select(
         cnxn, cols=ISSUE2CC_COLS, shard_id=shard_id, issue_id=issue_ids)
     notify_rows = self.issue_service.issue2notify_tbl.Select(
@@ -387,6 +395,17 @@ class IssueTwoLevelCache(caches.AbstractTwoLevelCache):
     fieldvalue_rows = self.issue_service.issue2fieldvalue_tbl.Select(
         cnxn, cols=ISSUE2FIELDVALUE_COLS, shard_id=shard_id,
         issue_id=issue_ids)
+    return cc_rows, notify_rows, fieldvalue_rows
+
+  def _FetchApprovalAndRelationRows(self, cnxn, issue_ids):
+    """Return approval and relation rows for the given issues.
+
+    These tables are not sharded, so the rows always come from the master.
+
+    Returns:
+      A 5-tuple (approvalvalue_rows, phase_rows, av_approver_rows,
+      relation_rows, dangling_relation_rows).
+    """
     approvalvalue_rows = self.issue_service.issue2approvalvalue_tbl.Select(
         cnxn, cols=ISSUE2APPROVALVALUE_COLS, issue_id=issue_ids)
     phase_ids = [av_row[2] for av_row in approvalvalue_rows]
@@ -416,6 +435,69 @@ class IssueTwoLevelCache(caches.AbstractTwoLevelCache):
       relation_rows = []
       dangling_relation_rows = []
 
+    return (approvalvalue_rows, phase_rows, av_approver_rows, relation_rows,
+            dangling_relation_rows)
+
+  def _ShouldFetchInParallel(self, issue_ids, shard_id):
+    """Return True if it is worth spreading the sub-queries over replicas."""
+    return (settings.fetch_issues_in_parallel and
+            shard_id is not None and
+            len(issue_ids) >= PARALLEL_FETCH_MIN_ISSUES)
+
+  # Note: sharding is used to here to allow us to load issues from the replicas
+  # without placing load on the master.  Writes are not sharded.
+  # pylint: disable=arguments-differ
+  def FetchItems(self, cnxn, issue_ids, shard_id=None):
+    """Retrieve and deserialize issues.
+
+    When loading many issues from a replica, the sharded sub-queries are
+    spread over the connections for consecutive shard IDs and run in
+    parallel, while the unsharded tables are read from the master.  Each
+    thread uses its own MonorailConnection because a connection can only run
+    one query at a time, and Execute() may redirect a query to the
+    connection for another shard.  Those connections are closed before
+    returning, even if a sub-query fails.
+    """
+    if self._ShouldFetchInParallel(issue_ids, shard_id):
+      num_shards = settings.num_logical_shards
+      thread_cnxns = [sql.MonorailConnection() for _ in range(3)]
+      promises = []
+      try:
+        issue_promise = framework_helpers.Promise(
+            self._FetchIssueAndSummaryRows, thread_cnxns[0],
+            issue_ids, shard_id)
+        promises.append(issue_promise)
+        label_promise = framework_helpers.Promise(
+            self._FetchLabelAndComponentRows, thread_cnxns[1],
+            issue_ids, (shard_id + 1) % num_shards)
+        promises.append(label_promise)
+        people_promise = framework_helpers.Promise(
+            self._FetchPeopleAndFieldValueRows, thread_cnxns[2],
+            issue_ids, (shard_id + 2) % num_shards)
+        promises.append(people_promise)
+        master_rows = self._FetchApprovalAndRelationRows(cnxn, issue_ids)
+        issue_rows, summary_rows = issue_promise.WaitAndGetValue()
+        label_rows, component_rows = label_promise.WaitAndGetValue()
+        cc_rows, notify_rows, fieldvalue_rows = (
+            people_promise.WaitAndGetValue())
+      finally:
+        # Let every thread finish with its connection before returning the
+        # underlying DB connections to the pool.
+        for promise in promises:
+          promise.event.wait()
+        for thread_cnxn in thread_cnxns:
+          thread_cnxn.Close()
+    else:
+      issue_rows, summary_rows = self._FetchIssueAndSummaryRows(
+          cnxn, issue_ids, shard_id)
+      label_rows, component_rows = self._FetchLabelAndComponentRows(
+          cnxn, issue_ids, shard_id)
+      cc_rows, notify_rows, fieldvalue_rows = (
+          self._FetchPeopleAndFieldValueRows(cnxn, issue_ids, shard_id))
+      master_rows = self._FetchApprovalAndRelationRows(cnxn, issue_ids)
+
+    (approvalvalue_rows, phase_rows, av_approver_rows, relation_rows,
+     dangling_relation_rows) = master_rows
     issue_dict = self._DeserializeIssues(
         cnxn, issue_rows, summary_rows, label_rows, component_rows, cc_rows,
         notify_rows, fieldvalue_rows, relation_rows, dangling_relation_rows,
@@ -552,6 +634,8 @@ class IssueService(object):
     # Like a dictionary {comment_id: comment)
     self.comment_2lc = CommentTwoLevelCache(
         cache_manager, self)
+    # Like a dictionary {issue_id: [comment_id, ...]} in sequence order.
+    self.comment_ids_cache = caches.RamCache(cache_manager, 'issue')
 
     self._config_service = config_service
     self.chart_service = chart_service
@@ -1031,23 +1115,7 @@ class IssueService(object):
     Returns:
       The int issue_id of the newly created issue.
     """
-    status_id = self._config_service.LookupStatusID(
-        cnxn, issue.project_id, issue.status)
-    row = (issue.project_id, issue.local_id, status_id,
-           issue.owner_id or None,
-           issue.reporter_id,
-           issue.opened_timestamp,
-           issue.closed_timestamp,
-           issue.modified_timestamp,
-           issue.owner_modified_timestamp,
-           issue.status_modified_timestamp,
-           issue.component_modified_timestamp,
-           issue.derived_owner_id or None,
-           self._config_service.LookupStatusID(
-               cnxn, issue.project_id, issue.derived_status),
-           bool(issue.deleted),
-           issue.star_count, issue.attachment_count,
-           issue.is_spam)
+    row = self._MakeIssueRow(cnxn, issue)
     # ISSUE_COLs[1:] to skip setting the ID
     # Insert into the Master DB.
     generated_ids = self.issue_tbl.InsertRows(
@@ -1068,10 +1136,89 @@ class IssueService(object):
     self._UpdateIssuesApprovals(cnxn, issue, commit=False)
     self.chart_service.StoreIssueSnapshots(cnxn, [issue], commit=False)
     cnxn.Commit()
-    self._config_service.InvalidateMemcache([issue])
+    self._config_service.InvalidateMemcache([issue], cnxn=cnxn)
 
     return issue_id
 
+  def InsertIssues(self, cnxn, issues, commit=True, invalidate=True):
+    """Store many new issues in SQL using multi-row inserts.
+
+    Args:
+      cnxn: connection to SQL database.
+      issues: list of Issue PBs that already have unused local IDs.
+      commit: set to False to skip the DB commit and do it in the caller.
+      invalidate: set to False to leave cache invalidatation to the caller.
+
+    Returns:
+      A list of the int issue_ids of the new issues, in the same order.
+    """
+    if not issues:
+      return []
+
+    # ISSUE_COLs[1:] to skip setting the ID
+    self.issue_tbl.InsertRows(
+        cnxn, ISSUE_COLS[1:],
+        [self._MakeIssueRow(cnxn, issue) for issue in issues], commit=False)
+
+    # A multi-row insert does not return the generated IDs, so look them up.
+    local_ids_by_project = collections.defaultdict(list)
+    for issue in issues:
+      local_ids_by_project[issue.project_id].append(issue.local_id)
+    issue_ids_by_key = {}
+    for project_id, local_ids in local_ids_by_project.items():
+      rows = self.issue_tbl.Select(
+          cnxn, cols=['id', 'local_id'], project_id=project_id,
+          local_id=local_ids)
+      issue_ids_by_key.update(
+          ((project_id, local_id), issue_id) for issue_id, local_id in rows)
+
+    issue_ids_by_shard = collections.defaultdict(list)
+    for issue in issues:
+      issue.issue_id = issue_ids_by_key[issue.project_id, issue.local_id]
+      issue_ids_by_shard[issue.issue_id % settings.num_logical_shards].append(
+          issue.issue_id)
+    for shard, shard_issue_ids in issue_ids_by_shard.items():
+      self.issue_tbl.Update(
+          cnxn, {'shard': shard}, id=shard_issue_ids, commit=False)
+
+    self._UpdateIssuesSummary(cnxn, issues, commit=False)
+    self._UpdateIssuesLabels(cnxn, issues, commit=False)
+    self._UpdateIssuesFields(cnxn, issues, commit=False)
+    self._UpdateIssuesComponents(cnxn, issues, commit=False)
+    self._UpdateIssuesCc(cnxn, issues, commit=False)
+    self._UpdateIssuesNotify(cnxn, issues, commit=False)
+    self._UpdateIssuesRelation(cnxn, issues, commit=False)
+    for issue in issues:
+      if issue.approval_values:
+        self._UpdateIssuesApprovals(cnxn, issue, commit=False)
+    self.chart_service.StoreIssueSnapshots(cnxn, issues, commit=False)
+    if commit:
+      cnxn.Commit()
+    if invalidate:
+      self._config_service.InvalidateMemcache(issues, cnxn=cnxn)
+
+    return [issue.issue_id for issue in issues]
+
+  def _MakeIssueRow(self, cnxn, issue):
+    """Return the values of ISSUE_COLS[1:] for a new issue."""
+    status_id = self._config_service.LookupStatusID(
+        cnxn, issue.project_id, issue.status)
+    return (issue.project_id, issue.local_id, status_id,
+            issue.owner_id or None,
+            issue.reporter_id,
+            issue.opened_timestamp,
+            issue.closed_timestamp,
+            issue.modified_timestamp,
+            issue.owner_modified_timestamp,
+            issue.status_modified_timestamp,
+            issue.component_modified_timestamp,
+            issue.derived_owner_id or None,
+            self._config_service.LookupStatusID(
+                cnxn, issue.project_id, issue.derived_status),
+            bool(issue.deleted),
+            issue.star_count, issue.attachment_count,
+            issue.is_spam)
+
   def UpdateIssues(
       self, cnxn, issues, update_cols=None, just_derived=False, commit=True,
       invalidate=True):
@@ -1137,7 +1284,7 @@ class IssueService(object):
     if commit:
       cnxn.Commit()
     if invalidate:
-      self._config_service.InvalidateMemcache(issues)
+      self._config_service.InvalidateMemcache(issues, cnxn=cnxn)
 
   def UpdateIssue(
       self, cnxn, issue, update_cols=None, just_derived=False, commit=True,
@@ -1515,14 +1662,17 @@ class IssueService(object):
     # can test for closed_timestamp, and also after filter rules
     # so that closed_timestamp will be set if the issue is closed by the rule.
     _UpdateClosedTimestamp(config, issue, old_effective_status)
+    rule_index = None
     if rules is None:
       logging.info('Rules were not given')
       rules = services.features.GetFilterRules(cnxn, config.project_id)
-      predicate_asts = filterrules_helpers.ParsePredicateASTs(
-          rules, config, [])
+      rule_index = filterrules_helpers.GetRuleIndex(
+          config.project_id, rules, config)
+      predicate_asts = rule_index.predicate_asts
 
     filterrules_helpers.ApplyGivenRules(
-        cnxn, services, issue, config, rules, predicate_asts)
+        cnxn, services, issue, config, rules, predicate_asts,
+        rule_index=rule_index)
     _UpdateClosedTimestamp(config, issue, old_effective_status)
     if old_effective_owner != tracker_bizobj.GetOwnerId(issue):
       issue.owner_modified_timestamp = timestamp
@@ -1775,6 +1925,7 @@ class IssueService(object):
       self.issueformerlocations_tbl.Delete(cnxn, issue_id=iids_in_chunk)
       self.reindexqueue_tbl.Delete(cnxn, issue_id=iids_in_chunk)
       self.issue_tbl.Delete(cnxn, id=iids_in_chunk)
+      self.comment_ids_cache.InvalidateKeys(cnxn, iids_in_chunk)
 
   def SoftDeleteIssue(self, cnxn, project_id, local_id, deleted, user_service):
     """Set the deleted boolean on the indicated issue and store it.
@@ -2069,6 +2220,55 @@ class IssueService(object):
 
     return comments
 
+  def GetCommentIDsForIssue(self, cnxn, issue_id, use_cache=True):
+    """Return the IDs of all comments on an issue, in sequence order.
+
+    The sequence number of each comment is its index in the returned list.
+    This is much smaller than the comments themselves, so it is cached and
+    used to find the comments in a range of sequence numbers.
+
+    The IDs are read from the primary DB rather than a replica, because
+    the cached list is kept until a comment on the issue changes, and a
+    lagging replica could leave a new comment out of it.
+    """
+    if use_cache and self.comment_ids_cache.HasItem(issue_id):
+      return self.comment_ids_cache.GetItem(issue_id)
+
+    rows = self.comment_tbl.Select(
+        cnxn, cols=['id'], issue_id=[issue_id],
+        order_by=[('created', []), ('id', [])])
+    comment_ids = [row[0] for row in rows]
+    self.comment_ids_cache.CacheItem(issue_id, comment_ids)
+    return comment_ids
+
+  def GetCommentsForIssuePage(self, cnxn, issue_id, start, max_items):
+    """Return one page of IssueComment PBs for the specified issue.
+
+    Only the comments in the page, and their amendments and attachments,
+    are loaded.
+
+    Args:
+      cnxn: connection to SQL database.
+      issue_id: int global ID of the issue.
+      start: int sequence number of the first comment to return.
+      max_items: int maximum number of comments to return.
+
+    Returns:
+      A pair (comments, total_count) with the IssueComment PBs that have
+      sequence numbers start, start+1, ..., and the total number of comments
+      on the issue.
+    """
+    comment_ids = self.GetCommentIDsForIssue(cnxn, issue_id)
+    page_ids = comment_ids[start:start + max_items]
+    comments = []
+    if page_ids:
+      comments = self.GetComments(cnxn, id=page_ids)
+    sequences = {
+        comment_id: start + i for i, comment_id in enumerate(page_ids)}
+    for comment in comments:
+      comment.sequence = sequences[comment.id]
+    comments.sort(key=lambda c: c.sequence)
+    return comments, len(comment_ids)
 
   def GetCommentsByID(self, cnxn, comment_ids, sequences, use_cache=True,
       shard_id=None):
@@ -2148,42 +2348,101 @@ class IssueService(object):
       self.commentimporter_tbl.InsertRow(
           cnxn, comment_id=comment_id, importer_id=comment.importer_id)
 
+    # ISSUEUPDATE_COLS[1:] to skip id column.
+    self.issueupdate_tbl.InsertRows(
+        cnxn, ISSUEUPDATE_COLS[1:], self._MakeAmendmentRows(comment),
+        commit=False)
+
+    self.attachment_tbl.InsertRows(
+        cnxn, ATTACHMENT_COLS[1:], self._MakeAttachmentRows(comment),
+        commit=False)
+
+    if comment.approval_id:
+      self.issueapproval2comment_tbl.InsertRows(
+          cnxn, ISSUEAPPROVAL2COMMENT_COLS,
+          [(comment.approval_id, comment_id)], commit=False)
+    self.comment_ids_cache.Invalidate(cnxn, comment.issue_id)
+
+    if commit:
+      cnxn.Commit()
+
+  def InsertComments(self, cnxn, comments, commit=True):
+    """Store many new issue comments in SQL.
+
+    Each comment and its content still need their own INSERT to get their
+    generated IDs, but the rows of amendments, attachments, importers and
+    approvals for all the comments are each stored in one statement.
+
+    Args:
+      cnxn: connection to SQL database.
+      comments: list of IssueComment PBs to insert into the database.
+      commit: set to False to avoid doing the commit for now.
+    """
+    importer_rows = []
+    amendment_rows = []
+    attachment_rows = []
+    approval_rows = []
+    for comment in comments:
+      commentcontent_id = self.commentcontent_tbl.InsertRow(
+          cnxn, content=comment.content,
+          inbound_message=comment.inbound_message, commit=False)
+      comment.id = self.comment_tbl.InsertRow(
+          cnxn, issue_id=comment.issue_id, created=comment.timestamp,
+          project_id=comment.project_id,
+          commenter_id=comment.user_id,
+          deleted_by=comment.deleted_by or None,
+          is_spam=comment.is_spam, is_description=comment.is_description,
+          commentcontent_id=commentcontent_id,
+          commit=False)
+      if comment.importer_id:
+        importer_rows.append((comment.id, comment.importer_id))
+      amendment_rows.extend(self._MakeAmendmentRows(comment))
+      attachment_rows.extend(self._MakeAttachmentRows(comment))
+      if comment.approval_id:
+        approval_rows.append((comment.approval_id, comment.id))
+
+    self.commentimporter_tbl.InsertRows(
+        cnxn, COMMENTIMPORTER_COLS, importer_rows, commit=False)
+    # ISSUEUPDATE_COLS[1:] to skip id column.
+    self.issueupdate_tbl.InsertRows(
+        cnxn, ISSUEUPDATE_COLS[1:], amendment_rows, commit=False)
+    self.attachment_tbl.InsertRows(
+        cnxn, ATTACHMENT_COLS[1:], attachment_rows, commit=False)
+    self.issueapproval2comment_tbl.InsertRows(
+        cnxn, ISSUEAPPROVAL2COMMENT_COLS, approval_rows, commit=False)
+    self.comment_ids_cache.InvalidateKeys(
+        cnxn, list({comment.issue_id for comment in comments}))
+
+    if commit:
+      cnxn.Commit()
+
+  def _MakeAmendmentRows(self, comment):
+    """Return IssueUpdate rows for the amendments of a stored comment."""
     amendment_rows = []
     for amendment in comment.amendments:
       field_enum = str(amendment.field).lower()
       if (amendment.get_assigned_value('newvalue') is not None and
           not amendment.added_user_ids and not amendment.removed_user_ids):
         amendment_rows.append((
-            comment.issue_id, comment_id, field_enum,
+            comment.issue_id, comment.id, field_enum,
             amendment.oldvalue, amendment.newvalue,
             None, None, amendment.custom_field_name))
       for added_user_id in amendment.added_user_ids:
         amendment_rows.append((
-            comment.issue_id, comment_id, field_enum, None, None,
+            comment.issue_id, comment.id, field_enum, None, None,
             added_user_id, None, amendment.custom_field_name))
       for removed_user_id in amendment.removed_user_ids:
         amendment_rows.append((
-            comment.issue_id, comment_id, field_enum, None, None,
+            comment.issue_id, comment.id, field_enum, None, None,
             None, removed_user_id, amendment.custom_field_name))
-    # ISSUEUPDATE_COLS[1:] to skip id column.
-    self.issueupdate_tbl.InsertRows(
-        cnxn, ISSUEUPDATE_COLS[1:], amendment_rows, commit=False)
-
-    attachment_rows = []
-    for attach in comment.attachments:
-      attachment_rows.append([
-          comment.issue_id, comment.id, attach.filename, attach.filesize,
-          attach.mimetype, attach.deleted, attach.gcs_object_id])
-    self.attachment_tbl.InsertRows(
-        cnxn, ATTACHMENT_COLS[1:], attachment_rows, commit=False)
-
-    if comment.approval_id:
-      self.issueapproval2comment_tbl.InsertRows(
-          cnxn, ISSUEAPPROVAL2COMMENT_COLS,
-          [(comment.approval_id, comment_id)], commit=False)
+    return amendment_rows
 
-    if commit:
-      cnxn.Commit()
+  def _MakeAttachmentRows(self, comment):
+    """Return Attachment rows for the attachments of a stored comment."""
+    return [
+        [comment.issue_id, comment.id, attach.filename, attach.filesize,
+         attach.mimetype, attach.deleted, attach.gcs_object_id]
+        for attach in comment.attachments]
 
   def _UpdateComment(self, cnxn, comment, update_cols=None):
     """Update the given issue comment in SQL.
@@ -2651,6 +2910,21 @@ class IssueService(object):
 
     return [row[0] for row in rows]
 
+  def GetIIDLabelIDPairs(self, cnxn, label_ids, project_id, shard_id):
+    """Return (issue_id, label_id) pairs for issues with the given labels.
+
+    This reads from the master DB so that the result includes any recent
+    changes.
+    """
+    rows = self.issue_tbl.Select(
+        cnxn, cols=['id', 'Issue2Label.label_id'],
+        joins=[('Issue2Label ON Issue.id = Issue2Label.issue_id', [])],
+        where=[('shard = %s', [shard_id]),
+               ('Issue2Label.label_id IN (%s)' % sql.PlaceHolders(label_ids),
+                label_ids)],
+        project_id=project_id)
+    return [(iid, label_id) for iid, label_id in rows]
+
   def GetIIDsByParticipant(self, cnxn, user_ids, project_ids, shard_id):
     """Return IIDs for issues where any of the given users participate."""
     iids = []
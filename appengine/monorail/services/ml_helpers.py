@@ -13,6 +13,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import absolute_import
 
+import collections
 import csv
 import hashlib
 import httplib2
@@ -31,6 +32,7 @@ from oauth2client.client import Error as Oauth2ClientError
 SPAM_COLUMNS = ['verdict', 'subject', 'content', 'email']
 LEGACY_CSV_COLUMNS = ['verdict', 'subject', 'content']
 DELIMITERS = ['\s', '\,', '\.', '\?', '!', '\:', '\(', '\)']
+DELIMITERS_RE = re.compile('|'.join(DELIMITERS))
 
 # Must be identical to settings.spam_feature_hashes.
 SPAM_FEATURE_HASHES = 500
@@ -78,6 +80,69 @@ def _SpamHashFeatures(content, num_features):
   return features
 
 
+class SparseFeatures(collections.namedtuple(
+    'SparseFeatures', 'indptr, indices, data, num_features')):
+  """Feature vectors of many documents, in compressed sparse row format.
+
+  The nonzero features of document i are at indices[indptr[i]:indptr[i+1]]
+  with values data[indptr[i]:indptr[i+1]], in ascending order of index.
+  """
+
+  def __len__(self):
+    return len(self.indptr) - 1
+
+  def GetRow(self, row):
+    """Return the dense list of feature values for one document."""
+    features = [0.0] * self.num_features
+    for pos in range(self.indptr[row], self.indptr[row + 1]):
+      features[self.indices[pos]] = self.data[pos]
+    return features
+
+
+def _EncodeContent(content):
+  return [value.encode('utf-8') if isinstance(value, text_type) else value
+          for value in content]
+
+
+def GenerateSpamFeaturesBatch(contents, num_features):
+  """Generate the spam word hash features of many documents at once.
+
+  The features of each document are the same as the 'word_hashes' that
+  GenerateFeaturesRaw() makes for it, but each distinct word is hashed
+  only once for the whole batch.
+
+  Args:
+    contents: list of documents, each a list of strings such as the
+        summary and description of an issue.
+    num_features: The number of features to generate.
+
+  Returns:
+    A SparseFeatures with one row per document.
+  """
+  indptr = [0]
+  indices = []
+  data = []
+  word_indexes = {}
+  for content in contents:
+    counts = collections.defaultdict(int)
+    total = 0
+    for blob in _EncodeContent(content):
+      for word in DELIMITERS_RE.split(blob):
+        feature_index = word_indexes.get(word)
+        if feature_index is None:
+          feature_index = int(int(hashlib.sha1(word).hexdigest(), 16)
+                              % num_features)
+          word_indexes[word] = feature_index
+        counts[feature_index] += 1
+        total += 1
+    for feature_index in sorted(counts):
+      indices.append(feature_index)
+      data.append(counts[feature_index] / total)
+    indptr.append(len(indices))
+
+  return SparseFeatures(indptr, indices, data, num_features)
+
+
 def GenerateFeaturesRaw(content, num_features, top_words=None):
   """Generates a vector of features for a given issue or comment.
 
@@ -99,7 +164,7 @@ def GenerateFeaturesRaw(content, num_features, top_words=None):
 
 
 def transform_spam_csv_to_features(csv_training_data):
-  X = []
+  contents = []
   y = []
 
   # Handle if the list is double-wrapped.
@@ -111,9 +176,11 @@ def transform_spam_csv_to_features(csv_training_data):
       verdict, subject, content, _email = row
     else:
       verdict, subject, content = row
-    X.append(GenerateFeaturesRaw([str(subject), str(content)],
-                                 SPAM_FEATURE_HASHES))
+    contents.append([str(subject), str(content)])
     y.append(1 if verdict == 'spam' else 0)
+
+  features = GenerateSpamFeaturesBatch(contents, SPAM_FEATURE_HASHES)
+  X = [{'word_hashes': features.GetRow(row)} for row in range(len(features))]
   return X, y
 
 
@@ -60,7 +60,8 @@ def set_up_services():
   if svcs is None:
     # Sorted as: cache_manager first, everything which depends on it,
     # issue (which depends on project and config), things with no deps.
-    cache_manager = cachemanager_svc.CacheManager()
+    cache_manager = cachemanager_svc.CacheManager(
+        transport=cachemanager_svc.MakeInvalidationTransport())
     config = config_svc.ConfigService(cache_manager)
     features = features_svc.FeaturesService(cache_manager, config)
     hotlist_star = star_svc.HotlistStarService(cache_manager)
@@ -32,6 +32,10 @@ REASON_CLASSIFIER = 'classifier'
 REASON_FAIL_OPEN = 'fail_open'
 SPAM_CLASS_LABEL = '1'
 
+# Maximum number of instances that ClassifyBatch sends to ML Engine in
+# one prediction request.
+MAX_PREDICT_BATCH_SIZE = 100
+
 SPAMREPORT_ISSUE_COLS = ['issue_id', 'reported_user_id', 'user_id']
 SPAMVERDICT_ISSUE_COL = ['created', 'content_created', 'user_id',
                          'reported_user_id', 'comment_id', 'issue_id']
@@ -311,9 +315,20 @@ class SpamService(object):
       A floating point number representing the confidence
       the instance is spam.
     """
+    return self._predict_batch([instance['word_hashes']])[0]
+
+  def _predict_batch(self, inputs):
+    """Requests predictions for many instances in one ML Engine API call.
+
+    Args:
+      inputs: list of dense feature vectors.
+
+    Returns:
+      A list with the confidence that each instance is spam.
+    """
     model_name = 'projects/%s/models/%s' % (
       settings.classifier_project_id, settings.spam_model_name)
-    body = {'instances': [{"inputs": instance["word_hashes"]}]}
+    body = {'instances': [{'inputs': features} for features in inputs]}
 
     if not self.ml_engine:
       self.ml_engine = ml_helpers.setup_ml_engine()
@@ -321,8 +336,11 @@ class SpamService(object):
     request = self.ml_engine.projects().predict(name=model_name, body=body)
     response = request.execute()
     logging.info('ML Engine API response: %r' % response)
-    prediction = response['predictions'][0]
+    return [self._SpamConfidence(prediction)
+            for prediction in response['predictions']]
 
+  def _SpamConfidence(self, prediction):
+    """Return the spam score of one prediction from the ML Engine API."""
     # Ensure the class confidence we return is for the spam, not the ham label.
     # The spam label, '1', is usually at index 1 but I'm not sure of any
     # guarantees around label order.
@@ -410,6 +428,60 @@ class SpamService(object):
       result['failed_open'] = True
     return result
 
+  def ClassifyBatch(self, items):
+    """Classify many issues or comments, using few ML Engine requests.
+
+    Args:
+      items: list of (content, author, is_project_member) tuples.  For an
+          issue, content is [summary, first comment content].  For a
+          comment, it is ['', comment content].
+
+    Returns:
+      A list of JSON dicts of classifier prediction results, one for each
+      item, in the same format as ClassifyIssue() returns.
+    """
+    results = [self.ham_classification() for _ in items]
+    to_predict = [
+        i for i, (_content, author, is_project_member) in enumerate(items)
+        if not self._IsExempt(author, is_project_member)]
+    if not to_predict:
+      return results
+
+    if not self.ml_engine:
+      self.ml_engine = ml_helpers.setup_ml_engine()
+
+    if not self.ml_engine:
+      logging.error("ML Engine not initialized.")
+      self.ml_engine_failures.increment()
+      for i in to_predict:
+        results[i]['failed_open'] = True
+      return results
+
+    features = ml_helpers.GenerateSpamFeaturesBatch(
+        [items[i][0] for i in to_predict], settings.spam_feature_hashes)
+    for start in range(0, len(to_predict), MAX_PREDICT_BATCH_SIZE):
+      rows = list(range(
+          start, min(start + MAX_PREDICT_BATCH_SIZE, len(to_predict))))
+      remaining_retries = 3
+      confidences = None
+      while remaining_retries > 0 and confidences is None:
+        try:
+          confidences = self._predict_batch(
+              [features.GetRow(row) for row in rows])
+        except Exception as ex:
+          remaining_retries = remaining_retries - 1
+          self.ml_engine_failures.increment()
+          logging.error('Error calling ML Engine API: %s' % ex)
+
+      for pos, row in enumerate(rows):
+        result = results[to_predict[row]]
+        if confidences is None:
+          result['failed_open'] = True
+        else:
+          result['confidence_is_spam'] = confidences[pos]
+
+    return results
+
   def ham_classification(self):
     return {'confidence_is_spam': 0.0,
             'failed_open': False}
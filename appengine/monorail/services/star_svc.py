@@ -13,8 +13,11 @@ from __future__ import absolute_import
 
 import logging
 
+from google.appengine.api import memcache
+
 import settings
 from features import filterrules_helpers
+from framework import framework_constants
 from framework import sql
 from services import caches
 
@@ -24,9 +27,15 @@ PROJECTSTAR_TABLE_NAME = 'ProjectStar'
 ISSUESTAR_TABLE_NAME = 'IssueStar'
 HOTLISTSTAR_TABLE_NAME = 'HotlistStar'
 
-# TODO(jrobbins): Consider adding memcache here if performance testing shows
-# that stars are a bottleneck.  Keep in mind that issue star counts are
-# already denormalized and stored in the Issue, which is cached in memcache.
+# Star counts are also kept in memcache so that every instance need not
+# count rows in SQL after each change.  The counts are deleted whenever
+# stars are set, unset, or expunged, and they expire so that any drift
+# does not last long.
+STAR_COUNT_EXPIRATION = framework_constants.SECS_PER_DAY
+# After a count is deleted, memcache refuses to add it again for this long
+# so that a reader who counted rows before the write committed cannot
+# store its stale count.
+STAR_COUNT_DELETE_LOCK_SECS = 10
 
 
 class AbstractStarService(object):
@@ -53,18 +62,34 @@ class AbstractStarService(object):
     self.starrer_cache = caches.RamCache(cache_manager, cache_kind)
     # Counts of the users that starred an item, keyed by item ID.
     self.star_count_cache = caches.RamCache(cache_manager, cache_kind)
+    self.star_count_key_prefix = 'star_count:%s:' % cache_kind
 
   def ExpungeStars(self, cnxn, item_id, commit=True, limit=None):
     """Wipes an item's stars from the system."""
     self.tbl.Delete(
         cnxn, commit=commit, limit=limit, **{self.item_col: item_id})
+    self._DeleteMemcacheCounts([item_id])
 
   def ExpungeStarsByUsers(self, cnxn, user_ids, limit=None):
     """Wipes a user's stars from the system.
     This method will not commit the operation. This method will
-    not make changes to in-memory data.
+    not make changes to in-memory data, but it does drop the memcache
+    star counts of the items that the users had starred.
     """
+    rows = self.tbl.Select(
+        cnxn, cols=[self.item_col], distinct=True, user_id=user_ids)
     self.tbl.Delete(cnxn, user_id=user_ids, commit=False, limit=limit)
+    self._DeleteMemcacheCounts([row[0] for row in rows])
+
+  def _DeleteMemcacheCounts(self, item_ids):
+    """Drop the memcache star counts of the given items."""
+    if not item_ids:
+      return
+    memcache.delete_multi(
+        [str(item_id) for item_id in item_ids],
+        seconds=STAR_COUNT_DELETE_LOCK_SECS,
+        key_prefix=self.star_count_key_prefix,
+        namespace=settings.memcache_namespace)
 
   def LookupItemStarrers(self, cnxn, item_id):
     """Returns list of users having stars on the specified item."""
@@ -108,6 +133,24 @@ class AbstractStarService(object):
     starred_ids = self.LookupStarredItemIDs(cnxn, starrer_user_id)
     return item_id in starred_ids
 
+  def LookupStarredItemIDsAmong(self, cnxn, starrer_user_id, item_ids):
+    """Return the set of the given item IDs that the user has starred.
+
+    Unlike LookupStarredItemIDs(), this does not load every star of the user
+    when they are not already cached, it asks about just the given items.
+    """
+    if not starrer_user_id or not item_ids:
+      return set()
+
+    cached_item_ids = self.star_cache.GetItem(starrer_user_id)
+    if cached_item_ids is not None:
+      return set(cached_item_ids).intersection(item_ids)
+
+    rows = self.tbl.Select(
+        cnxn, cols=[self.item_col],
+        **{self.user_col: starrer_user_id, self.item_col: list(item_ids)})
+    return {row[0] for row in rows}
+
   def CountItemStars(self, cnxn, item_id):
     """Returns the number of stars on the specified item."""
     count_dict = self.CountItemsStars(cnxn, [item_id])
@@ -117,6 +160,19 @@ class AbstractStarService(object):
     """Get a dict {item_id: count} for the given items."""
     item_count_dict, missed_ids = self.star_count_cache.GetAll(item_ids)
 
+    if missed_ids:
+      memcache_counts = memcache.get_multi(
+          [str(item_id) for item_id in missed_ids],
+          key_prefix=self.star_count_key_prefix,
+          namespace=settings.memcache_namespace)
+      found_counts = {
+          item_id: memcache_counts[str(item_id)] for item_id in missed_ids
+          if str(item_id) in memcache_counts}
+      item_count_dict.update(found_counts)
+      self.star_count_cache.CacheAll(found_counts)
+      missed_ids = [
+          item_id for item_id in missed_ids if item_id not in found_counts]
+
     if missed_ids:
       rows = self.tbl.Select(
           cnxn, cols=[self.item_col, 'COUNT(%s)' % self.user_col],
@@ -128,6 +184,12 @@ class AbstractStarService(object):
       retrieved_counts.update(rows)
       item_count_dict.update(retrieved_counts)
       self.star_count_cache.CacheAll(retrieved_counts)
+      # Use add rather than set so that a count that a writer just deleted
+      # is not stored again while its delete lock lasts.
+      memcache.add_multi(
+          {str(item_id): count for item_id, count in retrieved_counts.items()},
+          key_prefix=self.star_count_key_prefix, time=STAR_COUNT_EXPIRATION,
+          namespace=settings.memcache_namespace)
 
     return item_count_dict
 
@@ -141,6 +203,9 @@ class AbstractStarService(object):
       self.tbl.Delete(
           cnxn, **{self.item_col: item_id, self.user_col: starrer_user_ids})
 
+    # Drop the memcache count rather than adjusting it in place, so that
+    # the next reader counts the committed rows.
+    self._DeleteMemcacheCounts([item_id])
     self.star_cache.InvalidateKeys(cnxn, starrer_user_ids)
     self.starrer_cache.Invalidate(cnxn, item_id)
     self.star_count_cache.Invalidate(cnxn, item_id)
@@ -149,6 +214,22 @@ class AbstractStarService(object):
     """Sets or unsets stars for the specified item and users."""
     self._SetStarsBatch(cnxn, item_id, starrer_user_ids, starred)
 
+  def InsertStarsForNewItems(
+      self, cnxn, starrer_user_ids_by_item_id, commit=True):
+    """Store the stars of many items that were just created.
+
+    The items are not in any cache yet, so only the starrers' caches of
+    starred items are invalidated.
+    """
+    rows = [
+        (item_id, user_id)
+        for item_id, user_ids in sorted(starrer_user_ids_by_item_id.items())
+        for user_id in user_ids]
+    self.tbl.InsertRows(
+        cnxn, [self.item_col, self.user_col], rows, ignore=True,
+        commit=commit)
+    self.star_cache.InvalidateKeys(cnxn, list({row[1] for row in rows}))
+
   def SetStar(self, cnxn, item_id, starrer_user_id, starred):
     """Sets or unsets a star for the specified item and user."""
     self._SetStarsBatch(cnxn, item_id, [starrer_user_id], starred)
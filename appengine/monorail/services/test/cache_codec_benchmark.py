@@ -0,0 +1,143 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Benchmark for the memcache value formats used by the two-level caches.
+
+Compares encoded protobufs with the compact format of cache_codec for
+the PBs of several two-level caches.  The compact format is only enabled,
+via settings.compact_memcache_prefixes, for the kinds whose values it makes
+smaller.
+
+Usage: python services/test/cache_codec_benchmark.py [num_values]
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import sys
+import time
+
+from protorpc import protobuf
+
+from proto import features_pb2
+from proto import tracker_pb2
+from proto import user_pb2
+from services import cache_codec
+from tracker import tracker_bizobj
+
+
+def MakeIssue(local_id):
+  """Return an Issue PB similar to a typical issue on a large project."""
+  issue = tracker_pb2.Issue(
+      project_name='chromium', project_id=16, local_id=local_id,
+      issue_id=1000000 + local_id, summary='Crash when opening a new tab',
+      status='Assigned', owner_id=111, reporter_id=222,
+      labels=['Type-Bug', 'Pri-2', 'OS-Linux', 'M-80', 'Restrict-View-Google'],
+      component_ids=[10, 20], cc_ids=list(range(300, 320)),
+      blocked_on_iids=[1000000 + local_id + 1], blocked_on_ranks=[0],
+      blocking_iids=[1000000 + local_id - 1], opened_timestamp=1580000000,
+      modified_timestamp=1590000000, owner_modified_timestamp=1585000000,
+      star_count=12, attachment_count=3)
+  for field_id in range(1, 6):
+    issue.field_values.append(tracker_bizobj.MakeFieldValue(
+        field_id, field_id * 7, None, None, None, None, False))
+  issue.approval_values.append(tracker_pb2.ApprovalValue(
+      approval_id=3, status=tracker_pb2.ApprovalStatus.NEEDS_REVIEW,
+      approver_ids=[111, 222], phase_id=1, set_on=1585000000))
+  issue.phases.append(tracker_pb2.Phase(phase_id=1, name='Beta', rank=1))
+  return issue
+
+
+def MakeUser(user_id):
+  """Return a User PB similar to a typical user."""
+  return user_pb2.User(
+      email='user%d@example.com' % user_id, obscure_email=True,
+      last_visit_timestamp=1590000000, email_bounce_timestamp=0,
+      keep_people_perms_open=True, notify_issue_change=True,
+      notify_starred_issue_change=True)
+
+
+def MakeConfig(project_id):
+  """Return a ProjectIssueConfig PB similar to that of a large project."""
+  config = tracker_bizobj.MakeDefaultProjectIssueConfig(project_id)
+  for i in range(40):
+    config.field_defs.append(tracker_bizobj.MakeFieldDef(
+        i, project_id, 'Field%d' % i, tracker_pb2.FieldTypes.STR_TYPE,
+        None, '', False, False, False, None, None, '', False, '', '',
+        tracker_pb2.NotifyTriggers.NEVER, 'no_action', 'Doc for field %d' % i,
+        False))
+  for i in range(100):
+    config.component_defs.append(tracker_bizobj.MakeComponentDef(
+        i, project_id, 'UI>Comp%d' % i, 'Doc for component %d' % i, False,
+        [111], [222], 1580000000, 111))
+  return config
+
+
+def MakeHotlist(hotlist_id):
+  """Return a Hotlist PB with a typical number of issues."""
+  hotlist = features_pb2.Hotlist(
+      hotlist_id=hotlist_id, name='Hotlist-%d' % hotlist_id,
+      summary='Issues to fix for launch', owner_ids=[111])
+  for i in range(50):
+    hotlist.items.append(features_pb2.Hotlist.HotlistItem(
+        issue_id=1000000 + i, rank=i * 10, adder_id=111,
+        date_added=1580000000 + i, note=''))
+  return hotlist
+
+
+def MakeComment(comment_id):
+  """Return an IssueComment PB with a few lines of text."""
+  return tracker_pb2.IssueComment(
+      id=comment_id, issue_id=1000000 + comment_id // 10, project_id=16,
+      user_id=111, timestamp=1590000000 + comment_id, sequence=comment_id % 10,
+      content=('I can reproduce this on Linux with build %d.\n'
+               'Steps: open a new tab, then drag it to a second window.\n'
+               'The renderer crashes in the compositor.' % comment_id))
+
+
+def TimeFormat(encode, decode, pbs, repeat=5):
+  """Return (encode_ms, decode_ms, total_bytes) for encoding pbs."""
+  start = time.time()
+  for _ in range(repeat):
+    encoded = [encode(pb) for pb in pbs]
+  encode_ms = (time.time() - start) * 1000 / repeat
+  start = time.time()
+  for _ in range(repeat):
+    for serialized in encoded:
+      decode(serialized)
+  decode_ms = (time.time() - start) * 1000 / repeat
+  return encode_ms, decode_ms, sum(len(serialized) for serialized in encoded)
+
+
+def Compare(label, pb_class, pbs):
+  codec = cache_codec.CompactPBCodec(pb_class)
+  results = [
+      ('protobuf', TimeFormat(
+          protobuf.encode_message,
+          lambda s: protobuf.decode_message(pb_class, s), pbs)),
+      ('compact', TimeFormat(codec.Encode, codec.Decode, pbs)),
+      ]
+  print('%d %s PBs' % (len(pbs), label))
+  for name, (encode_ms, decode_ms, total_bytes) in results:
+    print('  %-9s encode %7.1f ms  decode %7.1f ms  %8d bytes' % (
+        name + ':', encode_ms, decode_ms, total_bytes))
+
+
+def main(argv):
+  num_values = int(argv[1]) if len(argv) > 1 else 500
+  Compare('Issue', tracker_pb2.Issue,
+          [MakeIssue(i) for i in range(1, num_values + 1)])
+  Compare('User', user_pb2.User,
+          [MakeUser(i) for i in range(1, num_values + 1)])
+  Compare('ProjectIssueConfig', tracker_pb2.ProjectIssueConfig,
+          [MakeConfig(i) for i in range(1, num_values // 10 + 1)])
+  Compare('Hotlist', features_pb2.Hotlist,
+          [MakeHotlist(i) for i in range(1, num_values + 1)])
+  Compare('IssueComment', tracker_pb2.IssueComment,
+          [MakeComment(i) for i in range(1, num_values + 1)])
+
+
+if __name__ == '__main__':
+  main(sys.argv)
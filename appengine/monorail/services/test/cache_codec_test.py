@@ -0,0 +1,92 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Tests for the cache_codec module."""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import unittest
+
+from protorpc import protobuf
+
+from proto import tracker_pb2
+from proto import user_pb2
+from services import cache_codec
+from tracker import tracker_bizobj
+
+
+class CompactPBCodecTest(unittest.TestCase):
+
+  def setUp(self):
+    self.codec = cache_codec.CompactPBCodec(tracker_pb2.Issue)
+    self.issue = tracker_pb2.Issue(
+        project_name='proj', project_id=789, local_id=1, issue_id=78901,
+        summary=u'sum \u2603', status='New', owner_id=111,
+        labels=['Type-Defect', 'Pri-2'], cc_ids=[222, 333],
+        blocked_on_iids=[78902], blocked_on_ranks=[10],
+        opened_timestamp=1234567890, is_spam=True)
+    self.issue.field_values.append(tracker_bizobj.MakeFieldValue(
+        1, 42, None, None, None, None, False))
+    self.issue.approval_values.append(tracker_pb2.ApprovalValue(
+        approval_id=3, status=tracker_pb2.ApprovalStatus.NEEDS_REVIEW,
+        approver_ids=[111], phase_id=1))
+    self.issue.phases.append(tracker_pb2.Phase(
+        phase_id=1, name='Canary', rank=1))
+    self.issue.dangling_blocked_on_refs.append(
+        tracker_pb2.DanglingIssueRef(project='codesite', issue_id=5001))
+
+  def testRoundTrip(self):
+    encoded = self.codec.Encode(self.issue)
+    self.assertTrue(encoded.startswith(cache_codec.FORMAT_MARKER))
+    self.assertEqual(self.issue, self.codec.Decode(encoded))
+
+  def testRoundTrip_EmptyPB(self):
+    user = user_pb2.User()
+    user_codec = cache_codec.CompactPBCodec(user_pb2.User)
+    self.assertEqual(user, user_codec.Decode(user_codec.Encode(user)))
+
+  def testEncode_SkipsUnsetFields(self):
+    small_issue = tracker_pb2.Issue(project_name='proj', local_id=1)
+    self.assertLess(
+        len(self.codec.Encode(small_issue)), len(self.codec.Encode(self.issue)))
+    self.assertEqual(
+        (1, 'proj', 2, 1),
+        self.codec._ToTuple(small_issue))
+
+  def testEncode_CompressesLargeValues(self):
+    encoded = self.codec.Encode(self.issue)
+    self.assertEqual(
+        cache_codec.FLAG_COMPRESSED,
+        ord(encoded[cache_codec.HEADER_LEN - 1:cache_codec.HEADER_LEN]))
+    self.assertEqual(self.issue, self.codec.Decode(encoded))
+
+  def testEncode_NoCompression(self):
+    codec = cache_codec.CompactPBCodec(
+        tracker_pb2.Issue, compression_threshold=None)
+    self.issue.cc_ids = list(range(1000))
+    encoded = codec.Encode(self.issue)
+    self.assertEqual(
+        0, ord(encoded[cache_codec.HEADER_LEN - 1:cache_codec.HEADER_LEN]))
+    self.assertEqual(self.issue, codec.Decode(encoded))
+
+  def testDecode_LegacyProtobuf(self):
+    encoded = protobuf.encode_message(self.issue)
+    self.assertEqual(self.issue, self.codec.Decode(encoded))
+
+  def testDecode_UnknownVersion(self):
+    encoded = self.codec.Encode(self.issue)
+    future = cache_codec.FORMAT_MARKER + b'\x63' + encoded[2:]
+    self.assertIsNone(self.codec.Decode(future))
+
+  def testDecode_IgnoresRemovedFields(self):
+    items = (1, 'proj', 2, 1, 9999, 'gone')
+    issue = self.codec._FromTuple(tracker_pb2.Issue, items)
+    self.assertEqual('proj', issue.project_name)
+    self.assertEqual(1, issue.local_id)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -12,6 +12,9 @@ import unittest
 
 import mox
 
+from google.appengine.api import memcache
+from google.appengine.ext import testbed
+
 from framework import sql
 from services import cachemanager_svc
 from services import caches
@@ -158,6 +161,119 @@ class CacheManagerServiceTest(unittest.TestCase):
     self.mox.VerifyAll()
 
 
+class CacheManagerTransportTest(unittest.TestCase):
+
+  def setUp(self):
+    self.mox = mox.Mox()
+    self.cnxn = fake.MonorailConnection()
+    self.hub = cachemanager_svc.LocalInvalidationHub()
+    self.writer = cachemanager_svc.CacheManager(
+        transport=self.hub.MakeTransport())
+    self.reader = cachemanager_svc.CacheManager(
+        transport=self.hub.MakeTransport())
+    for cache_manager in (self.writer, self.reader):
+      cache_manager.invalidate_tbl = self.mox.CreateMock(sql.SQLTableManager)
+    self.reader_cache = caches.RamCache(self.reader, 'issue')
+    self.reader_cache.CacheAll({33: 'issue 33', 34: 'issue 34'})
+
+  def tearDown(self):
+    self.mox.UnsetStubs()
+    self.mox.ResetAll()
+
+  def testStoreInvalidateRows_PublishesToOtherJobs(self):
+    self.writer.invalidate_tbl.InsertRows(
+        self.cnxn, ['kind', 'cache_key'], [('issue', 34)])
+    self.mox.ReplayAll()
+    self.writer.StoreInvalidateRows(self.cnxn, 'issue', [34])
+    # The reader polled the DB recently, so it does not need to again.
+    self.reader.last_db_poll_time = 1000
+    self.reader.DoDistributedInvalidation(self.cnxn, now=1001)
+    self.mox.VerifyAll()
+    self.assertTrue(self.reader_cache.HasItem(33))
+    self.assertFalse(self.reader_cache.HasItem(34))
+
+  def testStoreInvalidateAll_PublishesToOtherJobs(self):
+    self.writer.invalidate_tbl.InsertRow(
+        self.cnxn, kind='issue', cache_key=cachemanager_svc.INVALIDATE_ALL_KEYS,
+        ).AndReturn(44)
+    self.writer.invalidate_tbl.Delete(
+        self.cnxn, kind='issue', where=[('timestep < %s', [44])])
+    self.mox.ReplayAll()
+    self.writer.StoreInvalidateAll(self.cnxn, 'issue')
+    self.reader.last_db_poll_time = 1000
+    self.reader.DoDistributedInvalidation(self.cnxn, now=1001)
+    self.mox.VerifyAll()
+    self.assertEqual({}, self.reader_cache.cache)
+
+  def testDoDistributedInvalidation_SafetyNetAppliesRows(self):
+    """Polled rows are applied in case a Publish() was lost."""
+    rows = [(i, 'issue', 34) for i in range(
+        1, cachemanager_svc.MAX_INVALIDATE_ROWS_TO_CONSIDER + 1)]
+    self.reader.invalidate_tbl.Select(
+        self.cnxn, cols=['timestep', 'kind', 'cache_key'],
+        where=[('timestep > %s', [0])],
+        order_by=[('timestep DESC', [])],
+        limit=cachemanager_svc.MAX_INVALIDATE_ROWS_TO_CONSIDER
+        ).AndReturn(rows)
+    self.mox.ReplayAll()
+    self.reader.DoDistributedInvalidation(self.cnxn, now=1000)
+    self.mox.VerifyAll()
+    self.assertEqual(1000, self.reader.last_db_poll_time)
+    self.assertEqual(
+        cachemanager_svc.MAX_INVALIDATE_ROWS_TO_CONSIDER,
+        self.reader.processed_invalidations_up_to)
+    # Too many rows did not cause all caches to be dropped.
+    self.assertTrue(self.reader_cache.HasItem(33))
+    self.assertFalse(self.reader_cache.HasItem(34))
+
+
+class MemcacheInvalidationTransportTest(unittest.TestCase):
+
+  def setUp(self):
+    self.testbed = testbed.Testbed()
+    self.testbed.activate()
+    self.testbed.init_memcache_stub()
+    self.publisher = cachemanager_svc.MemcacheInvalidationTransport()
+    self.subscriber = cachemanager_svc.MemcacheInvalidationTransport()
+
+  def tearDown(self):
+    self.testbed.deactivate()
+
+  def testReceive_NothingPublishedYet(self):
+    self.assertEqual(([], False), self.subscriber.Receive())
+
+  def testReceive_FirstCallIsIncomplete(self):
+    self.publisher.Publish([('issue', 1)])
+    self.assertEqual(([], False), self.subscriber.Receive())
+    self.assertEqual(([], True), self.subscriber.Receive())
+
+  def testReceive_NewMessages(self):
+    self.publisher.Publish([('issue', 1)])
+    self.subscriber.Receive()
+    self.publisher.Publish([('issue', 2), ('user', 3)])
+    self.publisher.Publish([('project', 4)])
+    pairs, complete = self.subscriber.Receive()
+    self.assertEqual([('issue', 2), ('user', 3), ('project', 4)], pairs)
+    self.assertTrue(complete)
+
+  def testReceive_MissingMessage(self):
+    self.publisher.Publish([('issue', 1)])
+    self.subscriber.Receive()
+    self.publisher.Publish([('issue', 2)])
+    self.publisher.Publish([('issue', 3)])
+    memcache.delete(cachemanager_svc.INVALIDATE_MSG_KEY % 2)
+    pairs, complete = self.subscriber.Receive()
+    self.assertEqual([('issue', 3)], pairs)
+    self.assertFalse(complete)
+
+  def testReceive_TooFarBehind(self):
+    self.publisher.Publish([('issue', 1)])
+    self.subscriber.Receive()
+    for i in range(cachemanager_svc.MAX_INVALIDATE_MSGS_TO_CONSIDER + 1):
+      self.publisher.Publish([('issue', i)])
+    self.assertEqual(([], False), self.subscriber.Receive())
+
+
 class RamCacheConsolidateTest(unittest.TestCase):
 
   def setUp(self):
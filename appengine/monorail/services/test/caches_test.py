@@ -8,11 +8,16 @@ from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
 
+import mock
 import unittest
 
 from google.appengine.api import memcache
 from google.appengine.ext import testbed
+from protorpc import protobuf
 
+import settings
+from proto import user_pb2
+from services import cache_codec
 from services import caches
 from testing import fake
 
@@ -114,6 +119,91 @@ class RamCacheTest(unittest.TestCase):
                      ('StoreInvalidateAll', self.cnxn, 'issue'))
 
 
+  def testCacheItem_EvictsLeastRecentlyUsed(self):
+    lru_cache = caches.RamCache(
+        self.cache_manager, 'issue', max_size=3, eviction_policy='lru')
+    lru_cache.CacheAll({1: 'a', 2: 'b', 3: 'c'})
+    lru_cache.GetItem(1)
+    lru_cache.CacheItem(4, 'd')
+    self.assertItemsEqual([1, 3, 4], list(lru_cache.cache.keys()))
+    lru_cache.GetAll([3])
+    lru_cache.CacheItem(5, 'e')
+    self.assertItemsEqual([3, 4, 5], list(lru_cache.cache.keys()))
+
+  def testCacheItem_EvictsLeastFrequentlyUsed(self):
+    lfu_cache = caches.RamCache(
+        self.cache_manager, 'issue', max_size=3, eviction_policy='lfu')
+    # Sample every key so that the test is deterministic.
+    lfu_cache.policy.sample_size = 3
+    lfu_cache.CacheAll({1: 'a', 2: 'b', 3: 'c'})
+    for _ in range(3):
+      lfu_cache.GetItem(1)
+      lfu_cache.GetItem(3)
+    lfu_cache.CacheItem(4, 'd')
+    self.assertItemsEqual([1, 3, 4], list(lfu_cache.cache.keys()))
+
+  def testCacheItem_RespectsByteBudget(self):
+    sized_cache = caches.RamCache(
+        self.cache_manager, 'issue', max_size=100, eviction_policy='lru',
+        max_bytes=10, sizer=len)
+    sized_cache.CacheItem(1, 'aaaa')
+    sized_cache.CacheItem(2, 'bbbb')
+    self.assertEqual(8, sized_cache.total_bytes)
+    sized_cache.CacheItem(3, 'cccc')
+    self.assertItemsEqual([2, 3], list(sized_cache.cache.keys()))
+    self.assertEqual(8, sized_cache.total_bytes)
+    sized_cache.LocalInvalidate(2)
+    self.assertEqual(4, sized_cache.total_bytes)
+    sized_cache.LocalInvalidateAll()
+    self.assertEqual(0, sized_cache.total_bytes)
+
+  def testCacheItem_RewriteDoesNotEvict(self):
+    self.ram_cache.CacheAll({1: 'a', 2: 'b', 3: 'c'})
+    self.ram_cache.CacheItem(2, 'bb')
+    self.assertEqual({1: 'a', 2: 'bb', 3: 'c'}, self.ram_cache.cache)
+
+
+class EvictionPolicyTest(unittest.TestCase):
+
+  def testMakeEvictionPolicy(self):
+    self.assertIsInstance(
+        caches.MakeEvictionPolicy('lru'), caches.LRUEvictionPolicy)
+    self.assertIsInstance(
+        caches.MakeEvictionPolicy('lfu'), caches.LFUEvictionPolicy)
+    self.assertIsInstance(
+        caches.MakeEvictionPolicy('random'), caches.RandomEvictionPolicy)
+
+  def testLRUEvictionPolicy(self):
+    policy = caches.LRUEvictionPolicy()
+    for key in [1, 2, 3]:
+      policy.KeyAdded(key)
+    self.assertEqual(1, policy.ChooseVictim())
+    policy.KeyUsed(1)
+    self.assertEqual(2, policy.ChooseVictim())
+    policy.KeyRemoved(2)
+    self.assertEqual(3, policy.ChooseVictim())
+    policy.Clear()
+    self.assertEqual(0, len(policy.recency))
+
+  def testLFUEvictionPolicy_RemoveKeepsIndexConsistent(self):
+    policy = caches.LFUEvictionPolicy(sample_size=10)
+    for key in [1, 2, 3]:
+      policy.KeyAdded(key)
+    policy.KeyRemoved(1)
+    self.assertItemsEqual([2, 3], policy.keys)
+    self.assertEqual(policy.positions[3], policy.keys.index(3))
+    policy.KeyUsed(3)
+    self.assertEqual(2, policy.ChooseVictim())
+
+  def testLFUEvictionPolicy_Decay(self):
+    policy = caches.LFUEvictionPolicy(sample_size=10, decay_period=4)
+    policy.KeyAdded(1)
+    for _ in range(4):
+      policy.KeyUsed(1)
+    self.assertEqual(3, policy.counts[1])
+    self.assertEqual(0, policy.accesses_since_decay)
+
+
 class ShardedRamCacheTest(unittest.TestCase):
 
   def setUp(self):
@@ -252,3 +342,64 @@ class AbstractTwoLevelCacheTest(unittest.TestCase):
     self.testable_cache.InvalidateAllRamEntries(self.cnxn)
     self.assertFalse(self.testable_cache.HasItem(123))
     self.assertFalse(self.testable_cache.HasItem(124))
+
+
+class PBTwoLevelCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.testbed = testbed.Testbed()
+    self.testbed.activate()
+    self.testbed.init_memcache_stub()
+    self.cache_manager = fake.CacheManager()
+    self.user = user_pb2.User(email='a@example.com', is_site_admin=True)
+
+  def tearDown(self):
+    self.testbed.deactivate()
+
+  def MakeTwoLevelCache(self, memcache_prefix='user:'):
+    with mock.patch.object(
+        settings, 'compact_memcache_prefixes', ['user:']):
+      return caches.AbstractTwoLevelCache(
+          self.cache_manager, 'user', memcache_prefix, user_pb2.User)
+
+  def testValueToStr_Compact(self):
+    two_lc = self.MakeTwoLevelCache()
+    serialized = two_lc._ValueToStr(self.user)
+    self.assertTrue(serialized.startswith(cache_codec.FORMAT_MARKER))
+    self.assertEqual(self.user, two_lc._StrToValue(serialized))
+
+  def testStrToValue_LegacyProtobuf(self):
+    two_lc = self.MakeTwoLevelCache()
+    serialized = protobuf.encode_message(self.user)
+    self.assertEqual(self.user, two_lc._StrToValue(serialized))
+
+  def testWriteToMemcache_CompactUsesVersionedKeys(self):
+    """Older app versions never read values in the compact format."""
+    two_lc = self.MakeTwoLevelCache()
+    two_lc._WriteToMemcache({111: self.user})
+    self.assertIsNone(memcache.get('user:111'))
+    self.assertEqual(
+        self.user, two_lc._StrToValue(memcache.get('user:c1:111')))
+
+  def testInvalidateKeys_CompactDropsAllVersions(self):
+    two_lc = self.MakeTwoLevelCache()
+    two_lc._WriteToMemcache({111: self.user})
+    memcache.set('user:111', protobuf.encode_message(self.user))
+    two_lc.InvalidateKeys('cnxn', [111])
+    self.assertIsNone(memcache.get('user:111'))
+    self.assertIsNone(memcache.get('user:c1:111'))
+
+  def testReadFromMemcache_SkipsUndecodableValues(self):
+    two_lc = self.MakeTwoLevelCache()
+    two_lc._WriteToMemcache({111: self.user})
+    memcache.set('user:c1:222', cache_codec.FORMAT_MARKER + b'\x63\x00')
+    found, missed = two_lc._ReadFromMemcache([111, 222])
+    self.assertEqual({111: self.user}, found)
+    self.assertEqual([222], missed)
+
+  def testValueToStr_CompactDisabled(self):
+    two_lc = self.MakeTwoLevelCache(memcache_prefix='other:')
+    self.assertIsNone(two_lc.codec)
+    self.assertEqual('other:', two_lc.memcache_prefix)
+    self.assertEqual(
+        protobuf.encode_message(self.user), two_lc._ValueToStr(self.user))
@@ -9,7 +9,9 @@ from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
 
+import collections
 import datetime
+import mock
 import mox
 import re
 import settings
@@ -33,7 +35,8 @@ from tracker import tracker_bizobj
 def MakeChartService(my_mox, config):
   chart_service = chart_svc.ChartService(config)
   for table_var in ['issuesnapshot_tbl', 'issuesnapshot2label_tbl',
-      'issuesnapshot2component_tbl', 'issuesnapshot2cctbl', 'labeldef_tbl']:
+      'issuesnapshot2component_tbl', 'issuesnapshot2cctbl', 'labeldef_tbl',
+      'issuesnapshotrollup_tbl', 'issuesnapshotrollupstatus_tbl']:
     setattr(chart_service, table_var, my_mox.CreateMock(sql.SQLTableManager))
   return chart_service
 
@@ -711,3 +714,116 @@ class ChartServiceTest(unittest.TestCase):
     self.assertEqual(where, [])
     self.assertEqual(joins, [])
     self.assertEqual(group_by, [])
+
+  def SetUpQueryIssueSnapshotRollup(self, day_end, dimension, rows):
+    self.services.chart.issuesnapshotrollupstatus_tbl.Select(
+        self.cnxn, cols=['rolled_up_since', 'rolled_up_through'],
+        project_id=789).AndReturn([(1514678399, 1514851199)])
+    self.services.chart.issuesnapshotrollup_tbl.SelectValue(
+        self.cnxn, 'MAX(IssueSnapshotRollup.day_end)', project_id=789,
+        where=[('IssueSnapshotRollup.day_end <= %s', [day_end])]
+        ).AndReturn(1514678399)
+    self.services.chart.issuesnapshotrollup_tbl.Select(
+        self.cnxn, cols=['value_id', 'issue_count'], project_id=789,
+        day_end=1514678399, dimension=dimension).AndReturn(rows)
+
+  @mock.patch('settings.chart_snapshot_rollups', True)
+  def testQueryIssueSnapshots_FromRollup(self):
+    """Unrestricted counts at the end of a day come from the rollup."""
+    project = fake.Project(project_id=789)
+    perms = permissions.USER_PERMISSIONSET
+    # The at-risk labels are not used in this project.
+    search_helpers.GetPersonalAtRiskLabelIDs(self.cnxn, None,
+        self.config_service, [10, 20], project,
+        perms).AndReturn([91, 81])
+    self.services.chart._QueryToWhere(mox.IgnoreArg(), mox.IgnoreArg(),
+        mox.IgnoreArg(), mox.IgnoreArg(), mox.IgnoreArg(),
+        mox.IgnoreArg()).AndReturn(([], [], []))
+    self.SetUpQueryIssueSnapshotRollup(1514764799, 'open', [(0, 2), (1, 3)])
+
+    self.mox.ReplayAll()
+    result = self.services.chart.QueryIssueSnapshots(self.cnxn, self.services,
+        unixtime=1514764799, effective_ids=[10, 20], project=project,
+        perms=perms, group_by='open')
+    self.mox.VerifyAll()
+    self.assertEqual(({'Closed': 2, 'Opened': 3}, [], False), result)
+
+  def testQueryIssueSnapshotRollup_Labels(self):
+    """Label IDs are mapped to names with the requested prefix."""
+    self.config_service.TestAddLabelsDict({'Pri-1': 1, 'Pri-2': 2, 'Hot': 3})
+    self.SetUpQueryIssueSnapshotRollup(
+        1514764799, 'label', [(1, 4), (2, 5), (3, 6)])
+
+    self.mox.ReplayAll()
+    counts = self.services.chart._QueryIssueSnapshotRollup(
+        self.cnxn, 789, 1514764799, 'label', 'pri')
+    self.mox.VerifyAll()
+    self.assertEqual({'Pri-1': 4, 'Pri-2': 5}, counts)
+
+  def testQueryIssueSnapshotRollup_NotRolledUp(self):
+    """Times that are not the end of a rolled up day are not served."""
+    self.services.chart.issuesnapshotrollupstatus_tbl.Select(
+        self.cnxn, cols=['rolled_up_since', 'rolled_up_through'],
+        project_id=789).MultipleTimes().AndReturn([(1514678399, 1514764799)])
+
+    self.mox.ReplayAll()
+    for unixtime in [1514764800, 1514851199, 1514591999]:
+      self.assertIsNone(self.services.chart._QueryIssueSnapshotRollup(
+          self.cnxn, 789, unixtime, 'total', None))
+    self.mox.VerifyAll()
+
+  def testRollUpIssueSnapshots(self):
+    """A day's counts are stored when they differ from the day before."""
+    self.mox.StubOutWithMock(self.services.chart, '_CountIssueSnapshots')
+    counts_by_dimension = {
+        'total': {0: 3}, 'open': {1: 3}, 'status': {0: 1, 7: 2},
+        'owner': {111: 3}, 'label': {0: 1, 11: 2}, 'component': {}}
+    for dimension, col, left_joins in chart_svc.ROLLUP_DIMENSIONS:
+      self.services.chart._CountIssueSnapshots(
+          self.cnxn, 789, 1514764799, col, left_joins).AndReturn(
+              collections.Counter(counts_by_dimension[dimension]))
+    tbl = self.services.chart.issuesnapshotrollup_tbl
+    tbl.SelectValue(
+        self.cnxn, 'MAX(IssueSnapshotRollup.day_end)', project_id=789,
+        where=[('IssueSnapshotRollup.day_end < %s', [1514764799])]
+        ).AndReturn(1514678399)
+    tbl.Select(
+        self.cnxn, cols=['dimension', 'value_id', 'issue_count'],
+        project_id=789, day_end=1514678399).AndReturn([('total', 0, 2)])
+    tbl.Delete(self.cnxn, project_id=789, day_end=1514764799, commit=False)
+    tbl.InsertRows(
+        self.cnxn, chart_svc.ISSUESNAPSHOTROLLUP_COLS,
+        [(789, 1514764799, 'total', 0, 3),
+         (789, 1514764799, 'open', 1, 3),
+         (789, 1514764799, 'status', 0, 1),
+         (789, 1514764799, 'status', 7, 2),
+         (789, 1514764799, 'owner', 111, 3),
+         (789, 1514764799, 'label', 11, 2)],
+        commit=False)
+    self.services.chart.issuesnapshotrollupstatus_tbl.Select(
+        self.cnxn, cols=['rolled_up_since', 'rolled_up_through'],
+        project_id=789).AndReturn([])
+    self.services.chart.issuesnapshotrollupstatus_tbl.InsertRow(
+        self.cnxn, replace=True, project_id=789, rolled_up_since=1514764799,
+        rolled_up_through=1514764799, commit=False)
+    self.cnxn.Commit()
+
+    self.mox.ReplayAll()
+    self.services.chart.RollUpIssueSnapshots(self.cnxn, 789, 1514764799)
+    self.mox.VerifyAll()
+
+  def testCountIssueSnapshots(self):
+    """Counts from each shard are added up by value."""
+    settings.num_logical_shards = 2
+    _dimension, col, left_joins = chart_svc.ROLLUP_DIMENSIONS[-1]
+    for shard_id, rows in [(0, [(None, 2), (5, 1)]), (1, [(5, 4)])]:
+      self.services.chart.issuesnapshot_tbl.Select(
+          self.cnxn, cols=[col, 'COUNT(IssueSnapshot.id)'],
+          left_joins=mox.IgnoreArg(), where=mox.IgnoreArg(),
+          group_by=[col], shard_id=shard_id).AndReturn(rows)
+
+    self.mox.ReplayAll()
+    counts = self.services.chart._CountIssueSnapshots(
+        self.cnxn, 789, 1514764799, col, left_joins)
+    self.mox.VerifyAll()
+    self.assertEqual({0: 2, 5: 5}, counts)
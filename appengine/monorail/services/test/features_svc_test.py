@@ -31,6 +31,7 @@ from services import features_svc
 from services import star_svc
 from services import user_svc
 from testing import fake
+from tracker import rerank_helpers
 from tracker import tracker_bizobj
 from tracker import tracker_constants
 
@@ -1156,8 +1157,8 @@ Delete.assert_called_once_with(
   def SetUpUpdateHotlistItems(self, cnxn, hotlist_id, remove, added_tuples):
     self.features_service.hotlist2issue_tbl.Delete(
         cnxn, hotlist_id=hotlist_id, issue_id=remove, commit=False)
-    rank = 1
-    added_tuples_with_rank = [(issue_id, rank+10*mult, user_id, ts, note) for
+    rank = rerank_helpers.RANK_GAP
+    added_tuples_with_rank = [(issue_id, rank*(mult+1), user_id, ts, note) for
                               mult, (issue_id, user_id, ts, note) in
                               enumerate(added_tuples)]
     insert_rows = [(hotlist_id, issue_id,
@@ -0,0 +1,88 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Benchmark for serial vs. parallel IssueTwoLevelCache.FetchItems.
+
+Each simulated DB query sleeps for a fixed delay, so the difference in
+wall-clock time shows how much of the per-query latency is overlapped.
+
+Usage: python services/test/issue_svc_benchmark.py [num_issues] [delay_ms]
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import sys
+import time
+
+import settings
+from services import chart_svc
+from services import issue_svc
+from testing import fake
+
+
+class SlowTable(object):
+  """A fake SQLTableManager that takes delay_sec to answer any query."""
+
+  def __init__(self, delay_sec, rows=None):
+    self.delay_sec = delay_sec
+    self.rows = tuple(rows or ())
+
+  # pylint: disable=unused-argument
+  def Select(self, cnxn, **kwargs):
+    time.sleep(self.delay_sec)
+    return self.rows
+
+
+def MakeSlowIssueService(num_issues, delay_sec):
+  """Return an IssueService whose issue tables all respond slowly."""
+  project_service = fake.ProjectService()
+  project_service.TestAddProject('proj', project_id=789)
+  config_service = fake.ConfigService()
+  issue_service = issue_svc.IssueService(
+      project_service, config_service, fake.CacheManager(),
+      chart_svc.ChartService(config_service))
+  now = int(time.time())
+  issue_rows = [
+      (78900 + i, 789, i, None, 111, 222, now, 0, now, now, now, now,
+       0, None, 0, 0, 0, False)
+      for i in range(1, num_issues + 1)]
+  summary_rows = [(78900 + i, 'sum') for i in range(1, num_issues + 1)]
+  for table_var in [
+      'issue2label_tbl', 'issue2component_tbl', 'issue2cc_tbl',
+      'issue2notify_tbl', 'issue2fieldvalue_tbl', 'issuerelation_tbl',
+      'danglingrelation_tbl', 'issuephasedef_tbl', 'issue2approvalvalue_tbl',
+      'issueapproval2approver_tbl']:
+    setattr(issue_service, table_var, SlowTable(delay_sec))
+  issue_service.issue_tbl = SlowTable(delay_sec, rows=issue_rows)
+  issue_service.issuesummary_tbl = SlowTable(delay_sec, rows=summary_rows)
+  return issue_service
+
+
+def TimeFetchItems(issue_service, issue_ids, parallel, repeat=5):
+  """Return the average number of milliseconds FetchItems took."""
+  settings.fetch_issues_in_parallel = parallel
+  start = time.time()
+  for _ in range(repeat):
+    issue_service.issue_2lc.FetchItems('fake cnxn', issue_ids, shard_id=0)
+  return (time.time() - start) * 1000 / repeat
+
+
+def main(argv):
+  num_issues = int(argv[1]) if len(argv) > 1 else 100
+  delay_ms = int(argv[2]) if len(argv) > 2 else 20
+  issue_service = MakeSlowIssueService(num_issues, delay_ms / 1000.0)
+  issue_ids = [78900 + i for i in range(1, num_issues + 1)]
+
+  serial_ms = TimeFetchItems(issue_service, issue_ids, False)
+  parallel_ms = TimeFetchItems(issue_service, issue_ids, True)
+  print('%d issues, %d ms per query' % (num_issues, delay_ms))
+  print('  serial:   %6.1f ms' % serial_ms)
+  print('  parallel: %6.1f ms' % parallel_ms)
+  print('  speedup:  %6.2fx' % (serial_ms / parallel_ms))
+
+
+if __name__ == '__main__':
+  main(sys.argv)
@@ -289,28 +289,35 @@ class IssueTwoLevelCacheTest(unittest.TestCase):
         self.phase_rows, self.approvalvalue_rows, self.av_approver_rows)
     self.assertEqual('b/1234567', issue_dict[78901].merged_into_external)
 
-  def SetUpFetchItems(self, issue_ids):
-    shard_id = None
+  def SetUpFetchItems(
+      self, issue_ids, shard_id=None, parallel=False, thread_cnxn=None):
+    label_shard_id = people_shard_id = shard_id
+    if parallel:
+      label_shard_id = (shard_id + 1) % settings.num_logical_shards
+      people_shard_id = (shard_id + 2) % settings.num_logical_shards
+    thread_cnxn = thread_cnxn or self.cnxn
     self.issue_service.issue_tbl.Select(
-        self.cnxn, cols=issue_svc.ISSUE_COLS, id=issue_ids,
+        thread_cnxn, cols=issue_svc.ISSUE_COLS, id=issue_ids,
         shard_id=shard_id).AndReturn(self.issue_rows)
     self.issue_service.issuesummary_tbl.Select(
-        self.cnxn, cols=issue_svc.ISSUESUMMARY_COLS, shard_id=shard_id,
+        thread_cnxn, cols=issue_svc.ISSUESUMMARY_COLS, shard_id=shard_id,
         issue_id=issue_ids).AndReturn(self.summary_rows)
     self.issue_service.issue2label_tbl.Select(
-        self.cnxn, cols=issue_svc.ISSUE2LABEL_COLS, shard_id=shard_id,
+        thread_cnxn, cols=issue_svc.ISSUE2LABEL_COLS, shard_id=label_shard_id,
         issue_id=issue_ids).AndReturn(self.label_rows)
     self.issue_service.issue2component_tbl.Select(
-        self.cnxn, cols=issue_svc.ISSUE2COMPONENT_COLS, shard_id=shard_id,
+        thread_cnxn, cols=issue_svc.ISSUE2COMPONENT_COLS,
+        shard_id=label_shard_id,
         issue_id=issue_ids).AndReturn(self.component_rows)
     self.issue_service.issue2cc_tbl.Select(
-        self.cnxn, cols=issue_svc.ISSUE2CC_COLS, shard_id=shard_id,
+        thread_cnxn, cols=issue_svc.ISSUE2CC_COLS, shard_id=people_shard_id,
         issue_id=issue_ids).AndReturn(self.cc_rows)
     self.issue_service.issue2notify_tbl.Select(
-        self.cnxn, cols=issue_svc.ISSUE2NOTIFY_COLS, shard_id=shard_id,
+        thread_cnxn, cols=issue_svc.ISSUE2NOTIFY_COLS, shard_id=people_shard_id,
         issue_id=issue_ids).AndReturn(self.notify_rows)
     self.issue_service.issue2fieldvalue_tbl.Select(
-        self.cnxn, cols=issue_svc.ISSUE2FIELDVALUE_COLS, shard_id=shard_id,
+        thread_cnxn, cols=issue_svc.ISSUE2FIELDVALUE_COLS,
+        shard_id=people_shard_id,
         issue_id=issue_ids).AndReturn(self.fieldvalue_rows)
     self.issue_service.issuephasedef_tbl.Select(
         self.cnxn, cols=issue_svc.ISSUEPHASEDEF_COLS,
@@ -348,6 +355,52 @@ class IssueTwoLevelCacheTest(unittest.TestCase):
     self.mox.VerifyAll()
     self.assertItemsEqual(issue_ids, list(issue_dict.keys()))
 
+  @patch('services.issue_svc.PARALLEL_FETCH_MIN_ISSUES', 1)
+  @patch('framework.sql.MonorailConnection')
+  def testFetchItems_Parallel(self, mock_cnxn_class):
+    """Sharded sub-queries are spread over consecutive shards' connections."""
+    issue_ids = [78901]
+    thread_cnxn = Mock()
+    mock_cnxn_class.return_value = thread_cnxn
+    self.SetUpFetchItems(
+        issue_ids, shard_id=1, parallel=True, thread_cnxn=thread_cnxn)
+    self.mox.ReplayAll()
+    issue_dict = self.issue_2lc.FetchItems(self.cnxn, issue_ids, shard_id=1)
+    self.mox.VerifyAll()
+    # Each thread gets its own connection, the master rows use self.cnxn.
+    self.assertEqual(3, mock_cnxn_class.call_count)
+    self.assertEqual(3, thread_cnxn.Close.call_count)
+    self.assertItemsEqual(issue_ids, list(issue_dict.keys()))
+    self.assertEqual('sum', issue_dict[78901].summary)
+    self.assertEqual([333], issue_dict[78901].cc_ids)
+
+  @patch('services.issue_svc.PARALLEL_FETCH_MIN_ISSUES', 1)
+  @patch('framework.sql.MonorailConnection')
+  def testFetchItems_ParallelClosesConnections(self, mock_cnxn_class):
+    """Thread connections are closed even when a sub-query fails."""
+    thread_cnxns = [Mock(), Mock(), Mock()]
+    mock_cnxn_class.side_effect = thread_cnxns
+    self.issue_2lc._FetchIssueAndSummaryRows = Mock(return_value=([], []))
+    self.issue_2lc._FetchLabelAndComponentRows = Mock(
+        side_effect=exceptions.InputException('replica went away'))
+    self.issue_2lc._FetchPeopleAndFieldValueRows = Mock(
+        return_value=([], [], []))
+    self.issue_2lc._FetchApprovalAndRelationRows = Mock(
+        return_value=([], [], [], [], []))
+
+    with self.assertRaises(exceptions.InputException):
+      self.issue_2lc.FetchItems(self.cnxn, [78901], shard_id=1)
+    for thread_cnxn in thread_cnxns:
+      thread_cnxn.Close.assert_called_once_with()
+
+  def testFetchItems_FewIssuesNotParallel(self):
+    issue_ids = [78901]
+    self.SetUpFetchItems(issue_ids, shard_id=1)
+    self.mox.ReplayAll()
+    issue_dict = self.issue_2lc.FetchItems(self.cnxn, issue_ids, shard_id=1)
+    self.mox.VerifyAll()
+    self.assertItemsEqual(issue_ids, list(issue_dict.keys()))
+
 
 class IssueServiceTest(unittest.TestCase):
 
@@ -851,6 +904,39 @@ class IssueServiceTest(unittest.TestCase):
     self.mox.VerifyAll()
     self.assertEqual(78901, actual_issue_id)
 
+  def testInsertIssues(self):
+    row = (789, 1, 1, 111, 111,
+           self.now, 0, self.now, self.now, self.now, self.now,
+           None, 0,
+           False, 0, 0, False)
+    self.services.issue.issue_tbl.InsertRows(
+        self.cnxn, issue_svc.ISSUE_COLS[1:], [row], commit=False)
+    self.services.issue.issue_tbl.Select(
+        self.cnxn, cols=['id', 'local_id'], project_id=789,
+        local_id=[1]).AndReturn([(78901, 1)])
+    self.services.issue.issue_tbl.Update(
+        self.cnxn, {'shard': 78901 % settings.num_logical_shards},
+        id=[78901], commit=False)
+    self.SetUpUpdateIssuesSummary()
+    self.SetUpUpdateIssuesLabels()
+    self.SetUpUpdateIssuesFields()
+    self.SetUpUpdateIssuesComponents()
+    self.SetUpUpdateIssuesCc()
+    self.SetUpUpdateIssuesNotify()
+    self.SetUpUpdateIssuesRelation()
+    self.services.chart.StoreIssueSnapshots(self.cnxn, mox.IgnoreArg(),
+        commit=False)
+    self.mox.ReplayAll()
+    issue = fake.MakeTestIssue(
+        project_id=789, local_id=1, owner_id=111, reporter_id=111,
+        summary='sum', status='New', labels=['Type-Defect'],
+        opened_timestamp=self.now, modified_timestamp=self.now)
+    issue_ids = self.services.issue.InsertIssues(
+        self.cnxn, [issue], commit=False, invalidate=False)
+    self.mox.VerifyAll()
+    self.assertEqual([78901], issue_ids)
+    self.assertEqual(78901, issue.issue_id)
+
   def SetUpUpdateIssues(self, given_delta=None):
     delta = given_delta or {
         'project_id': 789,
@@ -1928,6 +2014,51 @@ class IssueServiceTest(unittest.TestCase):
     self.services.issue.GetCommentsForIssue(self.cnxn, issue.issue_id)
     self.mox.VerifyAll()
 
+  def SetUpGetCommentIDsForIssue(self, issue_id, comment_ids):
+    self.services.issue.comment_tbl.Select(
+        self.cnxn, cols=['id'], issue_id=[issue_id],
+        order_by=[('created', []), ('id', [])]).AndReturn(
+            [(comment_id,) for comment_id in comment_ids])
+
+  def testGetCommentIDsForIssue(self):
+    self.SetUpGetCommentIDsForIssue(78901, [11, 12, 13])
+    self.mox.ReplayAll()
+    self.assertEqual(
+        [11, 12, 13],
+        self.services.issue.GetCommentIDsForIssue(self.cnxn, 78901))
+    # The second time, the IDs come from the cache.
+    self.assertEqual(
+        [11, 12, 13],
+        self.services.issue.GetCommentIDsForIssue(self.cnxn, 78901))
+    self.mox.VerifyAll()
+
+  def testGetCommentsForIssuePage(self):
+    """Only the comments in the requested range of sequences are loaded."""
+    self.SetUpGetCommentIDsForIssue(78901, [11, 12, 13, 14, 15])
+    self.mox.ReplayAll()
+    page_comments = [
+        tracker_pb2.IssueComment(id=13, issue_id=78901),
+        tracker_pb2.IssueComment(id=14, issue_id=78901)]
+    with patch.object(
+        self.services.issue, 'GetComments',
+        return_value=page_comments) as get_comments:
+      comments, total_count = self.services.issue.GetCommentsForIssuePage(
+          self.cnxn, 78901, 2, 2)
+      get_comments.assert_called_once_with(self.cnxn, id=[13, 14])
+
+      # A page past the end loads no comments.
+      get_comments.reset_mock()
+      self.assertEqual(
+          ([], 5),
+          self.services.issue.GetCommentsForIssuePage(
+              self.cnxn, 78901, 5, 2))
+      get_comments.assert_not_called()
+    self.mox.VerifyAll()
+
+    self.assertEqual(5, total_count)
+    self.assertEqual([13, 14], [c.id for c in comments])
+    self.assertEqual([2, 3], [c.sequence for c in comments])
+
   def testGetCommentsForIssues(self):
     self.SetUpGetComments([100001, 100002])
     self.mox.ReplayAll()
@@ -1969,6 +2100,7 @@ class IssueServiceTest(unittest.TestCase):
 
   def testInsertComment(self):
     self.SetUpInsertComment(7890101, approval_id=23)
+    self.services.issue.comment_ids_cache.CacheItem(78901, [7890100])
     self.mox.ReplayAll()
     comment = tracker_pb2.IssueComment(
         issue_id=78901, timestamp=self.now, project_id=789, user_id=111,
@@ -1976,6 +2108,46 @@ class IssueServiceTest(unittest.TestCase):
     self.services.issue.InsertComment(self.cnxn, comment, commit=True)
     self.mox.VerifyAll()
     self.assertEqual(7890101, comment.id)
+    self.assertFalse(self.services.issue.comment_ids_cache.HasItem(78901))
+
+  def testInsertComments(self):
+    for comment_id in [7890101, 7890102]:
+      self.services.issue.commentcontent_tbl.InsertRow(
+          self.cnxn, content='content', inbound_message=None,
+          commit=False).AndReturn(comment_id * 10)
+      self.services.issue.comment_tbl.InsertRow(
+          self.cnxn, issue_id=78901, created=self.now, project_id=789,
+          commenter_id=111, deleted_by=None, is_spam=False,
+          is_description=False, commentcontent_id=comment_id * 10,
+          commit=False).AndReturn(comment_id)
+    self.services.issue.commentimporter_tbl.InsertRows(
+        self.cnxn, issue_svc.COMMENTIMPORTER_COLS, [(7890102, 222)],
+        commit=False)
+    self.services.issue.issueupdate_tbl.InsertRows(
+        self.cnxn, issue_svc.ISSUEUPDATE_COLS[1:],
+        [(78901, 7890101, 'status', 'New', 'Fixed', None, None, None),
+         (78901, 7890102, 'cc', None, None, 333, None, None)],
+        commit=False)
+    self.services.issue.attachment_tbl.InsertRows(
+        self.cnxn, issue_svc.ATTACHMENT_COLS[1:], [], commit=False)
+    self.services.issue.issueapproval2comment_tbl.InsertRows(
+        self.cnxn, issue_svc.ISSUEAPPROVAL2COMMENT_COLS, [(23, 7890101)],
+        commit=False)
+    self.cnxn.Commit()
+    self.mox.ReplayAll()
+
+    comment_1 = tracker_pb2.IssueComment(
+        issue_id=78901, timestamp=self.now, project_id=789, user_id=111,
+        content='content', approval_id=23, amendments=[
+            tracker_bizobj.MakeStatusAmendment('Fixed', 'New')])
+    comment_2 = tracker_pb2.IssueComment(
+        issue_id=78901, timestamp=self.now, project_id=789, user_id=111,
+        content='content', importer_id=222, amendments=[
+            tracker_bizobj.MakeCcAmendment([333], [])])
+    self.services.issue.InsertComments(self.cnxn, [comment_1, comment_2])
+    self.mox.VerifyAll()
+    self.assertEqual(7890101, comment_1.id)
+    self.assertEqual(7890102, comment_2.id)
 
   def SetUpUpdateComment(self, comment_id, delta=None):
     delta = delta or {
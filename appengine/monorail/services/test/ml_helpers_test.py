@@ -88,6 +88,31 @@ class MLHelpersTest(unittest.TestCase):
     features = ml_helpers.GenerateFeaturesRaw(['', ''], NUM_WORD_HASHES)
     self.assertEqual([1.0, 0.0, 0.0, 0.0, 0.0], features['word_hashes'])
 
+  def testGenerateSpamFeaturesBatch(self):
+    features = ml_helpers.GenerateSpamFeaturesBatch(
+        [['abc', 'abc def'], ['', '']], NUM_WORD_HASHES)
+    self.assertEqual(2, len(features))
+    self.assertEqual([0, 2, 3], features.indptr)
+    self.assertEqual([2, 4, 0], features.indices)
+    self.assertEqual([2 / 3, 1 / 3, 1.0], features.data)
+    self.assertEqual([0.0, 0.0, 2 / 3, 0.0, 1 / 3], features.GetRow(0))
+
+  def testGenerateSpamFeaturesBatch_MatchesGenerateFeaturesRaw(self):
+    contents = [
+        ['abc', 'abc def http://www.google.com http://www.google.com'],
+        ['abc', 'abc def'],
+        [u'abc’', u'abc ’ def'],
+        [u'abc國', u'abc 國 def'],
+        ['abc…', 'abc … def'],
+        ['', ''],
+        ['Free pills!!! (buy now)', 'visit: spam.example.com? now, now.'],
+        ]
+    for num_features in (NUM_WORD_HASHES, ml_helpers.SPAM_FEATURE_HASHES):
+      features = ml_helpers.GenerateSpamFeaturesBatch(contents, num_features)
+      for row, content in enumerate(contents):
+        expected = ml_helpers.GenerateFeaturesRaw(list(content), num_features)
+        self.assertEqual(expected['word_hashes'], features.GetRow(row))
+
   def test_from_file(self):
     csv_file = StringIO.StringIO('''
       "spam","the subject 1","the contents 1","spammer@gmail.com"
@@ -10,6 +10,7 @@ from __future__ import absolute_import
 
 import unittest
 
+import mock
 import mox
 
 from google.appengine.ext import testbed
@@ -372,6 +373,63 @@ class SpamServiceTest(unittest.TestCase):
     res = self.spam_service.ClassifyComment('this is spam', commenter, False)
     self.assertEqual(0.0, res['confidence_is_spam'])
 
+  def testClassifyBatch(self):
+    """Items are classified in as few prediction requests as possible."""
+    spam_scores = {
+        'this is spam': 0.9, 'a comment': 0.5, 'buy now': 0.8,
+        'more spam': 0.7}
+    scores_by_features = {
+        tuple(spam_svc.ml_helpers.GenerateFeaturesRaw(
+            ['', text], settings.spam_feature_hashes)['word_hashes']): score
+        for text, score in spam_scores.items()}
+
+    def Predict(name, body):
+      # Like ML Engine, return one prediction for each instance.
+      request = Mock()
+      request.execute.return_value = {'predictions': [
+          {'classes': ['0', '1'],
+           'scores': [1 - scores_by_features[tuple(instance['inputs'])],
+                      scores_by_features[tuple(instance['inputs'])]]}
+          for instance in body['instances']]}
+      return request
+
+    ml_engine = Mock()
+    predict = ml_engine.projects.return_value.predict
+    predict.side_effect = Predict
+    self.spam_service.ml_engine = ml_engine
+    author = user_pb2.MakeUser(111, email='test@test.com')
+    items = [
+        (['', 'this is spam'], author, False),
+        (['', 'a comment'], author, True),  # Project members are exempt.
+        (['', 'buy now'], author, False),
+        (['', 'more spam'], author, False),
+        ]
+
+    with mock.patch('services.spam_svc.MAX_PREDICT_BATCH_SIZE', 2):
+      results = self.spam_service.ClassifyBatch(items)
+
+    self.assertEqual(
+        [0.9, 0.0, 0.8, 0.7],
+        [result['confidence_is_spam'] for result in results])
+    self.assertFalse(any(result['failed_open'] for result in results))
+    self.assertEqual(
+        [2, 1],
+        [len(call[1]['body']['instances'])
+         for call in predict.call_args_list])
+
+  def testClassifyBatch_FailOpen(self):
+    def fail(_inputs):
+      raise Exception('ML Engine is down')
+    self.spam_service._predict_batch = fail
+    self.spam_service.ml_engine = True
+    author = user_pb2.MakeUser(111, email='test@test.com')
+    results = self.spam_service.ClassifyBatch(
+        [(['sum', 'spam'], author, False), (['sum', 'ham'], author, True)])
+    self.assertEqual(
+        [True, False], [result['failed_open'] for result in results])
+    self.assertEqual(
+        [0.0, 0.0], [result['confidence_is_spam'] for result in results])
+
   def test_ham_classification(self):
     actual = self.spam_service.ham_classification()
     self.assertEqual(actual['confidence_is_spam'], 0.0)
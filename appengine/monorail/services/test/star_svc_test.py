@@ -10,8 +10,10 @@ from __future__ import absolute_import
 
 import unittest
 
+import mock
 import mox
 
+from google.appengine.api import memcache
 from google.appengine.ext import testbed
 
 import settings
@@ -58,9 +60,18 @@ class AbstractStarServiceTest(unittest.TestCase):
 
   def testExpungeStarsByUsers(self):
     user_ids = [2, 3, 4]
+    self.mock_tbl.Select = Mock(return_value=[(123,), (234,)])
+    memcache.set('star_count:project:123', 5)
+    memcache.set('star_count:project:234', 1)
+    memcache.set('star_count:project:345', 7)
     self.star_service.ExpungeStarsByUsers(self.cnxn, user_ids, limit=40)
+    self.mock_tbl.Select.assert_called_once_with(
+        self.cnxn, cols=['item_id'], distinct=True, user_id=user_ids)
     self.mock_tbl.Delete.assert_called_once_with(
         self.cnxn, user_id=user_ids, commit=False, limit=40)
+    self.assertIsNone(memcache.get('star_count:project:123'))
+    self.assertIsNone(memcache.get('star_count:project:234'))
+    self.assertEqual(7, memcache.get('star_count:project:345'))
 
   def SetUpLookupItemsStarrers(self):
     self.mock_tbl.Select(
@@ -105,6 +116,28 @@ class AbstractStarServiceTest(unittest.TestCase):
         self.star_service.IsItemStarredBy(self.cnxn, 435, 111))
     self.mox.VerifyAll()
 
+  def testLookupStarredItemIDsAmong_Cached(self):
+    self.star_service.star_cache.CacheItem(111, [123, 234])
+    self.mox.ReplayAll()
+    self.assertEqual(
+        {234}, self.star_service.LookupStarredItemIDsAmong(
+            self.cnxn, 111, [234, 345]))
+    self.mox.VerifyAll()
+
+  def testLookupStarredItemIDsAmong_NotCached(self):
+    self.mock_tbl.Select(
+        self.cnxn, cols=['item_id'], user_id=111,
+        item_id=[234, 345]).AndReturn([(234,)])
+    self.mox.ReplayAll()
+    self.assertEqual(
+        {234}, self.star_service.LookupStarredItemIDsAmong(
+            self.cnxn, 111, [234, 345]))
+    self.assertEqual(
+        set(), self.star_service.LookupStarredItemIDsAmong(
+            self.cnxn, None, [234, 345]))
+    self.mox.VerifyAll()
+    self.assertFalse(self.star_service.star_cache.HasItem(111))
+
   def SetUpCountItemStars(self):
     self.mock_tbl.Select(
         self.cnxn, cols=['item_id', 'COUNT(user_id)'], item_id=[234],
@@ -129,6 +162,41 @@ class AbstractStarServiceTest(unittest.TestCase):
     self.assertEqual(3, count_dict[123])
     self.assertEqual(2, count_dict[234])
 
+  def testCountItemsStars_Memcache(self):
+    """Counts are shared through memcache and deleted as stars change."""
+    self.SetUpCountItemStars()
+    self.mox.ReplayAll()
+    self.assertEqual(
+        {234: 2}, self.star_service.CountItemsStars(self.cnxn, [234]))
+    self.mox.VerifyAll()
+    self.assertEqual(2, memcache.get('star_count:project:234'))
+
+    # Another instance that lacks the count in RAM gets it from memcache.
+    self.star_service.star_count_cache.LocalInvalidateAll()
+    self.assertEqual(
+        {234: 2}, self.star_service.CountItemsStars(self.cnxn, [234]))
+
+  def testSetStarsBatch_DeletesMemcacheCount(self):
+    """Writers delete the shared count with a lock instead of adjusting it."""
+    memcache.set('star_count:project:234', 2)
+    self.mock_tbl.InsertRows(
+        self.cnxn, ['item_id', 'user_id'], [(234, 111), (234, 333)],
+        ignore=True)
+    self.mox.ReplayAll()
+    with mock.patch.object(
+        memcache, 'delete_multi', wraps=memcache.delete_multi) as delete:
+      self.star_service.SetStarsBatch(self.cnxn, 234, [111, 333], True)
+      self.mox.VerifyAll()
+      self.assertIsNone(memcache.get('star_count:project:234'))
+      delete.assert_called_once_with(
+          ['234'], seconds=star_svc.STAR_COUNT_DELETE_LOCK_SECS,
+          key_prefix='star_count:project:',
+          namespace=settings.memcache_namespace)
+
+    memcache.set('star_count:project:234', 3)
+    self.star_service.SetStarsBatch(self.cnxn, 234, [111, 333], False)
+    self.assertIsNone(memcache.get('star_count:project:234'))
+
   def SetUpSetStar_Add(self):
     self.mock_tbl.InsertRows(
         self.cnxn, ['item_id', 'user_id'], [(123, 111)], ignore=True)
@@ -179,3 +247,19 @@ class AbstractStarServiceTest(unittest.TestCase):
     self.assertFalse(self.star_service.star_cache.HasItem(123))
     self.assertFalse(self.star_service.starrer_cache.HasItem(123))
     self.assertFalse(self.star_service.star_count_cache.HasItem(123))
+
+  def SetUpInsertStarsForNewItems(self):
+    self.mock_tbl.InsertRows(
+        self.cnxn, ['item_id', 'user_id'],
+        [(123, 111), (123, 222), (124, 111)], ignore=True, commit=False)
+
+  def testInsertStarsForNewItems(self):
+    self.star_service.star_cache.CacheItem(111, [99])
+    self.star_service.star_cache.CacheItem(333, [99])
+    self.SetUpInsertStarsForNewItems()
+    self.mox.ReplayAll()
+    self.star_service.InsertStarsForNewItems(
+        self.cnxn, {124: [111], 123: [111, 222]}, commit=False)
+    self.mox.VerifyAll()
+    self.assertFalse(self.star_service.star_cache.HasItem(111))
+    self.assertTrue(self.star_service.star_cache.HasItem(333))
@@ -72,6 +72,18 @@ db_cnxn_pool_size = 10
 # of the master, so any replica DB can answer queries about any logical shard.
 num_logical_shards = 5
 
+# Send a shard's queries to a different replica when the usual one has been
+# responding much more slowly, as measured by a moving average of latency.
+adaptive_replica_selection = False
+
+# When issues change, update cached search results that can be evaluated in
+# RAM rather than making all results for their project-shards stale.
+incremental_search_cache = False
+
+# Find restricted issues in a project-shard by using per-label IID sets kept
+# in memcache and updated as issues change, rather than querying the DB.
+index_restricted_issues = False
+
 # "Learn more" link for the site home page
 # TODO(agable): Update this when we have publicly visible documentation.
 learn_more_link = None
@@ -183,11 +195,38 @@ comment_cache_max_size = 400 * 1000
 # occasional users that are mentioned on any popular pages.
 user_cache_max_size = 150 * 1000
 
+# How RAM caches choose which entries to drop when they are full:
+# 'lru' drops the least recently used entry, 'lfu' drops an entry that
+# is rarely used, and 'random' drops an arbitrary entry.
+ram_cache_eviction_policy = 'lru'
+
 # Normally we use the default namespace, but during development it is
 # sometimes useful to run a tainted version on staging that has a separate
 # memcache namespace.  E.g., os.environ.get('CURRENT_VERSION_ID')
 memcache_namespace = None  # Should be None when committed.
 
+# Store PBs under these memcache key prefixes in the compact format of
+# services/cache_codec.py rather than as encoded protobufs.  Values larger
+# than the threshold (in bytes) are also compressed.  Configs and hotlists
+# get smaller.  Issues and users decode about 2.5x faster, but their values
+# get larger (issues by about a quarter), see
+# services/test/cache_codec_benchmark.py.
+# Compact values are stored under versioned keys, e.g., 'config:c1:16', so
+# that app versions which cannot read them never see them.
+compact_memcache_prefixes = ['config:', 'hotlist:', 'issue:', 'user:']
+memcache_compression_threshold = 256
+
+# How jobs learn about cache invalidations made by other jobs.  With
+# 'memcache', invalidations are fanned out through memcache and the
+# Invalidate table is only polled every invalidate_db_poll_interval_sec
+# as a safety net.  With None, the table is polled on every request.
+cache_invalidation_transport = 'memcache'
+invalidate_db_poll_interval_sec = 60
+
+# Load the parts of cache-missed issues from several replica connections
+# at once rather than one query after another.
+fetch_issues_in_parallel = True
+
 # Recompute derived issue fields via work items rather than while
 # the user is waiting for a page to load.
 recompute_derived_fields_in_worker = True
@@ -243,6 +282,13 @@ backend_deadline = 45
 # than queue behind other requests.  The last 2 retries will wait in queue.
 backend_retries = 3
 
+# If a backend search takes longer than this percentile of recent searches,
+# send a duplicate request and use whichever one answers first.  Never
+# duplicate a search that has taken less than backend_hedge_min_delay_sec.
+hedge_backend_searches = False
+backend_hedge_percentile = 95
+backend_hedge_min_delay_sec = 0.2
+
 # Do various extra logging at INFO level.
 enable_profiler_logging = True
 
@@ -425,6 +471,13 @@ maximum_snapshot_period_end = 4294967295
 # The maximum number of rows chart queries can scan.
 chart_query_max_rows = 10000
 
+# Serve unrestricted chart queries for the end of a UTC day from the daily
+# rollups of issue snapshot counts, rather than scanning the snapshots.
+chart_snapshot_rollups = False
+
+# The number of days that a snapshot rollup task will roll up in one run.
+chart_snapshot_rollup_max_days = 31
+
 # Client ID to use for loading the Google API client, gapi.js.
 if app_identity.get_application_id() == 'monorail-317205':
   gapi_client_id = (
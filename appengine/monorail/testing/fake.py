@@ -9,6 +9,7 @@ from __future__ import division
 from __future__ import absolute_import
 
 import collections
+import json
 import logging
 import re
 import sys
@@ -35,6 +36,7 @@ from services import caches
 from services import config_svc
 from services import features_svc
 from services import project_svc
+from tracker import rerank_helpers
 from tracker import tracker_bizobj
 from tracker import tracker_constants
 
@@ -490,7 +492,7 @@ class CacheManager(object):
     """Register a cache to be notified of future invalidations."""
     self.cache_registry[kind].append(cache)
 
-  def DoDistributedInvalidation(self, cnxn):
+  def DoDistributedInvalidation(self, cnxn, now=None):
     """Drop any cache entries that were invalidated by other jobs."""
     self.last_call = 'DoDistributedInvalidation', cnxn
 
@@ -814,12 +816,20 @@ class AbstractStarService(object):
   def LookupItemStarrers(self, _cnxn, item_id):
     return self.stars_by_item_id.get(item_id, [])
 
+  def LookupItemsStarrers(self, cnxn, item_ids):
+    return {item_id: self.LookupItemStarrers(cnxn, item_id)
+            for item_id in item_ids}
+
   def LookupStarredItemIDs(self, _cnxn, starrer_user_id):
     return self.stars_by_starrer_id.get(starrer_user_id, [])
 
   def IsItemStarredBy(self, cnxn, item_id, starrer_user_id):
     return item_id in self.LookupStarredItemIDs(cnxn, starrer_user_id)
 
+  def LookupStarredItemIDsAmong(self, cnxn, starrer_user_id, item_ids):
+    return set(self.LookupStarredItemIDs(cnxn, starrer_user_id)).intersection(
+        item_ids)
+
   def CountItemStars(self, cnxn, item_id):
     return len(self.LookupItemStarrers(cnxn, item_id))
 
@@ -843,6 +853,12 @@ class AbstractStarService(object):
     for starrer_user_id in starrer_user_ids:
       self._SetStar(cnxn, item_id, starrer_user_id, starred)
 
+  def InsertStarsForNewItems(
+      self, cnxn, starrer_user_ids_by_item_id, commit=True):
+    for item_id, starrer_user_ids in starrer_user_ids_by_item_id.items():
+      for starrer_user_id in starrer_user_ids:
+        self._SetStar(cnxn, item_id, starrer_user_id, True)
+
 
 class UserStarService(AbstractStarService):
   pass
@@ -1423,7 +1439,7 @@ class ConfigService(object):
         if cd.component_id != component_id]
     self.StoreConfig(cnxn, config)
 
-  def InvalidateMemcache(self, issues, key_prefix=''):
+  def InvalidateMemcache(self, issues, key_prefix='', cnxn=None):
     pass
 
   def InvalidateMemcacheForEntireProject(self, project_id):
@@ -1512,7 +1528,7 @@ class IssueService(object):
     self.enqueue_issues_called = True
     for i in issue_ids:
       if i not in self.enqueued_issues:
-        self.enqueued_issues.extend(issues)
+        self.enqueued_issues.append(i)
 
   def ExpungeIssues(self, _cnxn, issue_ids):
     self.expunged_issues.extend(issue_ids)
@@ -1723,6 +1739,10 @@ class IssueService(object):
 
     return comments
 
+  def GetCommentsForIssuePage(self, cnxn, issue_id, start, max_items):
+    comments = self.GetCommentsForIssue(cnxn, issue_id)
+    return comments[start:start + max_items], len(comments)
+
   def InsertIssue(self, cnxn, issue):
     issue.issue_id = issue.project_id * 1000000 + issue.local_id
     self.issues_by_project.setdefault(issue.project_id, {})
@@ -1730,6 +1750,9 @@ class IssueService(object):
     self.issues_by_iid[issue.issue_id] = issue
     return issue.issue_id
 
+  def InsertIssues(self, cnxn, issues, commit=True, invalidate=True):
+    return [self.InsertIssue(cnxn, issue) for issue in issues]
+
   def CreateIssue(
       self, cnxn, services, project_id,
       summary, status, owner_id, cc_ids, labels, field_values,
@@ -1972,6 +1995,10 @@ class IssueService(object):
     issue = self.GetIssue(cnxn, comment.issue_id)
     self.TestAddComment(comment, issue.local_id)
 
+  def InsertComments(self, cnxn, comments, commit=True):
+    for comment in comments:
+      self.InsertComment(cnxn, comment, commit=commit)
+
   # pylint: disable=unused-argument
   def DeltaUpdateIssue(
       self, cnxn, services, reporter_id, project_id,
@@ -2119,6 +2146,10 @@ class IssueService(object):
     """This always returns empty results.  Mock it to test other cases."""
     return []
 
+  def GetIIDLabelIDPairs(self, cnxn, label_ids, project_id, shard_id):
+    """This always returns empty results.  Mock it to test other cases."""
+    return []
+
   def GetIIDsByParticipant(self, cnxn, user_ids, project_ids, shard_id):
     """This always returns empty results.  Mock it to test other cases."""
     return []
@@ -2261,6 +2292,10 @@ class SpamService(object):
             'outputMulti': [{'label': 'ham', 'score': '1.0'}],
             'failed_open': False}
 
+  def ClassifyBatch(self, items):
+    return [{'confidence_is_spam': 0.0, 'failed_open': False}
+            for _ in items]
+
   def ClassifyIssue(self, issue, firstComment, reporter):
     return {'outputLabel': 'ham',
             'outputMulti': [{'label': 'ham', 'score': '1.0'}],
@@ -2502,13 +2537,14 @@ class FeaturesService(object):
 
     if hotlist.items:
       items_sorted = sorted(hotlist.items, key=lambda item: item.rank)
-      rank_base = items_sorted[-1].rank + 10
+      rank_base = items_sorted[-1].rank + rerank_helpers.RANK_GAP
     else:
-      rank_base = 1
+      rank_base = rerank_helpers.RANK_GAP
 
     new_hotlist_items = [
         features_pb2.MakeHotlistItem(
-            issue_id, rank+rank_base*10, adder_id, date, note)
+            issue_id, rank * rerank_helpers.RANK_GAP + rank_base, adder_id,
+            date, note)
         for rank, (issue_id, adder_id, date, note) in
         enumerate(added_issue_tuples)
         if issue_id not in current_issues_ids]
@@ -2803,6 +2839,79 @@ class PostData(object):
     return list(self.dictionary.keys())
 
 
+URLFetchResponse = collections.namedtuple(
+    'URLFetchResponse', 'content status_code')
+
+
+class BackendSearchRPC(object):
+  """A urlfetch RPC for a fake besearch call that finishes at finish_time."""
+
+  def __init__(self, finish_time, content):
+    self.finish_time = finish_time
+    self.content = content
+    self.callback = None
+
+  def get_result(self):
+    return URLFetchResponse(self.content, 200)
+
+
+class BesearchBackend(object):
+  """A fake besearch module that answers after scripted delays.
+
+  Time is simulated so that tests are deterministic.  Tests replace
+  time.time() with Now(), _StartBackendSearchCall() with StartSearchCall(),
+  and real_wait_any() with WaitAny().
+  """
+
+  def __init__(self, results_by_shard, latencies=None, default_latency=0.1):
+    """Args:
+      results_by_shard: {shard_id: [iid, ...]} to return for each shard.
+      latencies: {shard_id: [sec, ...]} delays for successive calls to each
+          shard.  A delay of None makes that call fail fast, and a delay of
+          (sec, False) makes it fail after sec.
+      default_latency: delay for calls that have no scripted delay.
+    """
+    self.results_by_shard = results_by_shard
+    self.latencies = {
+        shard_id: list(delays)
+        for shard_id, delays in (latencies or {}).items()}
+    self.default_latency = default_latency
+    self.now = 0.0
+    self.calls = []  # [(start_time, shard_key, failfast)]
+
+  def Now(self):
+    return self.now
+
+  # pylint: disable=unused-argument
+  def StartSearchCall(
+      self, query_project_names, shard_key, invalidation_timestep,
+      me_user_ids, logged_in_user_id, new_url_num, url_params,
+      sort_spec=None, group_by_spec=None, deadline=None, failfast=True):
+    shard_id, _subquery = shard_key
+    self.calls.append((self.now, shard_key, failfast))
+    delays = self.latencies.get(shard_id)
+    delay = delays.pop(0) if delays else self.default_latency
+    if delay is None:
+      return BackendSearchRPC(self.now, '')
+    if isinstance(delay, tuple):
+      return BackendSearchRPC(self.now + delay[0], '')
+    content = '})]\'\n' + json.dumps({
+        'unfiltered_iids': self.results_by_shard.get(shard_id, []),
+        'search_limit_reached': False,
+        })
+    return BackendSearchRPC(self.now + delay, content)
+
+  def WaitAny(self, active_rpcs, deadline=None):
+    """Finish the next RPC, or return None if deadline comes first."""
+    finished = min(active_rpcs, key=lambda rpc: rpc.finish_time)
+    if deadline is not None and deadline < finished.finish_time:
+      self.now = max(self.now, deadline)
+      return None
+    self.now = max(self.now, finished.finish_time)
+    finished.callback()
+    return finished
+
+
 class FakeFile:
   def __init__(self, data=None):
     self.data = data
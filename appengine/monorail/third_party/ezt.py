@@ -107,6 +107,9 @@ _re_subst = re.compile('%(%|[0-9]+)')
 
 class Template:
 
+  # The parsed program turned into a function(fp, ctx), see compile().
+  _compiled = None
+
   def __init__(self, fname=None, compress_whitespace=1,
                base_format=FORMAT_RAW):
     self.compress_whitespace = compress_whitespace
@@ -131,6 +134,15 @@ class Template:
 
     self.program = self._parse(text_or_reader,
                                base_printer=_parse_format(base_format))
+    self._compiled = None
+
+  def compile(self):
+    """Turn the parsed program into nested Python closures.
+
+    generate() does this the first time that it is called, but callers can
+    do it ahead of time, e.g., while an instance is warming up.
+    """
+    self._compiled = self._compile(self.program)
 
   def generate(self, fp, data):
     if hasattr(data, '__getitem__') or callable(getattr(data, 'keys', None)):
@@ -145,7 +157,9 @@ class Template:
     ctx.data = data
     ctx.for_index = { }
     ctx.defines = { }
-    self._execute(self.program, fp, ctx)
+    if self._compiled is None:
+      self.compile()
+    self._compiled(fp, ctx)
 
   def _parse(self, reader, for_names=None, file_args=(), base_printer=None):
     """text -> string object containing the template.
@@ -307,22 +321,157 @@ class Template:
         method, method_args, filename, line_number = step
         method(method_args, fp, ctx, filename, line_number)
 
-  def _cmd_print(self, transforms_and_valref, fp, ctx, filename, line_number):
+  def _compile(self, program):
+    """program -> a function(fp, ctx) that does what _execute() would do.
+
+    The steps of the program are resolved once, here, rather than on every
+    call to generate(): adjacent strings are joined, constant values are
+    formatted, and the common commands become closures that hold their
+    already-unpacked arguments and compiled sections.  Commands that are
+    rarely used fall back to calling their _cmd_ method.
+    """
+    steps = [ ]
+    for step in program:
+      if not isinstance(step, string_types):
+        method, method_args, filename, line_number = step
+        compiler = self._compilers.get(method.__name__)
+        if compiler:
+          step = compiler(self, method_args, filename, line_number)
+        else:
+          step = _bind_cmd(method, method_args, filename, line_number)
+      if isinstance(step, string_types):
+        if steps and type(steps[-1]) is type(step):
+          steps[-1] = steps[-1] + step
+          continue
+      steps.append(step)
+
+    if not steps:
+      return _no_op
+    if len(steps) == 1:
+      step = steps[0]
+      if isinstance(step, string_types):
+        return lambda fp, ctx: fp.write(step)
+      return step
+
+    steps = tuple((isinstance(step, string_types), step) for step in steps)
+    def run(fp, ctx):
+      for is_text, step in steps:
+        if is_text:
+          fp.write(step)
+        else:
+          step(fp, ctx)
+    return run
+
+  def _compile_section(self, section):
+    if section is None:
+      return None
+    return self._compile(section)
+
+  def _compile_print(self, transforms_and_valref, filename, line_number):
     transforms, valref = transforms_and_valref
-    value = _get_value(valref, ctx, filename, line_number)
-    # if the value has a 'read' attribute, then it is a stream: copy it
-    if hasattr(value, 'read'):
-      while 1:
-        chunk = value.read(16384)
-        if not chunk:
-          break
-        for t in transforms:
-          chunk = t(chunk)
-        fp.write(chunk)
-    else:
+    if valref[2] is None:
+      # A string constant can be formatted now.
+      value = valref[1]
       for t in transforms:
         value = t(value)
-      fp.write(value)
+      return value
+
+    def print_value(fp, ctx):
+      _write_value(transforms, _get_value(valref, ctx, filename, line_number),
+                   fp)
+    return print_value
+
+  def _compile_if(self, test, t_section, f_section):
+    if t_section is None:
+      t_section = f_section
+      f_section = None
+    t_section = self._compile_section(t_section) or _no_op
+    f_section = self._compile_section(f_section) or _no_op
+
+    def run_if(fp, ctx):
+      if test(ctx):
+        t_section(fp, ctx)
+      else:
+        f_section(fp, ctx)
+    return run_if
+
+  def _compile_if_any(self, args, filename, line_number):
+    (valrefs, t_section, f_section) = args
+    def test(ctx):
+      for valref in valrefs:
+        if _get_value(valref, ctx, filename, line_number):
+          return True
+      return False
+    return self._compile_if(test, t_section, f_section)
+
+  def _compile_if_index(self, args, filename, line_number):
+    ((valref, value), t_section, f_section) = args
+    name = valref[0]
+    if value == 'even':
+      def test(ctx):
+        return ctx.for_index[name][1] % 2 == 0
+    elif value == 'odd':
+      def test(ctx):
+        return ctx.for_index[name][1] % 2 == 1
+    elif value == 'first':
+      def test(ctx):
+        return ctx.for_index[name][1] == 0
+    elif value == 'last':
+      def test(ctx):
+        list, idx = ctx.for_index[name]
+        return idx == len(list)-1
+    else:
+      def test(ctx):
+        return ctx.for_index[name][1] == int(value)
+    return self._compile_if(test, t_section, f_section)
+
+  def _compile_is(self, args, filename, line_number):
+    ((left_ref, right_ref), t_section, f_section) = args
+    def test(ctx):
+      right_value = _get_value(right_ref, ctx, filename, line_number)
+      left_value = _get_value(left_ref, ctx, filename, line_number)
+      return left_value.lower() == right_value.lower()
+    return self._compile_if(test, t_section, f_section)
+
+  def _compile_for(self, args, filename, line_number):
+    ((valref,), unused, section) = args
+    refname = valref[0]
+    section = self._compile_section(section) or _no_op
+
+    def run_for(fp, ctx):
+      list = _get_value(valref, ctx, filename, line_number)
+      if isinstance(list, string_types):
+        raise NeedSequenceError(refname, filename, line_number)
+      ctx.for_index[refname] = idx = [ list, 0 ]
+      for item in list:
+        section(fp, ctx)
+        idx[1] = idx[1] + 1
+      del ctx.for_index[refname]
+    return run_for
+
+  def _compile_define(self, args, filename, line_number):
+    ((name,), unused, section) = args
+    section = self._compile_section(section) or _no_op
+
+    def run_define(fp, ctx):
+      valfp = StringIO.StringIO()
+      section(valfp, ctx)
+      ctx.defines[name] = valfp.getvalue()
+    return run_define
+
+  _compilers = {
+    '_cmd_print': _compile_print,
+    '_cmd_if_any': _compile_if_any,
+    '_cmd_if_index': _compile_if_index,
+    '_cmd_is': _compile_is,
+    '_cmd_for': _compile_for,
+    '_cmd_define': _compile_define,
+  }
+
+  def _cmd_print(self, transforms_and_valref, fp, ctx, filename, line_number):
+    transforms, valref = transforms_and_valref
+    value = _get_value(valref, ctx, filename, line_number)
+    _write_value(transforms, value, fp)
 
   def _cmd_subst(self, transforms_valref_args, fp, ctx, filename,
                  line_number):
@@ -418,6 +567,30 @@ class Template:
       self._execute(section, valfp, ctx)
     ctx.defines[name] = valfp.getvalue()
 
+def _write_value(transforms, value, fp):
+  # if the value has a 'read' attribute, then it is a stream: copy it
+  if hasattr(value, 'read'):
+    while 1:
+      chunk = value.read(16384)
+      if not chunk:
+        break
+      for t in transforms:
+        chunk = t(chunk)
+      fp.write(chunk)
+  else:
+    for t in transforms:
+      value = t(value)
+    fp.write(value)
+
+def _bind_cmd(method, method_args, filename, line_number):
+  "Return a function(fp, ctx) that runs one step of a program."
+  def run_cmd(fp, ctx):
+    method(method_args, fp, ctx, filename, line_number)
+  return run_cmd
+
+def _no_op(fp, ctx):
+  pass
+
 def boolean(value):
   "Return a value suitable for [if-any bool_var] usage in a template."
   if value:
@@ -9,18 +9,33 @@ from __future__ import print_function
 from __future__ import division
 from __future__ import absolute_import
 
+import json
 import logging
 import time
 
 from third_party import ezt
 
 from businesslogic import work_env
+from framework import framework_constants
+from framework import framework_helpers
 from framework import permissions
 from framework import jsonfeed
 from framework import servlet
+from framework import sql
 from tracker import tracker_bizobj
 
 
+# Number of issues that a streaming export loads and serializes at a time.
+EXPORT_CHUNK_SIZE = 100
+
+# A streaming export stops after this many chunks and ends with a cursor that
+# the client passes as the start of the next request.  This bounds the size
+# of each response, which App Engine buffers before sending.
+MAX_EXPORT_CHUNKS = 50
+
+CONTENT_TYPE_NDJSON = 'application/x-ndjson; charset=UTF-8'
+
+
 class IssueExport(servlet.Servlet):
   """IssueExportControls let's an admin choose how to export issues."""
 
@@ -89,8 +104,14 @@ class IssueExportJSON(jsonfeed.JsonFeed):
       mr: commonly used info parsed from the request.
 
     Returns:
-      Dict of values used by EZT for rendering the page.
+      Dict of values used by EZT for rendering the page, or an iterator over
+      the lines of a streaming export when the format param is "ndjson".
     """
+    if mr.GetParam('format') == 'ndjson':
+      if mr.query or mr.can != 1:
+        self.abort(400, 'Streaming export only supports all issues')
+      return self._IterExportLines(mr)
+
     if mr.query or mr.can != 1:
       with work_env.WorkEnv(mr, self.services) as we:
         url_params = []
@@ -107,24 +128,10 @@ class IssueExportJSON(jsonfeed.JsonFeed):
       issues = self.services.issue.GetIssuesByLocalIDs(
           mr.cnxn, mr.project.project_id, local_id_range)
 
-    user_id_set = tracker_bizobj.UsersInvolvedInIssues(issues)
-
     comments_dict = self.services.issue.GetCommentsForIssues(
         mr.cnxn, [issue.issue_id for issue in issues])
-    for comment_list in comments_dict.values():
-      user_id_set.update(
-        tracker_bizobj.UsersInvolvedInCommentList(comment_list))
-
-    starrers_dict = self.services.issue_star.LookupItemsStarrers(
-        mr.cnxn, [issue.issue_id for issue in issues])
-    for starrer_id_list in starrers_dict.values():
-      user_id_set.update(starrer_id_list)
-
-    # The value 0 indicates "no user", e.g., that an issue has no owner.
-    # We don't need to create a User row to represent that.
-    user_id_set.discard(0)
-    email_dict = self.services.user.LookupUserEmails(
-        mr.cnxn, user_id_set, ignore_missed=True)
+    starrers_dict, email_dict = self._LookupStarrersAndEmails(
+        mr.cnxn, issues, comments_dict)
 
     issues_json = [
       self._MakeIssueJSON(
@@ -149,6 +156,119 @@ class IssueExportJSON(jsonfeed.JsonFeed):
     }
     return json_data
 
+  def _LookupStarrersAndEmails(self, cnxn, issues, comments_dict):
+    """Return starrers of the issues and emails of everyone involved."""
+    user_id_set = tracker_bizobj.UsersInvolvedInIssues(issues)
+    for comment_list in comments_dict.values():
+      user_id_set.update(
+        tracker_bizobj.UsersInvolvedInCommentList(comment_list))
+
+    starrers_dict = self.services.issue_star.LookupItemsStarrers(
+        cnxn, [issue.issue_id for issue in issues])
+    for starrer_id_list in starrers_dict.values():
+      user_id_set.update(starrer_id_list)
+
+    # The value 0 indicates "no user", e.g., that an issue has no owner.
+    # We don't need to create a User row to represent that.
+    user_id_set.discard(0)
+    email_dict = self.services.user.LookupUserEmails(
+        cnxn, user_id_set, ignore_missed=True)
+    return starrers_dict, email_dict
+
+  def _IterExportLines(self, mr):
+    """Yield the lines of a newline-delimited JSON export.
+
+    Issues are exported in order of local ID starting at mr.start.  Each
+    chunk of issues is preceded by an "emails" line listing any users that
+    were not in earlier chunks.  The last line has the "cursor" to pass as
+    start to continue the export, or None if every issue was exported.
+
+    The comments of the next chunk are loaded on a separate connection while
+    the current chunk is serialized.
+    """
+    yield {
+        'metadata': {
+            'version': 1,
+            'when': int(time.time()),
+            'who': mr.auth.email,
+            'project': mr.project_name,
+            'start': mr.start,
+        },
+    }
+
+    highest_local_id = self.services.issue.GetHighestLocalID(
+        mr.cnxn, mr.project_id)
+    exported_emails = set()
+    prefetch_cnxn = sql.MonorailConnection()
+    comments_promise = None
+    try:
+      chunk_start = max(mr.start, 1)
+      issues, comments_promise = self._PrefetchChunk(
+          mr.cnxn, prefetch_cnxn, mr.project_id, chunk_start)
+      for num_chunks in range(1, MAX_EXPORT_CHUNKS + 1):
+        comments_dict = comments_promise.WaitAndGetValue()
+        next_start = chunk_start + EXPORT_CHUNK_SIZE
+        has_next = (
+            next_start <= highest_local_id and num_chunks < MAX_EXPORT_CHUNKS)
+        if has_next:
+          next_issues, comments_promise = self._PrefetchChunk(
+              mr.cnxn, prefetch_cnxn, mr.project_id, next_start)
+
+        starrers_dict, email_dict = self._LookupStarrersAndEmails(
+            mr.cnxn, issues, comments_dict)
+        new_emails = set(email_dict.values()) - exported_emails
+        if new_emails:
+          exported_emails.update(new_emails)
+          yield {'emails': sorted(new_emails)}
+        for issue in issues:
+          if not issue.deleted:
+            yield {
+                'issue': self._MakeIssueJSON(
+                    mr, issue, email_dict,
+                    comments_dict.get(issue.issue_id, []),
+                    starrers_dict.get(issue.issue_id, [])),
+            }
+
+        chunk_start = next_start
+        if not has_next:
+          break
+        issues = next_issues
+    finally:
+      # Let any prefetch finish before its connection is released.
+      if comments_promise:
+        comments_promise.event.wait()
+      prefetch_cnxn.Close()
+
+    if chunk_start > highest_local_id:
+      yield {'cursor': None}
+    else:
+      yield {'cursor': chunk_start}
+
+  def _PrefetchChunk(self, cnxn, prefetch_cnxn, project_id, chunk_start):
+    """Load a chunk of issues and start loading their comments."""
+    issues = self.services.issue.GetIssuesByLocalIDs(
+        cnxn, project_id,
+        list(range(chunk_start, chunk_start + EXPORT_CHUNK_SIZE)),
+        use_cache=False)
+    comments_promise = framework_helpers.Promise(
+        self.services.issue.GetCommentsForIssues, prefetch_cnxn,
+        [issue.issue_id for issue in issues])
+    return issues, comments_promise
+
+  def _RenderJsonResponse(self, json_data):
+    """Write one JSON value per line for a streaming export."""
+    if isinstance(json_data, dict):
+      super(IssueExportJSON, self)._RenderJsonResponse(json_data)
+      return
+
+    self.response.content_type = CONTENT_TYPE_NDJSON
+    self.response.headers['X-Content-Type-Options'] = (
+        framework_constants.CONTENT_TYPE_JSON_OPTIONS)
+    self.response.write(jsonfeed.XSSI_PREFIX)
+    for line_data in json_data:
+      self.response.write(json.dumps(line_data))
+      self.response.write('\n')
+
   def _MakeAmendmentJSON(self, amendment, email_dict):
     amendment_json = {
         'field': amendment.field.name,
@@ -25,6 +25,9 @@ from framework import urls
 from proto import tracker_pb2
 
 
+# Number of issues that are stored with each set of multi-row inserts.
+IMPORT_BATCH_SIZE = 500
+
 ParserState = collections.namedtuple(
     'ParserState',
     'user_id_dict, nonexist_emails, issue_list, comments_dict, starrers_dict, '
@@ -96,10 +99,14 @@ class IssueImport(servlet.Servlet):
 
     try:
       # First we parse the JSON into objects, but we don't have DB IDs yet.
+      start_time = time.time()
       state = self._ParseObjects(mr.cnxn, mr.project_id, json_data, event_log)
+      _LogThroughput(event_log, 'Parsed', state, time.time() - start_time)
       # If that worked, go ahead and start saving the data to the DB.
       if not pre_check_only:
+        start_time = time.time()
         self._SaveObjects(mr.cnxn, mr.project_id, state, event_log)
+        _LogThroughput(event_log, 'Saved', state, time.time() - start_time)
     except JSONImportError:
       # just report it to the user by displaying event_log
       event_log.append('Aborted import processing')
@@ -266,24 +273,35 @@ class IssueImport(servlet.Servlet):
         raise JSONImportError()
     event_log.append('Created %d users' % len(state.nonexist_emails))
 
+    # Imported issues keep their local IDs, and the local ID counter is
+    # moved past them once at the end.
     total_comments = 0
     total_stars = 0
     config = self.services.config.GetProjectConfig(cnxn, project_id)
-    for issue in state.issue_list:
+    for batch_start in range(0, len(state.issue_list), IMPORT_BATCH_SIZE):
+      batch = state.issue_list[batch_start:batch_start + IMPORT_BATCH_SIZE]
       # TODO(jrobbins): renumber issues if there is a local_id conflict.
-      if issue.local_id not in state.starrers_dict:
-        # Issues with stars will have filter rules applied in SetStar().
+      for issue in batch:
+        # Filter rules may depend on the number of stars.
+        issue.star_count = len(state.starrers_dict[issue.local_id])
         filterrules_helpers.ApplyFilterRules(
             cnxn, self.services, issue, config)
-      issue_id = self.services.issue.InsertIssue(cnxn, issue)
-      for comment in state.comments_dict[issue.local_id]:
-        total_comments += 1
-        comment.issue_id = issue_id
-        self.services.issue.InsertComment(cnxn, comment)
-      self.services.issue_star.SetStarsBatch(
-          cnxn, self.services, config, issue_id,
-          state.starrers_dict[issue.local_id], True)
-      total_stars += len(state.starrers_dict[issue.local_id])
+      self.services.issue.InsertIssues(
+          cnxn, batch, commit=False, invalidate=False)
+
+      comments = []
+      starrers_dict = {}
+      for issue in batch:
+        for comment in state.comments_dict[issue.local_id]:
+          comment.issue_id = issue.issue_id
+          comments.append(comment)
+        starrers_dict[issue.issue_id] = state.starrers_dict[issue.local_id]
+        total_stars += len(state.starrers_dict[issue.local_id])
+      self.services.issue.InsertComments(cnxn, comments, commit=False)
+      total_comments += len(comments)
+      self.services.issue_star.InsertStarsForNewItems(
+          cnxn, starrers_dict, commit=False)
+      cnxn.Commit()
 
     event_log.append('Created %d issues' % len(state.issue_list))
     event_log.append('Created %d comments for %d issues' % (
@@ -291,20 +309,46 @@ class IssueImport(servlet.Servlet):
     event_log.append('Set %d stars on %d issues' % (
         total_stars, len(state.starrers_dict)))
 
+    iids_by_local_id = {
+        issue.local_id: issue.issue_id for issue in state.issue_list}
+    other_local_ids = {
+        dst_local_id
+        for rels in state.relations_dict.values()
+        for dst_local_id, _kind in rels
+        if dst_local_id not in iids_by_local_id}
+    if other_local_ids:
+      iids_by_local_id.update(
+          (issue.local_id, issue.issue_id)
+          for issue in self.services.issue.GetIssuesByLocalIDs(
+              cnxn, project_id, sorted(other_local_ids)))
     global_relations_dict = collections.defaultdict(list)
-    for issue, rels in state.relations_dict.items():
-      src_iid = self.services.issue.GetIssueByLocalID(
-          cnxn, project_id, issue).issue_id
-      dst_iids = [i.issue_id for i in self.services.issue.GetIssuesByLocalIDs(
-          cnxn, project_id, [rel[0] for rel in rels])]
-      kinds = [rel[1] for rel in rels]
-      global_relations_dict[src_iid] = list(zip(dst_iids, kinds))
+    for src_local_id, rels in state.relations_dict.items():
+      global_relations_dict[iids_by_local_id[src_local_id]] = [
+          (iids_by_local_id[dst_local_id], kind)
+          for dst_local_id, kind in rels
+          if dst_local_id in iids_by_local_id]
     self.services.issue.RelateIssues(cnxn, global_relations_dict)
 
+    # Indexing and cache invalidation are done once for the whole import.
+    self.services.issue.EnqueueIssuesForIndexing(
+        cnxn, [issue.issue_id for issue in state.issue_list])
+    self.services.config.InvalidateMemcache(state.issue_list, cnxn=cnxn)
     self.services.issue.SetUsedLocalID(cnxn, project_id)
     event_log.append('Finished import')
 
 
+def _LogThroughput(event_log, verb, state, elapsed_seconds):
+  """Report how quickly the issues and comments were processed."""
+  num_comments = sum(len(cl) for cl in state.comments_dict.values())
+  elapsed_seconds = max(elapsed_seconds, 0.001)
+  event_log.append(
+      '%s %d issues and %d comments in %.1f seconds '
+      '(%.1f issues/sec, %.1f comments/sec)' % (
+          verb, len(state.issue_list), num_comments, elapsed_seconds,
+          len(state.issue_list) / elapsed_seconds,
+          num_comments / elapsed_seconds))
+
+
 class JSONImportError(Exception):
   """Exception to raise if imported JSON is invalid."""
   pass
@@ -82,7 +82,12 @@ class IssueList(servlet.Servlet):
           mr.query, mr.query_project_names, mr.me_user_id, mr.num, mr.start,
           url_params, mr.can, mr.group_by_spec, mr.sort_spec,
           mr.use_cached_searches, display_mode=mr.mode, project=mr.project)
-      starred_iid_set = set(we.ListStarredIssueIDs())
+      if pipeline.grid_mode:
+        displayed_results = pipeline.allowed_results or []
+      else:
+        displayed_results = pipeline.visible_results or []
+      starred_iid_set = we.ListStarredIssueIDsAmong(
+          [issue.issue_id for issue in displayed_results])
 
     with mr.profiler.Phase('computing col_spec'):
       mr.ComputeColSpec(config)
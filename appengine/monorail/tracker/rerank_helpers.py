@@ -13,6 +13,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import absolute_import
 
+import collections
 import sys
 
 from framework import exceptions
@@ -20,6 +21,15 @@ from framework import exceptions
 MAX_RANKING = sys.maxint
 MIN_RANKING = 0
 
+# Items added to the start or end of a list are spaced this far apart, so that
+# later moves can usually be given a rank between two neighbours without
+# changing the rank of any item that was not moved.
+RANK_GAP = 1 << 20
+
+# When moved items end up closer than this to a neighbour, the list should be
+# rebalanced before the next move into that spot has to rerank neighbours.
+MIN_RANK_GAP = 1 << 4
+
 def GetHotlistRerankChanges(hotlist_items, moved_issue_ids, target_position):
   # type: (int, Sequence[int], int) -> Collection[Tuple[int, int]]
   """Computes the new ranks from reranking and or inserting of HotlistItems.
@@ -42,9 +52,10 @@ def GetHotlistRerankChanges(hotlist_items, moved_issue_ids, target_position):
   """
   # Sort hotlist items by rank.
   sorted_hotlist_items = sorted(hotlist_items, key=lambda item: item.rank)
+  moved_issue_id_set = set(moved_issue_ids)
   unmoved_hotlist_items = [
       item for item in sorted_hotlist_items
-      if item.issue_id not in moved_issue_ids]
+      if item.issue_id not in moved_issue_id_set]
   if target_position < 0:
     raise exceptions.InputException(
         'given `target_position`: %d, must be non-negative')
@@ -68,6 +79,10 @@ def GetInsertRankings(lower, higher, moved_ids):
   """Compute rankings for moved_ids to insert between the
   lower and higher rankings
 
+  Only the moved issues are given new ranks if there is room between their
+  new neighbours.  Otherwise, the nearest neighbours are moved along with
+  them, one at a time from the side with less room, until there is room.
+
   Args:
     lower: a list of [(id, rank),...] of blockers that should have
       a lower rank than the moved issues. Should be sorted from highest
@@ -81,27 +96,35 @@ def GetInsertRankings(lower, higher, moved_ids):
     a list of [(id, rank),...] of blockers that need to be updated. rank
     is the new rank of the issue with the specified id.
   """
-  if lower:
-    lower_rank = lower[-1][1]
-  else:
-    lower_rank = MIN_RANKING
-
-  if higher:
-    higher_rank = higher[0][1]
-  else:
-    higher_rank = MAX_RANKING
-
-  slot_count = higher_rank - lower_rank - 1
-  if slot_count >= len(moved_ids):
-    new_ranks = _DistributeRanks(lower_rank, higher_rank, len(moved_ids))
-    return list(zip(moved_ids, new_ranks))
-  else:
-    new_lower, new_higher, new_moved_ids = _ResplitRanks(
-        lower, higher, moved_ids)
-    if not new_moved_ids:
+  moved_ids = collections.deque(moved_ids)
+  # lower[:lower_end] and higher[higher_start:] keep their current ranks.
+  lower_end = len(lower)
+  higher_start = 0
+  while True:
+    lower_rank = lower[lower_end - 1][1] if lower_end else MIN_RANKING
+    if higher_start < len(higher):
+      higher_rank = higher[higher_start][1]
+    elif lower_rank + RANK_GAP * len(moved_ids) <= MAX_RANKING:
+      # Leave room after each moved issue, as if they had been appended.
+      return [
+          (moved_id, lower_rank + RANK_GAP * (i + 1))
+          for i, moved_id in enumerate(moved_ids)]
+    else:
+      higher_rank = MAX_RANKING
+
+    slot_count = higher_rank - lower_rank - 1
+    if slot_count >= len(moved_ids):
+      new_ranks = _DistributeRanks(lower_rank, higher_rank, len(moved_ids))
+      return list(zip(moved_ids, new_ranks))
+
+    if not lower_end and higher_start >= len(higher):
       return None
+    if _TakeFromLower(lower, lower_end, higher, higher_start):
+      lower_end -= 1
+      moved_ids.appendleft(lower[lower_end][0])
     else:
-      return GetInsertRankings(new_lower, new_higher, new_moved_ids)
+      moved_ids.append(higher[higher_start][0])
+      higher_start += 1
 
 
 def _DistributeRanks(low, high, rank_count):
@@ -111,23 +134,54 @@ def _DistributeRanks(low, high, rank_count):
   return list(range(first_rank, high, bucket_size))
 
 
-def _ResplitRanks(lower, higher, moved_ids):
-  if not (lower or higher):
-    return None, None, None
+def _TakeFromLower(lower, lower_end, higher, higher_start):
+  """Return True if the next issue to move should come from the lower side."""
+  if not lower_end:
+    return False
+  if higher_start >= len(higher):
+    return True
+  next_lower = lower[lower_end - 2][1] if lower_end >= 2 else MIN_RANKING
+  next_higher = (
+      higher[higher_start + 1][1] if len(higher) > higher_start + 1
+      else MAX_RANKING)
+  return ((lower[lower_end - 1][1] - next_lower) >
+          (next_higher - higher[higher_start][1]))
 
-  if not lower:
-    take_from = 'higher'
-  elif not higher:
-    take_from = 'lower'
-  else:
-    next_lower = lower[-2][1] if len(lower) >= 2 else MIN_RANKING
-    next_higher = higher[1][1] if len(higher) >= 2 else MAX_RANKING
-    if (lower[-1][1] - next_lower) > (next_higher - higher[0][1]):
-      take_from = 'lower'
-    else:
-      take_from = 'higher'
 
-  if take_from == 'lower':
-    return (lower[:-1], higher, [lower[-1][0]] + moved_ids)
-  else:
-    return (lower, higher[1:], moved_ids + [higher[0][0]])
+def NeedsRebalance(items, changed_ranks):
+  # type: (Sequence[HotlistItem], Collection[Tuple[int, int]]) -> bool
+  """Return True if any changed item is crowded by its neighbours.
+
+  Args:
+    items: HotlistItems of the hotlist, before the change.
+    changed_ranks: A list of [(issue_id, rank), ...] that will be stored.
+  """
+  if not changed_ranks:
+    return False
+  ranks = {item.issue_id: item.rank for item in items}
+  ranks.update(changed_ranks)
+  sorted_ranks = sorted(ranks.values())
+  changed_rank_set = {rank for _issue_id, rank in changed_ranks}
+  for i, rank in enumerate(sorted_ranks):
+    if rank not in changed_rank_set:
+      continue
+    lower_rank = sorted_ranks[i - 1] if i else MIN_RANKING
+    higher_rank = (
+        sorted_ranks[i + 1] if i + 1 < len(sorted_ranks) else MAX_RANKING)
+    if min(rank - lower_rank, higher_rank - rank) < MIN_RANK_GAP:
+      return True
+  return False
+
+
+def GetRebalanceChanges(items):
+  # type: (Sequence[HotlistItem]) -> Collection[Tuple[int, int]]
+  """Return [(issue_id, rank), ...] that space out items RANK_GAP apart.
+
+  Items keep their order, and only items whose rank changes are returned.
+  """
+  sorted_items = sorted(items, key=lambda item: item.rank)
+  gap = min(RANK_GAP, (MAX_RANKING - MIN_RANKING) // (len(sorted_items) + 1))
+  return [
+      (item.issue_id, MIN_RANKING + gap * (i + 1))
+      for i, item in enumerate(sorted_items)
+      if item.rank != MIN_RANKING + gap * (i + 1)]
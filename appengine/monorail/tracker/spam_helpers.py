@@ -27,10 +27,25 @@ def DecorateIssueClassifierQueue(
   reporters = user_service.GetUsersByIDs(cnxn, reporter_ids)
   comments = issue_service.GetCommentsForIssues(cnxn, issue_ids)
 
+  # Score the whole page with the current model in a few batched requests.
+  # Reporters are not treated as project members so that every issue gets a
+  # score from the model.
+  first_comments = [
+      comments.get(item.issue_id, ["[Empty]"])[0]
+      for item in moderation_items]
+  classifications = spam_service.ClassifyBatch([
+      ([issue_map[item.issue_id].summary, first_comment.content],
+       reporters[issue_map[item.issue_id].reporter_id], False)
+      for item, first_comment in zip(moderation_items, first_comments)])
+
   items = []
-  for item in moderation_items:
+  for item, first_comment, classification in zip(
+      moderation_items, first_comments, classifications):
     issue=issue_map[item.issue_id]
-    first_comment = comments.get(item.issue_id, ["[Empty]"])[0]
+    if classification['failed_open']:
+      current_confidence = ''
+    else:
+      current_confidence = '%.3f' % classification['confidence_is_spam']
 
     items.append(template_helpers.EZTItem(
         issue=issue,
@@ -41,6 +56,7 @@ def DecorateIssueClassifierQueue(
         is_spam=ezt.boolean(item.is_spam),
         verdict_time=item.verdict_time,
         classifier_confidence=item.classifier_confidence,
+        current_confidence=current_confidence,
         reason=item.reason,
     ))
 
@@ -9,6 +9,7 @@ from __future__ import division
 from __future__ import absolute_import
 
 import unittest
+import webapp2
 
 from mock import Mock, patch
 
@@ -65,6 +66,62 @@ class IssueExportTest(unittest.TestCase):
     self.assertItemsEqual(
         json_data['emails'], ['user1@test.com', 'user2@test.com'])
 
+  def SetUpStreamingExport(self, start=0):
+    self.services.user.TestAddUser('user1@test.com', 111)
+    self.services.user.TestAddUser('user2@test.com', 222)
+    for local_id, owner_id in [(1, 111), (2, 222), (3, 111), (5, 222)]:
+      self.services.issue.TestAddIssue(fake.MakeTestIssue(
+          789, local_id, 'sum', 'New', owner_id, reporter_id=111,
+          issue_id=78900 + local_id))
+    self.services.issue.GetIssue(self.cnxn, 78902).deleted = True
+    self.services.issue_star.LookupItemsStarrers = Mock(return_value={})
+    mr = testing_helpers.MakeMonorailRequest(
+        path='/p/proj/issues/export/json?format=ndjson&start=%d' % start,
+        project=self.project, perms=permissions.OWNER_ACTIVE_PERMISSIONSET)
+    mr.can = 1
+    mr.project_name = self.project.project_name
+    return mr
+
+  @patch('tracker.issueexport.EXPORT_CHUNK_SIZE', 2)
+  @patch('time.time')
+  def testHandleRequest_Streaming(self, mockTime):
+    mockTime.return_value = 1234
+    mr = self.SetUpStreamingExport()
+
+    lines = list(self.jsonfeed.HandleRequest(mr))
+
+    self.assertEqual(
+        {'metadata': {'version': 1, 'who': None, 'when': 1234,
+                      'project': 'proj', 'start': 0}},
+        lines[0])
+    self.assertEqual({'emails': ['user1@test.com', 'user2@test.com']}, lines[1])
+    # Issue 2 is deleted, and the user of issue 3 was already listed.
+    self.assertEqual(
+        [1, 3, 5],
+        [line['issue']['local_id'] for line in lines if 'issue' in line])
+    self.assertEqual({'cursor': None}, lines[-1])
+
+  @patch('tracker.issueexport.MAX_EXPORT_CHUNKS', 1)
+  @patch('tracker.issueexport.EXPORT_CHUNK_SIZE', 2)
+  def testHandleRequest_StreamingResumes(self):
+    mr = self.SetUpStreamingExport()
+    lines = list(self.jsonfeed.HandleRequest(mr))
+    self.assertEqual([1], [line['issue']['local_id'] for line in lines[2:-1]])
+    self.assertEqual({'cursor': 3}, lines[-1])
+
+    mr = self.SetUpStreamingExport(start=3)
+    lines = list(self.jsonfeed.HandleRequest(mr))
+    self.assertEqual([3], [line['issue']['local_id'] for line in lines[2:-1]])
+    self.assertEqual({'cursor': 5}, lines[-1])
+
+  def testRenderJsonResponse_Streaming(self):
+    self.jsonfeed.response = webapp2.Response()
+    self.jsonfeed._RenderJsonResponse(iter([{'a': 1}, {'cursor': None}]))
+    self.assertEqual(
+        ')]}\'\n{"a": 1}\n{"cursor": null}\n', self.jsonfeed.response.body)
+    self.assertEqual(
+        'application/x-ndjson', self.jsonfeed.response.content_type)
+
   # TODO(jojwang): test attachments, amendments, comment details
   def testMakeIssueJSON(self):
     config = self.services.config.GetProjectConfig(
@@ -67,3 +67,14 @@ class IssueExportTest(unittest.TestCase):
             project_id=12, timestamp=223, user_id=111,
             content='I cant believe youve done this',
             is_description=True))
+
+  def testLogThroughput(self):
+    state = issueimport.ParserState(
+        {}, [], [tracker_pb2.Issue(local_id=1), tracker_pb2.Issue(local_id=2)],
+        {1: ['c1', 'c2'], 2: ['c3', 'c4']}, {}, {})
+    event_log = []
+    issueimport._LogThroughput(event_log, 'Saved', state, 2.0)
+    self.assertEqual(
+        ['Saved 2 issues and 4 comments in 2.0 seconds '
+         '(1.0 issues/sec, 2.0 comments/sec)'],
+        event_log)
@@ -0,0 +1,89 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Benchmark for reranking items in hotlists of different sizes.
+
+We make the same random moves in a hotlist whose items were added 10 ranks
+apart, as they used to be, and in one whose items are RANK_GAP apart and
+that is rebalanced whenever a move leaves items crowded, as the rebalance
+task would do.  For each, we report the time to compute each move and the
+number of Hotlist2Issue rows that each move writes.
+
+Usage: python tracker/test/rerank_helpers_benchmark.py [num_moves]
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import random
+import sys
+import time
+
+from proto import features_pb2
+from tracker import rerank_helpers
+
+
+HOTLIST_SIZES = [100, 1000, 10000]
+
+
+def MakeItems(num_items, gap):
+  return [
+      features_pb2.MakeHotlistItem(78900000 + i, rank=gap * (i + 1))
+      for i in range(num_items)]
+
+
+def RunMoves(items, moves, rebalance):
+  """Return ms per move, rows written per move, and number of rebalances."""
+  items_by_id = {item.issue_id: item for item in items}
+  rows_written = 0
+  rebalances = 0
+  elapsed = 0.0
+  for moved_ids, target_position in moves:
+    start = time.time()
+    changes = rerank_helpers.GetHotlistRerankChanges(
+        items, moved_ids, target_position)
+    elapsed += time.time() - start
+    crowded = rebalance and rerank_helpers.NeedsRebalance(items, changes)
+    for issue_id, rank in changes:
+      items_by_id[issue_id].rank = rank
+    rows_written += len(changes)
+    if crowded:
+      # The background task runs before the next move.
+      rebalances += 1
+      for issue_id, rank in rerank_helpers.GetRebalanceChanges(items):
+        items_by_id[issue_id].rank = rank
+  return elapsed * 1000 / len(moves), rows_written / len(moves), rebalances
+
+
+def MakeMoves(num_items, num_moves):
+  """Return moves that often drop issues into the same few spots."""
+  rand = random.Random(1)
+  hot_positions = [rand.randrange(num_items) for _ in range(3)]
+  moves = []
+  for _ in range(num_moves):
+    moved_ids = [
+        78900000 + i for i in rand.sample(range(num_items), rand.randint(1, 3))]
+    target_position = min(
+        rand.choice(hot_positions), num_items - len(moved_ids))
+    moves.append((moved_ids, target_position))
+  return moves
+
+
+def main(argv):
+  num_moves = int(argv[1]) if len(argv) > 1 else 200
+  for num_items in HOTLIST_SIZES:
+    moves = MakeMoves(num_items, num_moves)
+    old_ms, old_rows, _ = RunMoves(MakeItems(num_items, 10), moves, False)
+    new_ms, new_rows, rebalances = RunMoves(
+        MakeItems(num_items, rerank_helpers.RANK_GAP), moves, True)
+    print('%d items, %d moves' % (num_items, num_moves))
+    print('  gap 10:        %8.2f ms/move  %8.1f rows/move' % (
+        old_ms, old_rows))
+    print('  gap RANK_GAP:  %8.2f ms/move  %8.1f rows/move  %d rebalances' % (
+        new_ms, new_rows, rebalances))
+
+
+if __name__ == '__main__':
+  main(sys.argv)
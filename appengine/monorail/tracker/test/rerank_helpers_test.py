@@ -10,6 +10,8 @@ from __future__ import absolute_import
 
 import unittest
 
+import mock
+
 from framework import exceptions
 from testing import fake
 from tracker import rerank_helpers
@@ -133,3 +135,42 @@ class Rerank_HelpersTest(unittest.TestCase):
     ret = rerank_helpers.GetInsertRankings(lower, higher, moved_ids)
     self.assertIsNone(ret)
     rerank_helpers.MAX_RANKING = max_ranking
+
+  @mock.patch('tracker.rerank_helpers.MAX_RANKING', 1 << 30)
+  def testGetInsertRankings_AfterLast(self):
+    """Issues moved after the last one are spaced RANK_GAP apart."""
+    lower = [(1, 0), (2, 5)]
+    moved_ids = [3, 4]
+    ret = rerank_helpers.GetInsertRankings(lower, [], moved_ids)
+    self.assertEqual(
+        ret, [(3, 5 + rerank_helpers.RANK_GAP),
+              (4, 5 + 2 * rerank_helpers.RANK_GAP)])
+
+  @mock.patch('tracker.rerank_helpers.MAX_RANKING', 6000)
+  def testGetInsertRankings_ManyNeighbours(self):
+    """We can move past more neighbours than the recursion limit."""
+    lower = [(i, i) for i in range(2500)]
+    higher = [(i, i) for i in range(2500, 5000)]
+    ret = rerank_helpers.GetInsertRankings(lower, higher, [9999])
+    self.assertEqual([9999] + list(range(2500, 5000)), [i for i, _ in ret])
+    ranks = [rank for _id, rank in ret]
+    self.assertEqual(sorted(set(ranks)), ranks)
+    self.assertTrue(2499 < ranks[0] and ranks[-1] < 6000)
+
+  @mock.patch('tracker.rerank_helpers.MIN_RANK_GAP', 5)
+  def testNeedsRebalance(self):
+    items = self.hotlist.items
+    self.assertFalse(rerank_helpers.NeedsRebalance(items, []))
+    self.assertFalse(rerank_helpers.NeedsRebalance(items, [(78903, 6)]))
+    self.assertTrue(rerank_helpers.NeedsRebalance(items, [(78903, 8)]))
+    self.assertTrue(rerank_helpers.NeedsRebalance(items, [(78905, 33)]))
+
+  @mock.patch('tracker.rerank_helpers.MAX_RANKING', 1 << 30)
+  def testGetRebalanceChanges(self):
+    gap = rerank_helpers.RANK_GAP
+    for item, rank in zip(self.hotlist.items, [4 * gap, 21, 2 * gap, gap]):
+      item.rank = rank
+    self.assertEqual(
+        [(78903, gap), (78901, 2 * gap), (78902, 3 * gap)],
+        rerank_helpers.GetRebalanceChanges(self.hotlist.items))
+    self.assertEqual([], rerank_helpers.GetRebalanceChanges([]))
@@ -0,0 +1,65 @@
+# Copyright 2020 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+"""Tests for the spam_helpers module."""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+import unittest
+
+from mock import Mock
+
+from services import spam_svc
+from testing import fake
+from tracker import spam_helpers
+
+
+class DecorateIssueClassifierQueueTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cnxn = 'fake cnxn'
+    self.issue_service = fake.IssueService()
+    self.user_service = fake.UserService()
+    self.reporter = self.user_service.TestAddUser('spammer@example.com', 111)
+    self.spam_service = Mock()
+    self.spam_service.LookupIssueFlagCounts.return_value = {78901: 2}
+    self.issues = []
+    for local_id in [1, 2]:
+      issue = fake.MakeTestIssue(
+          789, local_id, 'summary %d' % local_id, 'New', 0,
+          reporter_id=111, issue_id=78900 + local_id)
+      # This also adds a description with the summary as its content.
+      self.issue_service.TestAddIssue(issue)
+      self.issues.append(issue)
+    self.moderation_items = [
+        spam_svc.ModerationItem(
+            issue_id=issue.issue_id, is_spam=False, reason='classifier',
+            classifier_confidence=0.4, verdict_time='2020-01-01')
+        for issue in self.issues]
+
+  def testDecorateIssueClassifierQueue(self):
+    """The page's issues are scored with one ClassifyBatch call."""
+    self.spam_service.ClassifyBatch.return_value = [
+        {'confidence_is_spam': 0.75, 'failed_open': False},
+        {'confidence_is_spam': 0.0, 'failed_open': True}]
+
+    items = spam_helpers.DecorateIssueClassifierQueue(
+        self.cnxn, self.issue_service, self.spam_service, self.user_service,
+        self.moderation_items)
+
+    self.spam_service.ClassifyBatch.assert_called_once_with([
+        (['summary 1', 'summary 1'], self.reporter, False),
+        (['summary 2', 'summary 2'], self.reporter, False)])
+    self.assertEqual(
+        [78901, 78902], [item.issue.issue_id for item in items])
+    self.assertEqual(['0.750', ''], [item.current_confidence for item in items])
+    self.assertEqual([2, 0], [item.flag_count for item in items])
+    self.assertEqual(
+        [0.4, 0.4], [item.classifier_confidence for item in items])
+
+
+if __name__ == '__main__':
+  unittest.main()
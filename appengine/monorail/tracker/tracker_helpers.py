@@ -738,6 +738,7 @@ def FilterOutNonViewableIssues(
       pid for pid, p in project_dict.items()
       if not permissions.CanView(effective_ids, perms_dict[pid], p, [])}
 
+  evaluator = permissions.PermissionEvaluator()
   results = []
   for issue in issues:
     if issue.deleted or issue.project_id in denied_project_ids:
@@ -751,7 +752,7 @@ def FilterOutNonViewableIssues(
       config = config_dict.get(issue.project_id, config_dict.get('harmonized'))
       granted_perms = tracker_bizobj.GetGrantedPerms(
           issue, effective_ids, config)
-      may_view = permissions.CanViewIssue(
+      may_view = evaluator.CanViewIssue(
           effective_ids, perms, project, issue, granted_perms=granted_perms)
 
     if may_view: